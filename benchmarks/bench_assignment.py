@@ -0,0 +1,149 @@
+"""
+Benchmark of the SPIN assignment solver against seeded databases.
+
+For each size (students, see benchmarks.seed): the time to load the problem,
+to solve it and to write the result (on a copy of the SPIN database), the
+solver's walks and repricings, the seats given by rank, and a check of the
+constraints (capacity, chosen course, program, one class per group, no
+overlapping timeslots). Then a repair (see src/spin/repair.py) after --changed students
+turned their ranks around: its time, and the classes it changed:
+
+    uv run python -m benchmarks.bench_assignment --sizes 1k,10k,50k --output assignment.json
+"""
+
+import argparse
+import dataclasses
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from benchmarks.seed import DEFAULT_DATA_DIR, parse_size, seed_databases
+from src.spin import assignment, repair
+
+
+def violations(problem: assignment.Problem, solution: assignment.Solution) -> Dict[str, int]:
+    """Assignments breaking each constraint (all 0 for a valid solution)"""
+    student = problem.choice_student[solution.choices]
+    group = problem.choice_group[solution.choices]
+    course = problem.class_course[solution.classes]
+    program = problem.class_program[solution.classes]
+    seated = np.bincount(solution.classes, minlength=len(problem.class_ids))
+    # Timeslot per student and group, to compare the groups pairwise
+    taken = np.full((len(problem.student_ids), len(problem.groups)), -1, np.int64)
+    taken[student, group] = problem.class_timeslot[solution.classes]
+    clashes = sum(
+        int(((first >= 0) & (second >= 0) & problem.timeslot_clash[first, second]).sum())
+        for a, first in enumerate(taken.T)
+        for second in taken.T[a + 1 :]
+    )
+    return {
+        "capacity": int(np.maximum(seated - problem.class_capacity, 0).sum()),
+        "course": int((course != problem.choice_course[solution.choices]).sum()),
+        "program": int(
+            (
+                (program != problem.student_program[student])
+                & (program != problem.programs.index(assignment.ALL_PROGRAMS))
+            ).sum()
+        ),
+        "group": len(student) - len(np.unique(student * len(problem.groups) + group)),
+        "timeslot": clashes,
+    }
+
+
+def turn_ranks(problem: assignment.Problem, students: np.ndarray) -> assignment.Problem:
+    """The problem with the students' ranks reversed in every group"""
+    rows = np.flatnonzero(np.isin(problem.choice_student, students))
+    frame = pd.DataFrame(
+        {
+            "key": problem.choice_student[rows] * len(problem.groups) + problem.choice_group[rows],
+            "rank": problem.choice_rank[rows],
+        }
+    )
+    ranks = frame.groupby("key")["rank"]
+    choice_rank = problem.choice_rank.copy()
+    choice_rank[rows] = ranks.transform("min") + ranks.transform("max") - frame["rank"]
+    return dataclasses.replace(problem, choice_rank=choice_rank)
+
+
+def run(args) -> List[Dict]:
+    results = []
+    for size in args.sizes:
+        rows = parse_size(size)
+        school_path, spin_path = seed_databases(rows, args.seed, args.data_dir)
+        with tempfile.TemporaryDirectory() as directory:
+            # Writes go to a copy, the seeded database stays as generated
+            spin_copy = Path(directory) / spin_path.name
+            shutil.copy(spin_path, spin_copy)
+            with (
+                duckdb.connect(str(spin_copy)) as spin_con,
+                duckdb.connect(str(school_path), read_only=True) as school_con,
+            ):
+                start = time.perf_counter()
+                problem = assignment.load_problem(spin_con, school_con)
+                load_seconds = time.perf_counter() - start
+                solution = assignment.solve(problem)
+                start = time.perf_counter()
+                assignment.write_assignments(spin_con, problem, solution)
+                write_seconds = time.perf_counter() - start
+                written = spin_con.execute("SELECT count(*) FROM assignment").fetchone()[0]
+
+        rng = np.random.default_rng(args.seed)
+        changed = np.zeros(len(problem.student_ids), bool)
+        changed[rng.choice(len(changed), min(args.changed, len(changed)), replace=False)] = True
+        current = repair.as_current(problem, solution)
+        changed_problem = turn_ranks(problem, np.flatnonzero(changed))
+        repaired = assignment.solve(changed_problem, current, changed)
+        moves = repair.delta(problem, current, repair.as_current(problem, repaired))
+
+        summary = assignment.summarize(problem, solution)
+        solve_seconds = summary.pop("seconds")
+        result = {
+            "rows": rows,
+            **summary,
+            "load_seconds": round(load_seconds, 3),
+            "solve_seconds": solve_seconds,
+            "write_seconds": round(write_seconds, 3),
+            "written": written,
+            "violations": violations(problem, solution),
+            "changed": args.changed,
+            "repair_seconds": round(repaired.seconds, 3),
+            "repair_moves": len(moves),
+            "repair_violations": violations(changed_problem, repaired),
+        }
+        results.append(result)
+        broken = sum(result["violations"].values()) + sum(result["repair_violations"].values())
+        print(
+            f"rows={rows:<8} students={result['students']:<7} assigned={result['assigned']:<7} "
+            f"of {result['requests']:<7} load {result['load_seconds']:7.2f}s "
+            f"solve {result['solve_seconds']:7.2f}s write {result['write_seconds']:6.2f}s "
+            f"walks={result['walks']:<4} repricings={result['repricings']:<4} "
+            f"{'ok' if not broken else f'{broken} VIOLATIONS'}"
+        )
+        print(
+            f"{'':<14} by rank {result['by_rank']}, repair after {args.changed} changed "
+            f"{result['repair_seconds']:.2f}s, {result['repair_moves']} classes changed"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1k,10k,50k", help="comma separated student counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--changed", type=int, default=20, help="students changed for the repair")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+    args.sizes = args.sizes.split(",")
+
+    results = run(args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"wrote {args.output}")
@@ -0,0 +1,183 @@
+"""
+Benchmark of the materialized class_view against the live join.
+
+For each size (students, see benchmarks.seed), on copies of the seeded
+databases: the time to build class_view (src/spin/class_view.py), to read
+the class listing and per-class rosters from it (a no-op refresh included)
+and from the live join of spin_class with the school tables, and to refresh
+it after --changed classes and a room changed (median of --repeat rounds of
+changes), next to a rebuild. The refreshed table is checked against the
+rebuilt one:
+
+    uv run python -m benchmarks.bench_class_view --sizes 1k,10k,50k --output class_view.json
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import duckdb
+import numpy as np
+
+from benchmarks.seed import DEFAULT_DATA_DIR, parse_size, seed_databases
+from src.db.change_log import ChangeLog
+from src.spin import class_view
+
+ROSTER_SQL = """
+    SELECT std.firstName, std.lastName, sc.timeslot, sc.title
+    FROM assignment AS asg
+    JOIN student AS std ON asg.student_id = std.id
+    JOIN {classes} AS sc ON asg.spin_class_id = sc.id
+    WHERE sc.id = ?
+    ORDER BY std.lastName, std.firstName
+"""
+LISTING_SQL = "FROM {classes} ORDER BY title, timeslot, id"
+
+
+def median_ms(function: Callable, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 2)
+
+
+def change(con, school_con, classes: List[str], rooms: List[str], count: int, rng):
+    """Move `count` classes to other rooms and resize a room, through the change logs"""
+    spin_log = ChangeLog("spin", lambda: con)
+    school_log = ChangeLog("school", lambda: school_con)
+    for class_id in rng.choice(classes, min(count, len(classes)), replace=False):
+        with spin_log.transaction(con):
+            con.execute(
+                "UPDATE spin_class SET room_name = ? WHERE id = ?",
+                [str(rng.choice(rooms)), str(class_id)],
+            )
+            spin_log.record(con, "spin_class", class_id, "update", ["room_name"])
+    room_id = school_con.execute("SELECT id FROM room LIMIT 1").fetchone()[0]
+    with school_log.transaction(school_con):
+        school_con.execute("UPDATE room SET capacity = capacity + 1 WHERE id = ?", [room_id])
+        school_log.record(school_con, "room", room_id, "update", ["capacity"])
+
+
+def run(args) -> List[Dict]:
+    results = []
+    rng = np.random.default_rng(args.seed)
+    for size in args.sizes:
+        rows = parse_size(size)
+        school_path, spin_path = seed_databases(rows, args.seed, args.data_dir)
+        with tempfile.TemporaryDirectory() as directory:
+            # class_view and the changes go to copies, the seeded databases stay as generated
+            spin_copy = Path(directory) / spin_path.name
+            school_copy = Path(directory) / school_path.name
+            shutil.copy(spin_path, spin_copy)
+            shutil.copy(school_path, school_copy)
+            with (
+                duckdb.connect(str(spin_copy)) as con,
+                duckdb.connect(str(school_copy)) as school_con,
+            ):
+                start = time.perf_counter()
+                classes = class_view.rebuild(con, school_con)
+                build_ms = round((time.perf_counter() - start) * 1000, 2)
+                class_ids = [
+                    str(id) for (id,) in con.execute("SELECT id FROM spin_class").fetchall()
+                ]
+                sample = [str(id) for id in rng.choice(class_ids, args.rosters, replace=False)]
+
+                def listing_materialized():
+                    class_view.refresh(con, school_con)
+                    con.execute(LISTING_SQL.format(classes="class_view")).df()
+
+                def rosters_materialized():
+                    class_view.refresh(con, school_con)
+                    for class_id in sample:
+                        con.execute(ROSTER_SQL.format(classes="class_view"), [class_id]).df()
+
+                materialized = {
+                    "listing_ms": median_ms(listing_materialized, args.repeat),
+                    "rosters_ms": median_ms(rosters_materialized, args.repeat),
+                }
+
+                rooms = [name for (name,) in school_con.execute("SELECT name FROM room").fetchall()]
+                refreshes, rejoined = [], []
+                for _ in range(args.repeat):
+                    change(con, school_con, class_ids, rooms, args.changed, rng)
+                    start = time.perf_counter()
+                    rejoined.append(class_view.refresh(con, school_con))
+                    refreshes.append(time.perf_counter() - start)
+                refresh_ms = round(statistics.median(refreshes) * 1000, 2)
+                rejoined = int(statistics.median(rejoined))
+                refreshed = con.execute("FROM class_view ORDER BY id").df()
+                rebuild_ms = median_ms(lambda: class_view.rebuild(con, school_con), args.repeat)
+                consistent = refreshed.equals(con.execute("FROM class_view ORDER BY id").df())
+
+                # The live join, over the school tables copied next to the classes
+                for name, frame in class_view.school_frames(con, school_con).items():
+                    con.register("frame", frame)
+                    con.execute(f"CREATE TEMP TABLE {name} AS FROM frame")
+                    con.unregister("frame")
+                con.execute(f"CREATE TEMP VIEW live_class_view AS {class_view.BUILD_SQL}")
+                live = {
+                    "listing_ms": median_ms(
+                        lambda: con.execute(LISTING_SQL.format(classes="live_class_view")).df(),
+                        args.repeat,
+                    ),
+                    "rosters_ms": median_ms(
+                        lambda: [
+                            con.execute(
+                                ROSTER_SQL.format(classes="live_class_view"), [class_id]
+                            ).df()
+                            for class_id in sample
+                        ],
+                        args.repeat,
+                    ),
+                }
+
+        result = {
+            "rows": rows,
+            "classes": classes,
+            "build_ms": build_ms,
+            "live": live,
+            "materialized": materialized,
+            "changed": args.changed,
+            "refresh_ms": refresh_ms,
+            "refresh_rejoined": rejoined,
+            "rebuild_ms": rebuild_ms,
+            "consistent": consistent,
+        }
+        results.append(result)
+        print(
+            f"rows={rows:<8} classes={classes:<6} build {build_ms:8.2f}ms  listing "
+            f"live {live['listing_ms']:8.2f}ms materialized {materialized['listing_ms']:8.2f}ms  "
+            f"{args.rosters} rosters live {live['rosters_ms']:8.2f}ms "
+            f"materialized {materialized['rosters_ms']:8.2f}ms"
+        )
+        print(
+            f"{'':<14} after {args.changed} classes and a room changed: refresh "
+            f"{refresh_ms:.2f}ms ({rejoined} rejoined), rebuild {rebuild_ms:.2f}ms, "
+            f"{'consistent' if consistent else 'INCONSISTENT'}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1k,10k,50k", help="comma separated student counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20, help="runs per measurement")
+    parser.add_argument("--rosters", type=int, default=20, help="class rosters read per run")
+    parser.add_argument("--changed", type=int, default=20, help="classes changed for the refresh")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+    args.sizes = args.sizes.split(",")
+
+    results = run(args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"wrote {args.output}")
@@ -0,0 +1,148 @@
+"""
+Benchmark of the double-booking detection of src/spin/conflicts.py.
+
+For each number of classes, on a synthetic week (classes spread over six
+daily slots, some running into the next, rooms and teachers drawn at random):
+the time to build the room and teacher indexes, to list every double booking,
+and to check a single class as edited, next to comparing every pair of classes.
+The pairs found are checked against the pairwise comparison:
+
+    uv run python -m benchmarks.bench_conflicts --classes 1k,10k,50k --output conflicts.json
+"""
+
+import argparse
+import json
+import statistics
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.seed import parse_size
+from src.spin.conflicts import WEEKDAYS, Schedule
+
+STARTS = ["09:00", "10:30", "12:40", "14:10", "15:40", "17:10"]
+
+
+def median_ms(function: Callable, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 3)
+
+
+def synthetic_classes(count: int, rng) -> pd.DataFrame:
+    """
+    class_view-like rows: a room per 5 classes and a teacher per 8, one room in
+    10 and one timeslot in 10 not matched to a school row
+    """
+    days = rng.choice(list(WEEKDAYS)[:5], count)
+    starts = rng.choice(STARTS, count)
+    # Most classes last 80 minutes, some run over into the next slot
+    lengths = rng.choice([80, 80, 80, 110], count)
+    ends = [
+        f"{(int(start[:2]) * 60 + int(start[3:]) + length) // 60:02d}:"
+        f"{(int(start[:2]) * 60 + int(start[3:]) + length) % 60:02d}"
+        for start, length in zip(starts, lengths)
+    ]
+    rooms = rng.integers(0, max(count // 5, 1), count)
+    teachers = rng.integers(0, max(count // 8, 1), count)
+    matched = rng.random(count) < 0.9
+    return pd.DataFrame(
+        {
+            "id": [uuid.UUID(int=int(number)) for number in rng.integers(1, 2**63, count)],
+            "title": [f"Class {number}" for number in range(count)],
+            "timeslot": [f"{day}: {start} - {end}" for day, start, end in zip(days, starts, ends)],
+            "room_name": [f"Room {room}" for room in rooms],
+            "teacher_name": [f"Teacher {teacher}" for teacher in teachers],
+            "weekday": np.where(matched, days, None),
+            "start_time": np.where(matched, starts, None),
+            "end_time": np.where(matched, ends, None),
+            "room_id": [uuid.UUID(int=int(room) + 1) if room % 10 else None for room in rooms],
+            "teacher_id": [None] * count,
+        }
+    )
+
+
+def pairwise(schedule: Schedule, classes: pd.DataFrame) -> Set[Tuple[str, str, str]]:
+    """Double bookings by comparing every pair of classes (rooms and teachers by name)"""
+    found = set()
+    starts, ends = schedule.starts, schedule.ends
+    ids = schedule.classes["id"].to_numpy()
+    for resource, column in (("room", "room_name"), ("teacher", "teacher_name")):
+        names = classes[column].to_numpy()
+        for one in range(len(classes)):
+            if starts[one] < 0:
+                continue
+            other = np.arange(one + 1, len(classes))
+            hits = other[
+                (names[other] == names[one])
+                & (starts[other] >= 0)
+                & (starts[other] < ends[one])
+                & (starts[one] < ends[other])
+            ]
+            found.update((resource, *sorted((ids[one], ids[hit]))) for hit in hits)
+    return found
+
+
+def run(args) -> List[Dict]:
+    results = []
+    rng = np.random.default_rng(args.seed)
+    for size in args.classes:
+        count = parse_size(size)
+        classes = synthetic_classes(count, rng)
+        schedule = Schedule(classes)
+        build_ms = median_ms(lambda: Schedule(classes), args.repeat)
+        conflicts_ms = median_ms(lambda: Schedule(classes).conflicts(), args.repeat) - build_ms
+        conflicts = schedule.conflicts()
+        edited = classes.sample(args.checks, random_state=args.seed).to_dict("records")
+        check_ms = median_ms(lambda: [schedule.check(row) for row in edited], args.repeat)
+
+        start = time.perf_counter()
+        expected = pairwise(schedule, classes)
+        pairwise_ms = round((time.perf_counter() - start) * 1000, 3)
+        found = {
+            (resource, *sorted(pair))
+            for resource, *pair in conflicts[["resource", "class_id", "other_id"]].itertuples(
+                index=False
+            )
+        }
+
+        result = {
+            "classes": count,
+            "double_bookings": len(conflicts),
+            "build_ms": build_ms,
+            "conflicts_ms": round(conflicts_ms, 3),
+            "check_ms": round(check_ms / args.checks, 3),
+            "pairwise_ms": pairwise_ms,
+            "consistent": found == expected and len(found) == len(conflicts),
+        }
+        results.append(result)
+        print(
+            f"classes={count:<7} double bookings={len(conflicts):<7} build {build_ms:8.2f}ms  "
+            f"all overlaps {result['conflicts_ms']:8.2f}ms  check one {result['check_ms']:6.3f}ms  "
+            f"pairwise {pairwise_ms:10.2f}ms  "
+            f"{'consistent' if result['consistent'] else 'INCONSISTENT'}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--classes", default="1k,10k,50k", help="comma separated class counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement")
+    parser.add_argument("--checks", type=int, default=100, help="classes checked one by one")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+    args.classes = args.classes.split(",")
+
+    results = run(args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"wrote {args.output}")
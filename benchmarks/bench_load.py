@@ -0,0 +1,318 @@
+"""
+Load test of the web tier against seeded databases.
+
+Concurrent clients drive the ASGI app in-process (httpx, no server) for each
+database size: the courses page, the courses table with filter/sort
+permutations, and the course CRUD endpoints. Latency percentiles, throughput
+and RSS are written to a JSON file per commit, to compare runs across commits:
+
+    uv run python -m benchmarks.bench_load --sizes 1k,100k --clients 8
+    uv run python -m benchmarks.bench_load --compare benchmarks/results/abc1234.json
+    uv run python -m benchmarks.bench_load --output new.json --compare old.json  # no run
+
+Databases are seeded with benchmarks.seed (cached between runs).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Keep instrumentation side effects out of the measurements
+os.environ.setdefault("REQUEST_LOG_SAMPLE_RATE", "0")
+os.environ.setdefault("SLOW_QUERY_MS", "inf")
+os.environ.setdefault("TAILWIND_MODE", "off")
+
+from benchmarks.seed import DEFAULT_DATA_DIR, parse_size, seed_databases  # noqa: E402
+
+RESULTS_DIR = Path(__file__).with_name("results")
+
+DATASTAR = {"Datastar-Request": "true"}
+
+# Filter/sort permutations of /school/courses/data
+DATA_QUERIES = [
+    {k: v for k, v in params.items() if v is not None}
+    for params in (
+        dict(zip(("q", "active_only", "sort_by", "sort_asc"), values))
+        for values in itertools.product(
+            (None, "gram", "no-such-course"),
+            (None, "true"),
+            (None, "code", "title"),
+            ("true", "false"),
+        )
+    )
+    if params["sort_by"] is not None or params["sort_asc"] == "true"
+]
+
+
+class Recorder:
+    """Latencies and status codes of one scenario"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors = 0
+
+    def add(self, seconds: float, status: Optional[int]):
+        self.latencies.append(seconds)
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] += 1
+            if status >= 400:
+                self.errors += 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def rss_mb() -> float:
+    """Current resident set size, from /proc where available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+async def timed_request(client, recorder: Recorder, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        status = response.status_code
+    except Exception:
+        response, status = None, None
+    recorder.add(time.perf_counter() - start, status)
+    return response
+
+
+async def run_clients(worker, clients: int, requests: int, duration: float):
+    """Run `clients` workers until `requests` iterations are issued or `duration` passes"""
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    async def loop(client_id: int):
+        while next(counter) < requests and time.perf_counter() < deadline:
+            await worker(client_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(loop(client_id) for client_id in range(clients)))
+    return time.perf_counter() - start
+
+
+async def bench_page(client, args) -> Dict[str, Recorder]:
+    recorder = Recorder()
+
+    async def worker(client_id):
+        await timed_request(client, recorder, "GET", "/school/courses")
+
+    recorder.wall = await run_clients(worker, args.clients, args.requests, args.duration)
+    return {"courses_page": recorder}
+
+
+async def bench_data(client, args) -> Dict[str, Recorder]:
+    recorder = Recorder()
+    queries = itertools.cycle(DATA_QUERIES)
+
+    async def worker(client_id):
+        params = next(queries)
+        await timed_request(
+            client, recorder, "GET", "/school/courses/data", params=params, headers=DATASTAR
+        )
+
+    recorder.wall = await run_clients(worker, args.clients, args.requests, args.duration)
+    return {"courses_data": recorder}
+
+
+async def bench_crud(client, args) -> Dict[str, Recorder]:
+    """Create, read, update and delete one course per iteration"""
+    from src.db import db_school
+
+    recorders = {name: Recorder() for name in ("create", "read", "update", "delete")}
+    sequence = itertools.count()
+
+    def created_id(code: str) -> Optional[str]:
+        # The create endpoint only answers with a message, so look the row up
+        with db_school.get_connection() as con:
+            row = con.execute("SELECT id FROM course WHERE code = ?", [code]).fetchone()
+        return str(row[0]) if row else None
+
+    async def worker(client_id):
+        # Course codes are at most 10 characters
+        code = f"B{client_id}-{next(sequence)}"
+        form = {"code": code, "title": f"Benchmark {code}", "active": "true"}
+        await timed_request(
+            client, recorders["create"], "POST", "/school/courses", data=form, headers=DATASTAR
+        )
+        course_id = created_id(code)
+        if course_id is None:
+            return
+        url = f"/school/courses/{course_id}"
+        await timed_request(client, recorders["read"], "GET", url, headers=DATASTAR)
+        form["title"] += " (updated)"
+        await timed_request(client, recorders["update"], "PUT", url, data=form, headers=DATASTAR)
+        await timed_request(client, recorders["delete"], "DELETE", url, headers=DATASTAR)
+
+    wall = await run_clients(worker, args.clients, args.requests // 4, args.duration)
+    for recorder in recorders.values():
+        recorder.wall = wall
+    return {f"crud_{name}": recorder for name, recorder in recorders.items()}
+
+
+SCENARIOS = {"page": bench_page, "data": bench_data, "crud": bench_crud}
+
+
+def summarize(recorder: Recorder) -> Dict:
+    latencies = [seconds * 1000 for seconds in recorder.latencies]
+    if not latencies:
+        return {"requests": 0}
+    return {
+        "requests": len(latencies),
+        "errors": recorder.errors,
+        "statuses": {str(status): count for status, count in sorted(recorder.statuses.items())},
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "max_ms": round(max(latencies), 3),
+        "throughput_rps": round(len(latencies) / recorder.wall, 2) if recorder.wall else 0.0,
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+def git_revision() -> Dict:
+    def git(*command):
+        result = subprocess.run(["git", *command], capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else ""
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or "unknown",
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+async def run(args) -> Dict:
+    import httpx
+
+    import main
+    from src.db import db_school, db_spin
+
+    transport = httpx.ASGITransport(app=main.app, client=("127.0.0.1", 50000))
+    results = []
+    for size in args.sizes:
+        rows = parse_size(size)
+        school_path, spin_path = seed_databases(rows, args.seed, args.data_dir)
+        # The db modules read the URL on every connect
+        db_school.SCHOOL_DB_URL = str(school_path)
+        db_spin.SPIN_DB_URL = str(spin_path)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.get("/school/courses/data", headers=DATASTAR)  # warm up caches
+            for scenario in args.scenarios:
+                for name, recorder in (await SCENARIOS[scenario](client, args)).items():
+                    summary = {"rows": rows, "scenario": name, **summarize(recorder)}
+                    results.append(summary)
+                    print(format_summary(summary))
+
+    return {
+        **git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "clients": args.clients,
+            "requests": args.requests,
+            "duration": args.duration,
+            "seed": args.seed,
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "results": results,
+    }
+
+
+def format_summary(summary: Dict) -> str:
+    if not summary.get("requests"):
+        return f"{summary['rows']:>8} {summary['scenario']:<14} no requests"
+    return (
+        f"{summary['rows']:>8} {summary['scenario']:<14} n={summary['requests']:<5} "
+        f"p50={summary['p50_ms']:8.2f}ms p95={summary['p95_ms']:8.2f}ms "
+        f"p99={summary['p99_ms']:8.2f}ms {summary['throughput_rps']:8.1f} req/s "
+        f"errors={summary['errors']} rss={summary['rss_mb']}MB"
+    )
+
+
+def compare(baseline_path: Path, current_path: Path):
+    """Print the p95 and throughput change of each scenario between two result files"""
+    baseline, current = (
+        json.loads(Path(path).read_text()) for path in (baseline_path, current_path)
+    )
+    before = {(result["rows"], result["scenario"]): result for result in baseline["results"]}
+    print(f"{baseline['commit']} -> {current['commit']}")
+    for result in current["results"]:
+        old = before.get((result["rows"], result["scenario"]))
+        if not old or not old.get("requests") or not result.get("requests"):
+            continue
+        p95 = (result["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+        rps = (result["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100
+        print(
+            f"{result['rows']:>8} {result['scenario']:<14} "
+            f"p95 {old['p95_ms']:8.2f} -> {result['p95_ms']:8.2f}ms ({p95:+6.1f}%)  "
+            f"throughput {old['throughput_rps']:8.1f} -> {result['throughput_rps']:8.1f} "
+            f"({rps:+6.1f}%)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", default="1k", help="comma separated courses/students, e.g. 1k,100k,1m"
+    )
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="page, data, crud")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--duration", type=float, default=30, help="max seconds per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--output", type=Path, help="defaults to benchmarks/results/<commit>.json")
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        metavar="BASELINE",
+        help="compare the run (or --output) against a result file",
+    )
+    args = parser.parse_args()
+
+    if args.compare and args.output and args.output.exists():
+        compare(args.compare, args.output)
+        sys.exit()
+
+    args.sizes = args.sizes.split(",")
+    args.scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+    report = asyncio.run(run(args))
+
+    output = (
+        args.output or RESULTS_DIR / f"{report['commit']}{'-dirty' if report['dirty'] else ''}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"wrote {output}")
+    if args.compare:
+        compare(args.compare, output)
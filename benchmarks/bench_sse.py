@@ -0,0 +1,270 @@
+"""
+Load test of the SSE connection manager with thousands of concurrent streams.
+
+Starts the app in a uvicorn worker, opens `--clients` streams to
+/school/courses/stream (raw sockets, so the load generator stays cheap) and
+reports:
+
+- server memory per open stream (RSS growth divided by streams)
+- heartbeats reaching every stream within one heartbeat interval
+- fan-out latency of course changes (POST /school/courses) to all streams
+- drain on SIGTERM: streams that got the last event and time to exit
+
+    uv run python -m benchmarks.bench_sse --clients 5000 --publish 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from benchmarks.seed import DEFAULT_DATA_DIR, seed_databases
+
+STREAM = "/school/courses/stream"
+EVENT = b"event: datastar-merge-signals"
+HEARTBEAT = b": heartbeat"
+GOODBYE = b"Server restarting"
+
+
+class Client:
+    """One stream, read until the server closes it"""
+
+    __slots__ = ("events", "heartbeats", "goodbye", "received", "closed", "error")
+
+    def __init__(self):
+        self.events = 0
+        self.heartbeats = 0
+        self.goodbye = False
+        # Arrival time of each event
+        self.received: List[float] = []
+        self.closed: Optional[float] = None
+        self.error: Optional[str] = None
+
+    async def run(self, port: int, opened: asyncio.Event):
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {STREAM} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+            head = await reader.readuntil(b"\r\n\r\n")
+            if not head.startswith(b"HTTP/1.1 200"):
+                self.error = head.split(b"\r\n", 1)[0].decode()
+                return
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.error = type(e).__name__
+            return
+        finally:
+            opened.set()
+
+        tail = b""
+        try:
+            while chunk := await reader.read(65536):
+                data = tail + chunk
+                now = time.perf_counter()
+                # Markers may straddle reads, so count on the unseen part plus a tail
+                self.heartbeats += data.count(HEARTBEAT) - tail.count(HEARTBEAT)
+                events = data.count(EVENT) - tail.count(EVENT)
+                self.events += events
+                self.received.extend([now] * events)
+                self.goodbye = self.goodbye or GOODBYE in data
+                tail = data[-64:]
+        except OSError as e:
+            self.error = type(e).__name__
+        self.closed = time.perf_counter()
+        writer.close()
+
+
+def raise_file_limit(clients: int):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, clients * 2 + 256))
+    if wanted > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+    if wanted < clients + 256:
+        print(f"warning: open file limit {wanted} is too low for {clients} clients")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def start_server(args, port: int) -> subprocess.Popen:
+    school_path, spin_path = seed_databases(1000, 0, args.data_dir)
+    env = {
+        **os.environ,
+        "SCHOOL_DB_URL": str(school_path),
+        "SPIN_DB_URL": str(spin_path),
+        "TAILWIND_MODE": "off",
+        "REQUEST_LOG_SAMPLE_RATE": "0",
+        "SLOW_QUERY_MS": "inf",
+        "SSE_HEARTBEAT_SECONDS": str(args.heartbeat),
+        "SSE_MAX_CONNECTIONS": str(max(args.clients, 10_000)),
+    }
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+        "--log-level", "warning", "--backlog", str(max(2048, args.clients)),
+        "--timeout-graceful-shutdown", "30",
+    ]  # fmt: skip
+    return subprocess.Popen(command, env=env)
+
+
+async def request(port: int, method: str, path: str, body: str = "") -> bytes:
+    """A minimal HTTP/1.1 request on its own connection, returning the response head"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    headers = f"{method} {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n"
+    if body:
+        headers += "Content-Type: application/x-www-form-urlencoded\r\n"
+        headers += f"Datastar-Request: true\r\nContent-Length: {len(body)}\r\n"
+    writer.write(f"{headers}\r\n{body}".encode())
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+async def wait_ready(port: int, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await request(port, "GET", "/admin/streams")).startswith(b"HTTP/1.1 200"):
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]  # noqa: E731
+    return {
+        "p50_ms": round(pick(50) * 1000, 2),
+        "p99_ms": round(pick(99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+async def run(args) -> dict:
+    port = free_port()
+    server = start_server(args, port)
+    report = {"clients": args.clients, "heartbeat_seconds": args.heartbeat}
+    try:
+        await wait_ready(port)
+        await asyncio.sleep(0.5)
+        baseline_kb = rss_kb(server.pid)
+
+        # Open the streams in batches, each waiting for its response headers
+        clients = [Client() for _ in range(args.clients)]
+        tasks = []
+        start = time.perf_counter()
+        for offset in range(0, args.clients, args.batch):
+            opened = []
+            for client in clients[offset : offset + args.batch]:
+                event = asyncio.Event()
+                opened.append(event)
+                tasks.append(asyncio.create_task(client.run(port, event)))
+            await asyncio.gather(*(event.wait() for event in opened))
+        report["connect_seconds"] = round(time.perf_counter() - start, 2)
+        failed = [client.error for client in clients if client.error]
+        report["failed"] = len(failed)
+        if failed:
+            print(f"{len(failed)} streams failed to open, e.g. {failed[0]}")
+
+        await asyncio.sleep(1)
+        open_kb = rss_kb(server.pid)
+        streams = args.clients - len(failed)
+        report["server_rss_mb"] = round(open_kb / 1024, 1)
+        report["kb_per_stream"] = round((open_kb - baseline_kb) / max(1, streams), 2)
+        print(
+            f"{streams} streams open in {report['connect_seconds']}s, server RSS "
+            f"{baseline_kb / 1024:.1f} -> {open_kb / 1024:.1f} MB "
+            f"({report['kb_per_stream']} KB/stream)"
+        )
+
+        # Every stream should see a heartbeat within an interval (plus a wheel tick)
+        await asyncio.sleep(args.heartbeat + 1.5)
+        live = [client for client in clients if not client.error]
+        report["heartbeat_coverage"] = round(
+            sum(client.heartbeats > 0 for client in live) / max(1, len(live)), 4
+        )
+        print(f"heartbeats reached {report['heartbeat_coverage']:.1%} of the streams")
+
+        # Fan-out: each course change reaches every stream
+        latencies = []
+        for i in range(args.publish):
+            sent = time.perf_counter()
+            # Course codes are at most 10 characters
+            form = f"code=SSE{os.getpid() % 1000:03d}-{i}&title=SSE+benchmark&active=true"
+            await request(port, "POST", "/school/courses", form)
+            deadline = sent + 30
+            while time.perf_counter() < deadline and any(
+                client.events <= i for client in live if client.closed is None
+            ):
+                await asyncio.sleep(0.01)
+            latencies.extend(
+                client.received[i] - sent for client in live if len(client.received) > i
+            )
+        report["fanout"] = percentiles(latencies)
+        report["events_delivered"] = len(latencies)
+        if args.publish:
+            print(
+                f"fan-out of {args.publish} changes to {len(live)} streams: "
+                f"{report['events_delivered']} events, {report['fanout']}"
+            )
+        report["rss_after_mb"] = round(rss_kb(server.pid) / 1024, 1)
+
+        # Drain: SIGTERM ends every stream with a last event, then the server exits
+        start = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=60)
+        streams_closed = max((client.closed or start) for client in live) - start
+        server.wait(timeout=60)
+        report["drain"] = {
+            "streams_closed_seconds": round(streams_closed, 2),
+            "exit_seconds": round(time.perf_counter() - start, 2),
+            "goodbye": sum(client.goodbye for client in live),
+        }
+        print(
+            f"drained {report['drain']['goodbye']}/{len(live)} streams in "
+            f"{report['drain']['streams_closed_seconds']}s, server exited after "
+            f"{report['drain']['exit_seconds']}s"
+        )
+    finally:
+        if server.poll() is None:
+            server.kill()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=5000, help="concurrent streams")
+    parser.add_argument("--batch", type=int, default=500, help="streams opened at once")
+    parser.add_argument(
+        "--publish", type=int, default=5, help="course changes to fan out (at most 1000)"
+    )
+    parser.add_argument("--heartbeat", type=float, default=5, help="SSE_HEARTBEAT_SECONDS")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--output", type=Path, help="write the report as JSON")
+    args = parser.parse_args()
+
+    raise_file_limit(args.clients)
+    report = asyncio.run(run(args))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"wrote {args.output}")
@@ -0,0 +1,171 @@
+"""
+Benchmark of the teacher staffing optimizer of src/spin/staffing.py.
+
+On synthetic ratings, 500 teachers x 2000 courses by default (each teacher
+rating some courses 1-5), for each number of classes (courses drawn among the
+rated ones, timeslots over a week of six daily slots, some running into the
+next): the time to build the rating matrix, the rounds and time of the
+optimizer, its total rating and bound, next to staffing greedily by rating.
+Every proposal is checked for the load limit and overlapping classes:
+
+    uv run python -m benchmarks.bench_staffing --classes 2k,5k,10k --output staffing.json
+"""
+
+import argparse
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.seed import parse_size
+from src.db.synthetic import RATING_WEIGHTS
+from src.spin import staffing
+from src.spin.conflicts import WEEKDAYS
+
+STARTS = ["09:00", "10:30", "12:40", "14:10", "15:40", "17:10"]
+
+
+def synthetic_ratings(args, rng) -> pd.DataFrame:
+    teachers = np.repeat(np.arange(args.teachers), args.rated)
+    courses = np.concatenate(
+        [rng.choice(args.courses, args.rated, replace=False) for _ in range(args.teachers)]
+    )
+    return pd.DataFrame(
+        {
+            "teacher_id": teachers.astype(str),
+            "course_id": courses.astype(str),
+            "rating": rng.choice(np.arange(1, 6), len(teachers), p=RATING_WEIGHTS),
+        }
+    )
+
+
+def synthetic_classes(count: int, ratings: pd.DataFrame, rng) -> pd.DataFrame:
+    """class_view-like rows, of rated courses, with a timeslot label and no teacher"""
+    days = rng.choice(list(WEEKDAYS)[:5], count)
+    starts = rng.choice(STARTS, count)
+    lengths = rng.choice([80, 80, 80, 110], count)
+    minutes = [
+        int(start[:2]) * 60 + int(start[3:]) + length for start, length in zip(starts, lengths)
+    ]
+    return pd.DataFrame(
+        {
+            "id": [str(uuid.UUID(int=int(number))) for number in rng.integers(1, 2**63, count)],
+            "title": [f"Class {number}" for number in range(count)],
+            "course_code": None,
+            "course_id": rng.choice(ratings["course_id"].unique(), count),
+            "timeslot": [
+                f"{day}: {start} - {end // 60:02d}:{end % 60:02d}"
+                for day, start, end in zip(days, starts, minutes)
+            ],
+            "teacher_name": None,
+            "teacher_id": None,
+            "weekday": None,
+            "start_time": None,
+            "end_time": None,
+        }
+    )
+
+
+def greedy(problem: staffing.Staffing, max_load: int) -> np.ndarray:
+    """Best rated options first, while the teacher has room and is free then"""
+    option_class, option_teacher, option_rating = staffing.class_options(problem)
+    option_seat = staffing.teacher_seats(problem, option_class, option_teacher)
+    none = np.empty(0, np.int64)
+    return staffing.repair(
+        problem, option_class, option_teacher, option_rating, option_seat, none, max_load
+    )
+
+
+def feasible(problem: staffing.Staffing, class_teacher: np.ndarray, max_load: int) -> bool:
+    staffed = np.flatnonzero(class_teacher >= 0)
+    teacher = class_teacher[staffed]
+    # By teacher and start: a class overlaps an earlier one of its teacher when
+    # it starts before the latest end among them
+    order = staffed[np.lexsort((problem.class_start[staffed], teacher))]
+    teachers, starts = class_teacher[order], problem.class_start[order]
+    reach = pd.Series(problem.class_end[order]).groupby(teachers).cummax().to_numpy()
+    overlapping = (teachers[1:] == teachers[:-1]) & (starts[1:] >= 0) & (starts[1:] < reach[:-1])
+    return bool(
+        (np.bincount(teacher, minlength=1).max(initial=0) <= max_load)
+        and not overlapping.any()
+        and (problem.ratings[teacher, problem.class_course[staffed]] > 0).all()
+    )
+
+
+def run(args) -> List[Dict]:
+    results = []
+    rng = np.random.default_rng(args.seed)
+    teachers = pd.DataFrame(
+        {
+            "id": np.arange(args.teachers).astype(str),
+            "name": [f"Teacher {n}" for n in range(args.teachers)],
+        }
+    )
+    courses = pd.DataFrame({"id": np.arange(args.courses).astype(str)})
+    ratings = synthetic_ratings(args, rng)
+    for size in args.classes:
+        count = parse_size(size)
+        classes = synthetic_classes(count, ratings, rng)
+        start = time.perf_counter()
+        problem = staffing.build_staffing(teachers, courses, ratings, classes)
+        build_ms = round((time.perf_counter() - start) * 1000, 3)
+
+        start = time.perf_counter()
+        for step in staffing.optimize(problem, args.max_load, rounds=args.rounds):
+            pass
+        optimize_ms = round((time.perf_counter() - start) * 1000, 3)
+        proposal = step["proposal"]
+
+        start = time.perf_counter()
+        baseline = greedy(problem, args.max_load)
+        greedy_ms = round((time.perf_counter() - start) * 1000, 3)
+        greedy_rating = staffing.total_rating(problem, baseline)
+
+        result = {
+            "teachers": args.teachers,
+            "courses": args.courses,
+            "classes": count,
+            "max_load": args.max_load,
+            "build_ms": build_ms,
+            "rounds": proposal.rounds,
+            "optimize_ms": optimize_ms,
+            "rating": proposal.rating,
+            "bound": proposal.bound,
+            "gap": step["gap"],
+            "staffed": step["staffed"],
+            "greedy_ms": greedy_ms,
+            "greedy_rating": greedy_rating,
+            "feasible": feasible(problem, proposal.class_teacher, args.max_load)
+            and feasible(problem, baseline, args.max_load),
+        }
+        results.append(result)
+        print(
+            f"classes={count:<7} matrix {build_ms:8.2f}ms  optimize {optimize_ms:9.2f}ms "
+            f"({proposal.rounds} rounds)  rating {proposal.rating} of at most {proposal.bound} "
+            f"(gap {step['gap']:.2%})  greedy {greedy_rating} in {greedy_ms:.2f}ms  "
+            f"{'feasible' if result['feasible'] else 'INFEASIBLE'}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--teachers", type=int, default=500)
+    parser.add_argument("--courses", type=int, default=2000)
+    parser.add_argument("--rated", type=int, default=40, help="courses rated per teacher")
+    parser.add_argument("--classes", default="2k,5k,10k", help="comma separated class counts")
+    parser.add_argument("--max-load", type=int, default=staffing.MAX_LOAD)
+    parser.add_argument("--rounds", type=int, default=staffing.ROUNDS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+    args.classes = args.classes.split(",")
+
+    results = run(args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"wrote {args.output}")
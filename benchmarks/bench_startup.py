@@ -0,0 +1,86 @@
+"""
+Startup time of the app with and without the skip-if-unchanged Tailwind build.
+
+Each run starts a fresh interpreter, imports `main` and enters the lifespan,
+against a scratch copy of static/ so the committed output.css is untouched.
+
+    uv run python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CHILD = """
+import asyncio, json, os, sys, time
+start = time.perf_counter()
+import main
+from init import static_files
+static_files.directory = os.environ["BENCH_STATIC_DIR"]
+imported = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+timings = {"import": imported - start, "lifespan": ready - imported, "total": ready - start}
+print(json.dumps(timings))
+"""
+
+SCENARIOS = {
+    # The previous behaviour: the compiler runs on every start
+    "always compile": {"TAILWIND_MODE": "build", "BENCH_FORCE": "1"},
+    "skip if unchanged": {"TAILWIND_MODE": "build"},
+    "ahead of time (off)": {"TAILWIND_MODE": "off"},
+}
+
+
+def run_child(static_dir: str, env_overrides: dict) -> dict:
+    if env_overrides.get("BENCH_FORCE"):
+        # Drop the stamp so the build has to run
+        stamp = os.path.join(static_dir, "output.css.inputs")
+        if os.path.exists(stamp):
+            os.remove(stamp)
+    env = {**os.environ, **env_overrides, "BENCH_STATIC_DIR": static_dir}
+    env.setdefault("SCHOOL_DB_URL", "data/eftk.duckdb")
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        static_dir = os.path.join(tmp, "static")
+        shutil.copytree("static", static_dir)
+
+        results = {}
+        for name, env_overrides in SCENARIOS.items():
+            run_child(static_dir, env_overrides)  # warm up (and write the stamp)
+            runs = [run_child(static_dir, env_overrides) for _ in range(args.runs)]
+            results[name] = {
+                key: statistics.median(run[key] * 1000 for run in runs)
+                for key in ("import", "lifespan", "total")
+            }
+            print(
+                f"{name:>20}  import={results[name]['import']:7.1f}ms  "
+                f"lifespan={results[name]['lifespan']:7.1f}ms  "
+                f"total={results[name]['total']:7.1f}ms"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="Write the medians (ms) to this file")
+    main(parser.parse_args())
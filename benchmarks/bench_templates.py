@@ -0,0 +1,226 @@
+"""
+Micro-benchmark of the Jinja table templates.
+
+Renders `school/courses_table.html` (the data_table macro) and
+`components/entity_page.html` (page content around it) with synthetic items
+for several row counts and column mixes, one renderer type per mix:
+
+    text       plain {{ item[key] }} cells
+    boolean    checkbox cells
+    custom     cells rendered by an included template (course code formatter)
+    formatter  cells rendered by a Python formatter function
+    courses    the course table configuration (custom, text, boolean)
+
+Reports the median render time per cell (ns/cell) and the memory allocated by
+a render (tracemalloc peak, per cell), so template changes can be compared:
+
+    uv run python -m benchmarks.bench_templates --rows 100,1000 --output before.json
+    uv run python -m benchmarks.bench_templates --rows 100,1000 --compare before.json
+"""
+
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+TEMPLATES = {
+    "table": "school/courses_table.html",
+    "page": "components/entity_page.html",
+}
+
+CUSTOM_TEMPLATE = "school/formatters/course_code.html"
+
+
+def format_count(value) -> str:
+    return f"{value:,} seats"
+
+
+class NamedFormatter(str):
+    """
+    A formatter name, as TableConfig stores it, that templates can call.
+
+    The page serializes the table configuration with |tojson, which the name
+    survives; the table calls column.renderer.formatter(value).
+    """
+
+    def __new__(cls, function: Callable):
+        name = super().__new__(cls, function.__name__)
+        name.function = function
+        return name
+
+    def __call__(self, value):
+        return self.function(value)
+
+
+def column(key: str, type: str = "text", renderer: Dict = None) -> Dict:
+    """A column as the templates get it from TableConfig.dict()"""
+    return {
+        "key": key,
+        "label": key.capitalize(),
+        "sortable": True,
+        "filterable": True,
+        "visible": True,
+        "type": type,
+        "renderer": renderer,
+    }
+
+
+def column_mixes() -> Dict[str, List[Dict]]:
+    from src.school.table_models import get_courses_table_config
+
+    custom = {"type": "custom", "template": CUSTOM_TEMPLATE, "formatter": None}
+    formatter = {"type": "text", "template": None, "formatter": NamedFormatter(format_count)}
+    return {
+        "text": [column("code"), column("title"), column("note")],
+        "boolean": [column(key, "boolean") for key in ("active", "waitlist", "archived")],
+        "custom": [column(key, renderer=custom) for key in ("code", "title", "note")],
+        "formatter": [column(key, renderer=formatter) for key in ("seats", "enrolled", "waiting")],
+        "courses": get_courses_table_config().dict()["columns"],
+    }
+
+
+def make_items(rows: int) -> List[Dict]:
+    return [
+        {
+            "id": f"00000000-0000-4000-8000-{i:012d}",
+            "code": f"JLGR-{i:04d}",
+            "title": f"JLPT Grammar {i} (A1.3-B2)",
+            "note": "Bring the textbook" if i % 3 else "",
+            "active": i % 5 != 0,
+            "waitlist": i % 7 == 0,
+            "archived": False,
+            "seats": 12 + i % 13,
+            "enrolled": i % 25,
+            "waiting": i % 4,
+        }
+        for i in range(rows)
+    ]
+
+
+def make_context(items: List[Dict], columns: List[Dict]) -> Dict:
+    """The context prepare_table_context builds, for a Datastar (standalone) render"""
+    return {
+        "request": None,
+        "standalone": True,
+        "entity_name": "course",
+        "entity_title": "Courses",
+        "entity_title_singular": "Course",
+        "table_config": {"entity_name": "course", "columns": columns},
+        "table_template": TEMPLATES["table"],
+        "items": items,
+        "courses": items,
+        "filters": {},
+        "sort_by": "code",
+        "sort_asc": True,
+        "include_table": True,
+    }
+
+
+def time_render(render: Callable[[], str], min_time: float, max_repeats: int) -> List[float]:
+    render()  # compile and warm up includes
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < max_repeats and (len(timings) < 3 or time.perf_counter() < deadline):
+        start = time.perf_counter_ns()
+        render()
+        timings.append(time.perf_counter_ns() - start)
+    return timings
+
+
+def measure_allocations(render: Callable[[], str]) -> Dict[str, int]:
+    """Peak memory allocated during a render, and what is left after it (the output)"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        html = render()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_bytes": peak - before,
+        "retained_bytes": current - before,
+        "output_bytes": len(html),
+    }
+
+
+def run(args) -> List[Dict]:
+    from init import templates
+
+    mixes = column_mixes()
+    results = []
+    for template_key in args.templates:
+        template = templates.env.get_template(TEMPLATES[template_key])
+        for mix in args.mixes:
+            columns = mixes[mix]
+            for rows in args.rows:
+                context = make_context(make_items(rows), columns)
+
+                def render():
+                    return template.render(context)
+
+                timings = time_render(render, args.min_time, args.max_repeats)
+                allocations = measure_allocations(render)
+                cells = max(1, rows * len(columns))
+                median = statistics.median(timings)
+                result = {
+                    "template": template_key,
+                    "mix": mix,
+                    "rows": rows,
+                    "columns": len(columns),
+                    "repeats": len(timings),
+                    "median_ms": round(median / 1e6, 3),
+                    "ns_per_cell": round(median / cells, 1),
+                    "peak_bytes_per_cell": round(allocations["peak_bytes"] / cells, 1),
+                    **allocations,
+                }
+                results.append(result)
+                print(
+                    f"{template_key:<6} {mix:<10} rows={rows:<7} {result['median_ms']:10.3f}ms "
+                    f"{result['ns_per_cell']:10.1f} ns/cell "
+                    f"{result['peak_bytes_per_cell']:8.1f} B/cell peak "
+                    f"{allocations['output_bytes'] / 1024:9.1f} KiB out"
+                )
+    return results
+
+
+def compare(baseline: List[Dict], results: List[Dict]):
+    """Print the ns/cell and allocation change of each measurement against a baseline"""
+    before = {(r["template"], r["mix"], r["rows"]): r for r in baseline}
+    for result in results:
+        old = before.get((result["template"], result["mix"], result["rows"]))
+        if old is None:
+            continue
+        time_change = (result["ns_per_cell"] / old["ns_per_cell"] - 1) * 100
+        peak_change = (result["peak_bytes"] / max(1, old["peak_bytes"]) - 1) * 100
+        print(
+            f"{result['template']:<6} {result['mix']:<10} rows={result['rows']:<7} "
+            f"{old['ns_per_cell']:10.1f} -> {result['ns_per_cell']:10.1f} ns/cell "
+            f"({time_change:+6.1f}%) "
+            f"peak {peak_change:+6.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", default="10,100,1000,10000", help="comma separated row counts")
+    parser.add_argument("--mixes", default="text,boolean,custom,formatter,courses")
+    parser.add_argument("--templates", default=",".join(TEMPLATES), help="table, page")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per measurement")
+    parser.add_argument("--max-repeats", type=int, default=200)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--compare", type=Path, metavar="BASELINE", help="an earlier --output")
+    args = parser.parse_args()
+    args.rows = [int(rows) for rows in args.rows.split(",")]
+    args.mixes = args.mixes.split(",")
+    args.templates = args.templates.split(",")
+
+    results = run(args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"wrote {args.output}")
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), results)
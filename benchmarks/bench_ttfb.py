@@ -0,0 +1,102 @@
+"""
+Time-to-first-byte benchmark for full-page loads.
+
+Drives the ASGI app in-process (no network, no server) and measures when the
+first body bytes and the last body bytes of a full page leave the app. The
+streamed layout shell is compared against rendering the page in one piece.
+
+    uv run python -m benchmarks.bench_ttfb --db-delay-ms 50 --requests 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("SCHOOL_DB_URL", "data/eftk.duckdb")
+
+
+async def fetch(app, path: str):
+    """Run one GET request through the app and return (ttfb, total) in seconds"""
+    start = time.perf_counter()
+    first_byte = None
+    done = asyncio.Event()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 80),
+    }
+
+    async def receive():
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal first_byte
+        if message["type"] == "http.response.body":
+            if first_byte is None and message.get("body"):
+                first_byte = time.perf_counter()
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    end = time.perf_counter()
+    return first_byte - start, end - start
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args):
+    import main
+    from src.db import db_school
+    from src.web import shell
+
+    if args.db_delay_ms:
+        # Simulate a slower database so the overlap is visible
+        get_all = db_school.get_all
+
+        def slow_get_all(table_name):
+            time.sleep(args.db_delay_ms / 1000)
+            return get_all(table_name)
+
+        db_school.get_all = slow_get_all
+
+    can_stream = shell.can_stream
+    for mode in ("buffered", "streamed"):
+        shell.can_stream = can_stream if mode == "streamed" else (lambda template: False)
+        await fetch(main.app, args.path)  # warm up template and shell caches
+
+        ttfbs, totals = [], []
+        for _ in range(args.requests):
+            ttfb, total = await fetch(main.app, args.path)
+            ttfbs.append(ttfb * 1000)
+            totals.append(total * 1000)
+
+        print(
+            f"{mode:>9}  ttfb p50={statistics.median(ttfbs):7.2f}ms "
+            f"p95={percentile(ttfbs, 95):7.2f}ms   "
+            f"total p50={statistics.median(totals):7.2f}ms p95={percentile(totals, 95):7.2f}ms"
+        )
+    shell.can_stream = can_stream
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--path", default="/school/courses")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--db-delay-ms", type=float, default=0)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,101 @@
+"""
+Import-time profile of the application entry point, with a startup budget.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter, prints the
+slowest modules (cumulative and self time), and fails (exit code 1) when:
+  - the median cold import of `main` exceeds the budget, or
+  - a heavy module (duckdb, pandas, numpy, ...) is imported at startup
+    instead of on first use.
+
+    uv run python -m benchmarks.profile_startup --top 20 --budget-ms 800
+
+tests/test_startup.py runs the same two checks as part of the test suite.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold import budget for `import main`, in milliseconds
+STARTUP_BUDGET_MS = 800
+
+# Modules that must only load on the first request that needs them
+DEFERRED_MODULES = ("duckdb", "pandas", "numpy", "pyarrow")
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("SCHOOL_DB_URL", "data/eftk.duckdb")
+    return env
+
+
+def import_profile():
+    """Parse -X importtime output into (module, self_us, cumulative_us) rows"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=child_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def cold_start_ms(runs: int) -> float:
+    """Median wall time of `import main` in a fresh interpreter"""
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            env=child_env(),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]) * 1000)
+    return statistics.median(timings)
+
+
+def main(args) -> int:
+    rows = import_profile()
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module (top {args.top} by cumulative time)")
+    for module, self_us, cumulative_us in sorted(rows, key=lambda r: -r[2])[: args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {module}")
+
+    failures = []
+    imported = {module for module, _, _ in rows}
+    eager = [module for module in DEFERRED_MODULES if module in imported]
+    if eager:
+        failures.append(f"imported at startup instead of on first use: {', '.join(eager)}")
+
+    started = time.perf_counter()
+    median_ms = cold_start_ms(args.runs)
+    print(
+        f"\ncold import of main: {median_ms:.1f}ms median of {args.runs} runs "
+        f"(budget {args.budget_ms:.0f}ms, measured in {time.perf_counter() - started:.1f}s)"
+    )
+    if median_ms > args.budget_ms:
+        failures.append(f"cold start {median_ms:.1f}ms exceeds the {args.budget_ms:.0f}ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""
+Seeded school and SPIN databases for the benchmarks.
+
+A size of N rows is a school with N courses (what the courses pages go
+through) and N students, the other tables scaled along (see src/db/synthetic.py).
+The same size and seed always produce the same databases. Files are cached by
+size and seed.
+
+    uv run python -m benchmarks.seed --rows 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Tuple
+
+from src.db.synthetic import Sizes, generate, write_database
+
+DEFAULT_DATA_DIR = Path(tempfile.gettempdir()) / "datastar-bench"
+
+
+def parse_size(size: str) -> int:
+    """Parse a row count such as 1000, 1k or 1m"""
+    size = size.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(size[-1:], 1)
+    return int(float(size.rstrip("km")) * multiplier)
+
+
+def seed_paths(rows: int, seed: int, data_dir: Path = DEFAULT_DATA_DIR) -> Tuple[Path, Path]:
+    """Paths of the (school, spin) databases for a size and seed"""
+    return data_dir / f"school-{rows}-{seed}.duckdb", data_dir / f"spin-{rows}-{seed}.duckdb"
+
+
+def seed_databases(
+    rows: int, seed: int = 0, data_dir: Path = DEFAULT_DATA_DIR, force: bool = False
+) -> Tuple[Path, Path]:
+    """
+    Create the seeded databases unless they are cached already.
+
+    Args:
+        rows: Number of courses and of students
+        seed: Seed of the generated values
+        data_dir: Directory of the database files
+        force: Rebuild cached databases
+
+    Returns:
+        The paths of the school and spin databases
+    """
+    school_path, spin_path = seed_paths(rows, seed, data_dir)
+    if school_path.exists() and spin_path.exists() and not force:
+        return school_path, spin_path
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    generated = generate(sizes_for_rows(rows), seed)
+    build(school_path, "school", generated["school"])
+    build(spin_path, "spin", generated["spin"])
+    return school_path, spin_path
+
+
+def sizes_for_rows(rows: int) -> Sizes:
+    """A school with `rows` students, and as many courses for the courses pages"""
+    return replace(Sizes.scaled(rows / Sizes().students), courses=rows)
+
+
+def build(path: Path, database: str, tables):
+    # Build next to the target and rename, so an interrupted seed is never reused
+    partial = path.with_suffix(".partial")
+    partial.unlink(missing_ok=True)
+    write_database(partial, database, tables)
+    os.replace(partial, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", default="1k", help="courses and students (1000, 1k, 1m)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--force", action="store_true", help="rebuild cached databases")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = seed_databases(parse_size(args.rows), args.seed, args.data_dir, args.force)
+    print(f"seeded {', '.join(map(str, paths))} in {time.perf_counter() - start:.1f}s")
@@ -1,28 +1,53 @@
+import asyncio
+
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from src.utils import is_datastar
-from fastapi_tailwind import tailwind
 from contextlib import asynccontextmanager
 from templates.layout.menu_data import NAV_DATA
 from starlette.middleware.cors import CORSMiddleware
+from src.instrumentation import TimingMiddleware
+from src.instrumentation.memory import MemoryMiddleware
+from src.web.compression import CompressionMiddleware
+from src.web.sse import manager as sse_manager
+from src.db.changes import change_bus
+from src.web.assets import StaticAssets, static_url
+from src.web.tailwind import build_stylesheet, tailwind_mode
 
 
-static_files = StaticFiles(directory="static")
+# Serves fingerprinted URLs (static_url in templates) with immutable caching
+static_files = StaticAssets(directory="static")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # YAY, our tailwind get's compiled here! 😄
-    process = tailwind.compile(
-        static_files.directory + "/output.css",
-        tailwind_stylesheet_path=static_files.directory + "/input.css",
-    )
+    # YAY, our tailwind get's compiled here! 😄 (see TAILWIND_MODE in src/web/tailwind.py)
+    output_path = static_files.directory + "/output.css"
+    input_path = static_files.directory + "/input.css"
+    process = None
+
+    mode = tailwind_mode()
+    if mode == "watch":
+        from fastapi_tailwind import tailwind
+
+        process = tailwind.compile(output_path, tailwind_stylesheet_path=input_path, watch=True)
+    elif mode == "build":
+        # Reuses output.css when nothing changed; only one worker compiles
+        await asyncio.to_thread(build_stylesheet, output_path, input_path)
+
+    # End open SSE streams on SIGTERM/SIGINT, or the server waits for them to time out
+    sse_manager.install_signal_handlers()
+    # Hear the changes other workers make to the databases
+    change_bus.start()
 
     yield  # The code after this is called on shutdown.
 
-    process.terminate()  # We must terminate the compiler on shutdown to
-    # prevent multiple compilers running in development mode or when watch is enabled.
+    await sse_manager.drain()
+    change_bus.stop()
+
+    if process is not None:
+        process.terminate()  # We must terminate the compiler on shutdown to
+        # prevent multiple compilers running in development mode or when watch is enabled.
 
 
 # app and templates shared across the project
@@ -38,6 +63,7 @@ app.mount("/static", static_files, name="static")
 
 # Add global context data to all templates
 templates.env.globals["menu_data"] = NAV_DATA
+templates.env.globals["static_url"] = static_url
 
 
 # Add CORS middleware
@@ -48,3 +74,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+# Compress pages and SSE streams (flushed per event)
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+# Allocation profiling per route, off until enabled at /admin/memory
+app.add_middleware(MemoryMiddleware)
+
+# Outermost: time the whole request and send Server-Timing headers
+app.add_middleware(TimingMiddleware)
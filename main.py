@@ -5,10 +5,24 @@ from fastapi.responses import HTMLResponse
 from datastar_py.responses import DatastarFastAPIResponse
 
 from src.school import router as school_router
+from src.admin import router as admin_router
+from src.spin.demand_routes import router as spin_router
+from src.spin.roster_routes import router as roster_router
+from src.spin.ingest_routes import router as ingest_router
+from src.spin.class_routes import router as class_router
+from src.spin.staffing_routes import router as staffing_router
+from src.instrumentation.metrics_routes import router as metrics_router
 
 
 # Include routes from other modules
 app.include_router(school_router)
+app.include_router(admin_router)
+app.include_router(spin_router)
+app.include_router(roster_router)
+app.include_router(ingest_router)
+app.include_router(class_router)
+app.include_router(staffing_router)
+app.include_router(metrics_router)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+
+from src.admin.admin_routes import router as admin_routes_router
+
+# Create a main router for the admin module
+router = APIRouter()
+
+# Include all admin routes
+router.include_router(admin_routes_router)
@@ -0,0 +1,86 @@
+"""
+Admin routes, only reachable from the host the app runs on
+"""
+
+from fastapi import APIRouter, Depends, Query, Request
+
+from init import templates
+from src.instrumentation import aggregator
+from src.instrumentation.memory import profiler
+from src.utils import require_local_client, response_adapter
+from src.web.compression import compression_stats
+from src.web.sse import manager as sse_manager
+
+# Create router for admin module
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_local_client)])
+
+
+@router.get("/compression")
+async def get_compression_report():
+    """Bytes saved by response compression, per route"""
+    return compression_stats.report()
+
+
+@router.get("/streams")
+async def get_streams_report():
+    """Open SSE streams per topic and events waiting to be sent"""
+    return sse_manager.stats()
+
+
+@router.get("/timings")
+async def get_timings_report():
+    """Count, average and maximum duration per span (db, model, context, render, request)"""
+    return aggregator.report()
+
+
+@router.get("/memory")
+async def get_memory_report():
+    """Peak traced memory and top allocation sites per route, while profiling is on"""
+    return profiler.report()
+
+
+@router.post("/memory")
+async def set_memory_profiling(
+    enabled: bool = Query(..., description="Start or stop tracemalloc"),
+    frames: int = Query(1, ge=1, le=50, description="Traceback frames per allocation"),
+    top: int = Query(10, ge=1, le=100, description="Allocation sites kept per route"),
+):
+    """Switch allocation profiling on or off"""
+    if enabled:
+        profiler.enable(frames, top)
+    else:
+        profiler.disable()
+    return profiler.report()
+
+
+@router.delete("/memory")
+async def reset_memory_report():
+    """Forget the measurements collected so far"""
+    profiler.reset()
+    return profiler.report()
+
+
+@router.get("/slow-queries")
+async def get_slow_queries_page(
+    request: Request,
+    order_by: str = Query("total", pattern="^(total|count|avg|max|rows)$"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Worst offenders of the slow-query log, with their EXPLAIN ANALYZE profiles"""
+    # Import here so the data layer stays out of startup (see src.db)
+    from src.db.slow_queries import slow_query_log
+
+    queries = slow_query_log.worst(order_by, limit)
+    return response_adapter(
+        request=request,
+        template_name="admin/slow_queries.html",
+        context={
+            "queries": queries,
+            "order_by": order_by,
+            "order_columns": ("count", "total", "avg", "max", "rows"),
+            "threshold_ms": slow_query_log.threshold * 1000,
+            "explain_rate": slow_query_log.explain_rate,
+        },
+        templates=templates,
+        url="/admin/slow-queries",
+    )
@@ -1,6 +1,6 @@
 """
 Database module for the application
-"""
 
-from src.db.db_school import *
-from src.db.db_spin import *
\ No newline at end of file
+Submodules are imported explicitly (`from src.db import db_school`) so that
+importing the package doesn't load duckdb; routers use `lazy_import`.
+"""
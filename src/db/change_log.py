@@ -0,0 +1,341 @@
+"""
+Change-data-capture log of the school and SPIN databases.
+
+Every create/update/delete made through db_school/db_spin appends a row to the
+`change_log` table of its database, in the same transaction as the change:
+
+    seq         BIGINT     increasing per database (with gaps)
+    table_name  VARCHAR
+    row_id      VARCHAR
+    op          VARCHAR    insert, update or delete
+    columns     VARCHAR[]  columns written (NULL for deletes)
+    changed_at  TIMESTAMP
+
+Consumers (caches, SSE, MotherDuck sync) keep the last sequence number they
+handled and read what changed since, instead of diffing tables:
+
+    changes, cursor = db_school.read_changes(cursor)
+
+Sequence numbers are taken when an entry is written, not when its transaction
+commits, so a transaction can commit an entry below one already visible. The
+cursors handed out therefore stop below the first sequence number of any
+logged transaction still open (`committed`): every entry up to a cursor is
+committed, and a consumer never skips one. DuckDB lets one process at a time
+open a database file for writing, so the open transactions are tracked in it.
+
+Every CHANGE_LOG_COMPACT_EVERY logged writes the writer compacts the log on
+its connection, after committing: entries
+older than the newest CHANGE_LOG_KEEP are collapsed to one per row, holding
+the net effect with the latest sequence number (deleted rows stay deletes,
+updates merge their columns, an insert followed by updates stays an insert).
+A consumer reading from an old cursor still learns about every row whose
+state changed, so it should treat inserts and updates alike (as upserts).
+"""
+
+import logging
+import os
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+COMPACT_EVERY = int(os.environ.get("CHANGE_LOG_COMPACT_EVERY", 1000))
+KEEP = int(os.environ.get("CHANGE_LOG_KEEP", 10_000))
+
+OPS = ("insert", "update", "delete")
+
+CHANGE_LOG_DDL = (
+    "CREATE SEQUENCE IF NOT EXISTS change_log_seq",
+    """
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq BIGINT NOT NULL DEFAULT nextval('change_log_seq'),
+        table_name VARCHAR NOT NULL,
+        row_id VARCHAR,
+        op VARCHAR NOT NULL,
+        columns VARCHAR[],
+        changed_at TIMESTAMP NOT NULL DEFAULT current_timestamp
+    )
+    """,
+)
+
+# The last sequence number handed out, by any transaction (sequences aren't transactional)
+SEQUENCE_SQL = """
+    SELECT coalesce(last_value, 0) FROM duckdb_sequences()
+    WHERE sequence_name = 'change_log_seq'
+        AND database_name = current_database() AND schema_name = current_schema()
+"""
+
+# Cursor per table kept up to date from the log: the last entry it reflects
+CURSOR_DDL = """
+    CREATE TABLE IF NOT EXISTS materialized_view (
+        name VARCHAR PRIMARY KEY,
+        seq BIGINT NOT NULL,
+        refreshed_at TIMESTAMP NOT NULL DEFAULT current_timestamp
+    )
+"""
+
+# Net effect per row of the entries up to a sequence number
+COMPACT_STATEMENTS = (
+    """
+    CREATE OR REPLACE TEMP TABLE compacted AS
+    SELECT
+        max(seq) AS seq,
+        table_name,
+        row_id,
+        CASE
+            WHEN arg_max(op, seq) = 'delete' THEN 'delete'
+            WHEN arg_min(op, seq) = 'insert' THEN 'insert'
+            ELSE 'update'
+        END AS op,
+        list_distinct(flatten(list(columns) FILTER (WHERE columns IS NOT NULL))) AS columns,
+        max(changed_at) AS changed_at
+    FROM change_log
+    WHERE seq <= $upto
+    GROUP BY table_name, row_id
+    """,
+    "DELETE FROM change_log WHERE seq <= $upto",
+    """
+    INSERT INTO change_log
+    SELECT
+        seq, table_name, row_id, op,
+        CASE WHEN op = 'delete' THEN NULL ELSE list_sort(columns) END,
+        changed_at
+    FROM compacted
+    """,
+    "DROP TABLE compacted",
+)
+
+
+class LoggedChange(NamedTuple):
+    seq: int
+    table: str
+    id: Optional[str]
+    op: str
+    columns: Optional[List[str]]
+
+
+def ensure_change_log(con):
+    for statement in CHANGE_LOG_DDL:
+        con.execute(statement)
+
+
+def rollback(con):
+    try:
+        con.execute("ROLLBACK")
+    except Exception:  # a failed COMMIT already ended the transaction
+        pass
+
+
+def read_cursor(con, name: str) -> Optional[int]:
+    """The cursor stored for a materialized table, None if it was never built"""
+    con.execute(CURSOR_DDL)
+    row = con.execute("SELECT seq FROM materialized_view WHERE name = ?", [name]).fetchone()
+    return None if row is None else row[0]
+
+
+def write_cursor(con, name: str, seq: int):
+    """Store the cursor of a materialized table, inside the transaction updating it"""
+    con.execute(
+        "INSERT OR REPLACE INTO materialized_view (name, seq, refreshed_at) "
+        "VALUES (?, ?, current_timestamp)",
+        [name, seq],
+    )
+
+
+class ChangeLog:
+    """Writes to the change log of one database and compacts it now and then"""
+
+    def __init__(self, database: str, connect: Callable):
+        self.database = database
+        self.connect = connect
+        self._writes = 0
+        self._lock = threading.Lock()
+        # Sequence number taken by each open transaction, below any of its entries
+        self._open: Dict[int, int] = {}
+        self._tokens = itertools.count()
+
+    @contextmanager
+    def transaction(self, con):
+        """A transaction for a change and its log entry (see `record`)"""
+        ensure_change_log(con)
+        con.execute("BEGIN TRANSACTION")
+        try:
+            token = self._open_transaction(con)
+        except BaseException:
+            rollback(con)
+            raise
+        try:
+            yield con
+            con.execute("COMMIT")
+        except BaseException:
+            rollback(con)
+            raise
+        finally:
+            with self._lock:
+                del self._open[token]
+        if self._compaction_due():
+            try:
+                self.compact(con=con)
+            except Exception:  # the change itself is committed
+                logger.exception("Compacting the %s change log failed", self.database)
+
+    def record(
+        self, con, table: str, row_id, op: str, columns: Optional[Iterable[str]] = None
+    ) -> int:
+        """
+        Append a change to the log, inside the `transaction` making it.
+
+        Args:
+            con: The connection the change is made on
+            table: The table changed
+            row_id: Id of the row changed
+            op: insert, update or delete
+            columns: The columns written (None for deletes)
+
+        Returns:
+            The sequence number of the entry
+        """
+        if op not in OPS:
+            raise ValueError(f"Unknown change operation {op!r}")
+        return con.execute(
+            "INSERT INTO change_log (table_name, row_id, op, columns) "
+            "VALUES (?, ?, ?, ?) RETURNING seq",
+            [
+                table,
+                None if row_id is None else str(row_id),
+                op,
+                None if columns is None else sorted(columns),
+            ],
+        ).fetchone()[0]
+
+    def record_many(
+        self, con, table: str, ids_sql: str, op: str, columns: Optional[Iterable[str]] = None
+    ) -> Optional[int]:
+        """
+        Append an entry per row to the log, for a bulk change (see `record`).
+
+        Args:
+            con: The connection the change is made on
+            table: The table changed
+            ids_sql: Query returning the ids of the rows changed, in its first column
+            op: insert, update or delete
+            columns: The columns written (None for deletes)
+
+        Returns:
+            The highest sequence number in the log, None if no rows changed
+        """
+        if op not in OPS:
+            raise ValueError(f"Unknown change operation {op!r}")
+        added = con.execute(
+            "INSERT INTO change_log (table_name, row_id, op, columns) "
+            f"SELECT ?, ids.id::VARCHAR, ?, ? FROM ({ids_sql}) AS ids(id)",
+            [table, op, None if columns is None else sorted(columns)],
+        ).fetchone()[0]
+        if not added:
+            return None
+        return con.execute("SELECT max(seq) FROM change_log").fetchone()[0]
+
+    def read(self, since: int = 0, limit: int = 1000, tables: Optional[Iterable[str]] = None):
+        """
+        Changes after a sequence number, oldest first.
+
+        Args:
+            since: The cursor, the last sequence number already handled (0 for all)
+            limit: Maximum number of changes returned
+            tables: Only changes to these tables
+
+        Returns:
+            (changes, cursor): the changes, and the cursor to pass next time
+        """
+        sql = (
+            "SELECT seq, table_name, row_id, op, columns FROM change_log "
+            "WHERE seq > ? AND seq <= ?"
+        )
+        params = [since]
+        if tables is not None:
+            sql += " AND list_contains(?, table_name)"
+            params.append(list(tables))
+        sql += " ORDER BY seq LIMIT ?"
+        params.append(limit)
+        with self.connect() as con:
+            ensure_change_log(con)
+            params.insert(1, self.committed(con))
+            changes = [LoggedChange(*row) for row in con.execute(sql, params).fetchall()]
+        return changes, changes[-1].seq if changes else since
+
+    def latest(self) -> int:
+        """The cursor every committed change is read up to (see `committed`)"""
+        with self.connect() as con:
+            ensure_change_log(con)
+            return self.committed(con)
+
+    def committed(self, con) -> int:
+        """
+        The highest cursor below the entries of the logged transactions still open.
+
+        Every entry up to it is committed, so a consumer taking it before reading
+        the tables it keeps up to date sees all of them. Entries above it may be
+        read too; they are handled again from the next cursor.
+
+        Args:
+            con: Connection to the database, outside a transaction
+
+        Returns:
+            The cursor (0 if nothing was logged)
+        """
+        with self._lock:
+            seq = con.execute(SEQUENCE_SQL).fetchone()
+            seq = seq[0] if seq else 0
+            if self._open:
+                seq = min(seq, min(self._open.values()) - 1)
+        return seq
+
+    def compact(self, keep: int = KEEP, con=None) -> int:
+        """
+        Collapse the entries older than the newest `keep` to one per row.
+
+        Args:
+            keep: Number of recent entries left as they are
+            con: Connection to use, a new one by default
+
+        Returns:
+            The number of entries removed
+        """
+        if con is None:
+            with self.connect() as con:
+                return self.compact(keep, con)
+
+        ensure_change_log(con)
+        before, upto = con.execute(
+            "SELECT count(*), coalesce(max(seq), 0) - ? FROM change_log", [keep]
+        ).fetchone()
+        upto = min(upto, self.committed(con))
+        if upto <= 0:
+            return 0
+        con.execute("BEGIN TRANSACTION")
+        try:
+            for statement in COMPACT_STATEMENTS:
+                con.execute(statement, {"upto": upto} if "$upto" in statement else None)
+            con.execute("COMMIT")
+        except BaseException:
+            rollback(con)
+            raise
+        removed = before - con.execute("SELECT count(*) FROM change_log").fetchone()[0]
+        logger.info("Compacted the %s change log, %d entries removed", self.database, removed)
+        return removed
+
+    def _open_transaction(self, con) -> int:
+        with self._lock:
+            token = next(self._tokens)
+            self._open[token] = con.execute("SELECT nextval('change_log_seq')").fetchone()[0]
+        return token
+
+    def _compaction_due(self) -> bool:
+        with self._lock:
+            self._writes += 1
+            if self._writes < COMPACT_EVERY:
+                return False
+            self._writes = 0
+            return True
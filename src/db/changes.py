@@ -0,0 +1,197 @@
+"""
+Change notifications between the workers on one host.
+
+The db modules report every create/update/delete as a Change (database,
+table, id, version). Listeners in this worker hear it right away; the other
+workers (`uvicorn --workers N`) hear it over Unix datagram sockets, one per
+worker in CHANGE_BUS_DIR, so their caches and SSE streams don't go stale.
+No service to run: each worker binds `<pid>.sock` at startup and sends every
+change to the other sockets in the directory. Processes that write without
+listening (the CLIs: assignment, repair, ingest, staffing) send from an
+unbound socket, so the workers hear their changes too. Sockets of workers
+that died are removed by the first process that fails to reach them.
+
+Versions are the change-log sequence numbers of the database (see
+src/db/change_log.py), so they compare across workers;
+`change_bus.version(database, table)` is the latest change seen for a table,
+for caches keyed by version.
+
+    @change_bus.subscribe
+    def on_change(change: Change):
+        if change.table == "course":
+            ...
+
+Listeners run on the thread that made the change, or on the event loop for
+changes from other workers, and must not block.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import stat
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.instrumentation.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Workers of the same checkout share a directory unless CHANGE_BUS_DIR says otherwise
+DEFAULT_BUS_DIR = Path(tempfile.gettempdir()) / (
+    "datastar-changes-" + hashlib.sha1(os.getcwd().encode()).hexdigest()[:10]
+)
+
+# Datagrams are small JSON arrays, well below this
+MAX_DATAGRAM = 4096
+
+CHANGES = Counter(
+    "db_changes",
+    "Row changes by table, made by this worker (local) or heard from another (remote)",
+    ("database", "table", "origin"),
+)
+CHANGES_UNDELIVERED = Counter(
+    "db_changes_undelivered", "Change notifications a worker's socket buffer had no room for"
+)
+
+
+def check_directory(directory: Path):
+    """Raise PermissionError unless the directory is this user's and private to them"""
+    info = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or stat.S_IMODE(info.st_mode) != 0o700
+    ):
+        raise PermissionError(
+            f"Refusing change bus directory {directory}: it must be a directory owned by"
+            f" uid {os.getuid()} with mode 0o700, not uid {info.st_uid} with mode"
+            f" {oct(stat.S_IMODE(info.st_mode))}"
+        )
+
+
+class Change(NamedTuple):
+    database: str
+    table: str
+    id: Optional[str]
+    version: int
+
+
+class ChangeBus:
+    """Local and cross-worker fan-out of row changes"""
+
+    def __init__(self, directory: Path = DEFAULT_BUS_DIR):
+        self.directory = Path(directory)
+        self.listeners: List[Callable[[Change], None]] = []
+        self.versions: Dict[Tuple[str, str], int] = {}
+        self.sock: Optional[socket.socket] = None
+        self.path: Optional[Path] = None
+        # Sends the changes of a process that doesn't listen (not started)
+        self._sender: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener: Callable[[Change], None]) -> Callable[[Change], None]:
+        """Call `listener` with every change; returns it, to be used as a decorator"""
+        self.listeners.append(listener)
+        return listener
+
+    def start(self):
+        """Bind this worker's socket and read other workers' changes on the event loop"""
+        if self.sock is not None:
+            return
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        check_directory(self.directory)
+        self.path = self.directory / f"{os.getpid()}.sock"
+        self.path.unlink(missing_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(str(self.path))
+        sock.setblocking(False)
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(sock.fileno(), self._receive)
+        self.sock = sock
+
+    def stop(self):
+        if self.sock is None:
+            return
+        self._loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        self.path.unlink(missing_ok=True)
+
+    def notify(self, database: str, table: str, id: Optional[str], version: int) -> Change:
+        """Report a change made by this worker, to its listeners and the other workers"""
+        change = Change(database, table, None if id is None else str(id), version)
+        self._dispatch(change, "local")
+        self._send(json.dumps(change).encode())
+        return change
+
+    def version(self, database: str, table: str) -> int:
+        """Version of the latest change seen for a table (0 if none since startup)"""
+        return self.versions.get((database, table), 0)
+
+    def peers(self) -> List[Path]:
+        """Sockets of the other workers (none if the directory is not private)"""
+        try:
+            check_directory(self.directory)
+            return [path for path in self.directory.glob("*.sock") if path != self.path]
+        except PermissionError as e:
+            logger.warning("Change notifications not sent: %s", e)
+            return []
+        except OSError:
+            return []
+
+    def _send(self, data: bytes):
+        peers = self.peers()
+        if not peers:
+            return
+        sock = self.sock or self._sending_socket()
+        for peer in peers:
+            try:
+                sock.sendto(data, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker is gone, nobody reads this socket anymore
+                peer.unlink(missing_ok=True)
+            except BlockingIOError:
+                CHANGES_UNDELIVERED.inc()
+                logger.warning("Change notification to %s dropped, its buffer is full", peer.name)
+
+    def _sending_socket(self) -> socket.socket:
+        with self._lock:
+            if self._sender is None:
+                sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                sender.setblocking(False)
+                self._sender = sender
+            return self._sender
+
+    def _receive(self):
+        while True:
+            try:
+                data = self.sock.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                change = Change(*json.loads(data))
+            except (TypeError, ValueError):
+                logger.warning("Ignoring malformed change notification %r", data[:100])
+                continue
+            self._dispatch(change, "remote")
+
+    def _dispatch(self, change: Change, origin: str):
+        key = (change.database, change.table)
+        with self._lock:
+            if change.version > self.versions.get(key, 0):
+                self.versions[key] = change.version
+        CHANGES.labels(database=change.database, table=change.table, origin=origin).inc()
+        for listener in self.listeners:
+            try:
+                listener(change)
+            except Exception:
+                logger.exception("Change listener %r failed", listener)
+
+
+change_bus = ChangeBus(Path(os.environ.get("CHANGE_BUS_DIR", DEFAULT_BUS_DIR)))
@@ -4,6 +4,10 @@ import os
 import uuid
 from typing import Dict, Any, Union, TypeVar, Optional
 
+from src.db.change_log import ChangeLog
+from src.db.changes import change_bus
+from src.db.tracing import query_span
+
 load_dotenv()
 MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
 SCHOOL_DB_URL = os.getenv("SCHOOL_DB_URL")
@@ -37,32 +41,50 @@ def refresh_school_db(table_name: str):
 # refresh_school_db("user_profile")
 
 
+# Every create/update/delete is appended to the change_log table (src/db/change_log.py)
+change_log = ChangeLog("school", get_connection)
+
+
+def read_changes(since: int = 0, limit: int = 1000, tables=None):
+    """Changes after the `since` cursor, and the next cursor (see ChangeLog.read)"""
+    return change_log.read(since, limit, tables)
+
+
 def run(sql):
-    with get_connection() as con:
-        return con.sql(sql).df()
+    with get_connection() as con, query_span("school", "run", sql, con) as query:
+        df = con.sql(sql).df()
+        query.rows = len(df)
+        return df
 
 
 def get(table_name: str, id: str):
     sql = f"""SELECT *,
      FROM {table_name} WHERE id = '{str(id)}' """
     #  CAST(id as VARCHAR) as id FROM {table_name} WHERE id = '{str(id)}' """
-    with get_connection() as con:
-        return con.sql(sql).df()
+    with get_connection() as con, query_span("school", "get", sql, con) as query:
+        df = con.sql(sql).df()
+        query.rows = len(df)
+        return df
 
 
 def get_all(table_name: str):
     sql = f"FROM {table_name}"
 
-    with get_connection() as con:
+    with get_connection() as con, query_span("school", "get_all", sql, con) as query:
         df = con.sql(sql).df()
+        query.rows = len(df)
         # df["id"] = df["id"].astype(str)
     return df
 
 
 def get_all_active(table_name: str):
     sql = f"FROM {table_name} WHERE active = True"
-    with get_connection() as con:
+    with (
+        get_connection() as con,
+        query_span("school", "get_all_active", sql, con) as query,
+    ):
         df = con.sql(sql).df()
+        query.rows = len(df)
         df["id"] = df["id"].astype(str)
         return df
 
@@ -100,8 +122,14 @@ def update(table_name: str, data: Dict[str, Any]):
         WHERE id = '{str(id)}'
     """
 
-    with get_connection() as con:
+    with (
+        get_connection() as con,
+        query_span("school", "update", sql, con),
+        change_log.transaction(con),
+    ):
         result = con.sql(sql)
+        seq = change_log.record(con, table_name, id, "update", fields)
+    change_bus.notify("school", table_name, id, seq)
 
     return result
 
@@ -109,8 +137,14 @@ def update(table_name: str, data: Dict[str, Any]):
 def delete(table_name: str, id: str):
     sql = f"DELETE FROM {table_name} WHERE id='{str(id)}'"
 
-    with get_connection() as con:
+    with (
+        get_connection() as con,
+        query_span("school", "delete", sql, con),
+        change_log.transaction(con),
+    ):
         con.sql(sql)
+        seq = change_log.record(con, table_name, id, "delete")
+    change_bus.notify("school", table_name, id, seq)
 
     return "DELETED"
 
@@ -131,6 +165,7 @@ def create(table_name: str, data: Dict[str, Any] = {}):
 
     if not data:
         # If no data provided, just create with ID
+        columns = ["id"]
         sql = f"INSERT INTO {table_name} (id) VALUES ('{id}') RETURNING *"
     else:
         # Create with all fields from the data
@@ -152,7 +187,14 @@ def create(table_name: str, data: Dict[str, Any] = {}):
             RETURNING *
         """
 
-    with get_connection() as con:
+    with (
+        get_connection() as con,
+        query_span("school", "create", sql, con) as query,
+        change_log.transaction(con),
+    ):
         result = con.sql(sql).df().iloc[0]
+        query.rows = 1
+        seq = change_log.record(con, table_name, id, "insert", columns)
+    change_bus.notify("school", table_name, id, seq)
 
     return result
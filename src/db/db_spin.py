@@ -4,6 +4,10 @@ import uuid
 import duckdb
 from dotenv import load_dotenv
 
+from src.db.change_log import ChangeLog
+from src.db.changes import change_bus
+from src.db.tracing import query_span
+
 load_dotenv()
 # MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
 SPIN_DB_URL = os.getenv("SPIN_DB_URL")
@@ -29,32 +33,50 @@ def get_connection():
     return duckdb.connect(SPIN_DB_URL)
 
 
+# Every create/update/delete is appended to the change_log table (src/db/change_log.py)
+change_log = ChangeLog("spin", get_connection)
+
+
+def read_changes(since: int = 0, limit: int = 1000, tables=None):
+    """Changes after the `since` cursor, and the next cursor (see ChangeLog.read)"""
+    return change_log.read(since, limit, tables)
+
+
 def run(sql):
-    with get_connection() as con:
-        return con.sql(sql).df()
+    with get_connection() as con, query_span("spin", "run", sql, con) as query:
+        df = con.sql(sql).df()
+        query.rows = len(df)
+        return df
 
 
 def get(table_name: str, id: str):
     sql = f"""SELECT *,
      FROM {table_name} WHERE id = '{str(id)}' """
     #  CAST(id as VARCHAR) as id FROM {table_name} WHERE id = '{str(id)}' """
-    with get_connection() as con:
-        return con.sql(sql).df()
+    with get_connection() as con, query_span("spin", "get", sql, con) as query:
+        df = con.sql(sql).df()
+        query.rows = len(df)
+        return df
 
 
 def get_all(table_name: str):
     sql = f"FROM {table_name}"
 
-    with get_connection() as con:
+    with get_connection() as con, query_span("spin", "get_all", sql, con) as query:
         df = con.sql(sql).df()
+        query.rows = len(df)
         # df["id"] = df["id"].astype(str)
     return df
 
 
 def get_all_active(table_name: str):
     sql = f"FROM {table_name} WHERE active = True"
-    with get_connection() as con:
+    with (
+        get_connection() as con,
+        query_span("spin", "get_all_active", sql, con) as query,
+    ):
         df = con.sql(sql).df()
+        query.rows = len(df)
         df["id"] = df["id"].astype(str)
         return df
 
@@ -71,8 +93,14 @@ def update(table_name: str, data):
         WHERE id = '{str(id)}'
     """
     print("SQL:", sql)
-    with get_connection() as con:
+    with (
+        get_connection() as con,
+        query_span("spin", "update", sql, con),
+        change_log.transaction(con),
+    ):
         result = con.sql(sql)
+        seq = change_log.record(con, table_name, id, "update", fields)
+    change_bus.notify("spin", table_name, id, seq)
 
     return result
 
@@ -80,8 +108,14 @@ def update(table_name: str, data):
 def delete(table_name: str, id: str):
     sql = f"DELETE FROM {table_name} WHERE id='{str(id)}'"
 
-    with get_connection() as con:
+    with (
+        get_connection() as con,
+        query_span("spin", "delete", sql, con),
+        change_log.transaction(con),
+    ):
         con.sql(sql)
+        seq = change_log.record(con, table_name, id, "delete")
+    change_bus.notify("spin", table_name, id, seq)
 
     return "DELETED"
 
@@ -90,7 +124,14 @@ def create(table_name: str, data: dict = {}):
     id = uuid.uuid4()
     sql = f"INSERT INTO {table_name} (id) VALUES ('{id}') RETURNING *"
 
-    with get_connection() as con:
+    with (
+        get_connection() as con,
+        query_span("spin", "create", sql, con) as query,
+        change_log.transaction(con),
+    ):
         result = con.sql(sql).df().iloc[0]
+        query.rows = 1
+        seq = change_log.record(con, table_name, id, "insert", ["id"])
+    change_bus.notify("spin", table_name, id, seq)
 
     return result
@@ -0,0 +1,144 @@
+"""
+Memoization of derived datasets, per data version.
+
+A memoized function keeps its result per arguments for as long as the data
+version it was computed at is current. The version is whatever the `version`
+callable returns, usually the change-bus versions of the tables the data is
+derived from (see `table_version`), so a change made by any worker makes the
+next call recompute. Change notifications from other workers are datagrams
+that are dropped when a worker's socket buffer is full, so a result is also
+recomputed once it is MEMO_MAX_AGE_SECONDS old: a lost notification leaves
+data stale for that long at most.
+
+Safe across the threads serving requests: concurrent callers asking for the
+same arguments at the same version wait for one computation instead of all
+running it (no stampede), and a failed computation is not cached.
+
+    @memoize("survey_students", table_version("spin", "student"))
+    def students() -> pd.DataFrame:
+        ...
+
+Results are shared between callers, so they must not be modified.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+from typing import Any, Callable, Hashable, NamedTuple
+
+from src.db.changes import change_bus
+from src.instrumentation.metrics import record_cache
+
+# Arguments kept per memoized function, least recently used dropped first
+DEFAULT_MAX_ENTRIES = 32
+# Results older than this are recomputed even if no change was heard
+DEFAULT_MAX_AGE = int(os.environ.get("MEMO_MAX_AGE_SECONDS", 60))
+
+
+class Entry(NamedTuple):
+    version: Hashable
+    result: Future
+    # time.monotonic() when the computation started
+    started: float
+
+
+class VersionedMemo:
+    """Results of a function per arguments, each valid for one data version"""
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable,
+        version: Callable[[], Hashable],
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_age: float = DEFAULT_MAX_AGE,
+    ):
+        self.name = name
+        self.function = function
+        self.version = version
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: "OrderedDict[Hashable, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, *args, **kwargs) -> Any:
+        """The result for these arguments at the current version, computed if needed"""
+        key = (args, tuple(sorted(kwargs.items())))
+        version = self.version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            computing = (
+                entry is None
+                or entry.version != version
+                or (entry.result.done() and now - entry.started >= self.max_age)
+            )
+            if computing:
+                entry = Entry(version, Future(), now)
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+        record_cache(self.name, not computing)
+        if not computing:
+            # Done, or being computed by another thread
+            return entry.result.result()
+
+        try:
+            result = self.function(*args, **kwargs)
+        except BaseException as error:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            entry.result.set_exception(error)
+            raise
+        entry.result.set_result(result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def memoize(
+    name: str,
+    version: Callable[[], Hashable],
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    max_age: float = DEFAULT_MAX_AGE,
+):
+    """
+    Decorator memoizing a function per arguments and data version (see VersionedMemo).
+
+    Args:
+        name: Cache name, for the cache_requests metric
+        version: Returns the current data version
+        max_entries: Arguments kept
+        max_age: Seconds a result is kept at the same version
+
+    The decorated function has the memo as its `memo` attribute.
+    """
+
+    def decorate(function: Callable) -> Callable:
+        memo = VersionedMemo(name, function, version, max_entries, max_age)
+
+        @wraps(function)
+        def memoized(*args, **kwargs):
+            return memo.get(*args, **kwargs)
+
+        memoized.memo = memo
+        return memoized
+
+    return decorate
+
+
+def table_version(database: str, *tables: str) -> Callable[[], Hashable]:
+    """A version callable: the latest change-bus versions of these tables"""
+
+    def version() -> Hashable:
+        return tuple(change_bus.version(database, table) for table in tables)
+
+    return version
@@ -0,0 +1,50 @@
+"""
+Schemas of the school and SPIN databases, read from the setup scripts.
+
+The setup scripts are kept as they are used by hand in the DuckDB shell and
+contain more than DDL (notes, ad-hoc queries, a view over tables that only
+exist in MotherDuck). Only the table statements are taken from them:
+
+    with duckdb.connect("school.duckdb") as con:
+        create_schema(con, "school")
+"""
+
+import re
+from pathlib import Path
+from typing import List
+
+SCHEMAS = {
+    "school": Path(__file__).with_name("setup_db_school.sql"),
+    "spin": Path(__file__).with_name("setup_db_spin.sql"),
+}
+
+# Statements that can be replayed on an empty database
+_table_statement = re.compile(
+    r"^\s*(CREATE\s+(OR\s+REPLACE\s+)?TABLE|DROP\s+TABLE|INSERT\s+INTO)\b", re.I | re.M
+)
+
+
+def schema_statements(database: str) -> List[str]:
+    """
+    Returns the table statements of a setup script, in order.
+
+    Args:
+        database: "school" or "spin"
+
+    Returns:
+        The CREATE TABLE / DROP TABLE / INSERT statements of the script
+    """
+    sql = SCHEMAS[database].read_text()
+    statements = []
+    for chunk in sql.split(";"):
+        # Lines before the statement (comments, notes) are dropped
+        match = _table_statement.search(chunk)
+        if match is not None:
+            statements.append(chunk[match.start() :].strip())
+    return statements
+
+
+def create_schema(con, database: str):
+    """Create (or replace) the tables of a database on a connection"""
+    for statement in schema_statements(database):
+        con.execute(statement)
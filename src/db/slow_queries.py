@@ -0,0 +1,201 @@
+"""
+Slow-query log for the db modules.
+
+Statements slower than SLOW_QUERY_MS (default 100) are grouped by their
+normalized SQL (literals replaced by ?) with count, total/max duration and
+rows returned. For a sample of them (SLOW_QUERY_EXPLAIN_RATE, default 0.1) an
+`EXPLAIN ANALYZE` profile is captured right after the statement, on its
+connection: a connection opened elsewhere (another thread) would keep the
+database file open past the request. EXPLAIN ANALYZE executes the statement
+again, so a sampled request runs its slow query twice before it returns (set
+SLOW_QUERY_EXPLAIN_RATE=0 to only profile a statement the first time it is
+slow). Only read statements are profiled: a single statement, starting with
+one of READ_STATEMENTS, with no INSERT, UPDATE, DELETE, COPY, CREATE, ... after
+its CTEs.
+
+Browse the worst offenders at /admin/slow-queries.
+"""
+
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.instrumentation.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERIES = Counter(
+    "duckdb_slow_queries", "Statements slower than SLOW_QUERY_MS", ("database", "kind")
+)
+
+# Keep the log bounded, dropping the statements with the least total time
+MAX_ENTRIES = 500
+
+READ_STATEMENTS = ("select", "from", "with", "pivot", "unpivot", "table", "values")
+# Keywords making a statement a write when they follow its CTEs (outside parentheses)
+WRITE_KEYWORDS = {
+    "insert", "update", "delete", "copy", "create", "drop", "alter", "merge", "attach",
+    "detach", "install", "load", "set", "call", "checkpoint", "vacuum", "export", "import",
+}  # fmt: skip
+
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r"\b\d+(?:\.\d+)?\b")
+_in_list = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_comment = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_whitespace = re.compile(r"\s+")
+_quoted_identifier = re.compile(r'"(?:[^"]|"")*"')
+_token = re.compile(r"[()]|;|\w+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Replace literals with ? and collapse whitespace so similar statements group"""
+    sql = _comment.sub(" ", sql)
+    sql = _string_literal.sub("?", sql)
+    sql = _number_literal.sub("?", sql)
+    sql = _in_list.sub("(?, ...)", sql)
+    return _whitespace.sub(" ", sql).strip()
+
+
+class SlowQuery:
+    """All slow executions of one normalized statement"""
+
+    __slots__ = (
+        "database", "kind", "sql", "count", "total", "max", "rows", "last_seen",
+        "explain", "explained_at",
+    )  # fmt: skip
+
+    def __init__(self, database: str, kind: str, sql: str):
+        self.database = database
+        self.kind = kind
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows: Optional[int] = None
+        self.last_seen = 0.0
+        self.explain: Optional[str] = None
+        self.explained_at: Optional[float] = None
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, explain_rate: float):
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+        self.entries: Dict[str, SlowQuery] = {}
+        self._lock = threading.Lock()
+        # One profile per statement at a time, however many requests are slow
+        self._pending_explains = set()
+
+    def record(
+        self,
+        database: str,
+        kind: str,
+        sql: str,
+        seconds: float,
+        rows: Optional[int],
+        con=None,
+    ):
+        """Log a statement if it was slow (called for every statement, `con` still open)"""
+        if seconds < self.threshold:
+            return
+
+        normalized = normalize_sql(sql)
+        key = f"{database}:{normalized}"
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= MAX_ENTRIES:
+                    self.evict()
+                entry = self.entries[key] = SlowQuery(database, kind, normalized)
+            entry.count += 1
+            entry.total += seconds
+            entry.max = max(entry.max, seconds)
+            entry.rows = rows
+            entry.last_seen = time.time()
+
+            explain = (
+                con is not None
+                and is_read_statement(sql)
+                and key not in self._pending_explains
+                and (entry.explain is None or random.random() < self.explain_rate)
+            )
+            if explain:
+                self._pending_explains.add(key)
+
+        SLOW_QUERIES.labels(database=database, kind=kind).inc()
+        logger.warning(
+            "slow query %.1fms rows=%s db=%s kind=%s: %s",
+            seconds * 1000,
+            rows,
+            database,
+            kind,
+            normalized,
+        )
+        if explain:
+            self.capture_explain(key, sql, con)
+
+    def capture_explain(self, key: str, sql: str, con):
+        try:
+            rows = con.sql(f"EXPLAIN ANALYZE {sql}").fetchall()
+            profile = "\n".join(str(row[-1]) for row in rows)
+            with self._lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry.explain = profile
+                    entry.explained_at = time.time()
+        except Exception as e:
+            logger.warning("EXPLAIN ANALYZE failed for %s: %s", key, e)
+        finally:
+            with self._lock:
+                self._pending_explains.discard(key)
+
+    def evict(self):
+        """Drop the tenth of the entries with the least total time (lock held)"""
+        ranked = sorted(self.entries, key=lambda key: self.entries[key].total)
+        for key in ranked[: max(1, len(ranked) // 10)]:
+            del self.entries[key]
+
+    def worst(self, order_by: str = "total", limit: int = 50) -> List[SlowQuery]:
+        with self._lock:
+            entries = list(self.entries.values())
+        # rows is None for statements that return nothing (update, delete)
+        entries.sort(key=lambda entry: getattr(entry, order_by) or 0, reverse=True)
+        return entries[:limit]
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+def is_read_statement(sql: str) -> bool:
+    """Whether EXPLAIN ANALYZE can run a statement again without writing anything"""
+    sql = _comment.sub(" ", sql)
+    sql = _quoted_identifier.sub('""', _string_literal.sub("''", sql))
+    tokens = [token.lower() for token in _token.findall(sql)]
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    if not tokens or tokens[0] not in READ_STATEMENTS:
+        return False
+    depth = 0
+    for token in tokens:
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif token == ";" or (depth == 0 and token in WRITE_KEYWORDS):
+            return False
+    return True
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=float(os.getenv("SLOW_QUERY_MS", 100)),
+    explain_rate=float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", 0.1)),
+)
@@ -1,83 +1,96 @@
-import streamlit as st
-from src.lib.components.session_selections import get_selected_choices
-import src.lib.db_survey as db_survey
-import duckdb as duckdb
+"""
+Derived survey datasets for the SPIN views, memoized per data version.
 
+Students, their choices (long and wide) and the course codes chosen, read
+from the tables of src/spin/choices.py, and the SPIN classes pre-joined with
+the school tables (src/spin/class_view.py), and the school rows a class can be
+moved to. Each function keeps its results per arguments until a table they are
+read from changes (see src/db/memo.py), whichever worker made the change, and
+concurrent requests share one computation. The frames returned are shared:
+copy before modifying them.
+"""
 
-# Module globals
-students_df = None
-student_choices_rel = None
-student_choices_long_df = None
-student_choices_wide_df = None
-distinct_course_codes = []
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import pandas as pd
 
-# Get Data Functions
-@st.cache_data
-def update_survey_data(_data_version):
-    print("Updating survey data...", _data_version)
-    # Variables below are used across the module
-    global \
-        students_df, \
-        student_choices_rel, \
-        student_choices_long_df, \
-        student_choices_wide_df, \
-        distinct_course_codes
+from src.db import db_school, db_spin
+from src.db.memo import memoize, table_version
+from src.spin import choices, class_view
 
-    students_df = db_survey.get_all("student")
+survey_version = table_version("spin", "student", "student_selection")
+spin_class_version = table_version("spin", "spin_class")
+school_class_version = table_version("school", "course", "timeslot", "teacher", "room")
 
-    sql = "SELECT st.id, email, firstName, lastName, level, program, created_at, active, preference_code, course_code FROM student as st JOIN student_selection as ss ON st.id = ss.student_id"
-    student_choices_rel = db_survey.run_sql(sql)
 
-    student_choices_long_df = student_choices_rel.df()
-    student_choices_long_df["id"] = student_choices_long_df["id"].astype(str)
+def codes_key(preference_codes: Optional[Iterable[str]]) -> Optional[Tuple[str, ...]]:
+    """Preference codes as a memo key (None: all)"""
+    return None if preference_codes is None else tuple(sorted(set(preference_codes)))
 
-    sql = "PIVOT student_choices_rel ON preference_code USING first(course_code) GROUP BY id, email, firstName, lastName, level, program, created_at, active"
-    pivot = db_survey.con.sql(sql)
-    student_choices_wide_df = pivot.df()
 
-    sql = "SELECT DISTINCT course_code FROM student_choices_rel"
-    distinct_course_codes = (
-        db_survey.con.sql(sql).df()["course_code"].astype(str).tolist()
-    )
-    # print("COURSE_CODES:", distinct_course_codes)
+@memoize("survey_students", survey_version)
+def get_students_df() -> pd.DataFrame:
+    df = db_spin.get_all("student")
+    df["id"] = df["id"].astype(str)
+    return df
 
 
-def get_students_df():
-    update_survey_data(st.session_state.data_version)
-    return students_df
+@memoize("survey_choices_long", survey_version)
+def _choices_long(preference_codes: Optional[Tuple[str, ...]]) -> pd.DataFrame:
+    return choices.choices_long(preference_codes)
 
 
-def get_filtered_choices_long():
-    update_survey_data(st.session_state.data_version)
-    filtered_choices = student_choices_long_df[
-        student_choices_long_df["preference_code"].isin(get_selected_choices())
-    ]
-    return filtered_choices
+def get_filtered_choices_long(preference_codes: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Selections with their students' columns, of these preference codes (all by default)"""
+    return _choices_long(codes_key(preference_codes))
 
 
-def get_filtered_student_choices_wide():
-    update_survey_data(st.session_state.data_version)
-    # Group by course
-    filtered = (
-        get_filtered_choices_long()
-        .pivot_table(
-            index=["student_id"],
-            columns="preference_code",
-            values="student_id",
-            aggfunc="count",
-            margins=True,
-            fill_value=0,
-        )
-        .reset_index()
-    )
+@memoize("survey_choice_counts", survey_version)
+def _choice_counts(preference_codes: Optional[Tuple[str, ...]]) -> pd.DataFrame:
+    return choices.choice_counts(preference_codes)
 
-    return filtered
 
+def get_filtered_student_choices_wide(
+    preference_codes: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """Choices per student and preference code, with `All` totals (see choices.choice_counts)"""
+    return _choice_counts(codes_key(preference_codes))
 
-def get_student_choices_wide_df():
-    update_survey_data(st.session_state.data_version)
-    return student_choices_wide_df
 
+@memoize("survey_choices_wide", survey_version)
+def get_student_choices_wide_df() -> pd.DataFrame:
+    """One row per student, the course chosen per preference code"""
+    return choices.choices_wide()
 
-update_survey_data(st.session_state.data_version)
+
+@memoize("survey_course_codes", survey_version)
+def get_distinct_course_codes() -> List[str]:
+    return choices.course_codes()["course_code"].astype(str).tolist()
+
+
+@memoize("spin_classes", lambda: (spin_class_version(), school_class_version()))
+def get_spin_classes_df() -> pd.DataFrame:
+    """The SpinClass listing: one row per class with its course, timeslot, teacher and room"""
+    return class_view.classes()
+
+
+# Active school rows a class can be moved to, timeslots as the labels classes store
+CLASS_OPTIONS_SQL = {
+    "timeslot": """
+        SELECT DISTINCT weekday || ': ' || start_time || ' - ' || end_time AS option,
+            list_position(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'], weekday) AS day,
+            start_time
+        FROM timeslot WHERE active ORDER BY day, start_time, option
+    """,
+    "teacher": "SELECT DISTINCT name AS option FROM teacher WHERE active ORDER BY option",
+    "room": "SELECT DISTINCT name AS option FROM room WHERE active ORDER BY option",
+}
+
+
+@memoize("spin_class_options", school_class_version)
+def get_class_options() -> Dict[str, List[str]]:
+    """Timeslot labels (in week order), teacher and room names offered when editing a class"""
+    return {
+        table: db_school.run(sql)["option"].dropna().astype(str).tolist()
+        for table, sql in CLASS_OPTIONS_SQL.items()
+    }
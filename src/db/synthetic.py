@@ -0,0 +1,502 @@
+"""
+Synthetic school and SPIN databases, for benchmarks and load tests.
+
+Tables are generated column-wise with NumPy, assembled as Arrow tables and bulk
+loaded into databases created from the setup scripts (see src/db/schema.py).
+The same sizes and seed always produce the same databases.
+
+At scale 1 the data looks like one school: 60 courses, 40 teachers, 1000
+students choosing up to 13 courses each (IM1-IM3, IW1-IW5, GA1-GA5) with a
+skew towards popular courses, classes for the offered courses and assignments
+for the first choices. Larger scales look like a rollout over many schools:
+
+    uv run python -m src.db.synthetic --scale 100 --school school.duckdb --spin spin.duckdb
+"""
+
+import argparse
+import time
+import zlib
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError as e:  # optional dependency
+    raise ImportError("The synthetic data generator needs pyarrow (the `arrow` extra)") from e
+
+from src.db.schema import create_schema
+
+# Preference slots per course group, as on the choice selector
+PREFERENCE_GROUPS = {"IM": 3, "IW": 5, "GA": 5}
+GROUP_NAMES = {"IM": "Intensive morning", "IW": "Intensive week", "GA": "General afternoon"}
+
+# Popularity of the courses of a group falls off as 1 / rank ** ZIPF_EXPONENT
+ZIPF_EXPONENT = 1.1
+# Share of preference slots students leave empty
+SKIP_RATE = 0.08
+
+COURSE_TOPICS = {
+    "JLGR": "JLPT Grammar",
+    "JLRD": "JLPT Reading",
+    "GAME": "Learning Japanese w/ Game",
+    "LISN": "Listening",
+    "SPKG": "Speaking",
+    "WRTG": "Writing",
+    "BUSI": "Business Japanese",
+    "KANJ": "Kanji",
+    "CULT": "Japanese Culture",
+    "CONV": "Conversation",
+}
+LEVEL_RANGES = ["(A1-A2)", "(A1.3-B2)", "(A2-B1)", "(B1-B2)", "(A1-B2)"]
+LEVELS = ["A1", "A2", "B1", "B2", "C1"]
+LEVEL_WEIGHTS = [0.2, 0.3, 0.3, 0.15, 0.05]
+PROGRAMS = ["SPIN", "ILP"]
+PROGRAM_WEIGHTS = [0.85, 0.15]
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri"]
+PERIODS = [
+    ("09:00", "10:20"),
+    ("10:30", "11:50"),
+    ("12:40", "14:00"),
+    ("14:10", "15:30"),
+    ("15:40", "17:00"),
+    ("17:10", "18:30"),
+]
+RATING_WEIGHTS = [0.05, 0.15, 0.3, 0.3, 0.2]
+FIRST_NAMES = [
+    "Emma", "Liam", "Olivia", "Noah", "Mia", "Lucas", "Sofia", "Leon", "Hanna", "Elias",
+    "Lea", "Paul", "Clara", "Felix", "Julia", "Jonas", "Marie", "Ben", "Laura", "Finn",
+    "Chloe", "Hugo", "Ines", "Mateo", "Alice", "Oscar", "Nora", "Luca", "Zoe", "Max",
+]  # fmt: skip
+LAST_NAMES = [
+    "Smith", "Muller", "Rossi", "Garcia", "Martin", "Bernard", "Jansen", "Nielsen", "Novak",
+    "Silva", "Schmidt", "Bianchi", "Lopez", "Dubois", "Peeters", "Berg", "Kowalski", "Costa",
+    "Weber", "Romano", "Fernandez", "Moreau", "Visser", "Larsen", "Horvat", "Santos", "Meyer",
+]  # fmt: skip
+JP_FAMILY_NAMES = [
+    "佐藤", "鈴木", "高橋", "田中", "伊藤",
+    "渡辺", "山本", "中村", "小林", "石橋",
+]  # fmt: skip
+JP_GIVEN_NAMES = [
+    "果林", "博子", "健太", "美咲", "大輔",
+    "陽子", "翔", "愛", "誠", "直子",
+]  # fmt: skip
+SURVEY_OPENS = np.datetime64("2025-08-01T09:00", "us")
+
+
+@dataclass(frozen=True)
+class Sizes:
+    """Row counts of the generated entities"""
+
+    courses: int = 60
+    teachers: int = 40
+    rooms: int = 30
+    timeslots: int = 15
+    students: int = 1000
+    spin_classes: int = 150
+    # Per group and per teacher, not scaled
+    survey_courses: int = 20
+    ratings_per_teacher: int = 20
+
+    @classmethod
+    def scaled(cls, scale: float) -> "Sizes":
+        base = cls()
+        counts = ("courses", "teachers", "rooms", "timeslots", "students", "spin_classes")
+        return replace(
+            base, **{name: max(1, round(getattr(base, name) * scale)) for name in counts}
+        )
+
+
+def random_generator(seed: int, table: str) -> np.random.Generator:
+    """One stream per table, so a table doesn't change when another one grows"""
+    return np.random.default_rng([seed, zlib.crc32(table.encode())])
+
+
+def uuid_array(rng: np.random.Generator, n: int) -> pa.Array:
+    """n random (version 4) UUIDs as strings, formatted without a Python loop"""
+    raw = rng.integers(0, 256, (n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hex_digits = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+    text = np.full((n, 36), ord("-"), dtype=np.uint8)
+    positions = np.array([i for i in range(36) if i not in (8, 13, 18, 23)])
+    text[:, positions[0::2]] = hex_digits[raw >> 4]
+    text[:, positions[1::2]] = hex_digits[raw & 0x0F]
+    offsets = np.arange(0, 36 * (n + 1), 36, dtype=np.int32)
+    return pa.Array.from_buffers(pa.string(), n, [None, pa.py_buffer(offsets), pa.py_buffer(text)])
+
+
+def pick(rng: np.random.Generator, values: List[str], n: int, p=None) -> pa.Array:
+    """n strings drawn from values"""
+    return pc.take(pa.array(values), pa.array(rng.choice(len(values), n, p=p)))
+
+
+def join(*parts, separator: str = "") -> pa.Array:
+    """Concatenate string arrays and scalars element-wise"""
+    parts = [part.cast(pa.string()) if isinstance(part, pa.Array) else part for part in parts]
+    return pc.binary_join_element_wise(*parts, separator)
+
+
+def numbers(values) -> pa.Array:
+    return pa.array(values).cast(pa.string())
+
+
+def chance(rng: np.random.Generator, probability: float, n: int) -> pa.Array:
+    return pa.array(rng.random(n) < probability)
+
+
+def generate(sizes: Sizes = Sizes(), seed: int = 0) -> Dict[str, Dict[str, pa.Table]]:
+    """
+    Generate the tables of both databases.
+
+    Args:
+        sizes: Row counts, e.g. Sizes.scaled(10)
+        seed: Seed of the random streams
+
+    Returns:
+        {"school": {table name: Arrow table}, "spin": {...}}
+    """
+    school = generate_school(sizes, seed)
+    spin = generate_spin(sizes, seed, school)
+    return {"school": school, "spin": spin}
+
+
+def generate_school(sizes: Sizes, seed: int) -> Dict[str, pa.Table]:
+    tables = {}
+
+    rng = random_generator(seed, "course")
+    n = sizes.courses
+    index = np.arange(n)
+    prefixes = list(COURSE_TOPICS)
+    prefix = pc.take(pa.array(prefixes), pa.array(index % len(prefixes)))
+    topic = pc.take(pa.array(list(COURSE_TOPICS.values())), pa.array(index % len(prefixes)))
+    tables["course"] = pa.table(
+        {
+            "id": uuid_array(rng, n),
+            "code": join(
+                prefix, pc.utf8_lpad(numbers(index // len(prefixes)), 3, "0"), separator="-"
+            ),
+            "title": join(topic, pick(rng, LEVEL_RANGES, n), separator=" "),
+            "active": chance(rng, 0.85, n),
+        }
+    )
+
+    rng = random_generator(seed, "teacher")
+    n = sizes.teachers
+    first, last = pick(rng, FIRST_NAMES, n), pick(rng, LAST_NAMES, n)
+    tables["teacher"] = pa.table(
+        {
+            "id": uuid_array(rng, n),
+            "name": join(first, last, separator=" "),
+            "nameJP": join(
+                pick(rng, JP_FAMILY_NAMES, n), pick(rng, JP_GIVEN_NAMES, n), separator=" "
+            ),
+            "email": pc.utf8_lower(join(first, ".", last, numbers(np.arange(n)), "@example.com")),
+            "note": pa.array([""] * n),
+            "active": chance(rng, 0.9, n),
+        }
+    )
+
+    rng = random_generator(seed, "room")
+    n = sizes.rooms
+    index = np.arange(n)
+    tables["room"] = pa.table(
+        {
+            "id": uuid_array(rng, n),
+            "name": join(numbers(20 + index % 10), "F C", numbers(index // 10 + 1)),
+            "type": pick(rng, ["Classroom", "Lounge"], n, p=[0.9, 0.1]),
+            "capacity": pa.array(rng.integers(12, 25, n), pa.int32()),
+            "active": chance(rng, 0.9, n),
+        }
+    )
+
+    rng = random_generator(seed, "timeslot")
+    n = sizes.timeslots
+    index = np.arange(n)
+    period = (index // len(WEEKDAYS)) % len(PERIODS)
+    tables["timeslot"] = pa.table(
+        {
+            "id": uuid_array(rng, n),
+            "weekday": pc.take(pa.array(WEEKDAYS), pa.array(index % len(WEEKDAYS))),
+            "start_time": pc.take(pa.array([start for start, _ in PERIODS]), pa.array(period)),
+            "end_time": pc.take(pa.array([end for _, end in PERIODS]), pa.array(period)),
+            "active": chance(rng, 0.7, n),
+        }
+    )
+
+    # Each teacher rates a run of distinct courses
+    rng = random_generator(seed, "teacherpreference")
+    per_teacher = min(sizes.ratings_per_teacher, sizes.courses)
+    first_course = rng.integers(0, sizes.courses, sizes.teachers)
+    course_index = (first_course[:, None] + np.arange(per_teacher)) % sizes.courses
+    n = sizes.teachers * per_teacher
+    tables["teacherpreference"] = pa.table(
+        {
+            "teacher_id": pc.take(
+                tables["teacher"]["id"], pa.array(np.repeat(np.arange(sizes.teachers), per_teacher))
+            ),
+            "course_id": pc.take(tables["course"]["id"], pa.array(course_index.ravel())),
+            "rating": pa.array(rng.choice(5, n, p=RATING_WEIGHTS) + 1, pa.int32()),
+        }
+    )
+
+    rng = random_generator(seed, "user_profile")
+    tables["user_profile"] = pa.table(
+        {
+            "id": uuid_array(rng, 3),
+            "user_name": ["Admin", "Staff One", "Staff Two"],
+            "email": ["admin@example.com", "staff1@example.com", "staff2@example.com"],
+            "user_role": ["Admin", "Staff", "Staff"],
+            "user_authorization": pa.array([None, None, None], pa.string()),
+            "selected_school": ["EF Tokyo"] * 3,
+            "selected_cycle": ["2508"] * 3,
+        }
+    )
+    return tables
+
+
+def generate_spin(sizes: Sizes, seed: int, school: Dict[str, pa.Table]) -> Dict[str, pa.Table]:
+    tables = {}
+    courses = school["course"]
+    groups = list(PREFERENCE_GROUPS)
+
+    # Courses offered in the survey: a disjoint pool per group, most popular first
+    rng = random_generator(seed, "survey_group")
+    pool_size = max(1, min(sizes.survey_courses, sizes.courses // len(groups)))
+    offered = rng.choice(sizes.courses, pool_size * len(groups), replace=False)
+    pools = {group: offered[i * pool_size : (i + 1) * pool_size] for i, group in enumerate(groups)}
+    popularity = 1 / np.arange(1, pool_size + 1) ** ZIPF_EXPONENT
+
+    rng = random_generator(seed, "student")
+    n = sizes.students
+    first, last = pick(rng, FIRST_NAMES, n), pick(rng, LAST_NAMES, n)
+    offsets = (rng.random(n) * 14 * 24 * 3600 * 1e6).astype("timedelta64[us]")
+    students = tables["student"] = pa.table(
+        {
+            "id": uuid_array(rng, n),
+            "email": pc.utf8_lower(join(first, ".", last, numbers(np.arange(n)), "@example.com")),
+            "firstName": first,
+            "lastName": last,
+            "level": pick(rng, LEVELS, n, p=LEVEL_WEIGHTS),
+            "program": pick(rng, PROGRAMS, n, p=PROGRAM_WEIGHTS),
+            "created_at": pa.array(SURVEY_OPENS + offsets, pa.timestamp("us")),
+            "active": chance(rng, 0.97, n),
+        }
+    )
+
+    # Weighted choices without replacement per student and group (Gumbel top-k):
+    # the k largest log(weight) + Gumbel noise are a weighted sample of k courses
+    rng = random_generator(seed, "student_selection")
+    student_index, slot_codes, course_index, first_choice = [], [], [], []
+    for group in groups:
+        slots = min(PREFERENCE_GROUPS[group], pool_size)
+        keys = np.log(popularity, dtype=np.float32) + rng.gumbel(size=(n, pool_size)).astype(
+            np.float32
+        )
+        ranked = np.argsort(-keys, axis=1)[:, :slots]
+        filled = rng.random((n, slots)) >= SKIP_RATE
+        rows, slot = np.nonzero(filled)
+        student_index.append(rows)
+        slot_codes.append(
+            pc.take(pa.array([f"{group}{i + 1}" for i in range(slots)]), pa.array(slot))
+        )
+        course_index.append(pools[group][ranked[rows, slot]])
+        first_choice.append(slot == 0)
+    student_index = np.concatenate(student_index)
+    course_index = np.concatenate(course_index)
+    first_choice = np.concatenate(first_choice)
+
+    # Classes: one per offered course, the rest spread by popularity
+    rng = random_generator(seed, "spin_class")
+    n = sizes.spin_classes
+    weights = np.tile(popularity, len(groups))
+    class_course = np.concatenate(
+        [
+            offered[: min(n, len(offered))],
+            rng.choice(offered, max(0, n - len(offered)), p=weights / weights.sum()),
+        ]
+    )
+    class_course.sort(kind="stable")
+    starts = np.searchsorted(class_course, class_course, side="left")
+    timeslots = school["timeslot"]
+    timeslot_index = pa.array(rng.integers(0, len(timeslots), n))
+    tables["spin_class"] = pa.table(
+        {
+            "id": uuid_array(rng, n),
+            "title": join(
+                pc.take(courses["code"], pa.array(class_course)),
+                numbers(np.arange(n) - starts + 1),
+                separator="-",
+            ),
+            "course_code": pc.take(courses["code"], pa.array(class_course)),
+            "timeslot": join(
+                pc.take(timeslots["weekday"], timeslot_index),
+                ": ",
+                pc.take(timeslots["start_time"], timeslot_index),
+                " - ",
+                pc.take(timeslots["end_time"], timeslot_index),
+            ),
+            "teacher_name": pc.take(
+                school["teacher"]["name"], pa.array(rng.integers(0, sizes.teachers, n))
+            ),
+            "room_name": pc.take(school["room"]["name"], pa.array(rng.integers(0, sizes.rooms, n))),
+            "for_program": pick(rng, ["SPIN", "ILP", "ALL"], n, p=[0.7, 0.1, 0.2]),
+        }
+    )
+
+    # First choices get a random class of their course
+    rng = random_generator(seed, "assignment")
+    first_class = np.searchsorted(class_course, course_index, side="left")
+    class_count = np.searchsorted(class_course, course_index, side="right") - first_class
+    assigned = first_choice & (class_count > 0)
+    chosen_class = first_class[assigned] + (
+        rng.random(assigned.sum()) * class_count[assigned]
+    ).astype(np.int64)
+    tables["assignment"] = pa.table(
+        {
+            "student_id": pc.take(students["id"], pa.array(student_index[assigned])),
+            "spin_class_id": pc.take(tables["spin_class"]["id"], pa.array(chosen_class)),
+            "uploaded": chance(rng, 0.3, int(assigned.sum())),
+        }
+    )
+
+    rng = random_generator(seed, "student_selection_id")
+    tables["student_selection"] = pa.table(
+        {
+            "id": uuid_array(rng, len(student_index)),
+            "student_id": pc.take(students["id"], pa.array(student_index)),
+            "preference_code": pa.concat_arrays(slot_codes),
+            "course_code": pc.take(courses["code"], pa.array(course_index)),
+            "assigned": pa.array(assigned),
+        }
+    )
+
+    tables.update(generate_survey(seed, courses, pools))
+    return tables
+
+
+def generate_survey(
+    seed: int, courses: pa.Table, pools: Dict[str, np.ndarray]
+) -> Dict[str, pa.Table]:
+    """The (small) survey configuration tables"""
+    rng = random_generator(seed, "survey")
+    codes, titles = courses["code"].to_pylist(), courses["title"].to_pylist()
+    groups = list(pools)
+
+    group_rows = [
+        {"course_group": group, "course_code": codes[i], "course_title": titles[i], "active": True}
+        for group in groups
+        for i in pools[group]
+    ]
+    table_ids = uuid_array(rng, len(groups)).to_pylist()
+    image_ids = uuid_array(rng, 2).to_pylist()
+    survey_id = uuid_array(rng, 1)[0].as_py()
+    png_header = b"\x89PNG\r\n\x1a\n"
+
+    return {
+        "survey_level": pa.table({"id": uuid_array(rng, len(LEVELS)), "level": LEVELS}),
+        "survey_group": pa.Table.from_pylist(group_rows).append_column(
+            "id", uuid_array(rng, len(group_rows))
+        ),
+        "survey_table": pa.table(
+            {
+                "id": table_ids,
+                "name": [GROUP_NAMES[group] for group in groups],
+                "description": [f"{GROUP_NAMES[group]} courses" for group in groups],
+                "option_codes": [
+                    ",".join(f"{group}{i + 1}" for i in range(PREFERENCE_GROUPS[group]))
+                    for group in groups
+                ],
+                "courses_group": groups,
+            }
+        ),
+        "survey_image": pa.table(
+            {
+                "id": image_ids,
+                "filename": ["intensive.png", "general.png"],
+                "content": [png_header + rng.bytes(2048), png_header + rng.bytes(2048)],
+            }
+        ),
+        "survey": pa.table(
+            {
+                "id": [survey_id],
+                "title": ["SPIN course survey"],
+                "introduction": ["Choose the courses you would like to take."],
+                "explanation": ["Rank your choices, the first ones are assigned first."],
+                "intensive_chart": [image_ids[0]],
+                "intensive_table_1": [table_ids[groups.index("IM")]],
+                "intensive_table_2": [table_ids[groups.index("IW")]],
+                "general_chart": [image_ids[1]],
+                "general_table": [table_ids[groups.index("GA")]],
+            }
+        ),
+        "survey_config": pa.table(
+            {"id": ["config"], "current_survey": [survey_id], "active": [True]}
+        ),
+        "course_collection": pa.table(
+            {
+                "id": uuid_array(rng, len(groups)),
+                "collection_name": [GROUP_NAMES[group] for group in groups],
+                "courses": pa.array(
+                    [[(codes[i], titles[i]) for i in pools[group]] for group in groups],
+                    pa.map_(pa.string(), pa.string()),
+                ),
+            }
+        ),
+    }
+
+
+def write_database(path, database: str, tables: Dict[str, pa.Table]):
+    """
+    Create the schema of a database and bulk load the generated tables.
+
+    Args:
+        path: The DuckDB file (tables of the schema are replaced)
+        database: "school" or "spin"
+        tables: Arrow tables by table name
+    """
+    import duckdb
+
+    with duckdb.connect(str(path)) as con:
+        create_schema(con, database)
+        for name, table in tables.items():
+            con.register("batch", table)
+            # Tables seeded by the setup script (survey_config) are replaced
+            con.execute(f"DELETE FROM {name}")
+            con.execute(f"INSERT INTO {name} BY NAME SELECT * FROM batch")
+            con.unregister("batch")
+        con.execute("CHECKPOINT")
+
+
+def build_databases(
+    school_path, spin_path, sizes: Sizes = Sizes(), seed: int = 0
+) -> Dict[str, int]:
+    """Generate and write both databases, returns the row count per table"""
+    generated = generate(sizes, seed)
+    write_database(school_path, "school", generated["school"])
+    write_database(spin_path, "spin", generated["spin"])
+    return {name: table.num_rows for tables in generated.values() for name, table in tables.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", type=float, default=1.0, help="1 is about one school")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--school", type=Path, required=True, help="school database file")
+    parser.add_argument("--spin", type=Path, required=True, help="SPIN database file")
+    parser.add_argument("--force", action="store_true", help="overwrite existing files")
+    args = parser.parse_args()
+
+    for path in (args.school, args.spin):
+        if path.exists() and not args.force:
+            parser.error(f"{path} exists, use --force to overwrite it")
+        path.unlink(missing_ok=True)
+
+    start = time.perf_counter()
+    counts = build_databases(args.school, args.spin, Sizes.scaled(args.scale), args.seed)
+    for name, count in counts.items():
+        print(f"{name:<20} {count:>12,}")
+    print(f"{sum(counts.values()):,} rows in {time.perf_counter() - start:.1f}s")
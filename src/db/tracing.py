@@ -0,0 +1,49 @@
+"""
+Tracing hook wrapped around every statement the db modules run
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from src.instrumentation import span
+from src.instrumentation.metrics import QUERY_DURATION, QUERY_ROWS
+from src.db.slow_queries import slow_query_log
+
+
+class QueryInfo:
+    """What the caller knows about a statement once it ran"""
+
+    __slots__ = ("database", "kind", "sql", "rows")
+
+    def __init__(self, database: str, kind: str, sql: str):
+        self.database = database
+        self.kind = kind
+        self.sql = sql
+        self.rows: Optional[int] = None
+
+
+@contextmanager
+def query_span(database: str, kind: str, sql: str, con=None):
+    """
+    Time a statement as a "db" span, in the DuckDB metrics and the slow-query log.
+
+    Args:
+        database: "school" or "spin"
+        kind: The helper running it (get_all, get, update, create, delete, run, ...)
+        sql: The statement
+        con: The connection it runs on, open until the span ends: slow reads are
+            profiled on it (EXPLAIN ANALYZE)
+
+    Yields:
+        A QueryInfo whose `rows` the caller sets to the number of rows returned
+    """
+    info = QueryInfo(database, kind, sql)
+    start = time.perf_counter()
+    with span("db"):
+        yield info
+    seconds = time.perf_counter() - start
+    QUERY_DURATION.labels(database=database, kind=kind).observe(seconds)
+    if info.rows is not None:
+        QUERY_ROWS.labels(database=database, kind=kind).observe(info.rows)
+    slow_query_log.record(database, kind, sql, seconds, info.rows, con)
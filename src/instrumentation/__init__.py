@@ -0,0 +1,5 @@
+"""
+Instrumentation for the application (request timing, Prometheus metrics)
+"""
+
+from src.instrumentation.timing import TimingMiddleware, aggregator, span, timed
@@ -0,0 +1,255 @@
+"""
+Opt-in allocation profiling per route, with tracemalloc.
+
+Off by default: tracemalloc slows every allocation down. Switch it on for a
+while from the host the app runs on, load the pages, then read the report:
+
+    curl -X POST 'localhost:8000/admin/memory?enabled=true&frames=1'
+    curl localhost:8000/admin/memory
+
+For each profiled request MemoryMiddleware records the peak of traced memory
+above what was allocated when the request started, and the allocation sites
+still alive when the page is rendered (items, context and output all exist at
+that point). Peaks also go to /metrics as http_request_memory_peak_bytes.
+
+tracemalloc is process wide, so only one request is profiled at a time;
+requests running alongside it are counted as skipped, and their allocations
+can show up in the profiled one. Event streams (Datastar responses, the
+entity page streams) are measured up to their response headers only: a
+stream can stay open for as long as the page does, and would hold the
+profiler all that time.
+"""
+
+import os
+import threading
+import tracemalloc
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from src.instrumentation.metrics import BYTE_BUCKETS, Gauge, Histogram
+
+# Frames of traceback stored per allocation (1 = the allocating line)
+DEFAULT_FRAMES = 1
+# Allocation sites kept per route
+DEFAULT_TOP_SITES = 10
+
+
+class RequestProfile:
+    """Memory measurements of the request being profiled"""
+
+    __slots__ = ("baseline", "start", "sites")
+
+    def __init__(self, baseline: int, start: tracemalloc.Snapshot):
+        self.baseline = baseline
+        self.start = start
+        self.sites: Optional[List[Dict]] = None
+
+
+class RouteMemory:
+    """Peaks and latest allocation sites of one route"""
+
+    __slots__ = ("requests", "peak_total", "peak_max", "sites")
+
+    def __init__(self):
+        self.requests = 0
+        self.peak_total = 0
+        self.peak_max = 0
+        self.sites: List[Dict] = []
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("memory_profile", default=None)
+
+
+class MemoryProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.frames = DEFAULT_FRAMES
+        self.top_sites = DEFAULT_TOP_SITES
+        self.routes: Dict[str, RouteMemory] = {}
+        self.skipped = 0
+        self._busy = False
+        self._lock = threading.Lock()
+
+    def enable(self, frames: int = DEFAULT_FRAMES, top_sites: int = DEFAULT_TOP_SITES):
+        if tracemalloc.is_tracing() and frames != tracemalloc.get_traceback_limit():
+            tracemalloc.stop()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.frames = frames
+        self.top_sites = top_sites
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+            self.skipped = 0
+
+    def begin(self) -> Optional[RequestProfile]:
+        """Start profiling a request, unless profiling is off or busy with another one"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._busy:
+                self.skipped += 1
+                return None
+            self._busy = True
+        start = snapshot()
+        tracemalloc.reset_peak()
+        return RequestProfile(tracemalloc.get_traced_memory()[0], start)
+
+    def capture(self):
+        """Record the live allocation sites of the current request (after rendering)"""
+        profile = _current_profile.get()
+        if profile is not None and profile.sites is None and tracemalloc.is_tracing():
+            profile.sites = self.top_allocations(profile.start, snapshot())
+
+    def end(self, route: str, profile: RequestProfile):
+        try:
+            if not tracemalloc.is_tracing():  # switched off during the request
+                return
+            peak = max(0, tracemalloc.get_traced_memory()[1] - profile.baseline)
+            if profile.sites is None:
+                # Also stops capture() for the rest of the request (streams)
+                profile.sites = self.top_allocations(profile.start, snapshot())
+        finally:
+            with self._lock:
+                self._busy = False
+
+        MEMORY_PEAK.labels(route=route).observe(peak)
+        with self._lock:
+            entry = self.routes.get(route)
+            if entry is None:
+                entry = self.routes[route] = RouteMemory()
+            entry.requests += 1
+            entry.peak_total += peak
+            entry.peak_max = max(entry.peak_max, peak)
+            entry.sites = profile.sites
+
+    def top_allocations(self, start: tracemalloc.Snapshot, end: tracemalloc.Snapshot) -> List[Dict]:
+        """Sites that allocated the most memory between two snapshots"""
+        key = "traceback" if self.frames > 1 else "lineno"
+        sites = []
+        for stat in end.compare_to(start, key):
+            if stat.size_diff <= 0:
+                continue
+            sites.append(
+                {
+                    "site": " <- ".join(
+                        f"{os.path.relpath(frame.filename)}:{frame.lineno}"
+                        for frame in stat.traceback
+                    ),
+                    "kb": round(stat.size_diff / 1024, 1),
+                    "blocks": stat.count_diff,
+                }
+            )
+            if len(sites) >= self.top_sites:
+                break
+        return sites
+
+    def report(self) -> Dict:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        with self._lock:
+            routes = {
+                route: {
+                    "requests": entry.requests,
+                    "avg_peak_kb": round(entry.peak_total / entry.requests / 1024, 1),
+                    "max_peak_kb": round(entry.peak_max / 1024, 1),
+                    "sites": entry.sites,
+                }
+                for route, entry in sorted(self.routes.items())
+            }
+            skipped = self.skipped
+        return {
+            "enabled": self.enabled,
+            "frames": self.frames,
+            "traced_kb": round(current / 1024, 1),
+            "traced_peak_kb": round(peak / 1024, 1),
+            "skipped": skipped,
+            "routes": routes,
+        }
+
+
+def snapshot() -> tracemalloc.Snapshot:
+    """A snapshot without tracemalloc's own and import machinery allocations"""
+    return tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        )
+    )
+
+
+def traced_memory():
+    if not tracemalloc.is_tracing():
+        return {}
+    current, peak = tracemalloc.get_traced_memory()
+    return {("current",): current, ("peak",): peak}
+
+
+profiler = MemoryProfiler()
+
+MEMORY_PEAK = Histogram(
+    "http_request_memory_peak_bytes",
+    "Peak traced memory above the start of profiled requests by route",
+    ("route",),
+    BYTE_BUCKETS,
+)
+TRACED_MEMORY = Gauge(
+    "tracemalloc_traced_bytes", "Memory traced while profiling is on", ("state",), traced_memory
+)
+MEMORY_PROFILING = Gauge(
+    "memory_profiling_enabled",
+    "1 while tracemalloc profiling is on",
+    function=lambda: {(): float(profiler.enabled)},
+)
+
+
+class MemoryMiddleware:
+    """ASGI middleware profiling requests while the profiler is enabled"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiler.begin()
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Import here to avoid circular imports (src.utils uses span)
+        from src.utils import route_path
+
+        ended = False
+
+        async def send_profiled(message):
+            nonlocal ended
+            if message["type"] == "http.response.start" and is_event_stream(message):
+                # Release the profiler before the stream's events
+                ended = True
+                profiler.end(route_path(scope), profile)
+            await send(message)
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            _current_profile.reset(token)
+            if not ended:
+                profiler.end(route_path(scope), profile)
+
+
+def is_event_stream(start_message) -> bool:
+    for key, value in start_message.get("headers", []):
+        if key.lower() == b"content-type":
+            return value.startswith(b"text/event-stream")
+    return False
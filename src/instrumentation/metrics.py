@@ -0,0 +1,338 @@
+"""
+Prometheus metrics (counters, gauges, histograms) and their text exposition.
+
+Writers never take a lock: every thread (the event loop, each threadpool
+worker) updates its own shard of a metric, and the shards are only merged when
+`/metrics` is scraped. Locks are taken once per thread and label set, when a
+shard or a labelled child is created, and when a thread ends and its shard is
+folded into the metric's base total.
+
+    REQUEST_DURATION.labels(route="/school/courses", method="GET").observe(0.012)
+"""
+
+import math
+import threading
+import weakref
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond renders to slow queries
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)  # fmt: skip
+
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+# Memory buckets in bytes, 4 KiB to 1 GiB
+BYTE_BUCKETS = tuple(4096 * 4**i for i in range(10))
+
+
+class _Sentinel:
+    """Kept in a thread's locals, collected when the thread ends"""
+
+    __slots__ = ("__weakref__",)
+
+
+class ThreadShards:
+    """
+    Per-thread values of one metric child, merged on read. The shard of a
+    thread that ended is folded into a base total, so threadpool workers
+    coming and going do not add up.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._local = threading.local()
+        self._shards: Dict[int, List[float]] = {}
+        self._base = [0.0] * size
+        self._lock = threading.Lock()
+
+    def mine(self) -> List[float]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = [0.0] * self.size
+            with self._lock:
+                self._shards[id(shard)] = shard
+            self._local.shard = shard
+            self._local.sentinel = _Sentinel()
+            weakref.finalize(self._local.sentinel, self._retire, shard)
+            return shard
+
+    def _retire(self, shard: List[float]):
+        """Fold the shard of a thread that ended into the base total"""
+        with self._lock:
+            del self._shards[id(shard)]
+            for i, value in enumerate(shard):
+                self._base[i] += value
+
+    def merged(self) -> List[float]:
+        with self._lock:
+            totals = list(self._base)
+            shards = list(self._shards.values())
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class Metric:
+    """Base class: a named metric with labelled children"""
+
+    type = "untyped"
+    suffix = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self.new_child()
+        return child
+
+    def new_child(self):
+        raise NotImplementedError
+
+    def children(self):
+        return list(self._children.items())
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class CounterChild:
+    __slots__ = ("_shards",)
+
+    def __init__(self):
+        self._shards = ThreadShards(1)
+
+    def inc(self, amount: float = 1):
+        self._shards.mine()[0] += amount
+
+    def value(self) -> float:
+        return self._shards.merged()[0]
+
+
+class Counter(Metric):
+    type = "counter"
+    suffix = "_total"
+
+    def new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for key, child in self.children():
+            yield self.name + self.suffix, dict(zip(self.labelnames, key)), child.value()
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1):
+        self._shards.mine()[0] -= amount
+
+
+class Gauge(Metric):
+    """A gauge moved with inc/dec, or computed at scrape time by `function`"""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def new_child(self):
+        return GaugeChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def samples(self):
+        if self.function is not None:
+            # function returns {label values tuple: value}
+            for key, value in self.function().items():
+                yield self.name, dict(zip(self.labelnames, key)), value
+            return
+        for key, child in self.children():
+            yield self.name, dict(zip(self.labelnames, key)), child.value()
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "_shards")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # one slot per bucket, +Inf, then sum and count
+        self._shards = ThreadShards(len(bounds) + 3)
+
+    def observe(self, value: float):
+        shard = self._shards.mine()
+        shard[bisect_left(self.bounds, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        merged = self._shards.merged()
+        return merged[:-2], merged[-2], merged[-1]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self):
+        for key, child in self.children():
+            labels = dict(zip(self.labelnames, key))
+            counts, total, count = child.snapshot()
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else format_value(bound)
+                yield self.name + "_bucket", {**labels, "le": le}, cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for metric in self.metrics:
+            family = metric.name + metric.suffix
+            lines.append(f"# HELP {family} {metric.documentation}")
+            lines.append(f"# TYPE {family} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = Registry()
+
+
+def cache_hit_ratios() -> Dict[Tuple[str, ...], float]:
+    requests: Dict[str, List[float]] = {}
+    for (cache, result), child in CACHE_REQUESTS.children():
+        counts = requests.setdefault(cache, [0.0, 0.0])
+        counts[0 if result == "hit" else 1] += child.value()
+    return {
+        (cache,): hits / (hits + misses)
+        for cache, (hits, misses) in requests.items()
+        if hits + misses
+    }
+
+
+def executor_stats() -> Dict[Tuple[str, ...], float]:
+    """Threadpool (run_in_threadpool / sync routes) usage, read from the running event loop"""
+    import anyio.to_thread
+
+    try:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+    except RuntimeError:  # no event loop, e.g. rendering from a script
+        return {}
+    statistics = limiter.statistics()
+    return {
+        ("busy",): statistics.borrowed_tokens,
+        ("waiting",): statistics.tasks_waiting,
+        ("limit",): limiter.total_tokens,
+    }
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a lookup in one of the in-process caches"""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+# Application metrics
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route")
+)
+QUERY_DURATION = Histogram(
+    "duckdb_query_duration_seconds",
+    "DuckDB statement duration (including connect) by helper",
+    ("database", "kind"),
+)
+QUERY_ROWS = Histogram(
+    "duckdb_query_rows", "Rows returned by DuckDB statements", ("database", "kind"), ROW_BUCKETS
+)
+TEMPLATE_RENDER_DURATION = Histogram(
+    "template_render_duration_seconds", "Jinja render duration by template", ("template",)
+)
+SSE_CONNECTIONS = Gauge("sse_active_connections", "Open text/event-stream responses")
+RESPONSE_BYTES = Counter(
+    "http_response_bytes",
+    "Response body bytes before and after compression by route",
+    ("route", "stage"),
+)
+CACHE_REQUESTS = Counter("cache_requests", "In-process cache lookups", ("cache", "result"))
+CACHE_HIT_RATIO = Gauge(
+    "cache_hit_ratio", "Hits / lookups per in-process cache", ("cache",), cache_hit_ratios
+)
+EXECUTOR_THREADS = Gauge(
+    "executor_threads",
+    "Default threadpool: busy threads, tasks waiting for a thread (queue depth) and limit",
+    ("state",),
+    executor_stats,
+)
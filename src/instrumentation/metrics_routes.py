@@ -0,0 +1,17 @@
+"""
+Prometheus scrape endpoint, only reachable from the host the app runs on
+"""
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from src.instrumentation.metrics import registry
+from src.utils import require_local_client
+
+router = APIRouter(tags=["instrumentation"], dependencies=[Depends(require_local_client)])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """All metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,202 @@
+"""
+Per-request timing: spans, Server-Timing headers and a process-wide aggregate.
+
+Code marks the expensive steps of a request with spans:
+
+    with span("db"):
+        df = con.sql(sql).df()
+
+TimingMiddleware collects the spans of each request, sends them to the browser
+as a `Server-Timing` header (db;dur=3.1, render;dur=8.4, total;dur=12.9) and
+logs a structured line for a sample of requests. Spans that finish after the
+headers went out (content of streamed pages) still reach the aggregate and the
+log line.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional
+
+from src.instrumentation.metrics import REQUEST_DURATION, SSE_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests logged with their spans (REQUEST_LOG_SAMPLE_RATE=1 logs all)
+DEFAULT_LOG_SAMPLE_RATE = 0.01
+
+
+class RequestTimings:
+    """Accumulated span durations of a single request"""
+
+    __slots__ = ("spans",)
+
+    def __init__(self):
+        # name -> [count, seconds]
+        self.spans: Dict[str, List] = {}
+
+    def add(self, name: str, seconds: float):
+        entry = self.spans.get(name)
+        if entry is None:
+            self.spans[name] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def server_timing(self, total: float) -> str:
+        """Format the spans as a Server-Timing header value"""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, (_, seconds) in self.spans.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+class SpanAggregator:
+    """Count, total and maximum duration per span name for the whole process"""
+
+    def __init__(self):
+        # name -> [count, total seconds, max seconds]
+        self.spans: Dict[str, List] = {}
+        # Spans are recorded from the event loop and the threadpool at once
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                entry = self.spans[name] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            spans = [(name, tuple(entry)) for name, entry in sorted(self.spans.items())]
+        return {
+            name: {
+                "count": count,
+                "total_ms": total * 1000,
+                "avg_ms": total * 1000 / count if count else 0.0,
+                "max_ms": maximum * 1000,
+            }
+            for name, (count, total, maximum) in spans
+        }
+
+
+aggregator = SpanAggregator()
+
+
+def record_span(name: str, seconds: float):
+    """Attribute a measured duration to the current request (if any) and the aggregate"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+    aggregator.record(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block and attribute it to the current request (if any)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """Decorator version of span()"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware timing each request.
+
+    Args:
+        app: The ASGI app to wrap
+        log_sample_rate: Fraction of requests to log, defaults to
+            REQUEST_LOG_SAMPLE_RATE or 1%
+    """
+
+    def __init__(self, app, log_sample_rate: Optional[float] = None):
+        self.app = app
+        if log_sample_rate is None:
+            log_sample_rate = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", DEFAULT_LOG_SAMPLE_RATE))
+        self.log_sample_rate = log_sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        status_code = 500
+        event_stream = False
+
+        async def send_with_timing(message):
+            nonlocal status_code, event_stream
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                value = timings.server_timing(time.perf_counter() - start)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", value.encode("latin-1")))
+                message = {**message, "headers": headers}
+                for key, header_value in headers:
+                    if key.lower() == b"content-type" and header_value.startswith(
+                        b"text/event-stream"
+                    ):
+                        event_stream = True
+                        SSE_CONNECTIONS.inc()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            total = time.perf_counter() - start
+            aggregator.record("request", total)
+            _current_timings.reset(token)
+            if event_stream:
+                SSE_CONNECTIONS.dec()
+
+            # Import here to avoid circular imports (src.utils uses span)
+            from src.utils import route_path
+
+            route = route_path(scope)
+            REQUEST_DURATION.labels(method=scope["method"], route=route).observe(total)
+            if self.log_sample_rate and random.random() < self.log_sample_rate:
+                self.log_request(scope, route, status_code, total, timings)
+
+    def log_request(
+        self, scope, route: str, status_code: int, total: float, timings: RequestTimings
+    ):
+        entry = {
+            "method": scope["method"],
+            "route": route,
+            "status": status_code,
+            "total_ms": round(total * 1000, 2),
+        }
+        for name, (count, seconds) in timings.spans.items():
+            entry[f"{name}_ms"] = round(seconds * 1000, 2)
+            entry[f"{name}_count"] = count
+        logger.info(json.dumps(entry))
@@ -5,20 +5,34 @@ from fastapi import APIRouter, Request, HTTPException, Form, Depends, Query
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
-from src.db import db_school
-from src.utils import prepare_table_context, response_adapter
+from datastar_py.sse import ServerSentEventGenerator
+
+from src.db.changes import Change, change_bus
+from src.instrumentation import span
+from src.utils import lazy_import, prepare_table_context, response_adapter
 from src.school.table_models import get_courses_table_config
 from src.school.models import Course
+from src.web import sse
 from pydantic import BaseModel, Field, ValidationError
 
+# The data layer (duckdb) is loaded on the first request, not when routes register
+db_school = lazy_import("src.db.db_school")
+
 # Create router for school module
 router = APIRouter(prefix="/school", tags=["school"])
 
-# Get the templates directory path
-templates_dir = os.path.join(
-    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "templates"
-)
-templates = Jinja2Templates(directory=templates_dir)
+# Share the app templates so pages get the layout globals (menu_data, static_url)
+from init import templates
+
+# Tells open course pages to reload their table (coursesRefresh in entity_page.html)
+COURSES_CHANGED = ServerSentEventGenerator.merge_signals({"coursesRefresh": True})
+
+
+@change_bus.subscribe
+def notify_course_pages(change: Change):
+    """Refresh the open course pages of this worker, whichever worker changed a course"""
+    if change.database == "school" and change.table == "course":
+        sse.manager.publish("course", COURSES_CHANGED)
 
 
 # Helper functions
@@ -40,8 +54,8 @@ def parse_filter_params(
 
 
 def filter_courses(courses: List[Any], filters: Dict[str, Any]) -> List[Any]:
-    """Filter courses based on the filter parameters"""
-    filtered_courses = courses.copy()
+    """Filter courses based on the filter parameters (the list itself is never modified)"""
+    filtered_courses = courses
 
     # Handle text search across multiple fields
     if "q" in filters and filters["q"]:
@@ -68,7 +82,7 @@ def filter_courses(courses: List[Any], filters: Dict[str, Any]) -> List[Any]:
 def sort_courses(
     courses: List[Any], sort_by: Optional[str], sort_asc: Optional[bool] = True
 ) -> List[Any]:
-    """Sort courses based on the sort parameters"""
+    """Sort courses in place based on the sort parameters, and return the list"""
     if not sort_by:
         return courses
 
@@ -81,20 +95,34 @@ def sort_courses(
 
     # Handle special case for code (case-insensitive sorting)
     if sort_by == "code":
-        sorted_courses = sorted(
-            courses, key=lambda c: str(get_value(c, sort_by)).lower(), reverse=not sort_asc
-        )
+        courses.sort(key=lambda c: str(get_value(c, sort_by)).lower(), reverse=not sort_asc)
     else:
-        sorted_courses = sorted(courses, key=lambda c: get_value(c, sort_by), reverse=not sort_asc)
+        courses.sort(key=lambda c: get_value(c, sort_by), reverse=not sort_asc)
 
-    return sorted_courses
+    return courses
+
+
+def courses_from_frame(db_courses) -> List[Dict[str, Any]]:
+    """Convert course rows to response dicts through the Course model"""
+    columns = list(db_courses.columns)
+    courses = []
+    with span("model"):
+        # itertuples yields plain tuples, iterrows would build a Series per row
+        for values in db_courses.itertuples(index=False, name=None):
+            course_dict = dict(zip(columns, values))
+            # Ensure ID is a string
+            if "id" in course_dict:
+                course_dict["id"] = str(course_dict["id"])
+            courses.append(Course.from_db_row(course_dict).to_response_dict())
+    return courses
 
 
 # Success and error messages
 def create_success_message() -> str:
     """Create a success message HTML snippet"""
     return """
-    <div class="bg-green-100 border border-green-400 text-green-700 px-4 py-3 rounded relative mb-4" role="alert">
+    <div class="bg-green-100 border border-green-400 text-green-700 px-4 py-3 rounded relative mb-4"
+        role="alert">
         <strong class="font-bold">Success!</strong>
         <span class="block sm:inline"> The operation was completed successfully.</span>
     </div>
@@ -104,7 +132,8 @@ def create_success_message() -> str:
 def create_error_message(error_msg: str = "") -> str:
     """Create an error message HTML snippet"""
     return f"""
-    <div class="bg-red-100 border border-red-400 text-red-700 px-4 py-3 rounded relative mb-4" role="alert">
+    <div class="bg-red-100 border border-red-400 text-red-700 px-4 py-3 rounded relative mb-4"
+        role="alert">
         <strong class="font-bold">Error!</strong>
         <span class="block sm:inline"> {error_msg}</span>
     </div>
@@ -120,40 +149,55 @@ class CourseCreate(BaseModel):
     active: bool = Field(False, description="Whether the course is active")
 
 
+async def course_form(request: Request) -> Dict[str, Any]:
+    """
+    Read the CourseCreate fields from the submitted form.
+
+    Validation is left to the routes, so a missing field reaches their
+    ValidationError handler instead of failing the dependency.
+    """
+    form = await request.form()
+    return {
+        "code": form.get("code"),
+        "title": form.get("title"),
+        "active": form.get("active") == "true" or form.get("active") == "on",
+    }
+
+
 # Routes
 @router.get("/courses", response_class=HTMLResponse)
 async def get_courses_page(request: Request):
     """Render the courses main page"""
-    # Get all courses from the database
-    db_courses = db_school.get_all("course")
 
-    # Convert DataFrame rows to Course models
-    courses = []
-    for index, row in db_courses.iterrows():
-        course_dict = row.to_dict()
-        # Ensure ID is a string
-        if "id" in course_dict:
-            course_dict["id"] = str(course_dict["id"])
-        # Create a Course model and convert to dict for template rendering
-        course = Course.from_db_row(course_dict)
-        courses.append(course.to_response_dict())
-
-    # Use the Pydantic model for table configuration
-    table_config = get_courses_table_config()
+    def load_context():
+        # Get all courses from the database
+        db_courses = db_school.get_all("course")
+
+        # Convert DataFrame rows to Course models
+        courses = courses_from_frame(db_courses)
 
-    # Use the entity_page.html template directly
-    context = prepare_table_context(request=request, table_config=table_config, items=courses)
+        # Use the Pydantic model for table configuration
+        table_config = get_courses_table_config()
 
-    # The entity_page template is different from the table template
+        return prepare_table_context(request=request, table_config=table_config, items=courses)
+
+    # The entity_page template is different from the table template.
+    # The context is loaded lazily so full pages can flush the layout shell first.
     return response_adapter(
         request=request,
         template_name="components/entity_page.html",
-        context=context,
+        context=load_context,
         templates=templates,
         url="/school/courses",
     )
 
 
+@router.get("/courses/stream")
+async def stream_courses():
+    """Live updates for open course pages (data-sse in entity_page.html)"""
+    return sse.manager.response("course")
+
+
 @router.get("/courses/new", response_class=HTMLResponse)
 async def get_new_course_form(request: Request):
     """Return the empty course form"""
@@ -184,15 +228,7 @@ async def get_courses_data(
     db_courses = db_school.get_all("course")
 
     # Convert DataFrame rows to Course models
-    courses = []
-    for index, row in db_courses.iterrows():
-        course_dict = row.to_dict()
-        # Ensure ID is a string
-        if "id" in course_dict:
-            course_dict["id"] = str(course_dict["id"])
-        # Create a Course model and convert to dict
-        course = Course.from_db_row(course_dict)
-        courses.append(course.to_response_dict())
+    courses = courses_from_frame(db_courses)
 
     # Apply filters if provided
     filters = parse_filter_params(q=q, active_only=active_only)
@@ -245,7 +281,8 @@ async def get_course(request: Request, course_id: str):
 
         # Create a Course Pydantic model from the database data
         # This will validate the data as it's loaded
-        course = Course.from_db_row(course_data.iloc[0].to_dict())
+        with span("model"):
+            course = Course.from_db_row(course_data.iloc[0].to_dict())
 
         return response_adapter(
             request=request,
@@ -278,13 +315,7 @@ async def get_course(request: Request, course_id: str):
 @router.post("/courses", response_class=HTMLResponse)
 async def create_course(
     request: Request,
-    form_data: CourseCreate = Depends(
-        lambda request: CourseCreate(
-            code=request.form.get("code"),
-            title=request.form.get("title"),
-            active=request.form.get("active") == "true" or request.form.get("active") == "on",
-        )
-    ),
+    form_data: Dict[str, Any] = Depends(course_form),
 ):
     """Create a new course with Pydantic validation"""
     try:
@@ -292,7 +323,7 @@ async def create_course(
         course_id = str(uuid.uuid4())
 
         # Create a validated Course model instance
-        new_course = Course(id=course_id, **form_data.dict())
+        new_course = Course(id=course_id, **CourseCreate(**form_data).dict())
 
         # Save the course to the database using the model's serialization method
         db_school.create("course", new_course.to_db_dict())
@@ -336,13 +367,7 @@ async def create_course(
 async def update_course(
     request: Request,
     course_id: str,
-    form_data: CourseCreate = Depends(
-        lambda request: CourseCreate(
-            code=request.form.get("code"),
-            title=request.form.get("title"),
-            active=request.form.get("active") == "true" or request.form.get("active") == "on",
-        )
-    ),
+    form_data: Dict[str, Any] = Depends(course_form),
 ):
     """Update an existing course with Pydantic validation"""
     try:
@@ -352,7 +377,7 @@ async def update_course(
             raise HTTPException(status_code=404, detail="Course not found")
 
         # Create a validated Course model instance for the update
-        updated_course = Course(id=course_id, **form_data.dict())
+        updated_course = Course(id=course_id, **CourseCreate(**form_data).dict())
 
         # Update the course in the database using the model's serialization method
         db_school.update("course", updated_course.to_db_dict())
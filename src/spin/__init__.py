@@ -0,0 +1,3 @@
+"""
+SPIN course selection: assigning students to the classes they chose
+"""
@@ -0,0 +1,938 @@
+"""
+Assignment of students to SPIN classes.
+
+Students rank courses per group in student_selection (IM1-IM3, IW1-IW5,
+GA1-GA5: group, then rank); spin_class offers courses at a timeslot in a room.
+The solver gives every active student at most one class per group:
+
+- a class of a course they chose in that group, open to their program
+  (`for_program` is theirs or ALL)
+- no more students than its room seats (`room.capacity` in the school
+  database, SPIN_DEFAULT_CAPACITY for rooms it doesn't know)
+- no two classes whose timeslots overlap: labels ('Tue: 10:30 - 11:50') are
+  read as minute intervals of the week (src/spin/conflicts.py), and labels
+  that don't parse only clash with themselves
+
+and maximizes the total value of the seats given: ASSIGNED_VALUE per seat plus
+one for every rank above the group's last, so placing one more student counts
+more than moving another to a better choice.
+
+Classes of the same course, timeslot and program are interchangeable, so the
+solver works on these buckets (capacity: the sum of the rooms) and seats each
+bucket's students in its classes at the end. Each group is a min-cost flow
+(transportation) problem, solved exactly by the primal-dual method (see
+Market): NumPy seats most students at a best choice at once, then the rest go
+along augmenting paths that move others between buckets, with bucket prices
+raised between rounds. Groups are solved in GROUP_ORDER, each avoiding the
+timeslots of the earlier ones; the result is optimal per group given the
+earlier groups, not over all groups at once (that is an integer program).
+
+Limits: on seeded databases (benchmarks/bench_assignment.py) a solve takes
+0.06s for 1k students and 2.3s for 10k, but 25s for 50k, where the augmenting
+paths walked in Python dominate. Seconds hold up to about 10k students; at 50k
+run the solver offline (the command below), not from a request.
+
+The result replaces the assignment table in one transaction: one bulk insert,
+`student_selection.assigned` marks the choices given, and pairs already
+uploaded stay uploaded. The change-log cursor the problem was read at is stored
+with it (`materialized_view`), for src/spin/repair.py to start from.
+
+    uv run python -m src.spin.assignment --dry-run
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.db import db_school, db_spin
+from src.db.change_log import CURSOR_DDL, write_cursor
+from src.db.changes import change_bus
+from src.instrumentation import span
+from src.spin.conflicts import to_intervals
+
+logger = logging.getLogger(__name__)
+
+# Groups are solved in this order (intensive courses first), unknown ones after
+GROUP_ORDER = ("IM", "IW", "GA")
+# Classes open to every program
+ALL_PROGRAMS = "ALL"
+# Value of any seat, on top of one per rank above the group's last
+ASSIGNED_VALUE = 5
+# Seats of classes whose room is not in the school database
+DEFAULT_CAPACITY = int(os.environ.get("SPIN_DEFAULT_CAPACITY", 20))
+# Cursor of the changes the stored assignment was solved with
+CURSOR = "assignment"
+
+STUDENTS_SQL = """
+    SELECT id::VARCHAR AS id, coalesce(program, '') AS program
+    FROM student
+    WHERE active
+"""
+# Choices of active students: group and rank from the preference code (GA2: GA, 2),
+# the best rank if a course was chosen twice in a group
+CHOICES_SQL = """
+    SELECT * FROM (
+        SELECT
+            s.id::VARCHAR AS id,
+            s.student_id::VARCHAR AS student_id,
+            regexp_extract(s.preference_code, '^(.*?)[0-9]+$', 1) AS course_group,
+            TRY_CAST(regexp_extract(s.preference_code, '([0-9]+)$', 1) AS INTEGER) AS rank,
+            s.course_code
+        FROM student_selection s
+        JOIN student ON student.id = s.student_id AND student.active
+        WHERE s.course_code IS NOT NULL
+    )
+    WHERE rank IS NOT NULL
+    QUALIFY row_number() OVER (
+        PARTITION BY student_id, course_group, course_code ORDER BY rank, id
+    ) = 1
+"""
+CLASSES_SQL = f"""
+    SELECT
+        id::VARCHAR AS id,
+        course_code,
+        timeslot,
+        room_name,
+        coalesce(for_program, '{ALL_PROGRAMS}') AS for_program
+    FROM spin_class
+    WHERE course_code IS NOT NULL AND timeslot IS NOT NULL
+    ORDER BY id
+"""
+ROOMS_SQL = "SELECT name, max(capacity) AS capacity FROM room WHERE name IS NOT NULL GROUP BY name"
+
+# Replace the assignments with the `solved` frame, keeping the uploaded flags
+WRITE_STATEMENTS = (
+    """
+    CREATE OR REPLACE TEMP TABLE solved_assignment AS
+    SELECT
+        solved.student_id::UUID AS student_id,
+        solved.spin_class_id::UUID AS spin_class_id,
+        coalesce(assignment.uploaded, false) AS uploaded
+    FROM solved
+    LEFT JOIN assignment
+        ON assignment.student_id = solved.student_id::UUID
+        AND assignment.spin_class_id = solved.spin_class_id::UUID
+    """,
+    "DELETE FROM assignment",
+    "INSERT INTO assignment SELECT * FROM solved_assignment",
+    "UPDATE student_selection SET assigned = id IN (SELECT selection_id::UUID FROM solved)",
+    "DROP TABLE solved_assignment",
+)
+
+
+@dataclass
+class Problem:
+    """Students, their choices and the classes, as arrays of indexes"""
+
+    student_ids: np.ndarray
+    student_program: np.ndarray
+    class_ids: np.ndarray
+    class_course: np.ndarray
+    class_timeslot: np.ndarray
+    class_program: np.ndarray
+    class_capacity: np.ndarray
+    choice_ids: np.ndarray
+    choice_student: np.ndarray
+    choice_group: np.ndarray
+    choice_rank: np.ndarray
+    choice_course: np.ndarray
+    courses: List[str]
+    groups: List[str]
+    programs: List[str]
+    timeslots: List[str]
+    # Whether two timeslots (by index) overlap, a timeslot always clashing with itself
+    timeslot_clash: np.ndarray
+    # Change-log cursor of the data read (see ChangeLog.committed)
+    seq: int = 0
+
+
+@dataclass
+class Solution:
+    """The choice given and the class of each assignment"""
+
+    choices: np.ndarray
+    classes: np.ndarray
+    walks: int
+    repricings: int
+    seconds: float
+
+
+def load_problem(spin_con, school_con) -> Problem:
+    """Read students, choices, classes and room capacities"""
+    seq = db_spin.change_log.committed(spin_con)
+    students = spin_con.execute(STUDENTS_SQL).df()
+    choices = spin_con.execute(CHOICES_SQL).df()
+    classes = spin_con.execute(CLASSES_SQL).df()
+    rooms = school_con.execute(ROOMS_SQL).df()
+    problem = build_problem(students, choices, classes, rooms)
+    problem.seq = seq
+    return problem
+
+
+def build_problem(
+    students: pd.DataFrame, choices: pd.DataFrame, classes: pd.DataFrame, rooms: pd.DataFrame
+) -> Problem:
+    """
+    Index the frames read by `load_problem`.
+
+    Choices of courses without classes are left out, no solver can place them.
+    """
+    courses = pd.Index(classes["course_code"].unique())
+    choice_course = courses.get_indexer(choices["course_code"])
+    choices = choices[choice_course >= 0]
+    choice_course = choice_course[choice_course >= 0]
+
+    present = set(choices["course_group"])
+    groups = [group for group in GROUP_ORDER if group in present]
+    groups += sorted(present - set(groups))
+    programs = pd.Index(
+        sorted(set(students["program"]) | set(classes["for_program"]) | {ALL_PROGRAMS})
+    )
+    timeslot_codes, timeslots = pd.factorize(classes["timeslot"])
+    capacity = classes["room_name"].map(rooms.set_index("name")["capacity"])
+
+    return Problem(
+        student_ids=students["id"].to_numpy(),
+        student_program=programs.get_indexer(students["program"]),
+        class_ids=classes["id"].to_numpy(),
+        class_course=courses.get_indexer(classes["course_code"]),
+        class_timeslot=timeslot_codes.astype(np.int64),
+        class_program=programs.get_indexer(classes["for_program"]),
+        class_capacity=capacity.fillna(DEFAULT_CAPACITY).clip(lower=0).to_numpy(np.int64),
+        choice_ids=choices["id"].to_numpy(),
+        choice_student=pd.Index(students["id"]).get_indexer(choices["student_id"]),
+        choice_group=pd.Index(groups).get_indexer(choices["course_group"]),
+        choice_rank=choices["rank"].to_numpy(np.int64),
+        choice_course=choice_course.astype(np.int64),
+        courses=list(courses),
+        groups=groups,
+        programs=list(programs),
+        timeslots=list(timeslots),
+        timeslot_clash=timeslot_clashes(timeslots),
+    )
+
+
+def update_problem(
+    problem: Problem, student_ids: Iterable[str], students: pd.DataFrame, choices: pd.DataFrame
+) -> Optional[Problem]:
+    """
+    The problem with the rows of some students read again, instead of a new build.
+
+    Args:
+        problem: The problem to update
+        student_ids: The students read again
+        students: Their rows in STUDENTS_SQL (students no longer active are missing)
+        choices: Their rows in CHOICES_SQL
+
+    Returns:
+        The updated problem (students no longer active keep their index, without
+        choices), None when it needs a new build: a program or group it doesn't have
+    """
+    # Choices of courses without classes are left out (see `build_problem`)
+    choice_course = pd.Index(problem.courses).get_indexer(choices["course_code"])
+    choices, choice_course = choices[choice_course >= 0], choice_course[choice_course >= 0]
+    program = pd.Index(problem.programs).get_indexer(students["program"])
+    group = pd.Index(problem.groups).get_indexer(choices["course_group"])
+    if (program < 0).any() or (group < 0).any():
+        return None
+
+    index = pd.Index(problem.student_ids)
+    added = students["id"][index.get_indexer(students["id"]) < 0].to_numpy()
+    student_ids_all = np.concatenate([problem.student_ids, added])
+    index = pd.Index(student_ids_all)
+    student_program = np.concatenate([problem.student_program, np.zeros(len(added), np.int64)])
+    student_program[index.get_indexer(students["id"])] = program
+    choice_student = index.get_indexer(choices["student_id"])
+    changed = index.get_indexer(pd.Index(list(student_ids), dtype=object))
+    kept = ~np.isin(problem.choice_student, changed[changed >= 0])
+    return replace(
+        problem,
+        student_ids=student_ids_all,
+        student_program=student_program,
+        choice_ids=np.concatenate([problem.choice_ids[kept], choices["id"].to_numpy()]),
+        choice_student=np.concatenate([problem.choice_student[kept], choice_student]),
+        choice_group=np.concatenate([problem.choice_group[kept], group]),
+        choice_rank=np.concatenate([problem.choice_rank[kept], choices["rank"].to_numpy(np.int64)]),
+        choice_course=np.concatenate([problem.choice_course[kept], choice_course]),
+    )
+
+
+def timeslot_clashes(timeslots: Iterable[str]) -> np.ndarray:
+    """Matrix of the timeslot labels whose minute intervals overlap"""
+    starts, ends = to_intervals(timeslots)
+    clash = (starts[:, None] < ends[None, :]) & (starts[None, :] < ends[:, None])
+    np.fill_diagonal(clash, True)
+    return clash
+
+
+def solve(
+    problem: Problem, current: Optional[np.ndarray] = None, changed: Optional[np.ndarray] = None
+) -> Solution:
+    """
+    Assign the students, group by group.
+
+    Args:
+        problem: The students, choices and classes
+        current: An earlier assignment to start from: class per student and
+            group, -1 for none. The result is still optimal, and of the optimal
+            assignments the one keeping the most students where they are (see
+            Market.start_from).
+        changed: Students placed again whatever their current classes (bool per
+            student), with `current`
+    """
+    start = time.perf_counter()
+    n_programs, n_timeslots = len(problem.programs), max(1, len(problem.timeslots))
+    all_programs = problem.programs.index(ALL_PROGRAMS)
+
+    # Buckets: the classes of a course at a timeslot for a program
+    keys = (problem.class_course * n_timeslots + problem.class_timeslot) * n_programs
+    bucket_keys, class_bucket = np.unique(keys + problem.class_program, return_inverse=True)
+    capacity = np.bincount(class_bucket, problem.class_capacity, len(bucket_keys)).astype(np.int64)
+    bucket_program = bucket_keys % n_programs
+    bucket_timeslot = bucket_keys // n_programs % n_timeslots
+    bucket_course = bucket_keys // (n_programs * n_timeslots)
+
+    # Timeslot of each student's class per group, -1 for none
+    taken = np.full((len(problem.student_ids), len(problem.groups)), -1, np.int64)
+    choices, classes, walks, repricings = [], [], 0, 0
+    for group in range(len(problem.groups)):
+        rows = np.flatnonzero(problem.choice_group == group)
+        rows = rows[np.argsort(problem.choice_student[rows], kind="stable")]
+        students, row_student = np.unique(problem.choice_student[rows], return_inverse=True)
+        ranks = problem.choice_rank[rows]
+
+        # A row may take the buckets of its course open to the student's program,
+        # at a timeslot the student has free
+        option_row, option_bucket = options(
+            problem.choice_course[rows],
+            problem.student_program[students][row_student],
+            bucket_course,
+            bucket_program,
+            all_programs,
+        )
+        option_student = row_student[option_row]
+        allowed = capacity[option_bucket] > 0
+        for column in taken[students, :group].T:
+            other = column[option_student]
+            allowed &= (other < 0) | ~problem.timeslot_clash[bucket_timeslot[option_bucket], other]
+        option_row, option_bucket = option_row[allowed], option_bucket[allowed]
+        option_student = option_student[allowed]
+
+        value = (ASSIGNED_VALUE + ranks.max(initial=0) + 1 - ranks)[option_row]
+        kept = held = waiting = None
+        if current is not None:
+            kept = current[students, group]
+            # A student has at most one option per bucket
+            held = np.full(len(students), -1, np.int64)
+            kept_bucket = np.where(kept >= 0, class_bucket[kept], -1)
+            found = np.flatnonzero(option_bucket == kept_bucket[option_student])
+            held[option_student[found]] = found
+            # One more for staying put, worth less than any other change in value:
+            # of the optimal assignments, the one moving the fewest students
+            value *= len(students) + 1
+            value[held[held >= 0]] += 1
+            waiting = (kept >= 0) & (held < 0)
+            if changed is not None:
+                waiting |= changed[students]
+        market = Market(option_student, option_bucket, value, capacity, len(students))
+        with span("assignment.group"):
+            if current is not None:
+                market.start_from(held, waiting)
+            market.solve()
+        held = market.held
+        placed = np.flatnonzero(held >= 0)
+        seated = fill_classes(
+            option_bucket[held[placed]],
+            class_bucket,
+            problem.class_capacity,
+            None if kept is None else kept[placed],
+        )
+        taken[students[placed], group] = problem.class_timeslot[seated]
+        choices.append(rows[option_row[held[placed]]])
+        classes.append(seated)
+        walks += market.walks
+        repricings += market.repricings
+        logger.debug(
+            "Group %s: %d of %d students placed in %d walks, %d repricings, %d released",
+            problem.groups[group],
+            len(placed),
+            len(students),
+            market.walks,
+            market.repricings,
+            market.released,
+        )
+
+    return Solution(
+        choices=np.concatenate(choices) if choices else np.zeros(0, np.int64),
+        classes=np.concatenate(classes) if classes else np.zeros(0, np.int64),
+        walks=walks,
+        repricings=repricings,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def options(
+    row_course: np.ndarray,
+    row_program: np.ndarray,
+    bucket_course: np.ndarray,
+    bucket_program: np.ndarray,
+    all_programs: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(row, bucket) pairs: the buckets of each row's course open to its program, sorted"""
+    # The buckets of a course are consecutive (bucket_course is sorted)
+    starts = np.searchsorted(bucket_course, row_course)
+    counts = np.searchsorted(bucket_course, row_course, side="right") - starts
+    row = np.repeat(np.arange(len(row_course)), counts)
+    bucket = ranges(starts, counts)
+    open_to = bucket_program[bucket]
+    keep = (open_to == row_program[row]) | (open_to == all_programs)
+    return row[keep], bucket[keep]
+
+
+class Market:
+    """
+    One group's students, the buckets they may take, and their assignment.
+
+    A min-cost flow (transportation) problem, solved by the primal-dual method.
+    Every bucket has a price and every student a profit, the most any option
+    is worth to them at these prices (value - price, 0 for staying out). An
+    option is tight when it is worth the student's profit. Students placed hold
+    tight options and buckets with free seats cost nothing, which makes the
+    assignment optimal for the students placed (complementary slackness).
+
+    `solve` alternates two steps until every student is placed or out:
+
+    - `augment`: place the waiting students along paths of tight options: a
+      student takes a bucket with a free seat, or a full one whose holder moves
+      on to another tight option, and so on (or out, at profit 0). A maximum
+      flow over the tight options, by Dinic's method.
+    - `reprice`: shortest distances over all options from the waiting students
+      (vectorized Bellman-Ford), on reduced costs (the profit given up). Buckets
+      nearer than the nearest free seat get dearer by the difference, which
+      makes the shortest paths tight and lowers the waiting students' profits
+      by at least 1.
+
+    Values are small integers, so there are few repricings: a waiting student
+    at profit 0 is out.
+
+    `start_from` sets up an earlier assignment with prices that keep it
+    optimal, so `solve` only places the students waiting again.
+
+    Args:
+        option_student: Student of each option, sorted
+        option_bucket: Bucket of each option
+        option_value: Value of each option, positive
+        capacity: Seats per bucket
+        n_students: Number of students
+    """
+
+    def __init__(
+        self,
+        option_student: np.ndarray,
+        option_bucket: np.ndarray,
+        option_value: np.ndarray,
+        capacity: np.ndarray,
+        n_students: int,
+    ):
+        self.option_student = option_student
+        self.option_bucket = option_bucket
+        self.option_value = option_value
+        self.start = np.searchsorted(option_student, np.arange(n_students + 1))
+        self.capacity = capacity
+        self.price = np.zeros(len(capacity), np.int64)
+        self.free = capacity.astype(np.int64)
+        # Option held by each student, -1 for none (out, or waiting)
+        self.held = np.full(n_students, -1, np.int64)
+        self.waiting = np.ones(n_students, bool)
+        self.walks = 0
+        self.repricings = 0
+        self.released = 0
+
+    def solve(self):
+        """Place every student, or leave them out"""
+        self.seat_best()
+        while True:
+            self.augment()
+            if not self.waiting.any():
+                return
+            self.reprice()
+
+    def start_from(self, held: np.ndarray, waiting: np.ndarray):
+        """
+        Start from an earlier assignment instead of from scratch.
+
+        Students keep their options (-1: out) where prices can make that
+        optimal, and `waiting` students wait to be placed. Prices are the lowest
+        that make every kept option (and out) the best: longest paths over the
+        options (vectorized Bellman-Ford). Students whose options no prices can
+        keep are released and wait too. A bucket left with free seats at a
+        price then gets cheaper until someone takes the seat, whose own seat is
+        then free (see `fill_vacancies`).
+
+        Args:
+            held: Option held per student, -1 for none
+            waiting: Students to place again, bool per student
+        """
+        self.held = np.where(waiting, -1, held)
+        self.waiting = waiting.copy()
+        while True:
+            # More holders than seats (capacity went down): the last ones go
+            holders = np.flatnonzero(self.held >= 0)
+            holder_bucket = self.option_bucket[self.held[holders]]
+            order = np.argsort(holder_bucket, kind="stable")
+            position = np.arange(len(order)) - np.searchsorted(
+                holder_bucket[order], holder_bucket[order]
+            )
+            released = holders[order[position >= self.capacity[holder_bucket[order]]]]
+            self.free = self.capacity - np.bincount(holder_bucket, minlength=len(self.capacity))
+            if not released.size:
+                released = self.lowest_prices()
+            if not released.size:
+                break
+            self.held[released] = -1
+            self.waiting[released] = True
+            self.released += len(released)
+        self.fill_vacancies()
+
+    def lowest_prices(self) -> np.ndarray:
+        """Set the prices for `start_from`; the students whose options they can't keep"""
+        n_buckets = len(self.price)
+        out = n_buckets
+        student, bucket, value = self.option_student, self.option_bucket, self.option_value
+        settled = np.flatnonzero(~self.waiting)
+        holders = settled[self.held[settled] >= 0]
+        position = np.full(len(self.held), out, np.int64)
+        position[holders] = bucket[self.held[holders]]
+        held_value = np.zeros(len(self.held), np.int64)
+        held_value[holders] = value[self.held[holders]]
+
+        # An option (or out, for holders) may be worth at most what the student holds:
+        # price[target] >= price[source] + weight, with out at 0
+        edges = np.flatnonzero(~self.waiting[student])
+        source = np.concatenate([position[student[edges]], position[holders]])
+        target = np.concatenate([bucket[edges], np.full(len(holders), out)])
+        weight = np.concatenate([value[edges] - held_value[student[edges]], -held_value[holders]])
+        mover = np.concatenate([student[edges], holders])
+        to_out = target == out
+
+        price = np.zeros(n_buckets + 1, np.int64)
+        for _ in range(n_buckets + 1):
+            raised = price[source] + weight
+            better = np.flatnonzero((raised > price[target]) & ~to_out)
+            if not better.size:
+                break
+            np.maximum.at(price, target[better], raised[better])
+        else:
+            # Rising forever: holders that would all gain by moving round a cycle
+            return np.unique(mover[better])
+
+        # Holders worth less than nothing
+        broken = (raised > 0) & to_out
+        if broken.any():
+            return np.unique(mover[broken])
+        self.price = price[:n_buckets]
+        return np.zeros(0, np.int64)
+
+    def fill_vacancies(self):
+        """Make the buckets with free seats free again, one seat at a time (see `fill_vacancy`)"""
+        vacant = np.flatnonzero((self.free > 0) & (self.price > 0))
+        if not vacant.size:
+            return
+        by_bucket = np.argsort(self.option_bucket, kind="stable")
+        first = np.searchsorted(self.option_bucket[by_bucket], np.arange(len(self.price) + 1))
+        for bucket in vacant:
+            while self.free[bucket] > 0 and self.price[bucket] > 0:
+                self.fill_vacancy(bucket, by_bucket, first)
+
+    def fill_vacancy(self, bucket: int, by_bucket: np.ndarray, first: np.ndarray):
+        """
+        Fill a free seat of a bucket with a price, or make the bucket free.
+
+        `reprice` and `augment` the other way round: shortest distances (Dijkstra)
+        from the bucket over the moves that fill a seat, on reduced costs. The
+        seat is taken by a student from out, or by a holder of another bucket,
+        whose seat is then free, and so on, until a free seat stays where its
+        price can go down to 0 (the bucket itself at worst). The buckets nearer
+        than that get cheaper by the difference, which keeps every student's
+        option the best and makes the path tight.
+
+        Args:
+            bucket: The bucket with a free seat
+            by_bucket: Options sorted by bucket
+            first: Start of each bucket's options in `by_bucket`
+        """
+        student, value = self.option_student, self.option_value
+        distance, via, settled = {bucket: 0}, {}, {}
+        # (length, bucket where a seat stays free, option of a student coming in from out)
+        best = (self.price[bucket], bucket, -1)
+        heap = [(0, bucket)]
+        while heap:
+            reached, target = heapq.heappop(heap)
+            if reached >= best[0]:
+                break
+            if target in settled:
+                continue
+            settled[target] = reached
+            if reached + self.price[target] < best[0]:
+                best = (reached + self.price[target], target, -1)
+
+            # Students who may take a seat here: from out, or leaving theirs free
+            movers = by_bucket[first[target] : first[target + 1]]
+            held = self.held[student[movers]]
+            movers = movers[~self.waiting[student[movers]] & (held != movers)]
+            held = self.held[student[movers]]
+            profit = np.where(held >= 0, value[held] - self.price[self.option_bucket[held]], 0)
+            length = reached + profit - (value[movers] - self.price[target])
+            entering = held < 0
+            if entering.any() and length[entering].min() < best[0]:
+                nearest = np.flatnonzero(entering)[length[entering].argmin()]
+                best = (length[nearest], target, movers[nearest])
+            source = self.option_bucket[held[~entering]]
+            length, movers = length[~entering], movers[~entering]
+            order = np.lexsort((length, source))
+            firsts = np.ones(len(order), bool)
+            firsts[1:] = source[order[1:]] != source[order[:-1]]
+            for option in order[firsts]:
+                if length[option] < distance.get(source[option], best[0]):
+                    distance[source[option]] = length[option]
+                    via[source[option]] = movers[option]
+                    heapq.heappush(heap, (length[option], source[option]))
+
+        shortest, stays, entering = best
+        for settled_bucket, reached in settled.items():
+            self.price[settled_bucket] -= max(0, shortest - reached)
+        if entering >= 0:
+            self.held[student[entering]] = entering
+            self.free[stays] -= 1
+        # Back along the path, each student taking the seat the next one left
+        while stays != bucket:
+            option = via[stays]
+            self.held[student[option]] = option
+            self.free[stays] += 1
+            stays = self.option_bucket[option]
+            self.free[stays] -= 1
+
+    def profits(self) -> np.ndarray:
+        """Each student's profit at the current prices"""
+        net = self.option_value - self.price[self.option_bucket]
+        starts = self.start[:-1]
+        some = starts < self.start[1:]
+        profit = np.zeros(len(self.held), np.int64)
+        if net.size:
+            profit[some] = np.maximum.reduceat(net, starts[some])
+        return np.maximum(profit, 0)
+
+    def seat_best(self):
+        """
+        Seat the waiting students at their best options while the buckets have room.
+
+        Vectorized: the students ask for a bucket among their tight options
+        that still has free seats, and each bucket takes as many as it can;
+        again, while some get a seat.
+        """
+        student, bucket = self.option_student, self.option_bucket
+        profit = self.profits()
+        candidates = np.flatnonzero(
+            self.waiting[student] & (self.option_value - self.price[bucket] == profit[student])
+        )
+        while candidates.size:
+            candidates = candidates[
+                self.waiting[student[candidates]] & (self.free[bucket[candidates]] > 0)
+            ]
+            # One request per student, its first such option
+            first = np.ones(len(candidates), bool)
+            first[1:] = student[candidates[1:]] != student[candidates[:-1]]
+            requests = candidates[first]
+            if not requests.size:
+                return
+            order = np.argsort(bucket[requests], kind="stable")
+            requested = bucket[requests][order]
+            position = np.arange(len(order)) - np.searchsorted(requested, requested)
+            granted = requests[order[position < self.free[requested]]]
+            self.held[student[granted]] = granted
+            self.waiting[student[granted]] = False
+            np.subtract.at(self.free, bucket[granted], 1)
+
+    def augment(self):
+        """
+        Place waiting students along paths of tight options, until none is left.
+
+        Dinic's method: number the buckets by their distance to a free seat
+        over tight moves (vectorized, breadth-first from the free seats), walk
+        each waiting student down the numbers, skipping the buckets found to be
+        dead ends; again until no waiting student has a path.
+        """
+        profit = self.profits()
+        self.waiting &= profit > 0
+        tight = self.option_value - self.price[self.option_bucket] == profit[self.option_student]
+        while self.waiting.any() and self.walk(tight, profit == 0):
+            pass
+
+    def walk(self, tight: np.ndarray, can_leave: np.ndarray) -> bool:
+        """One round of `augment`; False if no waiting student has a path"""
+        student, bucket = self.option_student, self.option_bucket
+        n_buckets = len(self.free)
+        out = n_buckets
+        seat = np.full(len(self.held), -1, np.int64)
+        movers = np.flatnonzero(self.held >= 0)
+        seat[movers] = bucket[self.held[movers]]
+
+        # Moves: a holder to another tight option, or out (bucket n_buckets)
+        moves = np.flatnonzero(tight & (seat[student] >= 0))
+        moves = moves[bucket[moves] != seat[student[moves]]]
+        leaving = movers[can_leave[movers]]
+        move_mover = np.concatenate([student[moves], leaving])
+        move_option = np.concatenate([moves, np.full(len(leaving), -1)])
+        move_source = seat[move_mover]
+        move_target = np.concatenate([bucket[moves], np.full(len(leaving), out)])
+
+        # Distance of each bucket to a free seat, in moves
+        unreached = np.iinfo(np.int64).max
+        level = np.full(n_buckets + 1, unreached)
+        level[np.flatnonzero(self.free > 0)] = 0
+        level[out] = 0
+        distance = 0
+        while True:
+            reached = (level[move_target] == distance) & (level[move_source] == unreached)
+            if not reached.any():
+                break
+            distance += 1
+            level[move_source[reached]] = distance
+
+        starts = np.flatnonzero(self.waiting[student] & tight & (level[bucket] < unreached))
+        if not starts.size:
+            return False
+        self.walks += 1
+
+        # Moves down the levels, by bucket
+        down = np.flatnonzero(level[move_target] == level[move_source] - 1)
+        down = down[np.argsort(move_source[down], kind="stable")]
+        first = np.searchsorted(move_source[down], np.arange(n_buckets + 1)).tolist()
+        move_mover = move_mover[down].tolist()
+        move_option = move_option[down].tolist()
+        move_target = move_target[down].tolist()
+        seat, held, free = seat.tolist(), self.held.tolist(), self.free.tolist()
+        following = first[:-1]
+        blocked = bytearray(n_buckets + 1)
+        placed = []
+
+        for start, walker, target in zip(
+            starts.tolist(), student[starts].tolist(), bucket[starts].tolist()
+        ):
+            if held[walker] >= 0 or blocked[target]:
+                continue
+            # Depth-first down the levels; path[i + 1] is reached by steps[i]
+            path, steps = [target], []
+            while path:
+                current = path[-1]
+                if current == out or free[current] > 0:
+                    break
+                index, end = following[current], first[current + 1]
+                while index < end and (
+                    seat[move_mover[index]] != current or blocked[move_target[index]]
+                ):
+                    index += 1
+                following[current] = index
+                if index < end:
+                    path.append(move_target[index])
+                    steps.append(index)
+                    continue
+                blocked[current] = 1
+                path.pop()
+                if steps:
+                    following[path[-1]] = steps.pop() + 1
+            if not path:
+                continue
+
+            # Shift the students along the path
+            if path[-1] != out:
+                free[path[-1]] -= 1
+            for index in steps:
+                mover = move_mover[index]
+                seat[mover] = move_target[index] if move_target[index] != out else -1
+                held[mover] = move_option[index]
+            seat[walker], held[walker] = path[0], start
+            placed.append(walker)
+
+        self.held = np.asarray(held, np.int64)
+        self.free = np.asarray(free, np.int64)
+        self.waiting[placed] = False
+        return True
+
+    def reprice(self):
+        """Raise the prices of the buckets nearer to the waiting students than a free seat"""
+        self.repricings += 1
+        n_buckets = len(self.price)
+        price, profit = self.price, self.profits()
+        student, bucket = self.option_student, self.option_bucket
+        cost = profit[student] - self.option_value + price[bucket]
+
+        # Sources: the waiting students' options; out is bucket n_buckets
+        distance = np.full(n_buckets + 1, np.iinfo(np.int64).max // 2)
+        sources = self.waiting[student]
+        np.minimum.at(distance, bucket[sources], cost[sources])
+        distance[n_buckets] = profit[self.waiting].min()
+
+        # Moves: a holder leaves its bucket for another option, or out
+        movers = np.flatnonzero(self.held >= 0)
+        counts = self.start[movers + 1] - self.start[movers]
+        options = ranges(self.start[movers], counts)
+        source = np.concatenate(
+            [np.repeat(bucket[self.held[movers]], counts), bucket[self.held[movers]]]
+        )
+        target = np.concatenate([bucket[options], np.full(len(movers), n_buckets)])
+        weight = np.concatenate([cost[options], profit[movers]])
+        # Out is never further than the nearest waiting student's profit
+        bound = distance[n_buckets]
+        while True:
+            nearer = distance[source] + weight
+            nearer[nearer >= bound] = bound
+            better = np.flatnonzero(nearer < distance[target])
+            if not better.size:
+                break
+            np.minimum.at(distance, target[better], nearer[better])
+
+        nearest = min(
+            distance[n_buckets],
+            distance[:n_buckets][self.free > 0].min(initial=distance[n_buckets]),
+        )
+        price += np.maximum(0, nearest - distance[:n_buckets])
+
+
+def ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenated aranges: starts[i], ..., starts[i] + counts[i] - 1 for each i"""
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(counts.sum())
+
+
+def fill_classes(
+    bucket: np.ndarray,
+    class_bucket: np.ndarray,
+    class_capacity: np.ndarray,
+    current: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Seat the students placed in each bucket in its classes, filling them in order.
+
+    Students whose `current` class (-1 for none) is in their bucket stay in it
+    while it has room.
+    """
+    classes = np.full(len(bucket), -1, np.int64)
+    capacity = class_capacity
+    if current is not None:
+        stay = np.flatnonzero(current >= 0)
+        stay = stay[class_bucket[current[stay]] == bucket[stay]]
+        stay = stay[np.argsort(current[stay], kind="stable")]
+        sorted_class = current[stay]
+        position = np.arange(len(stay)) - np.searchsorted(sorted_class, sorted_class)
+        kept = stay[position < class_capacity[sorted_class]]
+        classes[kept] = current[kept]
+        capacity = class_capacity - np.bincount(current[kept], minlength=len(class_capacity))
+
+    rest = np.flatnonzero(classes < 0)
+    order = rest[np.argsort(bucket[rest], kind="stable")]
+    sorted_bucket = bucket[order]
+    position = np.arange(len(order)) - np.searchsorted(sorted_bucket, sorted_bucket)
+    class_order = np.argsort(class_bucket, kind="stable")
+    seats = np.cumsum(capacity[class_order])
+    first = np.searchsorted(class_bucket[class_order], sorted_bucket)
+    before = np.where(first > 0, seats[first - 1], 0)
+    classes[order] = class_order[np.searchsorted(seats, before + position, side="right")]
+    return classes
+
+
+def summarize(problem: Problem, solution: Solution) -> Dict:
+    """Counts of the solution: requests (student and group), seats given by rank"""
+    requests = np.unique(problem.choice_student * len(problem.groups) + problem.choice_group)
+    ranks = problem.choice_rank[solution.choices]
+    groups = problem.choice_group[solution.choices]
+    return {
+        "students": len(problem.student_ids),
+        "classes": len(problem.class_ids),
+        "choices": len(problem.choice_ids),
+        "requests": len(requests),
+        "assigned": len(solution.choices),
+        "by_rank": {int(rank): int((ranks == rank).sum()) for rank in np.unique(ranks)},
+        "by_group": {
+            name: int((groups == group).sum()) for group, name in enumerate(problem.groups)
+        },
+        "walks": solution.walks,
+        "repricings": solution.repricings,
+        "seconds": round(solution.seconds, 3),
+    }
+
+
+def write_assignments(con, problem: Problem, solution: Solution) -> int:
+    """
+    Replace the assignment table with a solution, in one transaction.
+
+    Returns:
+        The change-log sequence number of the write
+    """
+    solved = pd.DataFrame(
+        {
+            "student_id": problem.student_ids[problem.choice_student[solution.choices]],
+            "spin_class_id": problem.class_ids[solution.classes],
+            "selection_id": problem.choice_ids[solution.choices],
+        }
+    )
+    con.execute(CURSOR_DDL)
+    con.register("solved", solved)
+    try:
+        with db_spin.change_log.transaction(con):
+            for statement in WRITE_STATEMENTS:
+                con.execute(statement)
+            write_cursor(con, CURSOR, problem.seq)
+            seq = db_spin.change_log.record(
+                con, "assignment", None, "update", ["spin_class_id", "student_id", "uploaded"]
+            )
+            selection_seq = db_spin.change_log.record(
+                con, "student_selection", None, "update", ["assigned"]
+            )
+    finally:
+        con.unregister("solved")
+    change_bus.notify("spin", "assignment", None, seq)
+    change_bus.notify("spin", "student_selection", None, selection_seq)
+    return seq
+
+
+def assign(write: bool = True) -> Dict:
+    """
+    Solve the assignment of the SPIN database and store it.
+
+    Args:
+        write: Replace the assignment table with the result
+
+    Returns:
+        The summary of the solution (see `summarize`)
+    """
+    with db_spin.get_connection() as spin_con, db_school.get_connection() as school_con:
+        with span("assignment.load"):
+            problem = load_problem(spin_con, school_con)
+        solution = solve(problem)
+        summary = summarize(problem, solution)
+        if write:
+            with span("assignment.write"):
+                summary["seq"] = write_assignments(spin_con, problem, solution)
+    logger.info(
+        "Assigned %d of %d requests in %.2fs",
+        summary["assigned"],
+        summary["requests"],
+        solution.seconds,
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dry-run", action="store_true", help="solve without writing")
+    args = parser.parse_args()
+    print(json.dumps(assign(write=not args.dry_run), indent=2))
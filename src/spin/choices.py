@@ -0,0 +1,411 @@
+"""
+Students' survey choices, as tables kept up to date in the SPIN database.
+
+    student_choices_long     one row per student_selection, with the student's columns
+    student_choices_wide     one row per student, a column per preference code
+                             (IM1, IM2, ...) holding the course chosen
+    student_choice_courses   course codes chosen, with their choices and students
+
+`refresh` brings them up to date from the change log: only the students whose
+selections (or student rows) changed since the last refresh are rebuilt, in
+one transaction, and the cursor is stored with the tables
+(`materialized_view`). A new preference code adds a column, so the wide table
+is then built again. The queries below refresh first and push their filters
+down to DuckDB, so a dashboard reads only the rows it shows:
+
+    wide = choices.choices_wide(program=["IB"])
+    counts = choices.choice_counts(["IM1", "IM2"])
+"""
+
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import duckdb
+import pandas as pd
+
+from src.db import db_spin
+from src.db.change_log import CURSOR_DDL, ensure_change_log, read_cursor, rollback, write_cursor
+
+logger = logging.getLogger(__name__)
+
+STUDENT_COLUMNS = (
+    "email",
+    "firstName",
+    "lastName",
+    "level",
+    "program",
+    "created_at",
+    "active",
+)
+VIEW = "student_choices"
+
+DDL = (
+    CURSOR_DDL,
+    """
+    CREATE TABLE IF NOT EXISTS student_choices_long (
+        selection_id UUID,
+        student_id UUID,
+        email VARCHAR,
+        firstName VARCHAR,
+        lastName VARCHAR,
+        level VARCHAR,
+        program VARCHAR,
+        created_at TIMESTAMP,
+        active BOOLEAN,
+        preference_code VARCHAR,
+        course_code VARCHAR
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS student_choice_courses (
+        course_code VARCHAR PRIMARY KEY,
+        choices BIGINT NOT NULL,
+        students BIGINT NOT NULL
+    )
+    """,
+)
+
+# Selections of the students in the `refreshed` frame (all of them without the WHERE)
+LONG_SQL = f"""
+    SELECT
+        ss.id AS selection_id,
+        st.id AS student_id,
+        {", ".join(f"st.{column}" for column in STUDENT_COLUMNS)},
+        ss.preference_code,
+        ss.course_code
+    FROM student AS st
+    JOIN student_selection AS ss ON st.id = ss.student_id
+"""
+REFRESHED = "WHERE st.id IN (SELECT student_id::UUID FROM refreshed)"
+
+# Students whose selections or student row changed after a cursor; deleted
+# selections are found through the long table
+CHANGED_SQL = """
+    SELECT DISTINCT student_id::VARCHAR AS student_id FROM (
+        SELECT ss.student_id
+        FROM change_log l JOIN student_selection ss ON ss.id::VARCHAR = l.row_id
+        WHERE l.seq > $since AND l.table_name = 'student_selection'
+        UNION ALL
+        SELECT long.student_id
+        FROM change_log l JOIN student_choices_long long ON long.selection_id::VARCHAR = l.row_id
+        WHERE l.seq > $since AND l.table_name = 'student_selection'
+        UNION ALL
+        SELECT TRY_CAST(row_id AS UUID)
+        FROM change_log
+        WHERE seq > $since AND table_name = 'student'
+    )
+    WHERE student_id IS NOT NULL
+"""
+# Changes without a row id (bulk writes): everything may have changed, unless
+# only `assigned` was written (the assignment solver)
+BULK_SQL = """
+    SELECT count(*) FROM change_log
+    WHERE seq > $since AND table_name IN ('student', 'student_selection') AND row_id IS NULL
+        AND columns IS DISTINCT FROM ['assigned']
+"""
+
+COURSES_SQL = """
+    SELECT course_code, count(*) AS choices, count(DISTINCT student_id) AS students
+    FROM student_choices_long
+    WHERE course_code IS NOT NULL {where}
+    GROUP BY course_code
+"""
+
+_lock = threading.Lock()
+
+
+def ensure_tables(con):
+    ensure_change_log(con)
+    for statement in DDL:
+        con.execute(statement)
+
+
+def quote(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def wide_sql(codes: Iterable[str], where: str = "") -> str:
+    """PIVOT of the long table, a column per preference code in `codes`"""
+    columns = ", ".join(["student_id", *STUDENT_COLUMNS])
+    return f"""
+        PIVOT (
+            SELECT * EXCLUDE (selection_id) FROM student_choices_long
+            WHERE preference_code IS NOT NULL {where}
+        )
+        ON preference_code IN ({", ".join(quote(code) for code in sorted(codes)) or "NULL"})
+        USING first(course_code)
+        GROUP BY {columns}
+        ORDER BY student_id
+    """
+
+
+def wide_codes(con) -> Optional[List[str]]:
+    """Preference codes with a column in the wide table (None if there is no table)"""
+    columns = con.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = 'student_choices_wide' AND table_schema = current_schema()"
+    ).fetchall()
+    if not columns:
+        return None
+    return [name for (name,) in columns if name not in ("student_id", *STUDENT_COLUMNS)]
+
+
+def rebuild(con) -> int:
+    """
+    Build the tables from scratch, in one transaction.
+
+    Returns:
+        The change-log cursor they are up to date with
+    """
+    ensure_tables(con)
+    # Before the transaction: its snapshot holds every change up to the cursor
+    seq = db_spin.change_log.committed(con)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute("DELETE FROM student_choices_long")
+        con.execute(f"INSERT INTO student_choices_long {LONG_SQL}")
+        codes = [
+            code
+            for (code,) in con.execute(
+                "SELECT DISTINCT preference_code FROM student_choices_long "
+                "WHERE preference_code IS NOT NULL"
+            ).fetchall()
+        ]
+        con.execute(f"CREATE OR REPLACE TABLE student_choices_wide AS {wide_sql(codes)}")
+        con.execute("DELETE FROM student_choice_courses")
+        con.execute(f"INSERT INTO student_choice_courses {COURSES_SQL.format(where='')}")
+        set_cursor(con, seq)
+        con.execute("COMMIT")
+    except BaseException:
+        rollback(con)
+        raise
+    logger.info("Built the student choices tables up to change %d", seq)
+    return seq
+
+
+def refresh(con=None) -> int:
+    """
+    Bring the tables up to date with the change log.
+
+    Args:
+        con: Connection to the SPIN database, a new one by default
+
+    Returns:
+        The number of students rebuilt (-1: everything)
+    """
+    if con is None:
+        with db_spin.get_connection() as con:
+            return refresh(con)
+
+    with _lock:
+        ensure_tables(con)
+        since = read_cursor(con, VIEW)
+        codes = wide_codes(con)
+        latest = db_spin.change_log.committed(con)
+        if since is None or codes is None:
+            rebuild(con)
+            return -1
+        if latest <= since:
+            return 0
+        if con.execute(BULK_SQL, {"since": since}).fetchone()[0]:
+            rebuild(con)
+            return -1
+
+        refreshed = con.execute(CHANGED_SQL, {"since": since}).df()
+        if refreshed.empty:
+            set_cursor(con, latest)
+            return 0
+        try:
+            return _refresh_students(con, refreshed, codes, latest)
+        except duckdb.TransactionException:
+            # Another worker is refreshing the same rows
+            logger.info("Student choices refresh skipped, another one is running")
+            return 0
+
+
+def _refresh_students(con, refreshed: pd.DataFrame, codes: List[str], latest: int) -> int:
+    con.register("refreshed", refreshed)
+    try:
+        con.execute("BEGIN TRANSACTION")
+        try:
+            # Courses of the old and new rows get counted again
+            con.execute(
+                "CREATE OR REPLACE TEMP TABLE refreshed_courses AS "
+                "SELECT DISTINCT course_code FROM student_choices_long "
+                "WHERE student_id IN (SELECT student_id::UUID FROM refreshed)"
+            )
+            con.execute(
+                "DELETE FROM student_choices_long "
+                "WHERE student_id IN (SELECT student_id::UUID FROM refreshed)"
+            )
+            con.execute(f"INSERT INTO student_choices_long {LONG_SQL} {REFRESHED}")
+            con.execute(
+                "INSERT INTO refreshed_courses SELECT DISTINCT course_code "
+                "FROM student_choices_long "
+                "WHERE student_id IN (SELECT student_id::UUID FROM refreshed)"
+            )
+            new_codes = {
+                code
+                for (code,) in con.execute(
+                    "SELECT DISTINCT preference_code FROM student_choices_long "
+                    "WHERE preference_code IS NOT NULL "
+                    "AND student_id IN (SELECT student_id::UUID FROM refreshed)"
+                ).fetchall()
+            } - set(codes)
+            if new_codes:
+                all_codes = sorted(set(codes) | new_codes)
+                con.execute(
+                    f"CREATE OR REPLACE TABLE student_choices_wide AS {wide_sql(all_codes)}"
+                )
+            else:
+                con.execute(
+                    "DELETE FROM student_choices_wide "
+                    "WHERE student_id IN (SELECT student_id::UUID FROM refreshed)"
+                )
+                con.execute(
+                    "INSERT INTO student_choices_wide BY NAME "
+                    + wide_sql(codes, "AND student_id IN (SELECT student_id::UUID FROM refreshed)")
+                )
+            con.execute(
+                "DELETE FROM student_choice_courses "
+                "WHERE course_code IN (SELECT course_code FROM refreshed_courses)"
+            )
+            con.execute(
+                "INSERT INTO student_choice_courses "
+                + COURSES_SQL.format(
+                    where="AND course_code IN (SELECT course_code FROM refreshed_courses)"
+                )
+            )
+            con.execute("DROP TABLE refreshed_courses")
+            set_cursor(con, latest)
+            con.execute("COMMIT")
+        except BaseException:
+            rollback(con)
+            raise
+    finally:
+        con.unregister("refreshed")
+    logger.debug("Refreshed the choices of %d students", len(refreshed))
+    return len(refreshed)
+
+
+def set_cursor(con, seq: int):
+    write_cursor(con, VIEW, seq)
+
+
+def student_filters(filters: Dict[str, Optional[Iterable]], params: list) -> str:
+    """AND clauses for the student columns given values (None: any)"""
+    clauses = ""
+    for column, values in filters.items():
+        if values is None:
+            continue
+        if column not in ("student_id", *STUDENT_COLUMNS):
+            raise ValueError(f"Unknown student column {column!r}")
+        clauses += f" AND list_contains(?, {column}::VARCHAR)"
+        params.append([str(value) for value in values])
+    return clauses
+
+
+def choices_long(
+    preference_codes: Optional[Iterable[str]] = None,
+    con=None,
+    **filters: Optional[Iterable],
+) -> pd.DataFrame:
+    """
+    Selections with their students' columns.
+
+    Args:
+        preference_codes: Only these preference codes (all by default)
+        con: Connection to the SPIN database, a new one by default
+        filters: Student columns and the values kept, e.g. program=["IB"]
+    """
+    if con is None:
+        with db_spin.get_connection() as con:
+            return choices_long(preference_codes, con, **filters)
+    refresh(con)
+    params = []
+    where = student_filters({"preference_code": None, **filters}, params)
+    if preference_codes is not None:
+        where += " AND list_contains(?, preference_code)"
+        params.append(list(preference_codes))
+    df = con.execute(
+        f"SELECT * FROM student_choices_long WHERE true {where} "
+        "ORDER BY student_id, preference_code",
+        params,
+    ).df()
+    df["student_id"] = df["student_id"].astype(str)
+    return df
+
+
+def choices_wide(con=None, **filters: Optional[Iterable]) -> pd.DataFrame:
+    """
+    One row per student: their columns and the course chosen per preference code.
+
+    Args:
+        con: Connection to the SPIN database, a new one by default
+        filters: Student columns and the values kept, e.g. program=["IB"]
+    """
+    if con is None:
+        with db_spin.get_connection() as con:
+            return choices_wide(con, **filters)
+    refresh(con)
+    params = []
+    where = student_filters(filters, params)
+    df = con.execute(
+        f"SELECT * FROM student_choices_wide WHERE true {where} ORDER BY student_id", params
+    ).df()
+    df["student_id"] = df["student_id"].astype(str)
+    return df
+
+
+def choice_counts(
+    preference_codes: Optional[Iterable[str]] = None, con=None, **filters: Optional[Iterable]
+) -> pd.DataFrame:
+    """
+    Choices per student and preference code, with totals (an `All` column and row).
+
+    Args:
+        preference_codes: Only these preference codes (all by default)
+        con: Connection to the SPIN database, a new one by default
+        filters: Student columns and the values kept
+    """
+    if con is None:
+        with db_spin.get_connection() as con:
+            return choice_counts(preference_codes, con, **filters)
+    refresh(con)
+    params = []
+    where = student_filters(filters, params)
+    if preference_codes is not None:
+        where += " AND list_contains(?, preference_code)"
+        params.append(list(preference_codes))
+    counts = con.execute(
+        f"""
+        SELECT
+            coalesce(student_id::VARCHAR, 'All') AS student_id,
+            coalesce(preference_code, 'All') AS preference_code,
+            count(*) AS choices
+        FROM student_choices_long
+        WHERE preference_code IS NOT NULL {where}
+        GROUP BY GROUPING SETS ((student_id, preference_code), (student_id), (preference_code), ())
+        """,
+        params,
+    ).df()
+    wide = counts.pivot(index="student_id", columns="preference_code", values="choices")
+    codes = sorted(code for code in wide.columns if code != "All")
+    students = sorted(student for student in wide.index if student != "All")
+    wide = wide.reindex(index=[*students, "All"], columns=[*codes, "All"])
+    return wide.fillna(0).astype("int64").rename_axis(columns=None).reset_index()
+
+
+def course_codes(con=None) -> pd.DataFrame:
+    """Course codes chosen, with their number of choices and students"""
+    if con is None:
+        with db_spin.get_connection() as con:
+            return course_codes(con)
+    refresh(con)
+    return con.execute("SELECT * FROM student_choice_courses ORDER BY course_code").df()
+
+
+if __name__ == "__main__":
+    with db_spin.get_connection() as con:
+        print("Built up to change", rebuild(con))
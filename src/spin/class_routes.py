@@ -0,0 +1,181 @@
+import json
+import os
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import HTMLResponse
+
+from datastar_py.responses import DatastarFastAPIResponse
+
+from src.utils import lazy_import, render_template, response_adapter
+
+# duckdb/pandas/numpy are loaded on the first request, not when routes register
+db_spin = lazy_import("src.db.db_spin")
+conflicts = lazy_import("src.spin.conflicts")
+spin_views = lazy_import("src.db.spin_views")
+
+router = APIRouter(prefix="/spin", tags=["spin"])
+
+# Share the app templates so pages get the layout globals (menu_data, static_url)
+from init import templates
+
+# Classes listed at most (the filter narrows them down)
+CLASS_ROWS = int(os.environ.get("SPIN_CLASS_ROWS", 200))
+
+# spin_class columns edited in spin/class_form.html
+EDIT_FIELDS = ("title", "course_code", "timeslot", "teacher_name", "room_name", "for_program")
+SEARCH_FIELDS = ("title", "course_code", "timeslot", "teacher_name", "room_name")
+# Edited columns picked from the school rows (see spin_views.get_class_options)
+OPTION_FIELDS = {"timeslot": "timeslot", "teacher_name": "teacher", "room_name": "room"}
+
+
+def read_filters(request: Request) -> dict:
+    """The listing filter: query parameters, or the q/onlyConflicts signals of a Datastar GET"""
+    signals = json.loads(request.query_params.get("datastar") or "{}")
+    only = request.query_params.get("conflicts", signals.get("onlyConflicts", False))
+    return {
+        "q": str(request.query_params.get("q", signals.get("q", ""))).strip(),
+        "only_conflicts": only in (True, "true", "1", "on"),
+    }
+
+
+def classes_context(q: str = "", only_conflicts: bool = False) -> dict:
+    """The classes matching the filter, with their double bookings counted"""
+    classes = spin_views.get_spin_classes_df()
+    schedule = conflicts.get_schedule()
+    counts = schedule.conflict_counts()
+    listing = classes[list(EDIT_FIELDS)].assign(
+        id=classes["id"].astype(str), conflicts=lambda frame: frame["id"].map(counts)
+    )
+    listing["conflicts"] = listing["conflicts"].fillna(0).astype(int)
+    if only_conflicts:
+        listing = listing[listing["conflicts"] > 0]
+    if q:
+        text = listing[list(SEARCH_FIELDS)].fillna("").astype(str).agg(" ".join, axis=1)
+        listing = listing[text.str.contains(q, case=False, regex=False)]
+    double_bookings = schedule.conflicts()["resource"].value_counts()
+    return {
+        "classes": listing.head(CLASS_ROWS).to_dict("records"),
+        "matched": len(listing),
+        "summary": {
+            "classes": len(classes),
+            "conflicted": len(counts),
+            "rooms": int(double_bookings.get("room", 0)),
+            "teachers": int(double_bookings.get("teacher", 0)),
+        },
+        "filters": {"q": q, "only_conflicts": only_conflicts},
+    }
+
+
+def form_context(spin_class: dict, saved: bool = False) -> dict:
+    """The class editor: the class, the options for its school columns and its double bookings"""
+    available = spin_views.get_class_options()
+    options = {}
+    for field, table in OPTION_FIELDS.items():
+        # The current value stays selectable when it is no longer active
+        value = spin_class.get(field)
+        options[field] = available[table] + (
+            [value] if value and value not in available[table] else []
+        )
+    found = conflicts.check_class(spin_class)
+    start, _ = conflicts.label_interval(spin_class.get("timeslot"))
+    return {
+        "spin_class": spin_class,
+        "options": options,
+        "conflicts": found.to_dict("records"),
+        "timeslot_valid": start >= 0,
+        "saved": saved,
+    }
+
+
+def class_from_form(class_id: str, form) -> dict:
+    return {"id": class_id, **{field: str(form.get(field) or "").strip() for field in EDIT_FIELDS}}
+
+
+def get_class(class_id: str) -> dict:
+    rows = db_spin.get("spin_class", class_id)
+    if rows.empty:
+        raise HTTPException(status_code=404, detail="SPIN class not found")
+    row = rows.iloc[0]
+    return {
+        "id": str(row["id"]),
+        **{field: row[field] if isinstance(row[field], str) else "" for field in EDIT_FIELDS},
+    }
+
+
+@router.get("/spin_classes", response_class=HTMLResponse)
+def get_classes_page(request: Request):
+    """SPIN classes with their double-booked rooms and teachers (see src/spin/conflicts.py)"""
+    filters = read_filters(request)
+    return response_adapter(
+        request=request,
+        template_name="spin/classes.html",
+        context=lambda: classes_context(**filters),
+        templates=templates,
+        url="/spin/spin_classes",
+    )
+
+
+@router.get("/spin_classes/table", response_class=HTMLResponse)
+def get_classes_table(request: Request):
+    """The class listing alone, filtered, merged into the page by its id"""
+    filters = read_filters(request)
+    return response_adapter(
+        request=request,
+        template_name="spin/classes_table.html",
+        context=lambda: classes_context(**filters),
+        templates=templates,
+    )
+
+
+@router.get("/spin_classes/{class_id}", response_class=HTMLResponse)
+def get_class_form(request: Request, class_id: str):
+    """The editor of a class, with the double bookings it has now"""
+    spin_class = get_class(class_id)
+    return response_adapter(
+        request=request,
+        template_name="spin/class_form.html",
+        context=lambda: form_context(spin_class),
+        templates=templates,
+    )
+
+
+@router.post("/spin_classes/{class_id}/check", response_class=HTMLResponse)
+async def check_class_form(request: Request, class_id: str):
+    """Double bookings of the class as edited so far, checked against the index"""
+    spin_class = class_from_form(class_id, await request.form())
+    return response_adapter(
+        request=request,
+        template_name="spin/class_conflicts.html",
+        context=lambda: form_context(spin_class),
+        templates=templates,
+    )
+
+
+@router.put("/spin_classes/{class_id}")
+async def update_class(request: Request, class_id: str):
+    """Save a class, then show its double bookings and the listing as filtered"""
+    form = await request.form()
+    get_class(class_id)
+    spin_class = class_from_form(class_id, form)
+    if not spin_class["title"]:
+        raise HTTPException(status_code=400, detail="A SPIN class needs a title")
+    db_spin.update("spin_class", spin_class)
+    filters = {
+        "q": str(form.get("q") or "").strip(),
+        "only_conflicts": form.get("conflicts") in ("true", "1", "on"),
+    }
+
+    editor = render_template(
+        templates.get_template("spin/class_form.html"),
+        {"request": request, "standalone": True, **form_context(spin_class, saved=True)},
+    )
+    listing = render_template(
+        templates.get_template("spin/classes_table.html"),
+        {"request": request, "standalone": True, **classes_context(**filters)},
+    )
+
+    async def saved_events(sse):
+        yield sse.merge_fragments([editor])
+        yield sse.merge_fragments([listing])
+
+    return DatastarFastAPIResponse(saved_events)
@@ -0,0 +1,318 @@
+"""
+SPIN classes pre-joined with the school's courses, timeslots, teachers and rooms.
+
+`class_view` in setup_db_spin.sql joins the classes to the school tables on
+every read (over tables that only exist in MotherDuck). Here the join is kept
+as a table in the SPIN database, one row per spin_class with the ids and
+columns of the school rows it matched (by course code, timeslot label,
+teacher name and room name):
+
+    id, title, course_code, timeslot, teacher_name, room_name, for_program,
+    course_id, course_title, timeslot_id, weekday, start_time, end_time,
+    teacher_id, room_id, room_capacity
+
+`refresh` brings it up to date from the change logs of both databases, by
+dependency: a class is joined again when its spin_class row changed, when a
+school row it matched changed (the stored ids), or when a changed school row
+now matches it (its current code or name). Other rows are left as they are:
+only the school rows changed, then those the affected classes' codes and names
+match, are read. Bulk changes (log entries without a row id) rebuild the
+table. The cursors are stored in `materialized_view`, as for the survey tables
+(src/spin/choices.py).
+
+    uv run python -m src.spin.class_view  # build from scratch
+"""
+
+import logging
+import threading
+from typing import Dict
+
+import pandas as pd
+
+from src.db import db_school, db_spin
+from src.db.change_log import (
+    CURSOR_DDL,
+    ensure_change_log,
+    read_cursor,
+    rollback,
+    write_cursor,
+)
+
+logger = logging.getLogger(__name__)
+
+VIEW = "class_view"
+SCHOOL_CURSOR = "class_view.school"
+
+DDL = """
+    CREATE TABLE IF NOT EXISTS class_view (
+        id UUID,
+        title VARCHAR,
+        course_code VARCHAR,
+        timeslot VARCHAR,
+        teacher_name VARCHAR,
+        room_name VARCHAR,
+        for_program VARCHAR,
+        course_id UUID,
+        course_title VARCHAR,
+        timeslot_id UUID,
+        weekday VARCHAR,
+        start_time VARCHAR,
+        end_time VARCHAR,
+        teacher_id UUID,
+        room_id UUID,
+        room_capacity INTEGER
+    )
+"""
+
+# School tables joined, read into school_<table> on the SPIN connection (ids as
+# strings, Python UUID objects would cost more than the join): their columns,
+# the key a spin_class column matches, and the row kept per key, the active one
+# first, the largest room (as assignment.ROOMS_SQL)
+SCHOOL_TABLES = {
+    "course": (
+        "id::VARCHAR AS id, code, title, active",
+        "code",
+        "course_code",
+        "active DESC NULLS LAST, id::VARCHAR",
+    ),
+    "timeslot": (
+        "id::VARCHAR AS id, weekday, start_time, end_time, active",
+        "weekday || ': ' || start_time || ' - ' || end_time",
+        "timeslot",
+        "active DESC NULLS LAST, id::VARCHAR",
+    ),
+    "teacher": (
+        "id::VARCHAR AS id, name, active",
+        "name",
+        "teacher_name",
+        "active DESC NULLS LAST, id::VARCHAR",
+    ),
+    "room": (
+        "id::VARCHAR AS id, name, capacity, active",
+        "name",
+        "room_name",
+        "capacity DESC NULLS LAST, id::VARCHAR",
+    ),
+}
+
+# One school row per key (match_key, see `school_frames`)
+BUILD_SQL = """
+    SELECT
+        sc.id, sc.title, sc.course_code, sc.timeslot, sc.teacher_name, sc.room_name,
+        sc.for_program,
+        c.id::UUID AS course_id, c.title AS course_title,
+        ts.id::UUID AS timeslot_id, ts.weekday, ts.start_time, ts.end_time,
+        t.id::UUID AS teacher_id,
+        r.id::UUID AS room_id, r.capacity AS room_capacity
+    FROM spin_class AS sc
+    LEFT JOIN school_course AS c ON c.match_key = sc.course_code
+    LEFT JOIN school_timeslot AS ts ON ts.match_key = sc.timeslot
+    LEFT JOIN school_teacher AS t ON t.match_key = sc.teacher_name
+    LEFT JOIN school_room AS r ON r.match_key = sc.room_name
+"""
+
+# Classes depending on the changed rows: their spin_class row changed, they
+# stored the id of a changed school row, or their column matches the key a
+# changed school row has now ($<table>_ids and $<table>_keys lists)
+AFFECTED_SQL = """
+    SELECT TRY_CAST(row_id AS UUID) AS id FROM change_log
+    WHERE seq > $since AND table_name = 'spin_class'
+    UNION
+    SELECT id FROM class_view
+    WHERE list_contains($course_ids::VARCHAR[], course_id::VARCHAR)
+        OR list_contains($timeslot_ids::VARCHAR[], timeslot_id::VARCHAR)
+        OR list_contains($teacher_ids::VARCHAR[], teacher_id::VARCHAR)
+        OR list_contains($room_ids::VARCHAR[], room_id::VARCHAR)
+    UNION
+    SELECT id FROM spin_class
+    WHERE list_contains($course_keys::VARCHAR[], course_code)
+        OR list_contains($timeslot_keys::VARCHAR[], timeslot)
+        OR list_contains($teacher_keys::VARCHAR[], teacher_name)
+        OR list_contains($room_keys::VARCHAR[], room_name)
+"""
+
+SCHOOL_CHANGES_SQL = """
+    SELECT table_name, row_id FROM change_log
+    WHERE seq > ? AND list_contains(?, table_name)
+"""
+
+_lock = threading.Lock()
+
+
+def school_frames(con, school_con, where: str = "") -> Dict[str, pd.DataFrame]:
+    """
+    The school rows the classes match, one per key (as match_key), by the name
+    they are registered under.
+
+    Args:
+        where: Only the classes kept by this clause on spin_class
+    """
+    keys = con.execute(
+        "SELECT "
+        + ", ".join(f"list(DISTINCT {column})" for _, _, column, _ in SCHOOL_TABLES.values())
+        + f" FROM spin_class {where}"
+    ).fetchone()
+    return {
+        f"school_{table}": school_con.execute(
+            f"SELECT DISTINCT ON ({key}) {columns}, {key} AS match_key FROM {table} "
+            f"WHERE list_contains($keys, {key}) ORDER BY {key}, {order}",
+            {"keys": table_keys},
+        ).df()
+        for (table, (columns, key, _, order)), table_keys in zip(SCHOOL_TABLES.items(), keys)
+    }
+
+
+def affected_params(school_con, school_changes: pd.DataFrame) -> Dict[str, list]:
+    """AFFECTED_SQL lists: the ids of the school rows changed, and the keys they have now"""
+    params = {}
+    for table, (_, key, _, _) in SCHOOL_TABLES.items():
+        ids = school_changes.loc[school_changes["table_name"] == table, "row_id"].tolist()
+        params[f"{table}_ids"] = ids
+        params[f"{table}_keys"] = (
+            [
+                value
+                for (value,) in school_con.execute(
+                    f"SELECT DISTINCT {key} FROM {table} WHERE list_contains($ids, id::VARCHAR)",
+                    {"ids": ids},
+                ).fetchall()
+            ]
+            if ids
+            else []
+        )
+    return params
+
+
+def register(con, frames: Dict[str, pd.DataFrame]):
+    for name, frame in frames.items():
+        con.register(name, frame)
+
+
+def unregister(con, frames: Dict[str, pd.DataFrame]):
+    for name in frames:
+        con.unregister(name)
+
+
+def rebuild(con, school_con) -> int:
+    """
+    Build the table from scratch, in one transaction.
+
+    Returns:
+        The number of classes
+    """
+    ensure_change_log(con)
+    ensure_change_log(school_con)
+    con.execute(CURSOR_DDL)
+    con.execute(DDL)
+    seq = db_spin.change_log.committed(con)
+    school_seq = db_school.change_log.committed(school_con)
+    frames = school_frames(con, school_con)
+    register(con, frames)
+    try:
+        con.execute("BEGIN TRANSACTION")
+        try:
+            con.execute("DELETE FROM class_view")
+            con.execute(f"INSERT INTO class_view {BUILD_SQL}")
+            write_cursor(con, VIEW, seq)
+            write_cursor(con, SCHOOL_CURSOR, school_seq)
+            con.execute("COMMIT")
+        except BaseException:
+            rollback(con)
+            raise
+    finally:
+        unregister(con, frames)
+    classes = con.execute("SELECT count(*) FROM class_view").fetchone()[0]
+    logger.info("Built class_view, %d classes, up to changes %d/%d", classes, seq, school_seq)
+    return classes
+
+
+def refresh(con=None, school_con=None) -> int:
+    """
+    Bring the table up to date with the change logs.
+
+    Args:
+        con: Connection to the SPIN database, a new one by default
+        school_con: Connection to the school database, a new one by default
+
+    Returns:
+        The number of classes joined again (-1: everything)
+    """
+    if con is None:
+        with db_spin.get_connection() as con:
+            return refresh(con, school_con)
+    if school_con is None:
+        with db_school.get_connection() as school_con:
+            return refresh(con, school_con)
+
+    with _lock:
+        ensure_change_log(con)
+        ensure_change_log(school_con)
+        since = read_cursor(con, VIEW)
+        school_since = read_cursor(con, SCHOOL_CURSOR)
+        if since is None or school_since is None:
+            rebuild(con, school_con)
+            return -1
+        latest = db_spin.change_log.committed(con)
+        school_latest = db_school.change_log.committed(school_con)
+        if latest <= since and school_latest <= school_since:
+            return 0
+
+        bulk = con.execute(
+            "SELECT count(*) FROM change_log "
+            "WHERE seq > ? AND table_name = 'spin_class' AND row_id IS NULL",
+            [since],
+        ).fetchone()[0]
+        school_changes = school_con.execute(
+            SCHOOL_CHANGES_SQL, [school_since, list(SCHOOL_TABLES)]
+        ).df()
+        if bulk or school_changes["row_id"].isna().any():
+            rebuild(con, school_con)
+            return -1
+
+        # The classes affected, found from the school rows changed alone
+        con.execute(
+            "CREATE OR REPLACE TEMP TABLE class_view_affected AS "
+            f"SELECT DISTINCT id FROM ({AFFECTED_SQL}) WHERE id IS NOT NULL",
+            {"since": since, **affected_params(school_con, school_changes)},
+        )
+        try:
+            return _rejoin(con, school_con, latest, school_latest)
+        finally:
+            con.execute("DROP TABLE IF EXISTS class_view_affected")
+
+
+def _rejoin(con, school_con, latest: int, school_latest: int) -> int:
+    """Join the classes of class_view_affected again, with the school rows their keys match"""
+    frames = school_frames(con, school_con, "WHERE id IN (SELECT id FROM class_view_affected)")
+    register(con, frames)
+    try:
+        con.execute("BEGIN TRANSACTION")
+        try:
+            con.execute("DELETE FROM class_view WHERE id IN (SELECT id FROM class_view_affected)")
+            con.execute(
+                f"INSERT INTO class_view {BUILD_SQL} "
+                "WHERE sc.id IN (SELECT id FROM class_view_affected)"
+            )
+            write_cursor(con, VIEW, latest)
+            write_cursor(con, SCHOOL_CURSOR, school_latest)
+            con.execute("COMMIT")
+        except BaseException:
+            rollback(con)
+            raise
+    finally:
+        unregister(con, frames)
+    return con.execute("SELECT count(*) FROM class_view_affected").fetchone()[0]
+
+
+def classes(con=None) -> pd.DataFrame:
+    """The SPIN classes with their school columns, by title (refreshed first)"""
+    if con is None:
+        with db_spin.get_connection() as con:
+            return classes(con)
+    refresh(con)
+    return con.execute("FROM class_view ORDER BY title, timeslot, id").df()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    with db_spin.get_connection() as con, db_school.get_connection() as school_con:
+        rebuild(con, school_con)
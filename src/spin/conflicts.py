@@ -0,0 +1,344 @@
+"""
+Double-booked rooms and teachers among the SPIN classes.
+
+Timeslots are normalized to integer minute intervals within the week,
+[weekday * 1440 + start, weekday * 1440 + end), from the weekday/start_time/
+end_time of the school timeslot a class matched in class_view, or from its
+label ('Tue: 10:30 - 11:50') when it matched none. Rooms and teachers are
+keyed by the school id the class matched, by name otherwise.
+
+Each kind of resource gets an `IntervalIndex`: the intervals sorted by
+(resource, start). All overlaps are found with one binary search per interval,
+O(n log n) plus the pairs reported, and a single class (the one being edited)
+is checked with two binary searches per resource:
+
+    schedule = get_schedule()
+    schedule.conflicts()  # every double booking (computed once per schedule)
+    schedule.check({"id": ..., "timeslot": ..., "teacher_name": ..., "room_name": ...})
+
+    uv run python -m src.spin.conflicts  # print the double bookings
+"""
+
+import re
+import threading
+import uuid
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.db.memo import memoize
+from src.db.spin_views import get_spin_classes_df, school_class_version, spin_class_version
+
+WEEKDAYS = {
+    day: number for number, day in enumerate(["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"])
+}
+DAY = 24 * 60
+WEEK = 7 * DAY
+
+LABEL = re.compile(r"^\s*(?P<weekday>\w+)\s*:\s*(?P<start_time>\S+)\s*-\s*(?P<end_time>\S+)\s*$")
+TIME = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*$")
+
+# Resource kinds: the class_view id column and the name column keying them
+RESOURCES = {"room": ("room_id", "room_name"), "teacher": ("teacher_id", "teacher_name")}
+
+CONFLICT_COLUMNS = [
+    "resource",
+    "name",
+    "class_id",
+    "title",
+    "timeslot",
+    "other_id",
+    "other_title",
+    "other_timeslot",
+    "overlap_minutes",
+]
+
+
+def interval(weekday, start_time, end_time) -> Tuple[int, int]:
+    """
+    A timeslot as a minute interval within the week.
+
+    Args:
+        weekday: Day name, matched on its first three letters ('Mon', 'Tuesday')
+        start_time: 'HH:MM' start time
+        end_time: 'HH:MM' end time
+
+    Returns:
+        (start, end), (-1, -1) when the timeslot is malformed or does not end
+        after it starts on the same day
+    """
+    day = WEEKDAYS.get(str(weekday or "").strip()[:3].capitalize())
+    minutes = []
+    for time in (start_time, end_time):
+        match = TIME.match(str(time or ""))
+        hours, mins = (int(part) for part in match.groups()) if match else (99, 99)
+        minutes.append(hours * 60 + mins if hours <= 24 and mins < 60 else DAY + 1)
+    start, end = minutes
+    if day is None or not start < end <= DAY:
+        return -1, -1
+    return day * DAY + start, day * DAY + end
+
+
+def label_interval(label: str) -> Tuple[int, int]:
+    """A timeslot label ('Tue: 10:30 - 11:50') as a minute interval (see `interval`)"""
+    match = LABEL.match(str(label or ""))
+    return interval(*match.groups()) if match else (-1, -1)
+
+
+def to_intervals(timeslots: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Timeslots as minute intervals, each distinct one parsed once.
+
+    Args:
+        timeslots: Labels, or (weekday, start_time, end_time) tuples
+
+    Returns:
+        (start, end) int64 arrays (see `interval`)
+    """
+    parsed: Dict[Hashable, Tuple[int, int]] = {}
+    intervals = []
+    for timeslot in timeslots:
+        if timeslot not in parsed:
+            parsed[timeslot] = (
+                interval(*timeslot) if isinstance(timeslot, tuple) else label_interval(timeslot)
+            )
+        intervals.append(parsed[timeslot])
+    bounds = np.array(intervals, np.int64).reshape(-1, 2)
+    return bounds[:, 0].copy(), bounds[:, 1].copy()
+
+
+def class_intervals(classes: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The timeslots of class_view rows as minute intervals: the school timeslot
+    matched, the label when none was (see `to_intervals`).
+    """
+    return to_intervals(
+        (weekday, start_time, end_time) if isinstance(weekday, str) else label
+        for label, weekday, start_time, end_time in zip(
+            *(
+                classes[column].to_numpy(object)
+                for column in ("timeslot", "weekday", "start_time", "end_time")
+            )
+        )
+    )
+
+
+def resource_key(id, name) -> Optional[Hashable]:
+    """The id when there is one, the trimmed name otherwise (None: no resource)"""
+    if isinstance(id, (str, uuid.UUID)):
+        return id
+    name = name.strip() if isinstance(name, str) else ""
+    return f"name:{name}" if name else None
+
+
+class IntervalIndex:
+    """Intervals of one kind of resource, sorted by (resource, start)"""
+
+    def __init__(self, keys: Iterable[Hashable], starts: np.ndarray, ends: np.ndarray):
+        """
+        Args:
+            keys: The resource of each interval, None for none
+            starts: Interval starts (minutes in the week), -1 for no interval
+            ends: Interval ends, exclusive
+        """
+        codes, resources = pd.factorize(pd.Series(list(keys), dtype=object))
+        self.resources = {key: code for code, key in enumerate(resources)}
+        keep = np.flatnonzero((codes >= 0) & (starts >= 0))
+        order = keep[np.lexsort((starts[keep], codes[keep]))]
+        # Positions in the intervals the index was built from, by (resource, start)
+        self.rows = order
+        self.codes = codes[order].astype(np.int64)
+        self.starts = starts[order]
+        self.ends = ends[order]
+        # Increasing: the starts offset by a week per resource
+        self.sort_keys = self.codes * WEEK + self.starts
+        self.longest = np.zeros(len(self.resources), np.int64)
+        np.maximum.at(self.longest, self.codes, self.ends - self.starts)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def overlaps(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Every pair of overlapping intervals of the same resource.
+
+        An interval overlaps the ones after it (same resource, later start)
+        starting before it ends, found by binary search.
+
+        Returns:
+            (first, second) positions in the intervals the index was built
+            from, first starting no later than second
+        """
+        count = len(self.rows)
+        upper = np.searchsorted(self.sort_keys, self.codes * WEEK + self.ends, side="left")
+        following = upper - np.arange(count) - 1
+        first = np.repeat(np.arange(count), following)
+        offsets = np.arange(len(first)) - np.repeat(np.cumsum(following) - following, following)
+        second = first + 1 + offsets
+        return self.rows[first], self.rows[second]
+
+    def query(self, key: Hashable, start: int, end: int) -> np.ndarray:
+        """
+        The intervals of a resource overlapping [start, end).
+
+        Returns:
+            Positions in the intervals the index was built from
+        """
+        if key is None or start < 0:
+            return np.empty(0, np.int64)
+        code = self.resources.get(key)
+        if code is None:
+            return np.empty(0, np.int64)
+        # Only intervals starting less than the longest one before `start` can reach it
+        since = max(start - int(self.longest[code]), -1)
+        lower = np.searchsorted(self.sort_keys, code * WEEK + since, side="right")
+        upper = np.searchsorted(self.sort_keys, code * WEEK + end, side="left")
+        found = np.arange(lower, upper)
+        return self.rows[found[self.ends[found] > start]]
+
+
+class Schedule:
+    """The SPIN classes with a room index and a teacher index over their timeslots"""
+
+    def __init__(self, classes: pd.DataFrame):
+        """
+        Args:
+            classes: class_view rows (see src/spin/class_view.py)
+        """
+        self.classes = pd.DataFrame(
+            {
+                "id": classes["id"].astype(str).to_numpy(),
+                "title": classes["title"].to_numpy(),
+                "timeslot": classes["timeslot"].to_numpy(),
+                "room_name": classes["room_name"].to_numpy(),
+                "teacher_name": classes["teacher_name"].to_numpy(),
+            }
+        )
+        self.starts, self.ends = class_intervals(classes)
+        # Columns as arrays, for the few rows `check` reads
+        self._columns = {column: self.classes[column].to_numpy() for column in self.classes}
+        self._ids = self._columns["id"]
+        self._conflicts = None
+        self._lock = threading.Lock()
+        self.indexes: Dict[str, IntervalIndex] = {}
+        # Name -> key of the resources the classes use, to key an edited class the same way
+        self.keys_by_name: Dict[str, Dict[str, Hashable]] = {}
+        for resource, (id_column, name_column) in RESOURCES.items():
+            names = classes[name_column].to_numpy(object)
+            keys = [
+                resource_key(id, name)
+                for id, name in zip(classes[id_column].to_numpy(object), names)
+            ]
+            self.indexes[resource] = IntervalIndex(keys, self.starts, self.ends)
+            self.keys_by_name[resource] = {
+                name.strip(): key for name, key in zip(names, keys) if isinstance(name, str)
+            }
+
+    def __len__(self) -> int:
+        return len(self.classes)
+
+    def _report(self, resource: str, first: np.ndarray, second: np.ndarray) -> pd.DataFrame:
+        _, name_column = RESOURCES[resource]
+        one = self.classes.iloc[first].reset_index(drop=True)
+        other = self.classes.iloc[second].reset_index(drop=True)
+        overlap = np.minimum(self.ends[first], self.ends[second]) - np.maximum(
+            self.starts[first], self.starts[second]
+        )
+        return pd.DataFrame(
+            {
+                "resource": resource,
+                "name": one[name_column],
+                "class_id": one["id"],
+                "title": one["title"],
+                "timeslot": one["timeslot"],
+                "other_id": other["id"],
+                "other_title": other["title"],
+                "other_timeslot": other["timeslot"],
+                "overlap_minutes": overlap,
+                "start": self.starts[first],
+            },
+            columns=CONFLICT_COLUMNS + ["start"],
+        )
+
+    def conflicts(self) -> pd.DataFrame:
+        """
+        Every double booking: a row per pair of classes overlapping in a room
+        or with a teacher (CONFLICT_COLUMNS), rooms first, by name and time.
+        Computed once per schedule, the frame is shared.
+        """
+        with self._lock:
+            if self._conflicts is None:
+                reports = [
+                    self._report(resource, *index.overlaps())
+                    for resource, index in self.indexes.items()
+                ]
+                conflicts = pd.concat(reports, ignore_index=True)
+                self._conflicts = conflicts.sort_values(
+                    ["resource", "name", "start"], ignore_index=True
+                ).drop(columns="start")
+            return self._conflicts
+
+    def conflict_counts(self) -> pd.Series:
+        """Number of double bookings per class id (classes without any left out)"""
+        conflicts = self.conflicts()
+        return pd.concat([conflicts["class_id"], conflicts["other_id"]]).value_counts()
+
+    def check(self, spin_class: Dict) -> pd.DataFrame:
+        """
+        Double bookings a class would have, against the other classes.
+
+        Args:
+            spin_class: The class as edited: timeslot (label), room_name,
+                teacher_name, and its id when it exists (left out of the check)
+
+        Returns:
+            A row per class it overlaps with (CONFLICT_COLUMNS), the class
+            itself on the left
+        """
+        start, end = label_interval(spin_class.get("timeslot"))
+        own_id = str(spin_class["id"]) if spin_class.get("id") else None
+
+        rows = []
+        for resource, index in self.indexes.items():
+            _, name_column = RESOURCES[resource]
+            name = (spin_class.get(name_column) or "").strip()
+            key = self.keys_by_name[resource].get(name, f"name:{name}") if name else None
+            for position in index.query(key, start, end):
+                if self._ids[position] == own_id:
+                    continue
+                rows.append(
+                    {
+                        "resource": resource,
+                        "name": self._columns[name_column][position],
+                        "class_id": own_id,
+                        "title": spin_class.get("title"),
+                        "timeslot": spin_class.get("timeslot"),
+                        "other_id": self._ids[position],
+                        "other_title": self._columns["title"][position],
+                        "other_timeslot": self._columns["timeslot"][position],
+                        "overlap_minutes": int(
+                            min(end, self.ends[position]) - max(start, self.starts[position])
+                        ),
+                    }
+                )
+        return pd.DataFrame(rows, columns=CONFLICT_COLUMNS)
+
+
+@memoize("spin_schedule", lambda: (spin_class_version(), school_class_version()))
+def get_schedule() -> Schedule:
+    """The schedule of the current classes (shared, rebuilt when the classes change)"""
+    return Schedule(get_spin_classes_df())
+
+
+def check_class(spin_class: Dict) -> pd.DataFrame:
+    """Double bookings of a class as edited, against the current classes (see Schedule.check)"""
+    return get_schedule().check(spin_class)
+
+
+if __name__ == "__main__":
+    schedule = get_schedule()
+    conflicts = schedule.conflicts()
+    print(f"{len(schedule)} classes, {len(conflicts)} double bookings")
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(conflicts.to_string(index=False))
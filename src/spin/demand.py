@@ -0,0 +1,133 @@
+"""
+Course demand, for deciding how many spin_class sections to open per course.
+
+Per course code (and survey group): the choices at each preference rank, the
+share of first choices, and the sections the first choices would fill at the
+course's room capacity, next to the sections open now. DuckDB counts the
+choices (GROUP BY over student_selection, the same choices the assignment
+solver reads), NumPy spreads them over ranks and sizes the sections.
+
+Results are memoized per data version (see src/db/memo.py): submissions,
+students, classes and rooms changing make the next read recompute.
+
+    uv run python -m src.spin.demand
+"""
+
+import logging
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from src.db import db_school, db_spin
+from src.db.memo import memoize, table_version
+from src.instrumentation import span
+from src.spin.assignment import CHOICES_SQL, DEFAULT_CAPACITY, GROUP_ORDER, ROOMS_SQL
+
+logger = logging.getLogger(__name__)
+
+DEMAND_SQL = f"""
+    SELECT course_group, course_code, rank, count(*) AS choices
+    FROM ({CHOICES_SQL})
+    GROUP BY ALL
+"""
+SECTIONS_SQL = """
+    SELECT course_code, room_name
+    FROM spin_class
+    WHERE course_code IS NOT NULL
+"""
+
+spin_version = table_version("spin", "student", "student_selection", "spin_class")
+school_version = table_version("school", "room")
+
+
+def course_demand(
+    demand: pd.DataFrame, sections: pd.DataFrame, rooms: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Demand per course from the frames read by `load_demand`.
+
+    Returns:
+        One row per course group and code: rank_1 ... rank_N choices, choices,
+        first_choice_ratio, section_capacity (mean seats of the course's
+        rooms, the median room for courses without sections), sections open,
+        projected_sections for the first choices, and missing_sections
+    """
+    demand = demand[demand["rank"] >= 1]
+    course_index, courses = pd.factorize(
+        pd.MultiIndex.from_frame(demand[["course_group", "course_code"]]), sort=True
+    )
+    ranks = int(demand["rank"].max()) if len(demand) else 1
+
+    # Choices per course and rank
+    counts = np.zeros((len(courses), ranks), np.int64)
+    np.add.at(counts, (course_index, demand["rank"].to_numpy(np.int64) - 1), demand["choices"])
+    choices = counts.sum(axis=1)
+    first = counts[:, 0]
+
+    # Sections open and their seats per course code
+    capacity = rooms.set_index("name")["capacity"]
+    seats = sections["room_name"].map(capacity).fillna(DEFAULT_CAPACITY).clip(lower=0)
+    per_course = seats.groupby(sections["course_code"]).agg(["count", "mean"])
+    course_code = courses.get_level_values(1)
+    found = per_course.index.get_indexer(course_code)
+    open_sections = np.where(found >= 0, per_course["count"].to_numpy()[found], 0)
+    median = capacity.median() if len(capacity) else DEFAULT_CAPACITY
+    section_capacity = np.where(found >= 0, per_course["mean"].to_numpy()[found], median)
+    section_capacity = np.maximum(np.round(section_capacity), 1).astype(np.int64)
+    projected = -(-first // section_capacity)
+
+    result = pd.DataFrame(
+        {
+            "course_group": courses.get_level_values(0),
+            "course_code": course_code,
+            **{f"rank_{rank + 1}": counts[:, rank] for rank in range(ranks)},
+            "choices": choices,
+            "first_choice_ratio": np.round(first / np.maximum(choices, 1), 3),
+            "section_capacity": section_capacity,
+            "sections": open_sections.astype(np.int64),
+            "projected_sections": projected,
+            "missing_sections": projected - open_sections.astype(np.int64),
+        }
+    )
+    # Groups in the solver's order, then the most chosen courses first
+    order = {group: position for position, group in enumerate(GROUP_ORDER)}
+    result["group_order"] = result["course_group"].map(order).fillna(len(order))
+    result = result.sort_values(
+        ["group_order", "course_group", "choices", "course_code"],
+        ascending=[True, True, False, True],
+    )
+    return result.drop(columns="group_order").reset_index(drop=True)
+
+
+def load_demand(spin_con, school_con) -> pd.DataFrame:
+    """Read the choices, sections and rooms, and compute the demand per course"""
+    demand = spin_con.execute(DEMAND_SQL).df()
+    sections = spin_con.execute(SECTIONS_SQL).df()
+    rooms = school_con.execute(ROOMS_SQL).df()
+    return course_demand(demand, sections, rooms)
+
+
+@memoize("course_demand", lambda: (spin_version(), school_version()))
+def get_course_demand() -> pd.DataFrame:
+    """Demand per course at the current data version (shared, don't modify it)"""
+    with db_spin.get_connection() as spin_con, db_school.get_connection() as school_con:
+        with span("db"):
+            return load_demand(spin_con, school_con)
+
+
+def summarize(demand: pd.DataFrame) -> Dict:
+    """Totals over the courses, for the dashboard header"""
+    return {
+        "courses": len(demand),
+        "choices": int(demand["choices"].sum()),
+        "first_choices": int(demand["rank_1"].sum()) if "rank_1" in demand else 0,
+        "sections": int(demand["sections"].sum()),
+        "projected_sections": int(demand["projected_sections"].sum()),
+        "missing_sections": int(demand["missing_sections"].clip(lower=0).sum()),
+    }
+
+
+if __name__ == "__main__":
+    with pd.option_context("display.width", 200, "display.max_columns", 30):
+        print(get_course_demand().to_string(index=False))
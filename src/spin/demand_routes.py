@@ -0,0 +1,73 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse
+
+from datastar_py.sse import ServerSentEventGenerator
+
+from src.db.changes import Change, change_bus
+from src.utils import lazy_import, response_adapter
+from src.web import sse
+
+# pandas/numpy are loaded on the first request, not when routes register
+demand = lazy_import("src.spin.demand")
+
+router = APIRouter(prefix="/spin", tags=["spin"])
+
+# Share the app templates so pages get the layout globals (menu_data, static_url)
+from init import templates
+
+# Tells open demand dashboards to reload their table (demandRefresh in spin/demand.html)
+DEMAND_CHANGED = ServerSentEventGenerator.merge_signals({"demandRefresh": True})
+
+# Tables the demand is computed from (see demand.spin_version and demand.school_version)
+DEMAND_TABLES = {
+    ("spin", "student"),
+    ("spin", "student_selection"),
+    ("spin", "spin_class"),
+    ("school", "room"),
+}
+
+
+@change_bus.subscribe
+def notify_demand_pages(change: Change):
+    """Refresh the open demand dashboards of this worker as submissions arrive"""
+    if (change.database, change.table) in DEMAND_TABLES:
+        sse.manager.publish("demand", DEMAND_CHANGED)
+
+
+def demand_context() -> dict:
+    course_demand = demand.get_course_demand()
+    ranks = [column for column in course_demand.columns if column.startswith("rank_")]
+    return {
+        "courses": course_demand.to_dict("records"),
+        "ranks": ranks,
+        "summary": demand.summarize(course_demand),
+    }
+
+
+@router.get("/demand", response_class=HTMLResponse)
+def get_demand_page(request: Request):
+    """Course demand dashboard: choices per rank and sections needed per course"""
+    return response_adapter(
+        request=request,
+        template_name="spin/demand.html",
+        context=demand_context,
+        templates=templates,
+        url="/spin/demand",
+    )
+
+
+@router.get("/demand/table", response_class=HTMLResponse)
+def get_demand_table(request: Request):
+    """The demand table alone, merged into the open dashboard by its id"""
+    return response_adapter(
+        request=request,
+        template_name="spin/demand_table.html",
+        context=demand_context,
+        templates=templates,
+    )
+
+
+@router.get("/demand/stream")
+async def stream_demand():
+    """Live updates for open demand dashboards (data-sse in spin/demand.html)"""
+    return sse.manager.response("demand")
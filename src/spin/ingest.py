@@ -0,0 +1,406 @@
+"""
+Bulk ingestion of survey submissions: students and their choices.
+
+An upload (CSV or JSON Lines) holds one student per row: the Student fields
+(email, firstName, lastName, level, program, optionally created_at and active)
+and a column per preference code (IM1, IW2, GA3, ...) holding the course
+chosen. JSON Lines rows may nest the choices in a "selections" object instead.
+Other columns are ignored.
+
+The upload is read INGEST_BATCH_ROWS rows at a time. Each batch is validated
+column-wise against the Student and Student_Selection models (src/db/models.py)
+and appended to temporary staging tables, so memory follows the batch size,
+not the upload. Invalid rows are skipped and reported with their line number.
+
+One transaction then merges the staging tables. The last row per email wins.
+Students already in the database (same email, ignoring case) keep their id and
+get the uploaded columns updated, and their selections are replaced when the
+row has any. The others are inserted. Every student and selection written gets
+a change-log entry, so the assignment repair and the survey tables pick them up.
+The command line repairs the assignment right after (the upload page in the
+background, see src/spin/repair.py):
+
+    uv run python -m src.spin.ingest submissions.csv --dry-run
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import re
+from dataclasses import MISSING, fields
+from datetime import datetime
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from src.db import db_spin
+from src.db.changes import change_bus
+from src.db.models import Student, Student_Selection
+from src.spin import repair
+
+# Rows parsed, validated and staged at a time
+BATCH_ROWS = int(os.environ.get("INGEST_BATCH_ROWS", 5000))
+# Invalid rows reported in the result (all of them are counted)
+MAX_ERRORS = 50
+
+FORMATS = ("csv", "jsonl")
+
+# Columns holding a choice: a course group and a rank (as parsed by assignment.CHOICES_SQL)
+PREFERENCE_CODE = re.compile(r"^[A-Za-z]+[0-9]+$")
+EMAIL = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+
+
+def model_fields(model, skip: Tuple[str, ...] = ()) -> Dict[str, Tuple[type, bool]]:
+    """Fields of a model dataclass: (type, required) by name"""
+    return {
+        field.name: (field.type, field.default is MISSING and field.default_factory is MISSING)
+        for field in fields(model)
+        if field.name not in skip
+    }
+
+
+# Ids are assigned here (students are matched by email), not read from the upload
+STUDENT_FIELDS = model_fields(Student, skip=("id",))
+SELECTION_FIELDS = model_fields(Student_Selection, skip=("id", "student_id", "assigned"))
+
+STAGING_DDL = (
+    """
+    CREATE OR REPLACE TEMP TABLE ingest_student (
+        line BIGINT, email VARCHAR, firstName VARCHAR, lastName VARCHAR,
+        level VARCHAR, program VARCHAR, created_at TIMESTAMP, active BOOLEAN
+    )
+    """,
+    """
+    CREATE OR REPLACE TEMP TABLE ingest_selection (
+        line BIGINT, preference_code VARCHAR, course_code VARCHAR
+    )
+    """,
+)
+
+# The last row per email, with the id of the student of that email if any
+MERGE_SQL = (
+    """
+    CREATE OR REPLACE TEMP TABLE ingest_kept AS
+    SELECT i.*, coalesce(s.id, uuid()) AS id, s.id IS NOT NULL AS existing
+    FROM (
+        FROM ingest_student
+        QUALIFY row_number() OVER (PARTITION BY email ORDER BY line DESC) = 1
+    ) AS i
+    LEFT JOIN (
+        SELECT lower(trim(email)) AS email, min(id) AS id FROM student GROUP BY ALL
+    ) AS s USING (email)
+    """,
+    """
+    CREATE OR REPLACE TEMP TABLE ingest_kept_selection AS
+    SELECT uuid() AS id, k.id AS student_id, sel.preference_code, sel.course_code
+    FROM ingest_selection AS sel
+    JOIN ingest_kept AS k USING (line)
+    """,
+    """
+    CREATE OR REPLACE TEMP TABLE ingest_removed AS
+    SELECT id FROM student_selection
+    WHERE student_id IN (SELECT student_id FROM ingest_kept_selection)
+    """,
+)
+COUNTS_SQL = """
+    SELECT
+        count(*) FILTER (WHERE NOT existing),
+        count(*) FILTER (WHERE existing),
+        (SELECT count(*) FROM ingest_kept_selection),
+        (SELECT count(*) FROM ingest_removed)
+    FROM ingest_kept
+"""
+WRITE_STATEMENTS = (
+    "DELETE FROM student_selection WHERE id IN (SELECT id FROM ingest_removed)",
+    """
+    UPDATE student SET
+        email = k.email,
+        firstName = k.firstName,
+        lastName = k.lastName,
+        level = k.level,
+        program = k.program,
+        created_at = coalesce(k.created_at, student.created_at),
+        active = coalesce(k.active, student.active)
+    FROM ingest_kept AS k
+    WHERE student.id = k.id AND k.existing
+    """,
+    """
+    INSERT INTO student (id, email, firstName, lastName, level, program, created_at, active)
+    SELECT
+        id, email, firstName, lastName, level, program,
+        coalesce(created_at, current_timestamp), coalesce(active, true)
+    FROM ingest_kept
+    WHERE NOT existing
+    """,
+    """
+    INSERT INTO student_selection (id, student_id, preference_code, course_code, assigned)
+    SELECT id, student_id, preference_code, course_code, false
+    FROM ingest_kept_selection
+    """,
+)
+STAGING_TABLES = (
+    "ingest_student",
+    "ingest_selection",
+    "ingest_kept",
+    "ingest_kept_selection",
+    "ingest_removed",
+)
+
+
+def detect_format(filename: Optional[str]) -> str:
+    """Upload format from the file name: jsonl for .jsonl/.ndjson, csv otherwise"""
+    if filename and filename.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "csv"
+
+
+def read_batches(
+    file: IO[bytes], format: str = "csv", batch_rows: int = BATCH_ROWS
+) -> Iterator[Tuple[pd.DataFrame, List[Tuple[int, str]]]]:
+    """
+    Parse an upload a batch of rows at a time.
+
+    Args:
+        file: The upload, opened in binary mode
+        format: "csv" or "jsonl"
+        batch_rows: Rows per batch
+
+    Yields:
+        (rows, errors): the rows as strings with their `line` number, and the
+        (line, error) of the lines that could not be parsed
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown upload format: {format}")
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        if format == "csv":
+            reader = csv.reader(text)
+            header = [column.strip() for column in next(reader, [])]
+            lines = ((reader.line_num, dict(zip(header, values))) for values in reader)
+        else:
+            lines = json_lines(text)
+
+        rows, errors = [], []
+        for line, row in lines:
+            if isinstance(row, str):
+                errors.append((line, row))
+            elif any(row.values()):
+                row["line"] = line
+                rows.append(row)
+            if len(rows) + len(errors) >= batch_rows:
+                yield pd.DataFrame(rows), errors
+                rows, errors = [], []
+        if rows or errors:
+            yield pd.DataFrame(rows), errors
+    finally:
+        text.detach()
+
+
+def json_lines(text: IO[str]) -> Iterator[Tuple[int, object]]:
+    """(line, row) per JSON line, with the choices of "selections" as columns (or an error)"""
+    for line, content in enumerate(text, 1):
+        if not content.strip():
+            continue
+        try:
+            row = json.loads(content)
+        except json.JSONDecodeError as e:
+            yield line, f"invalid JSON: {e.msg}"
+            continue
+        if not isinstance(row, dict):
+            yield line, "not a JSON object"
+            continue
+        selections = row.pop("selections", None) or {}
+        if not isinstance(selections, dict):
+            yield line, "selections is not an object"
+            continue
+        row.update(selections)
+        yield line, {
+            key: None if value is None else str(value).strip() for key, value in row.items()
+        }
+
+
+def as_text(column: pd.Series) -> pd.Series:
+    return column.astype("string").str.strip().replace("", pd.NA)
+
+
+def as_bool(column: pd.Series) -> pd.Series:
+    """true/false, yes/no, 1/0 (any case); anything else is NA"""
+    words = {"true": True, "yes": True, "1": True, "false": False, "no": False, "0": False}
+    return as_text(column).str.lower().map(words).astype("boolean")
+
+
+def validate(rows: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Validate a batch of rows against the Student and Student_Selection fields.
+
+    Returns:
+        (students, selections, errors): the valid students (columns of
+        ingest_student), their selections (line, preference_code,
+        course_code), and the (line, error) of the rows left out
+    """
+    line = rows["line"].astype("int64")
+    problems = pd.Series("", index=rows.index)
+
+    def invalid(mask: pd.Series, message: str):
+        problems[mask] = problems[mask] + f"{message}; "
+
+    students = pd.DataFrame({"line": line})
+    for name, (kind, required) in STUDENT_FIELDS.items():
+        given = rows[name] if name in rows else pd.Series(pd.NA, index=rows.index)
+        if kind is bool:
+            students[name] = as_bool(given)
+            invalid(students[name].isna() & as_text(given).notna(), f"{name} is not a boolean")
+        elif kind is datetime:
+            students[name] = pd.to_datetime(as_text(given), format="mixed", errors="coerce")
+            invalid(students[name].isna() & as_text(given).notna(), f"{name} is not a timestamp")
+        else:
+            students[name] = as_text(given)
+        if required:
+            invalid(students[name].isna(), f"{name} is missing")
+    students["email"] = students["email"].str.lower()
+    invalid(
+        students["email"].notna() & ~students["email"].str.match(EMAIL).fillna(False),
+        "email is not valid",
+    )
+
+    # One row per preference code column and student, choices left empty dropped
+    codes = [column for column in rows.columns if PREFERENCE_CODE.match(str(column))]
+    selections = rows[["line", *codes]].melt(
+        id_vars="line", var_name="preference_code", value_name="course_code"
+    )
+    selections["line"] = selections["line"].astype("int64")
+    selections["preference_code"] = selections["preference_code"].str.upper()
+    selections["course_code"] = as_text(selections["course_code"])
+    selections = selections.dropna(subset=[*SELECTION_FIELDS])
+
+    valid = problems == ""
+    errors = pd.DataFrame({"line": line[~valid], "error": problems[~valid].str.rstrip("; ")})
+    selections = selections[selections["line"].isin(line[valid])]
+    return students[valid], selections[["line", "preference_code", "course_code"]], errors
+
+
+def ingest(
+    file: IO[bytes],
+    format: str = "csv",
+    write: bool = True,
+    batch_rows: int = BATCH_ROWS,
+    con=None,
+) -> Iterator[Dict]:
+    """
+    Load an upload of students and their choices into the SPIN database.
+
+    Args:
+        file: The upload, opened in binary mode
+        format: "csv" or "jsonl"
+        write: Store the result (otherwise only count what would change)
+        batch_rows: Rows parsed and validated at a time
+        con: Connection to the SPIN database, a new one by default
+
+    Yields:
+        Progress after each batch ({"stage": "parsing", "rows", "valid",
+        "invalid"}), then the result ({"stage": "done"} with the students
+        inserted and updated, the selections inserted and removed, and the
+        first MAX_ERRORS errors)
+    """
+    if con is None:
+        with db_spin.get_connection() as con:
+            yield from ingest(file, format, write, batch_rows, con)
+        return
+
+    for statement in STAGING_DDL:
+        con.execute(statement)
+    try:
+        progress = {"stage": "parsing", "rows": 0, "valid": 0, "invalid": 0}
+        errors: List[Dict] = []
+        for rows, parse_errors in read_batches(file, format, batch_rows):
+            failed = [{"line": line, "error": error} for line, error in parse_errors]
+            if not rows.empty:
+                students, selections, invalid = validate(rows)
+                con.append("ingest_student", students, by_name=True)
+                con.append("ingest_selection", selections, by_name=True)
+                failed += invalid.to_dict("records")
+                failed.sort(key=lambda error: error["line"])
+                progress["valid"] += len(students)
+            progress["rows"] += len(rows) + len(parse_errors)
+            progress["invalid"] += len(failed)
+            errors.extend(failed[: MAX_ERRORS - len(errors)])
+            yield dict(progress)
+
+        yield {**progress, "stage": "loading"}
+        result = merge(con, write)
+        yield {**progress, **result, "stage": "done", "errors": errors}
+    finally:
+        for table in STAGING_TABLES:
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def merge(con, write: bool = True) -> Dict:
+    """Merge the staging tables into student and student_selection (see the module docstring)"""
+    for statement in MERGE_SQL:
+        con.execute(statement)
+    inserted, updated, selections, removed = con.execute(COUNTS_SQL).fetchone()
+    result = {
+        "students_inserted": inserted,
+        "students_updated": updated,
+        "selections_inserted": selections,
+        "selections_removed": removed,
+    }
+    if not write or not (inserted or updated):
+        return result
+
+    columns = ["email", "firstName", "lastName", "level", "program", "created_at", "active"]
+    log = db_spin.change_log
+    with log.transaction(con):
+        for statement in WRITE_STATEMENTS:
+            con.execute(statement)
+        student_seqs = [
+            log.record_many(
+                con,
+                "student",
+                "SELECT id FROM ingest_kept WHERE NOT existing",
+                "insert",
+                ["id", *columns],
+            ),
+            log.record_many(
+                con, "student", "SELECT id FROM ingest_kept WHERE existing", "update", columns
+            ),
+        ]
+        selection_seqs = [
+            log.record_many(con, "student_selection", "SELECT id FROM ingest_removed", "delete"),
+            log.record_many(
+                con,
+                "student_selection",
+                "SELECT id FROM ingest_kept_selection",
+                "insert",
+                ["id", "student_id", "preference_code", "course_code", "assigned"],
+            ),
+        ]
+    change_bus.notify("spin", "student", None, max(seq for seq in student_seqs if seq))
+    if any(selection_seqs):
+        change_bus.notify(
+            "spin", "student_selection", None, max(seq for seq in selection_seqs if seq)
+        )
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", help="CSV or JSON Lines file")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file name")
+    parser.add_argument("--dry-run", action="store_true", help="validate and count only")
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as file:
+        for progress in ingest(file, args.format or detect_format(args.path), not args.dry_run):
+            if progress["stage"] != "done":
+                print(
+                    f"{progress['stage']}: {progress['rows']} rows, {progress['invalid']} invalid"
+                )
+    written = progress.get("students_inserted") or progress.get("students_updated")
+    if written and not args.dry_run and repair.REPAIR_ON_INGEST:
+        repaired = repair.repair_if_assigned()
+        if repaired is not None:
+            progress["repair"] = {key: repaired[key] for key in ("changed", "moved", "seq")}
+    print(json.dumps(progress, indent=2, default=str))
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse
+from starlette.concurrency import iterate_in_threadpool
+from starlette.datastructures import UploadFile
+
+from datastar_py.responses import DatastarFastAPIResponse
+
+from src.utils import lazy_import, render_template, response_adapter
+
+# pandas/duckdb are loaded on the first upload, not when routes register
+ingest = lazy_import("src.spin.ingest")
+repair = lazy_import("src.spin.repair")
+
+router = APIRouter(prefix="/spin", tags=["spin"])
+
+# Share the app templates so pages get the layout globals (menu_data, static_url)
+from init import templates
+
+
+@router.get("/ingest", response_class=HTMLResponse)
+async def get_ingest_page(request: Request):
+    """Upload form for survey submissions (see src/spin/ingest.py)"""
+    return response_adapter(
+        request=request,
+        template_name="spin/ingest.html",
+        context={},
+        templates=templates,
+        url="/spin/ingest",
+    )
+
+
+@router.post("/ingest")
+async def post_ingest(request: Request):
+    """Load an uploaded CSV/JSON Lines file, streaming the progress as signals, then repair"""
+    form = await request.form()
+    upload = form.get("file")
+    format = form.get("format") or None
+
+    def render_result(result: dict) -> str:
+        template = templates.get_template("spin/ingest_result.html")
+        return render_template(template, {"result": result})
+
+    async def progress_events(sse):
+        if not isinstance(upload, UploadFile) or not upload.filename:
+            yield sse.merge_fragments([render_result({"failed": "Choose a file to upload"})])
+            return
+        progress = ingest.ingest(upload.file, format or ingest.detect_format(upload.filename))
+        try:
+            # Parsing and loading run in the threadpool, a batch per step
+            async for step in iterate_in_threadpool(progress):
+                signals = {key: step[key] for key in ("stage", "rows", "valid", "invalid")}
+                yield sse.merge_signals({"ingest": signals})
+            if repair.REPAIR_ON_INGEST and (step["students_inserted"] or step["students_updated"]):
+                # The new choices get their classes in the background
+                repair.runner.request()
+                step["repair"] = True
+            yield sse.merge_fragments([render_result(step)])
+        except Exception as e:
+            yield sse.merge_signals({"ingest": {"stage": "failed"}})
+            yield sse.merge_fragments([render_result({"failed": str(e)})])
+        finally:
+            await upload.close()
+
+    return DatastarFastAPIResponse(progress_events)
@@ -0,0 +1,412 @@
+"""
+Incremental re-assignment of SPIN classes, after some students changed their choices.
+
+Instead of solving from scratch and replacing the assignment table (see
+src/spin/assignment.py), `repair` starts from the assignment stored: the
+changed students are placed again, and the others keep their classes unless
+that is no longer optimal. The solver finds the assignment moving the fewest
+students among the optimal ones, so a change reaches past the students it
+concerns only along the augmenting paths that make room for them.
+
+Changed students are the ones with a student_selection or student change in
+the change log after the cursor the stored assignment was solved at (or the
+`since` cursor), the ones whose classes no longer match an assigned
+selection (`student_selection.assigned`), and the ones given explicitly.
+
+Only the difference is written, in one transaction: the assignments removed
+and added, and `assigned` of the students concerned. The result reports it
+class by class:
+
+    uv run python -m src.spin.repair --dry-run
+    uv run python -m src.spin.repair --student 6c0f... --student 91ab...
+
+The problem stays in memory between repairs (`warm_problem`): the next one
+reads only the students changed since, from the change log. Each ingest of
+submissions (src/spin/ingest.py) asks `runner` for a repair, which runs on a
+background thread, one at a time (SPIN_REPAIR_ON_INGEST=0 turns that off).
+The solve still goes over every student of a group: about 0.8s at 10k
+students, 13s at 50k (benchmarks/bench_assignment.py), so at that size
+submissions wait for the repair running before theirs.
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.db import db_school, db_spin
+from src.db.change_log import (
+    CURSOR_DDL,
+    ensure_change_log,
+    read_cursor,
+    rollback,
+    write_cursor,
+)
+from src.db.changes import change_bus
+from src.instrumentation import span
+from src.spin import assignment
+from src.spin.assignment import Problem, Solution
+
+logger = logging.getLogger(__name__)
+
+# Repair after every ingest of submissions (0: leave it to the command line)
+REPAIR_ON_INGEST = int(os.environ.get("SPIN_REPAIR_ON_INGEST", 1))
+
+# Assigned classes with the assigned selection of their course, if any
+CURRENT_SQL = """
+    SELECT
+        a.student_id::VARCHAR AS student_id,
+        a.spin_class_id::VARCHAR AS spin_class_id,
+        s.id::VARCHAR AS selection_id
+    FROM assignment a
+    JOIN spin_class c ON c.id = a.spin_class_id
+    LEFT JOIN student_selection s
+        ON s.student_id = a.student_id AND s.course_code = c.course_code AND s.assigned
+    QUALIFY row_number() OVER (PARTITION BY a.student_id, a.spin_class_id ORDER BY s.id) = 1
+"""
+# Students whose choices (or whose record) changed after a cursor
+CHANGED_SQL = """
+    SELECT s.student_id::VARCHAR AS student_id
+    FROM change_log l
+    JOIN student_selection s ON s.id::VARCHAR = l.row_id
+    WHERE l.seq > $since AND l.table_name = 'student_selection'
+    UNION
+    SELECT row_id AS student_id
+    FROM change_log
+    WHERE seq > $since AND table_name = 'student' AND row_id IS NOT NULL
+"""
+# Students with choices but no assigned one: new submissions, or left out last time
+UNASSIGNED_SQL = """
+    SELECT student_id::VARCHAR AS student_id
+    FROM student_selection
+    GROUP BY student_id
+    HAVING NOT bool_or(coalesce(assigned, false))
+"""
+LAST_WRITE_SQL = "SELECT coalesce(max(seq), 0) FROM change_log WHERE table_name = 'assignment'"
+
+# Changes after a cursor to the rows the problem is read from. The assignment
+# writes' updates of `assigned` leave the choices as they are.
+PROBLEM_CHANGES_SQL = """
+    SELECT table_name, row_id FROM change_log
+    WHERE seq > $since
+        AND table_name IN ('spin_class', 'student', 'student_selection')
+        AND columns IS DISTINCT FROM ['assigned']
+"""
+ROOM_CHANGES_SQL = "SELECT count(*) FROM change_log WHERE seq > ? AND table_name = 'room'"
+SELECTION_STUDENTS_SQL = """
+    SELECT student_id::VARCHAR AS student_id FROM student_selection
+    WHERE list_contains($ids, id::VARCHAR)
+"""
+
+# The problem of the last repair and the school cursor it was read at, by databases
+_warm: Dict[Tuple[str, str], Tuple[Problem, int]] = {}
+_lock = threading.Lock()
+
+# Apply the `removed` and `added` frames, and mark the `solved` selections of `touched` students
+WRITE_STATEMENTS = (
+    """
+    DELETE FROM assignment
+    USING removed
+    WHERE assignment.student_id = removed.student_id::UUID
+        AND assignment.spin_class_id = removed.spin_class_id::UUID
+    """,
+    """
+    INSERT INTO assignment (student_id, spin_class_id)
+    SELECT student_id::UUID, spin_class_id::UUID FROM added
+    """,
+    """
+    UPDATE student_selection
+    SET assigned = id IN (SELECT selection_id::UUID FROM solved)
+    WHERE student_id IN (SELECT student_id::UUID FROM touched)
+    """,
+)
+
+
+def load_current(con, problem: Problem) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The stored assignment, as `assignment.solve` takes it.
+
+    Returns:
+        (current, stale): class per student and group (-1 for none), and the
+        students with classes that match no assigned selection
+    """
+    rows = con.execute(CURRENT_SQL).df()
+    student = pd.Index(problem.student_ids).get_indexer(rows["student_id"])
+    klass = pd.Index(problem.class_ids).get_indexer(rows["spin_class_id"])
+    choice = pd.Index(problem.choice_ids).get_indexer(rows["selection_id"])
+    found = (student >= 0) & (klass >= 0) & (choice >= 0)
+
+    current = np.full((len(problem.student_ids), len(problem.groups)), -1, np.int64)
+    keys = student[found] * len(problem.groups) + problem.choice_group[choice[found]]
+    current.flat[keys] = klass[found]
+    stale = np.zeros(len(problem.student_ids), bool)
+    stale[student[(student >= 0) & ~found]] = True
+    # Two classes in one group: only one was kept
+    unique, counts = np.unique(keys, return_counts=True)
+    stale[unique[counts > 1] // len(problem.groups)] = True
+    return current, stale
+
+
+def warm_problem(spin_con, school_con) -> Problem:
+    """
+    The problem of the databases, from the one kept since the last call.
+
+    Only the students with changes in the change log since are read again (see
+    `assignment.update_problem`); a change to the classes or the rooms, a bulk
+    change, or a new program or group builds it again (`assignment.load_problem`).
+    """
+    key = (db_spin.SPIN_DB_URL, db_school.SCHOOL_DB_URL)
+    ensure_change_log(school_con)
+    school_seq = db_school.change_log.committed(school_con)
+    warm = _warm.get(key)
+    problem = None if warm is None else updated_problem(spin_con, school_con, *warm)
+    if problem is None:
+        problem = assignment.load_problem(spin_con, school_con)
+    _warm.clear()
+    _warm[key] = (problem, school_seq)
+    return problem
+
+
+def updated_problem(spin_con, school_con, problem: Problem, school_since: int) -> Optional[Problem]:
+    """The problem with the students changed since it was read, None if it needs a new build"""
+    if school_con.execute(ROOM_CHANGES_SQL, [school_since]).fetchone()[0]:
+        return None
+    ensure_change_log(spin_con)
+    seq = db_spin.change_log.committed(spin_con)
+    changes = spin_con.execute(PROBLEM_CHANGES_SQL, {"since": problem.seq}).df()
+    if changes["row_id"].isna().any() or (changes["table_name"] == "spin_class").any():
+        return None
+
+    selections = changes["row_id"][changes["table_name"] == "student_selection"].tolist()
+    # Selections deleted since are only in the problem
+    known = pd.Index(problem.choice_ids).get_indexer(selections)
+    student_ids = set(problem.student_ids[problem.choice_student[known[known >= 0]]])
+    student_ids |= set(changes["row_id"][changes["table_name"] == "student"])
+    student_ids |= set(
+        spin_con.execute(SELECTION_STUDENTS_SQL, {"ids": selections}).df()["student_id"]
+    )
+    ids = sorted(student_ids)
+    # One snapshot: the students' rows and their choices agree
+    spin_con.execute("BEGIN TRANSACTION")
+    try:
+        students = spin_con.execute(
+            f"SELECT * FROM ({assignment.STUDENTS_SQL}) WHERE list_contains($ids, id)",
+            {"ids": ids},
+        ).df()
+        choices = spin_con.execute(
+            f"SELECT * FROM ({assignment.CHOICES_SQL}) WHERE list_contains($ids, student_id)",
+            {"ids": ids},
+        ).df()
+    finally:
+        rollback(spin_con)
+    updated = assignment.update_problem(problem, ids, students, choices)
+    if updated is not None:
+        updated.seq = seq
+    return updated
+
+
+def changed_students(
+    con, problem: Problem, since: Optional[int] = None, student_ids: Iterable[str] = ()
+) -> Tuple[np.ndarray, int]:
+    """
+    Students to place again.
+
+    Args:
+        con: Connection to the SPIN database
+        problem: The problem loaded from it
+        since: Change-log cursor, the one the stored assignment was solved at by default
+        student_ids: More students to place again
+
+    Returns:
+        (changed, since): bool per student, and the cursor used
+    """
+    ensure_change_log(con)
+    if since is None:
+        since = read_cursor(con, assignment.CURSOR)
+    if since is None:  # an assignment written before the cursor was stored
+        since = con.execute(LAST_WRITE_SQL).fetchone()[0]
+    ids = con.execute(CHANGED_SQL, {"since": since}).df()["student_id"]
+    ids = pd.concat([ids, con.execute(UNASSIGNED_SQL).df()["student_id"]])
+    ids = pd.concat([ids, pd.Series(list(student_ids), dtype=object)])
+    student = pd.Index(problem.student_ids).get_indexer(ids)
+    changed = np.zeros(len(problem.student_ids), bool)
+    changed[student[student >= 0]] = True
+    return changed, since
+
+
+def as_current(problem: Problem, solution: Solution) -> np.ndarray:
+    """Class per student and group of a solution, -1 for none"""
+    current = np.full((len(problem.student_ids), len(problem.groups)), -1, np.int64)
+    student = problem.choice_student[solution.choices]
+    current[student, problem.choice_group[solution.choices]] = solution.classes
+    return current
+
+
+def delta(problem: Problem, before: np.ndarray, after: np.ndarray) -> List[Dict]:
+    """The classes that changed, per student and group: from (None: none) and to"""
+    student, group = np.nonzero(before != after)
+    return [
+        {
+            "student_id": problem.student_ids[s],
+            "group": problem.groups[g],
+            "from": problem.class_ids[before[s, g]] if before[s, g] >= 0 else None,
+            "to": problem.class_ids[after[s, g]] if after[s, g] >= 0 else None,
+        }
+        for s, g in zip(student, group)
+    ]
+
+
+def write_delta(
+    con, problem: Problem, solution: Solution, moves: List[Dict], changed: np.ndarray
+) -> int:
+    """
+    Write the moves of `delta`, and `assigned` of the students moved or changed.
+
+    Returns:
+        The change-log sequence number of the write
+    """
+    removed = pd.DataFrame(
+        [(move["student_id"], move["from"]) for move in moves if move["from"] is not None],
+        columns=["student_id", "spin_class_id"],
+    )
+    added = pd.DataFrame(
+        [(move["student_id"], move["to"]) for move in moves if move["to"] is not None],
+        columns=["student_id", "spin_class_id"],
+    )
+    moved = {move["student_id"] for move in moves}
+    touched = pd.DataFrame(
+        {"student_id": sorted(moved | set(problem.student_ids[changed]))}, dtype=object
+    )
+    solved = pd.DataFrame({"selection_id": problem.choice_ids[solution.choices]}, dtype=object)
+
+    frames = {"removed": removed, "added": added, "touched": touched, "solved": solved}
+    con.execute(CURSOR_DDL)
+    for name, frame in frames.items():
+        con.register(name, frame)
+    try:
+        with db_spin.change_log.transaction(con):
+            for statement in WRITE_STATEMENTS:
+                con.execute(statement)
+            write_cursor(con, assignment.CURSOR, problem.seq)
+            for student_id in sorted(moved):
+                seq = db_spin.change_log.record(
+                    con, "assignment", student_id, "update", ["spin_class_id"]
+                )
+            # One entry when nothing moved, so that readers of the log see the write
+            if not moved:
+                seq = db_spin.change_log.record(con, "assignment", None, "update", [])
+            selection_seq = db_spin.change_log.record(
+                con, "student_selection", None, "update", ["assigned"]
+            )
+    finally:
+        for name in frames:
+            con.unregister(name)
+    change_bus.notify("spin", "assignment", None, seq)
+    change_bus.notify("spin", "student_selection", None, selection_seq)
+    return seq
+
+
+def repair(
+    write: bool = True, since: Optional[int] = None, student_ids: Iterable[str] = ()
+) -> Dict:
+    """
+    Re-assign the changed students, moving as few others as possible.
+
+    Args:
+        write: Store the changes
+        since: Change-log cursor (see `changed_students`)
+        student_ids: More students to place again
+
+    Returns:
+        The summary of the solution (see `assignment.summarize`), with the
+        cursor used, the number of students changed and the moves
+    """
+    start = time.perf_counter()
+    with (
+        _lock,
+        db_spin.get_connection() as spin_con,
+        db_school.get_connection() as school_con,
+    ):
+        with span("assignment.load"):
+            problem = warm_problem(spin_con, school_con)
+            current, stale = load_current(spin_con, problem)
+            changed, since = changed_students(spin_con, problem, since, student_ids)
+        changed |= stale
+        solution = assignment.solve(problem, current, changed)
+        moves = delta(problem, current, as_current(problem, solution))
+        summary = assignment.summarize(problem, solution)
+        summary.update(since=since, changed=int(changed.sum()), moved=len(moves))
+        if write:
+            with span("assignment.write"):
+                summary["seq"] = write_delta(spin_con, problem, solution, moves, changed)
+    summary["moves"] = moves
+    logger.info(
+        "Repaired the assignment of %d changed students in %.2fs, %d classes changed",
+        summary["changed"],
+        time.perf_counter() - start,
+        len(moves),
+    )
+    return summary
+
+
+def repair_if_assigned() -> Optional[Dict]:
+    """`repair`, unless nothing was assigned yet (None): that takes `assignment.assign`"""
+    with db_spin.get_connection() as con:
+        if not con.execute("SELECT count(*) FROM assignment").fetchone()[0]:
+            return None
+    return repair()
+
+
+class RepairRunner:
+    """Runs `repair_if_assigned` on a background thread, once more if asked while it runs"""
+
+    def __init__(self):
+        self.last: Optional[Dict] = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._again = False
+
+    def request(self):
+        """Repair soon; the requests made during a repair share the next one"""
+        with self._lock:
+            if self._running:
+                self._again = True
+                return
+            self._running = True
+        threading.Thread(target=self._run, name="spin-repair", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.last = repair_if_assigned()
+            except Exception:
+                logger.exception("Repairing the SPIN assignment failed")
+            with self._lock:
+                if not self._again:
+                    self._running = False
+                    return
+                self._again = False
+
+
+runner = RepairRunner()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dry-run", action="store_true", help="solve without writing")
+    parser.add_argument("--since", type=int, help="change-log cursor (default: the assignment's)")
+    parser.add_argument(
+        "--student", action="append", default=[], help="student id to place again (repeatable)"
+    )
+    args = parser.parse_args()
+    print(
+        json.dumps(
+            repair(write=not args.dry_run, since=args.since, student_ids=args.student), indent=2
+        )
+    )
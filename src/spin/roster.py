@@ -0,0 +1,261 @@
+"""
+Roster export of the SPIN assignments, streamed as CSV or Parquet.
+
+The roster is the assignment -> student -> spin_class join at the end of
+src/db/setup_db_spin.sql (firstName, lastName, timeslot, title, as in
+data/export-4.csv), with the classes read pre-joined from class_view
+(src/spin/class_view.py). Rows are fetched from DuckDB ROSTER_BATCH_ROWS at a time
+and each batch is encoded and handed on before the next one is read, so memory
+stays flat whatever the roster size and the first bytes go out right away.
+
+With `by` ("class" or "teacher") the roster is split into one file per class
+or teacher, streamed as members of a zip archive:
+
+    uv run python -m src.spin.roster --format parquet --by teacher --output rosters.zip
+"""
+
+import argparse
+import csv
+import io
+import os
+import re
+import sys
+import zipfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.db import db_spin
+from src.spin import class_view
+
+# Rows fetched from DuckDB (and encoded) at a time
+BATCH_ROWS = int(os.environ.get("ROSTER_BATCH_ROWS", 10000))
+
+COLUMNS = ["firstName", "lastName", "timeslot", "title"]
+
+# Partition key, file name and order of the rows within the partitions
+PARTITIONS = {
+    None: ("NULL", "NULL", "std.lastName, std.firstName, sc.timeslot"),
+    "class": (
+        "sc.id",
+        "sc.title",
+        "sc.title, sc.timeslot, sc.id, std.lastName, std.firstName",
+    ),
+    "teacher": (
+        "sc.teacher_name",
+        "sc.teacher_name",
+        "sc.teacher_name, std.lastName, std.firstName, sc.timeslot",
+    ),
+}
+
+ROSTER_SQL = """
+    SELECT {key} AS part_key, {name} AS part_name,
+        std.firstName, std.lastName, sc.timeslot, sc.title
+    FROM assignment AS asg
+    JOIN student AS std ON asg.student_id = std.id
+    LEFT JOIN class_view AS sc ON asg.spin_class_id = sc.id
+    ORDER BY {order}
+"""
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "zip": "application/zip",
+}
+
+
+class Sink(io.RawIOBase):
+    """Write-only buffer handed on in chunks: what was written since the last `take`"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+class CsvWriter:
+    """One CSV file, written batch by batch"""
+
+    def __init__(self, sink: Sink):
+        self.sink = sink
+        self._write_rows([COLUMNS])
+
+    def _write_rows(self, rows: Iterable[Tuple]):
+        text = io.StringIO()
+        csv.writer(text, lineterminator="\n").writerows(rows)
+        self.sink.write(text.getvalue().encode())
+
+    def write(self, rows: List[Tuple]):
+        self._write_rows(rows)
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """One Parquet file, a row group per batch"""
+
+    def __init__(self, sink: Sink):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:  # optional dependency
+            raise ImportError("The Parquet export needs pyarrow (the `arrow` extra)") from e
+
+        self.pa = pa
+        self.schema = pa.schema([(column, pa.string()) for column in COLUMNS])
+        self.writer = pq.ParquetWriter(sink, self.schema)
+
+    def write(self, rows: List[Tuple]):
+        columns = [self.pa.array(values, self.pa.string()) for values in zip(*rows)]
+        self.writer.write_batch(self.pa.record_batch(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "parquet": ParquetWriter}
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def partitions(result, batch_rows: int) -> Iterator[Tuple[bool, object, str, List[Tuple]]]:
+    """
+    The rows of a roster query, batch by batch.
+
+    Yields:
+        (first, key, name, rows): rows of one partition, `first` for the first
+        batch of the partition
+    """
+    key = object()
+    while True:
+        batch = result.fetchmany(batch_rows)
+        if not batch:
+            return
+        start = 0
+        for end in range(1, len(batch) + 1):
+            if end == len(batch) or batch[end][0] != batch[start][0]:
+                first = batch[start][0] != key
+                key = batch[start][0]
+                rows = [row[2:] for row in batch[start:end]]
+                yield first, key, batch[start][1], rows
+                start = end
+
+
+def file_name(name: Optional[str], extension: str, used: Dict[str, int]) -> str:
+    """Zip member name for a partition, unique within the archive"""
+    stem = re.sub(r"[^\w.()+-]+", "_", str(name)).strip("_.") if name else "unassigned"
+    used[stem] = used.get(stem, 0) + 1
+    if used[stem] > 1:
+        stem = f"{stem}-{used[stem]}"
+    return f"{stem}.{extension}"
+
+
+def stream_roster(
+    format: str = "csv", by: Optional[str] = None, batch_rows: int = BATCH_ROWS, con=None
+) -> Iterator[bytes]:
+    """
+    The roster, encoded in chunks as it is read.
+
+    Args:
+        format: "csv" or "parquet"
+        by: None for one file, or "class"/"teacher" for a zip with a file each
+        batch_rows: Rows fetched and encoded at a time
+        con: SPIN database connection (a new one by default)
+
+    Yields:
+        The bytes of the file (or zip archive)
+    """
+    if format not in WRITERS:
+        raise ValueError(f"Unknown roster format: {format}")
+    if by not in PARTITIONS:
+        raise ValueError(f"Unknown roster partition: {by}")
+    Writer = WRITERS[format]
+    key, name, order = PARTITIONS[by]
+    sql = ROSTER_SQL.format(key=key, name=name, order=order)
+
+    if con is None:
+        with db_spin.get_connection() as con:
+            yield from stream_roster(format, by, batch_rows, con)
+        return
+
+    sink = Sink()
+    if by is None:
+        # The header (CSV) or magic bytes (Parquet) go out before the query runs
+        writer = Writer(sink)
+        yield sink.take()
+        class_view.refresh(con)
+        for _, _, _, rows in partitions(con.execute(sql), batch_rows):
+            writer.write(rows)
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+        return
+
+    class_view.refresh(con)
+    used: Dict[str, int] = {}
+    file_sink = Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        member = writer = None
+        for first, _, part_name, rows in partitions(con.execute(sql), batch_rows):
+            if first:
+                if member is not None:
+                    writer.close()
+                    member.write(file_sink.take())
+                    member.close()
+                member_name = file_name(part_name, format, used)
+                member = archive.open(member_name, "w", force_zip64=True)
+                writer = Writer(file_sink)
+            writer.write(rows)
+            member.write(file_sink.take())
+            yield sink.take()
+        if member is not None:
+            writer.close()
+            member.write(file_sink.take())
+            member.close()
+    yield sink.take()
+
+
+def download_name(format: str, by: Optional[str] = None) -> str:
+    return f"roster-by-{by}.zip" if by else f"roster.{format}"
+
+
+def media_type(format: str, by: Optional[str] = None) -> str:
+    return MEDIA_TYPES["zip" if by else format]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv")
+    parser.add_argument(
+        "--by", choices=[by for by in PARTITIONS if by], help="zip per class/teacher"
+    )
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream_roster(args.format, args.by):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
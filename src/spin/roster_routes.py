@@ -0,0 +1,32 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from src.utils import lazy_import
+
+# duckdb is loaded on the first export, not when routes register
+roster = lazy_import("src.spin.roster")
+
+router = APIRouter(prefix="/spin", tags=["spin"])
+
+
+@router.get("/roster")
+def export_roster(
+    format: Literal["csv", "parquet"] = Query("csv", description="File format"),
+    by: Optional[Literal["class", "teacher"]] = Query(
+        None, description="A file per class or teacher, in a zip archive"
+    ),
+):
+    """Stream the roster of the assignments (see src/spin/roster.py)"""
+    if format == "parquet" and not roster.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow")
+
+    # A sync generator: Starlette reads it in the threadpool, a batch at a time
+    chunks = (chunk for chunk in roster.stream_roster(format, by) if chunk)
+    filename = roster.download_name(format, by)
+    return StreamingResponse(
+        chunks,
+        media_type=roster.media_type(format, by),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,487 @@
+"""
+Staffing of the SPIN classes: a teacher per class from their course ratings.
+
+teacherpreference holds a rating per teacher and course (1-5, higher is
+better). The ratings of the active teachers for the active courses are read
+into a dense matrix, teachers x courses (0: not rated). A teacher may take a
+class of a course they rated at least STAFFING_MIN_RATING, no more than
+STAFFING_MAX_LOAD classes, and never two classes at overlapping times
+(timeslots as minute intervals, see src/spin/conflicts.py). The optimizer
+maximizes the total rating of the teachers given.
+
+The timeslots are split into blocks of pairwise overlapping ones (the fewest,
+by earliest end), and a teacher takes at most one class per block. That drops
+the overlaps between blocks, so it only relaxes the problem, and it is exact
+when timeslots are either equal or disjoint, as the school's periods are.
+Without the load limit, classes taking (teacher, block) seats is a
+transportation problem, solved exactly by the assignment Market
+(src/spin/assignment.py). The load limit is relaxed into a price per teacher
+(Lagrangian relaxation). Each round solves the market at the current prices,
+then raises the prices of the teachers over their limit and lowers the prices
+of those under it. Every round gives:
+
+- an upper bound on the total rating: the relaxed optimum plus the prices
+  times the load limit
+- a proposal: teachers keep their best rated classes within the load limit
+  and without overlaps (between blocks), and the classes left are staffed
+  greedily by the teachers with room and time for them
+
+Rounds stop when the best proposal reaches the bound (it is optimal), after
+STAFFING_ROUNDS, or once the bound has not improved for STAFFING_PATIENCE
+rounds. Nothing is written until a proposal is applied:
+
+    uv run python -m src.spin.staffing --max-load 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.db import db_school, db_spin
+from src.db.changes import change_bus
+from src.db.spin_views import get_spin_classes_df
+from src.instrumentation import span
+from src.spin.assignment import Market
+from src.spin.conflicts import class_intervals
+
+logger = logging.getLogger(__name__)
+
+# Classes per teacher at most
+MAX_LOAD = int(os.environ.get("STAFFING_MAX_LOAD", 6))
+# Lowest rating a teacher may be given a course's classes at
+MIN_RATING = int(os.environ.get("STAFFING_MIN_RATING", 1))
+ROUNDS = int(os.environ.get("STAFFING_ROUNDS", 40))
+PATIENCE = int(os.environ.get("STAFFING_PATIENCE", 8))
+# Market values are ratings times SCALE, so prices can move by a fraction of a rating
+SCALE = 8
+
+TEACHERS_SQL = "SELECT id::VARCHAR AS id, name FROM teacher WHERE active ORDER BY name, id"
+COURSES_SQL = "SELECT id::VARCHAR AS id, code FROM course WHERE active ORDER BY code, id"
+RATINGS_SQL = """
+    SELECT teacher_id::VARCHAR AS teacher_id, course_id::VARCHAR AS course_id, rating
+    FROM teacherpreference
+    WHERE rating IS NOT NULL
+"""
+
+
+@dataclass
+class Staffing:
+    """Teachers, courses, their ratings and the classes, as arrays of indexes"""
+
+    teacher_ids: np.ndarray
+    teacher_names: np.ndarray
+    course_ids: np.ndarray
+    # int8, teachers x courses, 0 for not rated
+    ratings: np.ndarray
+    class_ids: np.ndarray
+    # Column in `ratings` of each class's course, -1 for an inactive or unknown course
+    class_course: np.ndarray
+    class_block: np.ndarray
+    # Timeslots as minute intervals, -1 for none (see src/spin/conflicts.py)
+    class_start: np.ndarray
+    class_end: np.ndarray
+    # The teacher each class has now, -1 for none (or not active)
+    class_teacher: np.ndarray
+    # The class_view rows, for the proposals
+    classes: pd.DataFrame
+
+
+@dataclass
+class Proposal:
+    """A teacher per class (-1 for none) and how good it is"""
+
+    class_teacher: np.ndarray
+    rating: int
+    bound: float
+    rounds: int
+    seconds: float
+
+
+def timeslot_blocks(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Block of each interval: the intervals of a block all overlap each other.
+
+    By earliest end: the interval ending first and every interval left that
+    starts before that end (they all hold its last minute) make a block. This
+    gives the fewest such blocks. Intervals without a timeslot (-1) get a
+    block each.
+    """
+    timed = np.flatnonzero(starts >= 0)
+    by_end = timed[np.argsort(ends[timed], kind="stable")].tolist()
+    by_start = timed[np.argsort(starts[timed], kind="stable")].tolist()
+    block = np.full(len(starts), -1, np.int64)
+    count, next_start = 0, 0
+    for interval in by_end:
+        if block[interval] >= 0:
+            continue
+        end = ends[interval]
+        while next_start < len(by_start) and starts[by_start[next_start]] < end:
+            if block[by_start[next_start]] < 0:
+                block[by_start[next_start]] = count
+            next_start += 1
+        count += 1
+    untimed = np.flatnonzero(starts < 0)
+    block[untimed] = count + np.arange(len(untimed))
+    return block
+
+
+def build_staffing(
+    teachers: pd.DataFrame,
+    courses: pd.DataFrame,
+    ratings: pd.DataFrame,
+    classes: pd.DataFrame,
+) -> Staffing:
+    """
+    Index the frames read by `load_staffing`.
+
+    Args:
+        teachers: Active teachers (id, name)
+        courses: Active courses (id)
+        ratings: teacher_id, course_id, rating
+        classes: class_view rows (see src/spin/class_view.py)
+    """
+    teacher_index = pd.Index(teachers["id"].astype(str))
+    course_index = pd.Index(courses["id"].astype(str))
+    rows = teacher_index.get_indexer(ratings["teacher_id"].astype(str))
+    columns = course_index.get_indexer(ratings["course_id"].astype(str))
+    known = (rows >= 0) & (columns >= 0)
+    matrix = np.zeros((len(teacher_index), len(course_index)), np.int8)
+    matrix[rows[known], columns[known]] = ratings["rating"].to_numpy()[known].clip(0, 127)
+    starts, ends = class_intervals(classes)
+
+    return Staffing(
+        teacher_ids=teacher_index.to_numpy(),
+        teacher_names=teachers["name"].to_numpy(object),
+        course_ids=course_index.to_numpy(),
+        ratings=matrix,
+        class_ids=classes["id"].astype(str).to_numpy(),
+        class_course=course_index.get_indexer(classes["course_id"].astype(str)),
+        class_block=timeslot_blocks(starts, ends),
+        class_start=starts,
+        class_end=ends,
+        class_teacher=teacher_index.get_indexer(classes["teacher_id"].astype(str)),
+        classes=classes,
+    )
+
+
+def load_staffing(school_con=None) -> Staffing:
+    """Read the active teachers, courses and ratings, and the classes (class_view)"""
+    if school_con is None:
+        with db_school.get_connection() as school_con:
+            return load_staffing(school_con)
+    return build_staffing(
+        school_con.execute(TEACHERS_SQL).df(),
+        school_con.execute(COURSES_SQL).df(),
+        school_con.execute(RATINGS_SQL).df(),
+        get_spin_classes_df(),
+    )
+
+
+def class_options(
+    problem: Staffing, min_rating: int = MIN_RATING
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(class, teacher, rating) of each teacher a class may have, sorted by class"""
+    rated = np.flatnonzero(problem.class_course >= 0)
+    # Classes x teachers, the ratings of each class's course
+    by_class = problem.ratings[:, problem.class_course[rated]].T
+    row, teacher = np.nonzero(by_class >= max(min_rating, 1))
+    return rated[row], teacher.astype(np.int64), by_class[row, teacher].astype(np.int64)
+
+
+def teacher_seats(
+    problem: Staffing, option_class: np.ndarray, option_teacher: np.ndarray
+) -> np.ndarray:
+    """The (teacher, block) seat each option takes, numbered from 0"""
+    n_blocks = int(problem.class_block.max(initial=-1)) + 1
+    _, seat = np.unique(
+        option_teacher * n_blocks + problem.class_block[option_class], return_inverse=True
+    )
+    return seat.astype(np.int64)
+
+
+def total_rating(problem: Staffing, class_teacher: np.ndarray) -> int:
+    """Sum of the ratings of the teachers given, for their classes"""
+    staffed = np.flatnonzero((class_teacher >= 0) & (problem.class_course >= 0))
+    return int(problem.ratings[class_teacher[staffed], problem.class_course[staffed]].sum())
+
+
+def repair(
+    problem: Staffing,
+    option_class: np.ndarray,
+    option_teacher: np.ndarray,
+    option_rating: np.ndarray,
+    option_seat: np.ndarray,
+    chosen: np.ndarray,
+    max_load: int,
+) -> np.ndarray:
+    """
+    A feasible staffing from the options chosen by the relaxed problem.
+
+    Teachers keep their best rated classes, within the load limit and
+    without two at overlapping times (blocks only rule out the overlaps
+    within them). The classes left without a teacher then get one with room
+    and time for them, best ratings first.
+
+    Returns:
+        The teacher of each class, -1 for none
+    """
+    class_teacher = np.full(len(problem.class_ids), -1, np.int64)
+    load = np.zeros(len(problem.teacher_ids), np.int64)
+    taken = np.zeros(option_seat.max(initial=-1) + 1, bool)
+    # Intervals of each teacher's classes so far
+    busy: Dict[int, list] = {}
+
+    def give(option: int):
+        spin_class, teacher = option_class[option], option_teacher[option]
+        if (
+            class_teacher[spin_class] >= 0
+            or load[teacher] >= max_load
+            or taken[option_seat[option]]
+        ):
+            return
+        start, end = problem.class_start[spin_class], problem.class_end[spin_class]
+        intervals = busy.setdefault(teacher, [])
+        if start >= 0 and any(
+            start < other_end and other_start < end for other_start, other_end in intervals
+        ):
+            return
+        class_teacher[spin_class] = teacher
+        load[teacher] += 1
+        taken[option_seat[option]] = True
+        if start >= 0:
+            intervals.append((start, end))
+
+    for option in chosen[np.lexsort((-option_rating[chosen], option_teacher[chosen]))].tolist():
+        give(option)
+
+    candidates = np.flatnonzero(
+        (class_teacher[option_class] < 0) & (load[option_teacher] < max_load) & ~taken[option_seat]
+    )
+    for option in candidates[np.argsort(-option_rating[candidates], kind="stable")].tolist():
+        give(option)
+    return class_teacher
+
+
+def optimize(
+    problem: Staffing,
+    max_load: int = MAX_LOAD,
+    min_rating: int = MIN_RATING,
+    rounds: int = ROUNDS,
+    patience: int = PATIENCE,
+) -> Iterator[Dict]:
+    """
+    Staff the classes, round by round.
+
+    Args:
+        problem: The teachers, ratings and classes
+        max_load: Classes per teacher at most
+        min_rating: Lowest rating a teacher may be given a course's classes at
+        rounds: Rounds at most
+        patience: Rounds without a better bound before stopping
+
+    Yields:
+        Progress after each round ({"stage": "solving", "round", "rating":
+        of the best proposal so far, "bound", "gap": the share of the bound
+        the proposal may miss, "staffed", "overloaded": teachers over the
+        limit in the relaxed solution}), then {"stage": "done", ...} with the
+        best `Proposal` under "proposal"
+    """
+    start = time.perf_counter()
+    n_classes, n_teachers = len(problem.class_ids), len(problem.teacher_ids)
+    option_class, option_teacher, option_rating = class_options(problem, min_rating)
+    option_seat = teacher_seats(problem, option_class, option_teacher)
+    capacity = np.ones(option_seat.max(initial=-1) + 1, np.int64)
+
+    price = np.zeros(n_teachers, np.int64)
+    best: Optional[np.ndarray] = None
+    best_rating, bound, stalled, done = -1, np.inf, 0, 0
+    for number in range(1, rounds + 1):
+        done = number
+        value = option_rating * SCALE - price[option_teacher]
+        usable = np.flatnonzero(value > 0)
+        market = Market(
+            option_class[usable], option_seat[usable], value[usable], capacity, n_classes
+        )
+        with span("staffing.round"):
+            market.solve()
+        chosen = usable[market.held[market.held >= 0]]
+
+        # The relaxed optimum: the most any staffing can reach at these prices
+        relaxed = (value[chosen].sum() + max_load * price.sum()) / SCALE
+        if relaxed < bound - 1e-9:
+            bound, stalled = relaxed, 0
+        else:
+            stalled += 1
+        class_teacher = repair(
+            problem, option_class, option_teacher, option_rating, option_seat, chosen, max_load
+        )
+        rating = total_rating(problem, class_teacher)
+        if rating > best_rating:
+            best, best_rating = class_teacher, rating
+
+        load = np.bincount(option_teacher[chosen], minlength=n_teachers)
+        over = load - max_load
+        yield {
+            "stage": "solving",
+            "round": number,
+            "rating": best_rating,
+            "bound": round_bound(bound),
+            "gap": gap(best_rating, bound),
+            "staffed": int((best >= 0).sum()),
+            "classes": n_classes,
+            "overloaded": int((over > 0).sum()),
+        }
+        # Ratings are whole numbers: nothing can beat a proposal at the bound's floor
+        if best_rating >= np.floor(bound + 1e-9) or stalled >= patience:
+            break
+        if not (over > 0).any() and not ((over < 0) & (price > 0)).any():
+            break
+        # Polyak step: towards the prices at which the relaxed optimum meets the best proposal
+        step = (relaxed - best_rating) * SCALE / max(float((over**2).sum()), 1.0)
+        price = np.maximum(price + np.ceil(step * over).astype(np.int64), 0)
+
+    proposal = Proposal(
+        class_teacher=best if best is not None else np.full(n_classes, -1, np.int64),
+        rating=max(best_rating, 0),
+        bound=round_bound(bound),
+        rounds=done,
+        seconds=time.perf_counter() - start,
+    )
+    logger.info(
+        "Staffed %d of %d classes, rating %d (bound %.1f) in %d rounds, %.2fs",
+        int((proposal.class_teacher >= 0).sum()),
+        n_classes,
+        proposal.rating,
+        proposal.bound,
+        proposal.rounds,
+        proposal.seconds,
+    )
+    yield {
+        "stage": "done",
+        "round": proposal.rounds,
+        "rating": proposal.rating,
+        "bound": proposal.bound,
+        "gap": gap(proposal.rating, proposal.bound),
+        "staffed": int((proposal.class_teacher >= 0).sum()),
+        "classes": n_classes,
+        "current_rating": total_rating(problem, problem.class_teacher),
+        "seconds": round_bound(proposal.seconds),
+        "proposal": proposal,
+    }
+
+
+def round_bound(value: float) -> float:
+    return round(float(value), 2) if np.isfinite(value) else 0.0
+
+
+def gap(rating: int, bound: float) -> float:
+    """Share of the bound a rating may fall short of the optimum by"""
+    return round(max(bound - rating, 0) / bound, 4) if np.isfinite(bound) and bound > 0 else 0.0
+
+
+def proposals(problem: Staffing, proposal: Proposal, changed_only: bool = True) -> pd.DataFrame:
+    """
+    The proposal per class: the teacher now and the one proposed, with their ratings.
+
+    Returns:
+        id, title, course_code, timeslot, current_teacher, current_rating,
+        teacher_id, teacher, rating; by title
+    """
+    classes = problem.classes
+    frame = pd.DataFrame(
+        {
+            "id": problem.class_ids,
+            "title": classes["title"].to_numpy(),
+            "course_code": classes["course_code"].to_numpy(),
+            "timeslot": classes["timeslot"].to_numpy(),
+            "current_teacher": classes["teacher_name"].to_numpy(),
+            "current_rating": ratings_of(problem, problem.class_teacher),
+            "teacher_id": np.where(
+                proposal.class_teacher >= 0, problem.teacher_ids[proposal.class_teacher], None
+            ),
+            "teacher": np.where(
+                proposal.class_teacher >= 0, problem.teacher_names[proposal.class_teacher], None
+            ),
+            "rating": ratings_of(problem, proposal.class_teacher),
+        }
+    )
+    if changed_only:
+        frame = frame[
+            (proposal.class_teacher >= 0) & (proposal.class_teacher != problem.class_teacher)
+        ]
+    return frame.sort_values(["title", "timeslot"], ignore_index=True)
+
+
+def ratings_of(problem: Staffing, class_teacher: np.ndarray) -> np.ndarray:
+    """Rating of each class's teacher for its course, 0 for none"""
+    known = (class_teacher >= 0) & (problem.class_course >= 0)
+    rating = np.zeros(len(class_teacher), np.int64)
+    rating[known] = problem.ratings[class_teacher[known], problem.class_course[known]]
+    return rating
+
+
+def apply(changes: Dict[str, str], con=None) -> int:
+    """
+    Give classes their proposed teachers, in one transaction.
+
+    Args:
+        changes: Teacher name by class id
+        con: Connection to the SPIN database, a new one by default
+
+    Returns:
+        The number of classes changed
+    """
+    if not changes:
+        return 0
+    if con is None:
+        with db_spin.get_connection() as con:
+            return apply(changes, con)
+
+    staffed = pd.DataFrame({"id": list(changes), "teacher_name": list(changes.values())})
+    con.register("staffed", staffed)
+    try:
+        with db_spin.change_log.transaction(con):
+            con.execute(
+                "UPDATE spin_class SET teacher_name = staffed.teacher_name FROM staffed "
+                "WHERE spin_class.id = staffed.id::UUID"
+            )
+            seq = db_spin.change_log.record_many(
+                con,
+                "spin_class",
+                "SELECT spin_class.id FROM spin_class "
+                "JOIN staffed ON spin_class.id = staffed.id::UUID",
+                "update",
+                ["teacher_name"],
+            )
+    finally:
+        con.unregister("staffed")
+    if seq is not None:
+        change_bus.notify("spin", "spin_class", None, seq)
+    return len(changes)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-load", type=int, default=MAX_LOAD)
+    parser.add_argument("--min-rating", type=int, default=MIN_RATING)
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--apply", action="store_true", help="give the classes their teachers")
+    args = parser.parse_args()
+
+    problem = load_staffing()
+    for step in optimize(problem, args.max_load, args.min_rating, args.rounds):
+        if step["stage"] == "solving":
+            print(json.dumps(step))
+    proposal = step.pop("proposal")
+    print(json.dumps(step, indent=2))
+    if args.apply:
+        changed = proposals(problem, proposal)
+        print(f"{apply(dict(zip(changed['id'], changed['teacher'])))} classes changed")
@@ -0,0 +1,97 @@
+import os
+
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from datastar_py.responses import DatastarFastAPIResponse
+
+from src.utils import lazy_import, render_template, response_adapter
+
+# numpy/pandas/duckdb are loaded on the first run, not when routes register
+staffing = lazy_import("src.spin.staffing")
+
+router = APIRouter(prefix="/spin", tags=["spin"])
+
+# Share the app templates so pages get the layout globals (menu_data, static_url)
+from init import templates
+
+# Proposed changes listed (and applicable) at most
+PROPOSAL_ROWS = int(os.environ.get("STAFFING_PROPOSAL_ROWS", 500))
+PROGRESS_FIELDS = ("stage", "round", "rating", "bound", "gap", "staffed", "classes")
+
+
+def read_int(form, name: str, default: int, low: int, high: int) -> int:
+    try:
+        return min(max(int(form.get(name) or default), low), high)
+    except ValueError:
+        return default
+
+
+def render_result(result: dict) -> str:
+    template = templates.get_template("spin/staffing_result.html")
+    return render_template(template, {"result": result})
+
+
+@router.get("/staffing", response_class=HTMLResponse)
+async def get_staffing_page(request: Request):
+    """Teachers for the SPIN classes from their course ratings (see src/spin/staffing.py)"""
+    return response_adapter(
+        request=request,
+        template_name="spin/staffing.html",
+        context=lambda: {"max_load": staffing.MAX_LOAD, "min_rating": staffing.MIN_RATING},
+        templates=templates,
+        url="/spin/staffing",
+    )
+
+
+@router.post("/staffing")
+async def post_staffing(request: Request):
+    """Run the optimizer, streaming each round as signals, then the proposed changes"""
+    form = await request.form()
+    max_load = read_int(form, "max_load", staffing.MAX_LOAD, 1, 50)
+    min_rating = read_int(form, "min_rating", staffing.MIN_RATING, 1, 5)
+
+    async def progress_events(sse):
+        try:
+            yield sse.merge_signals({"staffing": {"stage": "loading"}})
+            problem = await run_in_threadpool(staffing.load_staffing)
+            # Every round solves a market in the threadpool
+            async for step in iterate_in_threadpool(
+                staffing.optimize(problem, max_load, min_rating)
+            ):
+                yield sse.merge_signals({"staffing": {key: step[key] for key in PROGRESS_FIELDS}})
+            changes = staffing.proposals(problem, step["proposal"])
+            result = {
+                **{key: value for key, value in step.items() if key != "proposal"},
+                "max_load": max_load,
+                "min_rating": min_rating,
+                "changed": len(changes),
+                "proposals": changes.head(PROPOSAL_ROWS).to_dict("records"),
+            }
+            yield sse.merge_fragments([render_result(result)])
+        except Exception as e:
+            yield sse.merge_signals({"staffing": {"stage": "failed"}})
+            yield sse.merge_fragments([render_result({"failed": str(e)})])
+
+    return DatastarFastAPIResponse(progress_events)
+
+
+@router.post("/staffing/apply")
+async def apply_staffing(request: Request):
+    """Give the classes ticked their proposed teachers"""
+    form = await request.form()
+    changes = {
+        class_id: form.get(f"teacher_{class_id}")
+        for class_id in form.getlist("class")
+        if form.get(f"teacher_{class_id}")
+    }
+
+    async def applied_events(sse):
+        try:
+            applied = await run_in_threadpool(staffing.apply, changes)
+            yield sse.merge_fragments([render_result({"applied": applied})])
+        except Exception as e:
+            yield sse.merge_fragments([render_result({"failed": str(e)})])
+
+    return DatastarFastAPIResponse(applied_events)
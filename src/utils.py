@@ -2,16 +2,63 @@
 Utility functions for the application
 """
 
-from fastapi import Request
-from fastapi.responses import HTMLResponse
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, StreamingResponse
+from starlette.routing import Mount
 import datetime
-from typing import Dict, Any, List, Optional, TypeVar, Union, Type
+import importlib.util
+import logging
+import sys
+import time
+import types
+from typing import Dict, Any, Callable, List, Optional, TypeVar, Union, Type
+from markupsafe import escape
 from pydantic import BaseModel
 
+from src.instrumentation import span, timed
+from src.instrumentation.memory import profiler
+from src.instrumentation.metrics import TEMPLATE_RENDER_DURATION
+from src.instrumentation.timing import record_span
+from src.web import shell
+
+logger = logging.getLogger(__name__)
+
 # Type variable for Pydantic models
 T = TypeVar("T", bound=BaseModel)
 
 
+class LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is read (see lazy_import)"""
+
+    def __getattr__(self, attr: str):
+        # import_module runs the module once; threads importing it meanwhile wait
+        # on the import system's per-module lock, then get the loaded module
+        return getattr(importlib.import_module(self.__name__), attr)
+
+
+def lazy_import(name: str):
+    """
+    Import a module on first attribute access instead of now.
+
+    Used by routers so registering routes doesn't load their data layer
+    (and through it duckdb/pandas) before the first request needs it.
+    Safe when the first requests arrive on several threads at once, unlike
+    importlib.util.LazyLoader before Python 3.12.3.
+
+    Args:
+        name: The absolute module name, e.g. "src.db.db_school"
+
+    Returns:
+        The module if it was already imported, a LazyModule forwarding to it otherwise
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    return LazyModule(name)
+
+
 def is_datastar(req):
     """
     Check if the request is from DataStar.
@@ -25,6 +72,43 @@ def is_datastar(req):
     return req.headers.get("Datastar-Request") == "true"
 
 
+# Route label of requests no route matched (404s): raw paths would give every
+# scanned URL its own metrics series
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_path(scope) -> str:
+    """
+    Get the route template of a request scope (e.g. "/school/courses/{course_id}").
+
+    Requests served by a mounted app (static files) get the mount's path plus
+    "/{path}", and UNMATCHED_ROUTE when no route matched, e.g. for 404s.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template:
+        return template
+    # Mounts don't leave their route in the outer scope
+    path = scope.get("path", "")
+    for candidate in getattr(scope.get("app"), "routes", ()):
+        if isinstance(candidate, Mount) and path.startswith(candidate.path + "/"):
+            return candidate.path + "/{path}"
+    return UNMATCHED_ROUTE
+
+
+def require_local_client(request: Request):
+    """
+    Dependency restricting a route to clients on the same host (admin, metrics).
+
+    Raises:
+        HTTPException: 404 for any other client, so the route stays hidden
+    """
+    client = request.client.host if request.client else None
+    if client not in ("127.0.0.1", "::1"):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@timed("context")
 def prepare_table_context(
     request: Request,
     table_config,
@@ -53,13 +137,11 @@ def prepare_table_context(
     items = items or []
     filters = filters or {}
 
-    # Convert any Pydantic models in the items list to dictionaries
-    processed_items = []
-    for item in items:
-        if isinstance(item, BaseModel):
-            processed_items.append(item.dict())
-        else:
-            processed_items.append(item)
+    # Convert any Pydantic models in the items list to dictionaries (lists of
+    # dicts, the usual case, are passed through rather than copied)
+    processed_items = items
+    if any(isinstance(item, BaseModel) for item in items):
+        processed_items = [item.dict() if isinstance(item, BaseModel) else item for item in items]
 
     # Build the context with table_config as the central source of truth
     return {
@@ -71,7 +153,8 @@ def prepare_table_context(
         "table_config": table_config.dict(),
         "table_template": table_config.table_template,
         "items": processed_items,  # Generic name for table items
-        f"{table_config.entity_name}s": processed_items,  # Also include with specific name (e.g. "courses")
+        # Also include with specific name (e.g. "courses")
+        f"{table_config.entity_name}s": processed_items,
         "filters": filters,
         "sort_by": sort_by,
         "sort_asc": sort_asc,
@@ -98,13 +181,21 @@ def pydantic_to_context(model_instance: Optional[BaseModel]) -> Dict[str, Any]:
 def response_adapter(
     request: Request,
     template_name: str,
-    context: dict = None,
+    context: Union[dict, Callable[[], dict]] = None,
     templates=None,
     url=None,
     status_code: int = 200,
 ):
     """
     Returns either a full HTML response or a Datastar fragment based on the request.
+
+    The context can be a dict or a function returning one. Full pages flush the
+    pre-rendered layout shell first and only then call the function, so slow
+    queries run while the browser is already loading CSS/JS. By then the 200
+    status is sent: checks that should fail with another status (a missing
+    entity, a bad parameter) belong in the route, before calling this. An error
+    raised by the function is logged and rendered as an error message in place
+    of the content, so the page still ends with the rest of the layout.
     """
     # We can't import templates directly due to circular imports
     if templates is None:
@@ -113,19 +204,16 @@ def response_adapter(
     # Avoid circular imports for DatastarFastAPIResponse
     from datastar_py.responses import DatastarFastAPIResponse
 
-    if context is None:
-        context = {}
-
-    # Always include the request in the context
-    context["request"] = request
-
     # If this is a Datastar request, return a fragment
     if is_datastar(request):
+        context = load_context(context)
+        context["request"] = request
+
         # Set standalone to True for fragment rendering
         context["standalone"] = True
 
         # Pre-render the template to avoid doing it inside the generator
-        html_content = templates.get_template(template_name).render(context)
+        html_content = render_template(templates.get_template(template_name), context)
 
         # Create an optimized async generator function
         async def fragment_generator(sse):
@@ -141,13 +229,97 @@ def response_adapter(
                 yield sse.merge_fragments([html_content])
 
         return DatastarFastAPIResponse(fragment_generator)
-    else:
-        # Otherwise return a full page
+
+    # Otherwise return a full page, streamed inside the pre-rendered shell
+    template = templates.get_template(template_name)
+    if not shell.can_stream(template):
+        context = load_context(context)
+        context["request"] = request
         context["standalone"] = False
-        print("RENDERING FULL PAGE")
-        return templates.TemplateResponse(
-            name=template_name, context=context, status_code=status_code
-        )
+        return HTMLResponse(render_template(template, context), status_code=status_code)
+
+    head, tail = shell.get_shell(templates, request)
+
+    async def page_generator():
+        yield head
+        try:
+            page_context = await run_in_threadpool(load_context, context)
+        except Exception as e:
+            logger.exception("Loading the context of %s failed", template_name)
+            page_context = {"message_html": error_alert(e)}
+            page = templates.get_template("error_message.html")
+        else:
+            page = template
+        page_context["request"] = request
+        # The shell already provides the layout, render only the content block
+        page_context["standalone"] = True
+        for chunk in render_chunks(page, page_context):
+            yield chunk
+        yield tail
+
+    return StreamingResponse(page_generator(), status_code=status_code, media_type="text/html")
+
+
+def error_alert(error: Exception) -> str:
+    """The alert shown when a streamed page's content failed (HTTPException: its detail)"""
+    message = error.detail if isinstance(error, HTTPException) else "The page could not be loaded"
+    return (
+        '<div class="bg-red-100 border border-red-400 text-red-700 px-4 py-3 rounded relative mb-4"'
+        ' role="alert"><strong class="font-bold">Error!</strong>'
+        f' <span class="block sm:inline">{escape(message)}</span></div>'
+    )
+
+
+def render_template(template, context: dict, name: Optional[str] = None) -> str:
+    """Render a Jinja template, timed as a "render" span and per template name"""
+    start = time.perf_counter()
+    with span("render"):
+        html = template.render(context)
+    TEMPLATE_RENDER_DURATION.labels(template=name or template.name).observe(
+        time.perf_counter() - start
+    )
+    profiler.capture()
+    return html
+
+
+# Characters rendered before a chunk of a streamed page is sent
+RENDER_CHUNK_SIZE = 64 * 1024
+
+
+def render_chunks(template, context: dict, name: Optional[str] = None):
+    """
+    Render a Jinja template piece by piece, yielding chunks of about RENDER_CHUNK_SIZE.
+
+    Streamed pages never hold the whole output (and its encoded copy) in memory.
+    Only the time spent rendering is counted in the "render" span, not the time
+    the consumer takes between chunks.
+    """
+    seconds = 0.0
+    chunk, size = [], 0
+    start = time.perf_counter()
+    for piece in template.generate(context):
+        chunk.append(piece)
+        size += len(piece)
+        if size >= RENDER_CHUNK_SIZE:
+            seconds += time.perf_counter() - start
+            yield "".join(chunk)
+            chunk, size = [], 0
+            start = time.perf_counter()
+    seconds += time.perf_counter() - start
+    profiler.capture()
+    record_span("render", seconds)
+    TEMPLATE_RENDER_DURATION.labels(template=name or template.name).observe(seconds)
+    if chunk:
+        yield "".join(chunk)
+
+
+def load_context(context: Union[dict, Callable[[], dict], None]) -> dict:
+    """Resolve a template context given as a dict or as a function returning one"""
+    if context is None:
+        return {}
+    if callable(context):
+        return context()
+    return context
 
 
 def render_html(request: Request, template: str, context: dict = None) -> str:
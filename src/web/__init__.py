@@ -0,0 +1,3 @@
+"""
+Web-tier helpers shared by all routers (page shell, response plumbing)
+"""
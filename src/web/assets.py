@@ -0,0 +1,257 @@
+"""
+Static asset pipeline: fingerprinted URLs, immutable caching and precompressed variants.
+
+Templates link assets with `static_url('static', path='/output.css')`, which
+takes the same arguments as `url_for` but returns a content-hashed URL such as
+`/static/output.3f2a9c0b1d4e.css`. Hashed URLs are served with
+`Cache-Control: immutable`, so browsers never revalidate them; a new build
+changes the hash and therefore the URL.
+
+Compressible files get `.gz` (and `.br` with brotli installed) siblings, which
+are served instead of the original when the client accepts them.
+
+    uv run python -m src.web.assets static   # precompress ahead of time
+"""
+
+import gzip
+import hashlib
+import os
+import re
+import stat
+import sys
+import tempfile
+import threading
+from mimetypes import guess_type
+from typing import Dict, Optional, Set, Tuple
+
+from jinja2 import pass_context
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.routing import Mount
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from src.instrumentation.metrics import record_cache
+from src.web.compression import negotiate_encoding
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Length of the content hash embedded in file names
+DIGEST_LENGTH = 12
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Files worth precompressing
+PRECOMPRESS_SUFFIXES = (".css", ".js", ".svg", ".html", ".json", ".txt")
+
+# Files being precompressed again by a background task
+_in_flight: Set[str] = set()
+_in_flight_lock = threading.Lock()
+
+_fingerprinted = re.compile(
+    r"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<suffix>\.[^./\\]+)?$" % DIGEST_LENGTH
+)
+
+
+def variant_encodings() -> Dict[str, str]:
+    """Precompressed variants (encoding -> file suffix), in server preference order"""
+    encodings = {}
+    if brotli is not None:
+        encodings["br"] = ".br"
+    encodings["gzip"] = ".gz"
+    return encodings
+
+
+def split_fingerprint(path: str) -> Tuple[str, Optional[str]]:
+    """
+    Split a fingerprinted path into the original path and its digest.
+
+    Returns:
+        (path, None) if the path carries no fingerprint
+    """
+    directory, name = os.path.split(path)
+    match = _fingerprinted.match(name)
+    if not match:
+        return path, None
+    original = match["stem"] + (match["suffix"] or "")
+    return os.path.join(directory, original), match["digest"]
+
+
+def precompress(full_path: str):
+    """Write .gz (and .br) variants next to a file, replacing stale ones atomically"""
+    with open(full_path, "rb") as f:
+        data = f.read()
+    mode = stat.S_IMODE(os.stat(full_path).st_mode)
+
+    variants = {".gz": lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = lambda: brotli.compress(data, quality=11)
+
+    directory, name = os.path.split(full_path)
+    for suffix, compress in variants.items():
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{name}{suffix}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(compress())
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, full_path + suffix)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def refresh_variants(full_path: str) -> Optional[BackgroundTask]:
+    """
+    A task precompressing a file again, None if one is already running for it:
+    requests served while the variants are stale share a single compression.
+    """
+    with _in_flight_lock:
+        if full_path in _in_flight:
+            return None
+        _in_flight.add(full_path)
+
+    def run():
+        try:
+            precompress(full_path)
+        finally:
+            with _in_flight_lock:
+                _in_flight.discard(full_path)
+
+    return BackgroundTask(run)
+
+
+def precompress_directory(directory: str):
+    """Precompress every compressible file of a static directory"""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(PRECOMPRESS_SUFFIXES):
+                precompress(os.path.join(root, name))
+
+
+class StaticAssets(StaticFiles):
+    """
+    StaticFiles with content-hashed URLs and precompressed variants.
+
+    Plain URLs keep working and are served with `Cache-Control: no-cache`
+    (revalidated with ETags); fingerprinted URLs are cached forever.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # path -> (mtime_ns, size, digest)
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        # Paths templates asked fingerprinted URLs for
+        self._fingerprinted: Set[str] = set()
+
+    def digest(self, path: str) -> Optional[str]:
+        """Content hash of a static file, recomputed only when the file changes"""
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None:
+            return None
+
+        cached = self._digests.get(path)
+        hit = cached is not None and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size)
+        record_cache("static_digest", hit)
+        if hit:
+            return cached[2]
+
+        sha = hashlib.sha256()
+        with open(full_path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()[:DIGEST_LENGTH]
+        self._digests[path] = (stat_result.st_mtime_ns, stat_result.st_size, digest)
+        return digest
+
+    def fingerprint(self, path: str) -> str:
+        """Turn "/output.css" into "/output.<digest>.css" (unchanged if missing)"""
+        relative = path.lstrip("/")
+        self._fingerprinted.add(relative)
+        digest = self.digest(relative)
+        if digest is None:
+            return path
+        stem, suffix = os.path.splitext(relative)
+        return "/" + f"{stem}.{digest}{suffix}"
+
+    def version(self) -> Tuple[Tuple[str, Optional[str]], ...]:
+        """
+        Digests of the files fingerprinted so far: HTML caching fingerprinted
+        URLs (the layout shell) is stale once this changes.
+        """
+        return tuple((path, self.digest(path)) for path in sorted(self._fingerprinted))
+
+    async def get_response(self, path: str, scope):
+        original, digest = split_fingerprint(path)
+        if digest is not None and self.lookup_path(original)[1] is None:
+            # Not a fingerprint after all, just a file with a dotted name
+            original, digest = path, None
+
+        response = await super().get_response(original, scope)
+        if digest is not None and digest == self.digest(original):
+            response.headers["cache-control"] = IMMUTABLE
+        else:
+            # Plain URL or outdated fingerprint: let the browser revalidate
+            response.headers["cache-control"] = REVALIDATE
+        return response
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        if not str(full_path).endswith(PRECOMPRESS_SUFFIXES):
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        encodings = variant_encodings()
+        encoding = negotiate_encoding(request_headers.get("accept-encoding", ""), encodings)
+        if encoding is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        variant_path = f"{full_path}{encodings[encoding]}"
+        try:
+            variant_stat = os.stat(variant_path)
+        except FileNotFoundError:
+            variant_stat = None
+        if variant_stat is None or variant_stat.st_mtime_ns < stat_result.st_mtime_ns:
+            # Source was rebuilt: serve it as is, refresh the variants afterwards
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            response.background = refresh_variants(str(full_path))
+            return response
+
+        response = FileResponse(
+            variant_path,
+            status_code=status_code,
+            stat_result=variant_stat,
+            media_type=guess_type(str(full_path))[0] or "text/plain",
+            headers={"content-encoding": encoding, "vary": "Accept-Encoding"},
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def find_assets(app, name: str = "static") -> Optional[StaticAssets]:
+    """The StaticAssets mounted under this route name, if any"""
+    for route in app.routes:
+        if isinstance(route, Mount) and route.name == name and isinstance(route.app, StaticAssets):
+            return route.app
+    return None
+
+
+@pass_context
+def static_url(context, name: str, /, **path_params):
+    """
+    `url_for` replacement for templates that fingerprints static asset paths.
+
+    Usage: {{ static_url('static', path='/output.css') }}
+    """
+    request = context["request"]
+    assets = find_assets(request.app, name)
+    if assets is not None:
+        path_params["path"] = assets.fingerprint(path_params["path"])
+    return request.url_for(name, **path_params)
+
+
+if __name__ == "__main__":
+    precompress_directory(sys.argv[1] if len(sys.argv) > 1 else "static")
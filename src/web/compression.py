@@ -0,0 +1,296 @@
+"""
+Response compression middleware.
+
+Compresses HTML pages and Datastar SSE streams with gzip, or with brotli/zstd
+when those packages are installed and the client accepts them. Streamed
+responses are flushed after every chunk, so each SSE event reaches the browser
+as soon as it is yielded; the compressor lives as long as the response, which
+for `/stream` endpoints means one compression context per connection.
+Responses that set `scope[SKIP_COMPRESSION]` (managed SSE streams, see
+src/web/sse.py) are passed through as they are.
+"""
+
+import zlib
+from collections import defaultdict
+from typing import Dict, Optional
+
+from src.instrumentation.metrics import RESPONSE_BYTES
+from src.utils import route_path
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Scope key set by responses that must not be compressed
+SKIP_COMPRESSION = "compression.skip"
+
+# Content types worth compressing (images, fonts, ... are already compressed)
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality: int = 4):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level: int = 3):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encoders() -> Dict[str, type]:
+    """Encoders usable in this environment, in server preference order"""
+    encoders = {}
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    encoders["gzip"] = GzipEncoder
+    return encoders
+
+
+def negotiate_encoding(accept_encoding: str, encoders: Dict[str, type]) -> Optional[str]:
+    """
+    Pick the encoding to use for an Accept-Encoding header value.
+
+    Returns:
+        The name of the encoding, or None if the client accepts none of ours
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for name in encoders:
+        if accepted.get(name, accepted.get("*", 0.0)) > 0:
+            return name
+    return None
+
+
+class CompressionStats:
+    """Bytes before/after compression per route"""
+
+    def __init__(self):
+        # route -> [responses, bytes_in, bytes_out]
+        self.routes = defaultdict(lambda: [0, 0, 0])
+
+    def record(self, route: str, bytes_in: int, bytes_out: int):
+        counts = self.routes[route]
+        counts[0] += 1
+        counts[1] += bytes_in
+        counts[2] += bytes_out
+        RESPONSE_BYTES.labels(route=route, stage="uncompressed").inc(bytes_in)
+        RESPONSE_BYTES.labels(route=route, stage="compressed").inc(bytes_out)
+
+    def report(self) -> Dict[str, Dict[str, int]]:
+        return {
+            route: {
+                "responses": responses,
+                "bytes_in": bytes_in,
+                "bytes_out": bytes_out,
+                "bytes_saved": bytes_in - bytes_out,
+            }
+            for route, (responses, bytes_in, bytes_out) in sorted(self.routes.items())
+        }
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses according to Accept-Encoding.
+
+    Args:
+        app: The ASGI app to wrap
+        minimum_size: Responses sent in one piece below this size are left alone.
+            Streamed responses (SSE, streamed pages) are always compressed since
+            their size is unknown when the first chunk goes out.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 500,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = available_encoders()
+        self.encoder_options = {
+            "gzip": {"level": gzip_level},
+            "br": {"quality": brotli_quality},
+            "zstd": {"level": zstd_level},
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+
+        encoding = negotiate_encoding(accept_encoding, self.encoders)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(self, scope, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+    def create_encoder(self, encoding: str):
+        return self.encoders[encoding](**self.encoder_options[encoding])
+
+
+class CompressionResponder:
+    """Compresses the messages of a single response"""
+
+    def __init__(self, middleware: CompressionMiddleware, scope, send, encoding: str):
+        self.middleware = middleware
+        self.scope = scope
+        self.downstream = send
+        self.encoding = encoding
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def send(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            if self.scope.get(SKIP_COMPRESSION):
+                self.passthrough = True
+                await self.downstream(message)
+                return
+            # Hold the headers until the first body chunk tells us the size
+            self.start_message = message
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if not self.should_compress(start, body, more_body):
+                self.passthrough = True
+                await self.downstream(start)
+                await self.downstream(message)
+                return
+            self.encoder = self.middleware.create_encoder(self.encoding)
+            data = self.encode(body, more_body)
+            await self.downstream(self.compressed_start(start, None if more_body else len(data)))
+        else:
+            data = self.encode(body, more_body)
+
+        if data or not more_body:
+            await self.downstream(
+                {"type": "http.response.body", "body": data, "more_body": more_body}
+            )
+
+        if not more_body:
+            compression_stats.record(route_path(self.scope), self.bytes_in, self.bytes_out)
+
+    def encode(self, body: bytes, more_body: bool) -> bytes:
+        self.bytes_in += len(body)
+        if not more_body:
+            data = self.encoder.compress(body) + self.encoder.finish()
+        elif body:
+            # Flush so the chunk (e.g. an SSE event) is not held in the compressor
+            data = self.encoder.compress(body) + self.encoder.flush()
+        else:
+            data = b""
+        self.bytes_out += len(data)
+        return data
+
+    def should_compress(self, start, body: bytes, more_body: bool) -> bool:
+        headers = {key.lower(): value for key, value in start.get("headers", [])}
+        if b"content-encoding" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        return more_body or len(body) >= self.middleware.minimum_size
+
+    def compressed_start(self, start, content_length: Optional[int]):
+        """Rewrite the response headers for a compressed body"""
+        headers = [
+            (key, value)
+            for key, value in start.get("headers", [])
+            if key.lower() not in (b"content-length", b"vary")
+        ]
+        vary = [value for key, value in start.get("headers", []) if key.lower() == b"vary"]
+        vary.append(b"Accept-Encoding")
+        headers.append((b"vary", b", ".join(vary)))
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return {**start, "headers": headers}
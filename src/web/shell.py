@@ -0,0 +1,89 @@
+"""
+Pre-rendered layout shell for full-page responses.
+
+The layout (head, CDN links, navigation) does not depend on the page being
+rendered, so it is rendered once, split around the content block and reused.
+Full-page responses flush the head immediately and stream the content after it,
+which lets the browser fetch CSS/JS while the route is still querying DuckDB.
+"""
+
+from typing import Dict, Tuple
+
+from src.instrumentation.metrics import record_cache
+
+LAYOUT_TEMPLATE = "layout/index.html"
+
+# Marker rendered in place of the content block, used to split the shell
+CONTENT_MARKER = "<!--shell:content-->"
+
+# Keep the cache bounded (one entry per templates env / nav data / base url / assets)
+MAX_SHELLS = 32
+
+_shells: Dict[tuple, Tuple[str, str]] = {}
+
+
+def invalidate_shells():
+    """Drop all pre-rendered shells (e.g. after editing NAV_DATA in place)"""
+    _shells.clear()
+
+
+def can_stream(template) -> bool:
+    """
+    Check if a page template can be streamed inside the shared shell.
+
+    Templates that override layout blocks other than "content" (title, head, ...)
+    need their own shell, so they are rendered in one piece instead.
+    """
+    return set(template.blocks) <= {"content"}
+
+
+def get_shell(templates, request) -> Tuple[str, str]:
+    """
+    Returns the (head, tail) halves of the layout around the content block.
+
+    Args:
+        templates: The Jinja2Templates instance used for the page
+        request: The request object (url_for needs it for static URLs)
+
+    Returns:
+        The HTML before and after the content of the page
+    """
+    # Import here to avoid circular imports (through src.web.compression)
+    from src.web.assets import find_assets
+
+    env = templates.env
+    layout = env.get_template(LAYOUT_TEMPLATE)
+
+    # The compiled layout is replaced by Jinja when the file changes on disk,
+    # and NAV_DATA is swapped by assigning a new list to the globals. The
+    # shell holds fingerprinted asset URLs, which change when the files do.
+    assets = find_assets(request.app)
+    key = (
+        id(env),
+        id(layout),
+        id(env.globals.get("menu_data")),
+        str(request.base_url),
+        assets.version() if assets is not None else None,
+    )
+    shell = _shells.get(key)
+    record_cache("layout_shell", shell is not None)
+    if shell is None:
+        shell = render_shell(templates, request)
+        if len(_shells) >= MAX_SHELLS:
+            _shells.clear()
+        _shells[key] = shell
+    return shell
+
+
+def render_shell(templates, request) -> Tuple[str, str]:
+    """Render the layout with a marker as content and split it in two"""
+    page = templates.env.from_string(
+        "{% extends '" + LAYOUT_TEMPLATE + "' %}"
+        "{% block content %}" + CONTENT_MARKER + "{% endblock %}"
+    )
+    # Import here to avoid circular imports (src.utils uses this module)
+    from src.utils import render_template
+
+    html = render_template(page, {"request": request, "standalone": False}, name=LAYOUT_TEMPLATE)
+    head, tail = html.split(CONTENT_MARKER, 1)
+    return head, tail
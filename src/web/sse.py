@@ -0,0 +1,345 @@
+"""
+Long-lived server-sent event streams (`data-sse` in entity_page.html).
+
+Every open entity page holds a stream, so a worker serves thousands of them.
+ConnectionManager keeps each one cheap:
+
+- No polling per client: a stream sleeps on its own future until an event is
+  published to its topic. `publish` gets the event rendered once and queues
+  the same string on every connection of the topic. The only task per stream
+  is the request's own, plus a bare one waiting for the disconnect.
+- Queues are bounded (SSE_MAX_QUEUED events). A client that falls behind
+  loses its oldest events, counted as sse_events_total{kind="dropped"}.
+- One heartbeat task for all connections: a timer wheel with a slot per
+  second visits each connection once per SSE_HEARTBEAT_SECONDS. Quiet
+  connections get an SSE comment, so proxies don't time them out. Connections
+  whose last write has been blocked for SSE_IDLE_SECONDS (the client stopped
+  reading and the socket buffers filled up) are closed.
+- On SIGTERM/SIGINT every stream gets a last event and ends, before the
+  server waits for open requests to finish; browsers reconnect elsewhere.
+- Managed streams skip response compression: a compressor per connection
+  costs more memory than the small events it would save.
+
+Beyond SSE_MAX_CONNECTIONS streams (default 10000) new ones are refused with 503.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from datastar_py.sse import SSE_HEADERS, ServerSentEventGenerator
+from starlette.exceptions import HTTPException
+from starlette.responses import StreamingResponse
+
+from src.instrumentation.metrics import Counter, Gauge
+from src.web.compression import SKIP_COMPRESSION
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))
+IDLE_SECONDS = float(os.environ.get("SSE_IDLE_SECONDS", 60))
+MAX_CONNECTIONS = int(os.environ.get("SSE_MAX_CONNECTIONS", 10_000))
+MAX_QUEUED = int(os.environ.get("SSE_MAX_QUEUED", 16))
+
+# An SSE comment: ignored by EventSource and Datastar, keeps proxies from timing out
+HEARTBEAT = ": heartbeat\n\n"
+
+# Sent to every stream before shutdown; Datastar reconnects on its own
+GOODBYE = ServerSentEventGenerator.merge_signals(
+    {"sseStatus": "Server restarting, reconnecting..."}
+)
+
+
+class Connection:
+    """One open stream: its pending events and write state"""
+
+    __slots__ = (
+        "topic", "events", "waiter", "slot", "last_write", "writing_since", "task", "closed",
+        "aborted",
+    )  # fmt: skip
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.events: List[str] = []
+        self.waiter: Optional[asyncio.Future] = None
+        self.slot = 0
+        self.last_write = time.monotonic()
+        # Set while a chunk is being sent, i.e. while the client has not read it yet
+        self.writing_since: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        # Reason the stream was closed by the server (drain, idle)
+        self.closed: Optional[str] = None
+        self.aborted = False
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+
+class ConnectionManager:
+    """
+    Open streams by topic, with a shared heartbeat timer wheel.
+
+    Args:
+        heartbeat_seconds: Quiet time after which a stream gets a heartbeat
+        idle_seconds: Time a write may stay blocked before the stream is closed
+        max_connections: Streams accepted at once
+        max_queued: Events kept per stream while the client is not reading
+        tick: Seconds per slot of the timer wheel
+    """
+
+    def __init__(
+        self,
+        heartbeat_seconds: float = HEARTBEAT_SECONDS,
+        idle_seconds: float = IDLE_SECONDS,
+        max_connections: int = MAX_CONNECTIONS,
+        max_queued: int = MAX_QUEUED,
+        tick: float = 1.0,
+    ):
+        self.heartbeat_seconds = heartbeat_seconds
+        self.idle_seconds = idle_seconds
+        self.max_connections = max_connections
+        self.max_queued = max_queued
+        self.tick = min(tick, heartbeat_seconds)
+        self.topics: Dict[str, Set[Connection]] = {}
+        self.wheel: List[Set[Connection]] = [
+            set() for _ in range(max(1, round(heartbeat_seconds / self.tick)))
+        ]
+        self.position = 0
+        self.count = 0
+        self.draining = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._heartbeats: Optional[asyncio.Task] = None
+        self._closed = asyncio.Event()
+
+    def response(self, topic: str) -> StreamingResponse:
+        """A stream of the events published to `topic`, or 503 when at capacity"""
+        if self.draining or self.count >= self.max_connections:
+            raise HTTPException(503, "Too many open streams", headers={"Retry-After": "5"})
+        return EventStreamResponse(self, topic)
+
+    def connect(self, topic: str) -> Connection:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        if self._heartbeats is None or self._heartbeats.done():
+            self._heartbeats = self._loop.create_task(self.run_heartbeats())
+
+        connection = Connection(topic)
+        self.topics.setdefault(topic, set()).add(connection)
+        # The slot just visited comes round again after a full heartbeat interval
+        connection.slot = self.position
+        self.wheel[connection.slot].add(connection)
+        self.count += 1
+        self._closed.clear()
+        return connection
+
+    def disconnect(self, connection: Connection):
+        connections = self.topics.get(connection.topic)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.topics[connection.topic]
+        self.wheel[connection.slot].discard(connection)
+        self.count -= 1
+        SSE_DISCONNECTS.labels(reason=connection.closed or "client").inc()
+        if not self.count:
+            self._closed.set()
+
+    def publish(self, topic: str, event: str):
+        """Queue an event on every stream of a topic; safe to call from any thread"""
+        loop = self._loop
+        if loop is None:  # no stream was ever opened
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.deliver(topic, event)
+        else:
+            loop.call_soon_threadsafe(self.deliver, topic, event)
+
+    def deliver(self, topic: str, event: str, kind: str = "event"):
+        connections = self.topics.get(topic, ())
+        for connection in connections:
+            self.enqueue(connection, event)
+        if connections:
+            SSE_EVENTS.labels(kind=kind).inc(len(connections))
+
+    def enqueue(self, connection: Connection, event: str):
+        if len(connection.events) >= self.max_queued:
+            del connection.events[0]
+            SSE_EVENTS.labels(kind="dropped").inc()
+        connection.events.append(event)
+        connection.wake()
+
+    def close(self, connection: Connection, reason: str):
+        """End a stream once its queued events are sent"""
+        if connection.closed is None:
+            connection.closed = reason
+            connection.wake()
+
+    async def events(self, connection: Connection):
+        """The body of a stream: queued events, joined per write"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if not connection.events:
+                    if connection.closed is not None:
+                        return
+                    connection.waiter = loop.create_future()
+                    await connection.waiter
+                    connection.waiter = None
+                    continue
+                chunk = "".join(connection.events)
+                connection.events.clear()
+                connection.writing_since = time.monotonic()
+                yield chunk
+                connection.writing_since = None
+                connection.last_write = time.monotonic()
+        finally:
+            self.disconnect(connection)
+
+    async def run_heartbeats(self):
+        # Ends with the last stream, connect starts it again
+        while self.count:
+            await asyncio.sleep(self.tick)
+            self.beat(time.monotonic())
+
+    def beat(self, now: float):
+        """Advance the wheel one slot and visit its connections"""
+        self.position = (self.position + 1) % len(self.wheel)
+        heartbeats = 0
+        for connection in list(self.wheel[self.position]):
+            if connection.writing_since is not None:
+                if now - connection.writing_since >= self.idle_seconds:
+                    self.abort(connection, "idle")
+            elif not connection.events and (
+                now - connection.last_write >= self.heartbeat_seconds - self.tick
+            ):
+                self.enqueue(connection, HEARTBEAT)
+                heartbeats += 1
+        if heartbeats:
+            SSE_EVENTS.labels(kind="heartbeat").inc(heartbeats)
+
+    def abort(self, connection: Connection, reason: str):
+        """Close a stream whose write is stuck, by cancelling its request"""
+        connection.closed = reason
+        connection.aborted = True
+        if connection.task is not None:
+            connection.task.cancel()
+
+    def begin_drain(self, event: Optional[str] = GOODBYE):
+        """Send a last event to every stream and end them; new streams are refused"""
+        if self.draining:
+            return
+        self.draining = True
+        logger.info("Draining %d event streams", self.count)
+        for connections in list(self.topics.values()):
+            for connection in connections:
+                if event is not None:
+                    self.enqueue(connection, event)
+                self.close(connection, "drain")
+
+    async def drain(self, timeout: float = 5.0, event: Optional[str] = GOODBYE):
+        """Drain all streams, aborting the ones still open after `timeout` seconds"""
+        self.begin_drain(event)
+        if self.count:
+            try:
+                await asyncio.wait_for(self._closed.wait(), timeout)
+            except asyncio.TimeoutError:
+                for connections in list(self.topics.values()):
+                    for connection in list(connections):
+                        self.abort(connection, "drain")
+        if self._heartbeats is not None:
+            self._heartbeats.cancel()
+
+    def install_signal_handlers(self):
+        """
+        Start draining on SIGINT/SIGTERM, before the server's own handler runs.
+
+        Servers only run the lifespan shutdown once open requests are done, which
+        open streams never are; chaining the handlers ends them in time. Call
+        from the lifespan startup, after the server installed its handlers.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous = signal.getsignal(signum)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.begin_drain)
+                previous(signum, frame)
+
+            signal.signal(signum, handler)
+
+    def stats(self) -> Dict:
+        return {
+            "connections": self.count,
+            "topics": {topic: len(connections) for topic, connections in self.topics.items()},
+            "queued": sum(
+                len(connection.events)
+                for connections in self.topics.values()
+                for connection in connections
+            ),
+            "draining": self.draining,
+        }
+
+
+class EventStreamResponse(StreamingResponse):
+    """A managed stream; registers on start and unregisters when the body ends"""
+
+    def __init__(self, manager: ConnectionManager, topic: str):
+        self.manager = manager
+        self.topic = topic
+        super().__init__(iter(()), headers=SSE_HEADERS, media_type="text/event-stream")
+
+    async def __call__(self, scope, receive, send):
+        scope[SKIP_COMPRESSION] = True
+        connection = self.manager.connect(self.topic)
+        connection.task = asyncio.current_task()
+        self.body_iterator = self.manager.events(connection)
+        # A bare task waiting for the disconnect, instead of StreamingResponse's task group
+        listener = asyncio.ensure_future(wait_disconnect(receive))
+        listener.add_done_callback(lambda _: self.manager.close(connection, "client"))
+        try:
+            await self.stream_response(send)
+        except OSError:  # servers implementing ASGI 2.4 raise on sending to closed sockets
+            pass
+        except asyncio.CancelledError:
+            if not connection.aborted or connection.task.uncancel():
+                raise
+            # Aborted by the manager (idle client): the server closes the socket
+        finally:
+            listener.cancel()
+            await self.body_iterator.aclose()
+            self.manager.disconnect(connection)
+
+
+async def wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+manager = ConnectionManager()
+
+SSE_STREAMS = Gauge(
+    "sse_streams",
+    "Open managed event streams by topic",
+    ("topic",),
+    function=lambda: {(topic,): len(c) for topic, c in list(manager.topics.items())},
+)
+SSE_EVENTS = Counter(
+    "sse_events", "Events queued on managed streams (event, heartbeat, dropped)", ("kind",)
+)
+SSE_DISCONNECTS = Counter(
+    "sse_disconnects", "Closed managed streams by reason (client, idle, drain)", ("reason",)
+)
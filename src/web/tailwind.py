@@ -0,0 +1,130 @@
+"""
+Tailwind build that only runs when its inputs changed.
+
+The inputs (input.css plus every file Tailwind scans for class names) are
+hashed and the digest is stored next to the output. Startup reuses the existing
+output.css when the digest matches, and a file lock makes sure only one process
+compiles when several uvicorn workers start at once.
+
+TAILWIND_MODE selects what the app does on startup:
+    watch  spawn `tailwindcss --watch` (default under `fastapi dev` / --reload)
+    build  build once if the inputs changed (default otherwise)
+    off    never compile, output.css is built ahead of time:
+
+    uv run python -m src.web.tailwind
+"""
+
+import glob
+import hashlib
+import os
+import sys
+from contextlib import contextmanager
+
+from src.web.assets import precompress
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+MODES = ("watch", "build", "off")
+
+# Files Tailwind scans for class names (relative to the project root)
+SOURCE_GLOBS = ("templates/**/*.html", "src/**/*.py", "static/*.js")
+
+
+def tailwind_mode() -> str:
+    """Startup mode from TAILWIND_MODE, defaulting to watch in development"""
+    mode = os.getenv("TAILWIND_MODE")
+    if mode:
+        if mode not in MODES:
+            raise ValueError(f"TAILWIND_MODE must be one of {', '.join(MODES)}, got {mode!r}")
+        return mode
+    if "--reload" in sys.argv or sys.argv[1:2] == ["dev"]:
+        return "watch"
+    return "build"
+
+
+def inputs_digest(input_path: str, source_globs=SOURCE_GLOBS) -> str:
+    """Hash of the input stylesheet and of every scanned source file"""
+    paths = {input_path}
+    for pattern in source_globs:
+        paths.update(glob.glob(pattern, recursive=True))
+
+    sha = hashlib.sha256()
+    for path in sorted(paths):
+        sha.update(path.encode())
+        sha.update(b"\0")
+        with open(path, "rb") as f:
+            sha.update(f.read())
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+@contextmanager
+def build_lock(output_path: str):
+    """Exclusive lock so concurrent workers don't compile the same stylesheet"""
+    if fcntl is None:
+        yield
+        return
+    with open(output_path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def build_stylesheet(
+    output_path: str, input_path: str, force: bool = False, minify: bool = False
+) -> bool:
+    """
+    Compile the stylesheet unless the output is up to date.
+
+    Args:
+        output_path: The css file to write
+        input_path: The Tailwind input stylesheet
+        force: Compile even if the inputs did not change
+        minify: Minify the output
+
+    Returns:
+        True if the compiler ran, False if the existing output was reused
+
+    Raises:
+        RuntimeError: If the Tailwind compiler fails
+    """
+    # Imported here so processes that never compile don't load it
+    from fastapi_tailwind import tailwind
+
+    stamp_path = output_path + ".inputs"
+    with build_lock(output_path):
+        # Computed under the lock: another worker may have just built it
+        digest = inputs_digest(input_path)
+        if not force and os.path.exists(output_path) and read_stamp(stamp_path) == digest:
+            return False
+
+        process = tailwind.compile(
+            output_path, tailwind_stylesheet_path=input_path, watch=False, minify=minify
+        )
+        if process.wait() != 0:
+            raise RuntimeError(f"Tailwind failed to compile {output_path} ({process.returncode})")
+
+        with open(stamp_path, "w") as f:
+            f.write(digest)
+        precompress(output_path)
+        return True
+
+
+def read_stamp(stamp_path: str) -> str:
+    try:
+        with open(stamp_path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+if __name__ == "__main__":
+    built = build_stylesheet(
+        "static/output.css", "static/input.css", force="--force" in sys.argv, minify=True
+    )
+    print("Built static/output.css" if built else "static/output.css is up to date")
@@ -32,12 +32,14 @@ NAV_DATA = [
         "menu_items": [
             {"icon": "monitor", "text": "SPIN Classes", "url": "/spin/spin_classes"},
             {"icon": "users", "text": "Students", "url": "/spin/students"},
+            {"icon": "upload", "text": "Import Submissions", "url": "/spin/ingest"},
             {"icon": "user-round-search", "text": "Selections", "url": "/spin/selections"},
             {"icon": "file-text", "text": "by Course", "url": "/spin/by_course"},
             {"icon": "bar-chart", "text": "by Level", "url": "/spin/by_level"},
             {"icon": "user-check", "text": "Assign Students", "url": "/spin/assign_students/"},
             {"icon": "calendar", "text": "Assign Classes", "url": "/spin/assign_classes/"},
-            {"icon": "layout-dashboard", "text": "Dashboard", "url": "/"},
+            {"icon": "briefcase", "text": "Staffing", "url": "/spin/staffing"},
+            {"icon": "layout-dashboard", "text": "Dashboard", "url": "/spin/demand"},
         ],
     },
     {
@@ -0,0 +1,96 @@
+"""
+Shared fixtures.
+
+The data layer reads SCHOOL_DB_URL, SPIN_DB_URL and CHANGE_BUS_DIR when it is
+imported, so they are set here, before any test imports it: notifications go
+to a directory of the test run, never to a server running on this checkout.
+Tests touching the databases take `databases`, their own copies of small
+seeded ones (see benchmarks/seed.py).
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+RUN_DIR = Path(tempfile.mkdtemp(prefix="datastar-tests-"))
+os.environ["CHANGE_BUS_DIR"] = str(RUN_DIR / "changes")
+os.environ["SCHOOL_DB_URL"] = str(RUN_DIR / "school.duckdb")
+os.environ["SPIN_DB_URL"] = str(RUN_DIR / "spin.duckdb")
+
+# Students (and courses) of the seeded databases
+SEED_ROWS = 300
+
+
+@pytest.fixture(scope="session")
+def seeded():
+    """Paths of the seeded (school, spin) databases, built once per run"""
+    # The generator writes through pyarrow, the `arrow` extra
+    pytest.importorskip("pyarrow")
+    from benchmarks.seed import seed_databases
+
+    return seed_databases(SEED_ROWS, seed=0, data_dir=RUN_DIR / "seeded")
+
+
+@pytest.fixture
+def databases(seeded, tmp_path, monkeypatch):
+    """Copies of the seeded databases, used by src.db for this test"""
+    from src.db import db_school, db_spin
+    from src.db.changes import change_bus
+
+    school_path, spin_path = (
+        Path(shutil.copy(path, tmp_path / path.name.split("-")[0])) for path in seeded
+    )
+    monkeypatch.setattr(db_school, "SCHOOL_DB_URL", str(school_path))
+    monkeypatch.setattr(db_spin, "SPIN_DB_URL", str(spin_path))
+    # Versions start over with the copies
+    monkeypatch.setattr(change_bus, "versions", {})
+    return school_path, spin_path
+
+
+@pytest.fixture
+def built(databases):
+    """The copies, with the survey tables and class_view built from scratch"""
+    from src.db import db_school, db_spin
+    from src.spin import choices, class_view
+
+    with db_spin.get_connection() as con, db_school.get_connection() as school_con:
+        choices.rebuild(con)
+        class_view.rebuild(con, school_con)
+    return databases
+
+
+@pytest.fixture
+def first_row():
+    """The first row a query returns, as strings: first_row(db_spin.run, sql)"""
+
+    def first_row(run, sql: str) -> dict:
+        return run(sql).astype(str).iloc[0].to_dict()
+
+    return first_row
+
+
+@pytest.fixture
+def assert_as_rebuilt():
+    """
+    Check tables refreshed from the change log against the same tables built
+    from scratch: assert_as_rebuilt(con, tables, rebuild). Rows and columns are
+    compared in a sorted order, as strings. Returns the refreshed tables.
+    """
+    import pandas as pd
+
+    def snapshot(con, table: str) -> pd.DataFrame:
+        df = con.execute(f"FROM {table}").df()
+        df = df[sorted(df.columns)].astype(str)
+        return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+    def assert_as_rebuilt(con, tables, rebuild) -> dict:
+        refreshed = {table: snapshot(con, table) for table in tables}
+        rebuild()
+        for table in tables:
+            pd.testing.assert_frame_equal(refreshed[table], snapshot(con, table), obj=table)
+        return refreshed
+
+    return assert_as_rebuilt
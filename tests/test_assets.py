@@ -0,0 +1,87 @@
+import asyncio
+import gzip
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from init import templates
+from src.utils import response_adapter
+from src.web.assets import IMMUTABLE, REVALIDATE, StaticAssets, precompress, refresh_variants
+from src.web.shell import invalidate_shells
+
+STYLESHEET = re.compile(r'href="http://testserver(/static/output\.\w+\.css)"')
+
+
+def make_client(directory) -> TestClient:
+    app = FastAPI()
+    app.mount("/static", StaticAssets(directory=directory), name="static")
+
+    @app.get("/page")
+    def page(request: Request):
+        return response_adapter(request, "error_message.html", {"message_html": ""}, templates)
+
+    return TestClient(app)
+
+
+def write_stylesheet(directory, css: str):
+    path = directory / "output.css"
+    path.write_text(css)
+    # A rebuild within the same clock tick must still count as a change
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_fingerprinted_urls_are_immutable_plain_ones_revalidated(tmp_path):
+    write_stylesheet(tmp_path, "body { color: red }")
+    client = make_client(tmp_path)
+    url = STYLESHEET.search(client.get("/page").text).group(1)
+
+    assert client.get(url).headers["cache-control"] == IMMUTABLE
+    assert client.get("/static/output.css").headers["cache-control"] == REVALIDATE
+
+
+def test_layout_shell_follows_a_rebuilt_stylesheet(tmp_path):
+    invalidate_shells()
+    write_stylesheet(tmp_path, "body { color: red }")
+    client = make_client(tmp_path)
+    before = STYLESHEET.search(client.get("/page").text).group(1)
+    assert STYLESHEET.search(client.get("/page").text).group(1) == before
+
+    write_stylesheet(tmp_path, "body { color: blue }")
+    after = STYLESHEET.search(client.get("/page").text).group(1)
+
+    assert after != before
+    assert client.get(after).headers["cache-control"] == IMMUTABLE
+    # The old URL is now outdated and revalidated
+    assert client.get(before).headers["cache-control"] == REVALIDATE
+
+
+def test_stale_variants_are_compressed_once_at_a_time(tmp_path):
+    path = str(tmp_path / "app.js")
+    with open(path, "w") as f:
+        f.write("console.log('x');" * 100)
+
+    task = refresh_variants(path)
+    assert task is not None
+    # Requests served meanwhile schedule nothing more
+    assert refresh_variants(path) is None
+    asyncio.run(task())
+    assert gzip.decompress((tmp_path / "app.js.gz").read_bytes()).startswith(b"console")
+
+    task = refresh_variants(path)
+    assert task is not None
+    asyncio.run(task())
+
+
+def test_concurrent_precompressions_do_not_share_a_temp_file(tmp_path):
+    path = tmp_path / "app.js"
+    path.write_text("console.log('x');" * 10_000)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: precompress(str(path)), range(16)))
+
+    assert gzip.decompress((tmp_path / "app.js.gz").read_bytes()) == path.read_bytes()
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,139 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.spin import assignment, repair
+from src.spin.assignment import ALL_PROGRAMS, ASSIGNED_VALUE
+
+
+def build(students, choices, classes, rooms=()):
+    """A problem from (id, program), (id, student, code, course), (id, course,
+    timeslot, room, program) and (room, capacity) rows"""
+    choices = pd.DataFrame(choices, columns=["id", "student_id", "code", "course_code"])
+    code = choices.pop("code")
+    choices.insert(2, "course_group", code.str.rstrip("0123456789"))
+    choices.insert(3, "rank", code.str.extract(r"(\d+)$")[0].astype(int))
+    return assignment.build_problem(
+        pd.DataFrame(students, columns=["id", "program"]),
+        choices,
+        pd.DataFrame(
+            classes, columns=["id", "course_code", "timeslot", "room_name", "for_program"]
+        ),
+        pd.DataFrame(list(rooms), columns=["name", "capacity"]),
+    )
+
+
+def given(problem, solution):
+    """Class id per (student id, group)"""
+    return {
+        (
+            problem.student_ids[problem.choice_student[choice]],
+            problem.groups[problem.choice_group[choice]],
+        ): problem.class_ids[klass]
+        for choice, klass in zip(solution.choices, solution.classes)
+    }
+
+
+def value(problem, solution) -> int:
+    """Total value of the seats given (see the assignment module)"""
+    total = 0
+    for group in range(len(problem.groups)):
+        last = problem.choice_rank[problem.choice_group == group].max()
+        ranks = problem.choice_rank[solution.choices][
+            problem.choice_group[solution.choices] == group
+        ]
+        total += int((ASSIGNED_VALUE + last + 1 - ranks).sum())
+    return total
+
+
+def test_overlapping_timeslots_are_never_given_together():
+    problem = build(
+        [("s", "IB")],
+        [("1", "s", "IM1", "ART"), ("2", "s", "IW1", "BIO"), ("3", "s", "IW2", "CHEM")],
+        [
+            ("art", "ART", "Mon: 10:00 - 11:00", None, ALL_PROGRAMS),
+            # Not the same label, but it overlaps the art class
+            ("bio", "BIO", "Mon: 10:30 - 11:30", None, ALL_PROGRAMS),
+            ("chem", "CHEM", "Mon: 11:00 - 12:00", None, ALL_PROGRAMS),
+        ],
+    )
+    assert given(problem, assignment.solve(problem)) == {("s", "IM"): "art", ("s", "IW"): "chem"}
+
+
+def test_room_capacity_and_programs_are_respected():
+    problem = build(
+        [("a", "IB"), ("b", "IB"), ("c", "DP")],
+        [
+            ("a1", "a", "IM1", "ART"),
+            ("a2", "a", "IM2", "BIO"),
+            ("b1", "b", "IM1", "ART"),
+            ("b2", "b", "IM2", "BIO"),
+            ("c1", "c", "IM1", "CHEM"),
+        ],
+        [
+            ("art", "ART", "Mon: 09:00 - 10:20", "small", ALL_PROGRAMS),
+            ("bio", "BIO", "Mon: 09:00 - 10:20", None, ALL_PROGRAMS),
+            ("chem", "CHEM", "Tue: 09:00 - 10:20", None, "IB"),
+        ],
+        [("small", 1)],
+    )
+    seats = given(problem, assignment.solve(problem))
+    assert sorted(seats.values()) == ["art", "bio"]
+    assert ("c", "IM") not in seats
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_each_group_is_solved_to_the_optimum(seed):
+    rng = np.random.default_rng(seed)
+    courses = ["ART", "BIO", "CHEM"]
+    classes = [
+        (course.lower(), course, f"Mon: {9 + i:02d}:00 - {9 + i:02d}:50", f"room{i}", ALL_PROGRAMS)
+        for i, course in enumerate(courses)
+    ]
+    rooms = [(f"room{i}", int(rng.integers(0, 3))) for i in range(len(courses))]
+    students, choices = [], []
+    for s in range(5):
+        students.append((f"s{s}", "IB"))
+        for rank, course in enumerate(rng.permutation(courses)[: rng.integers(1, 4)], 1):
+            choices.append((f"s{s}-{course}", f"s{s}", f"IM{rank}", course))
+    problem = build(students, choices, classes, rooms)
+
+    # Every choice or none per student, within the capacities
+    per_student = [
+        [None, *np.flatnonzero(problem.choice_student == s)] for s in range(len(students))
+    ]
+    best = 0
+    for picks in itertools.product(*per_student):
+        picked = np.array([pick for pick in picks if pick is not None], np.int64)
+        seated = np.bincount(problem.choice_course[picked], minlength=len(courses))
+        if (seated[problem.class_course] > problem.class_capacity).any():
+            continue
+        last = problem.choice_rank.max()
+        best = max(best, int((ASSIGNED_VALUE + last + 1 - problem.choice_rank[picked]).sum()))
+
+    assert value(problem, assignment.solve(problem)) == best
+
+
+def test_starting_from_an_optimal_assignment_moves_nobody():
+    problem = build(
+        [(f"s{s}", "IB") for s in range(6)],
+        [
+            (f"s{s}-{course}", f"s{s}", f"IM{rank}", course)
+            for s in range(6)
+            for rank, course in enumerate(["ART", "BIO"] if s % 2 else ["BIO", "ART"], 1)
+        ],
+        [
+            ("art1", "ART", "Mon: 09:00 - 10:20", "small", ALL_PROGRAMS),
+            ("art2", "ART", "Mon: 09:00 - 10:20", "small", ALL_PROGRAMS),
+            ("bio", "BIO", "Mon: 09:00 - 10:20", "small", ALL_PROGRAMS),
+        ],
+        [("small", 2)],
+    )
+    solution = assignment.solve(problem)
+    current = repair.as_current(problem, solution)
+
+    again = assignment.solve(problem, current)
+    assert value(problem, again) == value(problem, solution)
+    assert repair.delta(problem, current, repair.as_current(problem, again)) == []
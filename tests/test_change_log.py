@@ -0,0 +1,112 @@
+from contextlib import ExitStack
+
+import duckdb
+import pytest
+
+from src.db.change_log import ChangeLog
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = str(tmp_path / "log.duckdb")
+    with duckdb.connect(path) as con:
+        con.execute("CREATE TABLE item (id INTEGER, name VARCHAR)")
+    return ChangeLog("test", lambda: duckdb.connect(path))
+
+
+def write(log: ChangeLog, con, id: int, op: str = "insert") -> int:
+    con.execute("INSERT INTO item VALUES (?, 'x')", [id])
+    return log.record(con, "item", id, op, None if op == "delete" else ["id", "name"])
+
+
+def test_changes_are_read_from_the_cursor(log):
+    with log.connect() as con:
+        for id in range(3):
+            with log.transaction(con):
+                write(log, con, id)
+
+    changes, cursor = log.read()
+    assert [(change.id, change.op) for change in changes] == [
+        ("0", "insert"),
+        ("1", "insert"),
+        ("2", "insert"),
+    ]
+    assert cursor == changes[-1].seq
+    assert log.read(cursor) == ([], cursor)
+    # Above the last entry when sequence numbers were skipped, never below
+    assert log.latest() >= cursor
+    assert log.read(log.latest())[0] == []
+    changes, _ = log.read(changes[0].seq)
+    assert [change.id for change in changes] == ["1", "2"]
+
+
+def test_a_late_commit_below_the_cursor_is_not_skipped(log):
+    with log.connect() as first, log.connect() as second, ExitStack() as open_first:
+        # The first transaction takes its sequence numbers, then commits last
+        open_first.enter_context(log.transaction(first))
+        early = write(log, first, 1)
+        with log.transaction(second):
+            late = write(log, second, 2)
+        assert early < late
+
+        changes, cursor = log.read()
+        assert changes == []
+        assert cursor < early
+        assert log.latest() < early
+
+        open_first.close()
+
+    changes, cursor = log.read(cursor)
+    assert [change.seq for change in changes] == [early, late]
+    assert cursor == late
+
+
+def test_rolled_back_transactions_release_the_cursor(log):
+    with log.connect() as con:
+        with pytest.raises(RuntimeError), log.transaction(con):
+            write(log, con, 1)
+            raise RuntimeError
+        with log.transaction(con):
+            seq = write(log, con, 2)
+
+    changes, cursor = log.read()
+    assert [change.id for change in changes] == ["2"]
+    assert cursor == seq
+
+
+def test_record_many_logs_a_row_per_id(log):
+    with log.connect() as con, log.transaction(con):
+        con.execute("INSERT INTO item SELECT range, 'x' FROM range(5)")
+        seq = log.record_many(con, "item", "SELECT id FROM item", "update", ["name"])
+        assert log.record_many(con, "item", "SELECT id FROM item WHERE false", "update") is None
+
+    changes, cursor = log.read()
+    assert sorted(change.id for change in changes) == ["0", "1", "2", "3", "4"]
+    assert all(change.columns == ["name"] for change in changes)
+    assert cursor == seq
+
+
+def test_compaction_keeps_the_net_effect_per_row(log):
+    with log.connect() as con:
+        for op in ("insert", "update", "update"):
+            with log.transaction(con):
+                write(log, con, 1, op)
+        for op in ("insert", "delete"):
+            with log.transaction(con):
+                write(log, con, 2, op)
+        with log.transaction(con):
+            last = write(log, con, 3)
+
+    assert log.compact(keep=1) == 3
+    changes, cursor = log.read()
+    assert [(change.id, change.op) for change in changes] == [
+        ("1", "insert"),
+        ("2", "delete"),
+        ("3", "insert"),
+    ]
+    assert cursor == last
+
+
+def test_unknown_operations_are_refused(log):
+    with log.connect() as con, pytest.raises(ValueError), log.transaction(con):
+        log.record(con, "item", 1, "upsert")
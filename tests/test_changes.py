@@ -0,0 +1,108 @@
+import asyncio
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from src.db.changes import Change, ChangeBus
+
+
+def listen(bus: ChangeBus, write, timeout: float = 2.0):
+    """Start `bus` as a worker would, run `write`, and return the changes it heard"""
+    heard = []
+    bus.subscribe(heard.append)
+
+    async def scenario():
+        bus.start()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, write)
+            deadline = asyncio.get_running_loop().time() + timeout
+            while not heard and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(0.01)
+        finally:
+            bus.stop()
+
+    asyncio.run(scenario())
+    return heard
+
+
+def test_started_workers_hear_each_other(tmp_path):
+    other = ChangeBus(tmp_path)
+
+    def write():
+        other.directory.mkdir(parents=True, exist_ok=True)
+        # Bound like a worker's, but not read: only its sending side is used
+        other.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        other.path = tmp_path / "other.sock"
+        other.sock.bind(str(other.path))
+        try:
+            other.notify("spin", "student", "1", 7)
+        finally:
+            other.sock.close()
+
+    worker = ChangeBus(tmp_path)
+    heard = listen(worker, write)
+
+    assert heard == [Change("spin", "student", "1", 7)]
+    assert worker.version("spin", "student") == 7
+
+
+def test_workers_hear_a_process_that_does_not_listen(tmp_path):
+    worker = ChangeBus(tmp_path)
+    cli = ChangeBus(tmp_path)
+
+    heard = listen(worker, lambda: cli.notify("spin", "assignment", None, 12))
+
+    assert heard == [Change("spin", "assignment", None, 12)]
+    assert worker.version("spin", "assignment") == 12
+    assert cli.sock is None
+
+
+def test_workers_hear_a_cli_run(tmp_path):
+    code = (
+        "from src.db.changes import ChangeBus; import sys;"
+        "ChangeBus(sys.argv[1]).notify('spin', 'spin_class', None, 3)"
+    )
+
+    heard = listen(
+        ChangeBus(tmp_path),
+        lambda: subprocess.run([sys.executable, "-c", code, str(tmp_path)], check=True),
+    )
+
+    assert heard == [Change("spin", "spin_class", None, 3)]
+
+
+def test_sockets_of_dead_workers_are_removed(tmp_path):
+    stale = tmp_path / "999999999.sock"
+    stale.touch()
+
+    ChangeBus(tmp_path).notify("school", "course", "1", 1)
+
+    assert not stale.exists()
+
+
+def test_only_private_directories_are_used(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o700)
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        listen(ChangeBus(shared), lambda: None)
+    # Nor through a link to a private one
+    private = tmp_path / "private"
+    private.mkdir(mode=0o700)
+    link = tmp_path / "link"
+    link.symlink_to(private, target_is_directory=True)
+    with pytest.raises(PermissionError):
+        listen(ChangeBus(link), lambda: None)
+
+    # Senders don't reach the sockets there
+    peer = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    peer.bind(str(shared / "1.sock"))
+    peer.setblocking(False)
+    try:
+        ChangeBus(shared).notify("spin", "student", "1", 1)
+        with pytest.raises(BlockingIOError):
+            peer.recv(4096)
+    finally:
+        peer.close()
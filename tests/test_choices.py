@@ -0,0 +1,55 @@
+from src.db import db_spin
+from src.spin import choices
+
+TABLES = ("student_choices_long", "student_choices_wide", "student_choice_courses")
+
+
+def test_edits_refresh_as_a_rebuild(built, first_row, assert_as_rebuilt):
+    def first(sql: str) -> str:
+        return first_row(db_spin.run, sql)["id"]
+
+    selection = first("SELECT id FROM student_selection ORDER BY id LIMIT 1")
+    db_spin.update("student_selection", {"id": selection, "course_code": "NEW-001"})
+    db_spin.delete("student_selection", first("SELECT id FROM student_selection ORDER BY id DESC"))
+    student = first("SELECT id FROM student ORDER BY email LIMIT 1")
+    db_spin.update("student", {"id": student, "program": "DP"})
+    db_spin.delete("student", first("SELECT id FROM student ORDER BY email DESC LIMIT 1"))
+
+    with db_spin.get_connection() as con:
+        refreshed = choices.refresh(con)
+        assert 0 < refreshed <= 4
+        assert choices.refresh(con) == 0
+        assert_as_rebuilt(con, TABLES, lambda: choices.rebuild(con))
+
+
+def test_a_new_preference_code_refreshes_as_a_rebuild(built, first_row, assert_as_rebuilt):
+    student = first_row(db_spin.run, "SELECT id FROM student ORDER BY email LIMIT 1")["id"]
+    selection = str(db_spin.create("student_selection")["id"])
+    db_spin.update(
+        "student_selection",
+        {"id": selection, "student_id": student, "preference_code": "XX1", "course_code": "NEW"},
+    )
+
+    with db_spin.get_connection() as con:
+        assert choices.refresh(con) == 1
+        assert "XX1" in choices.wide_codes(con)
+        assert_as_rebuilt(con, TABLES, lambda: choices.rebuild(con))
+
+
+def test_assigned_flags_are_not_a_change(built):
+    with db_spin.get_connection() as con:
+        with db_spin.change_log.transaction(con):
+            con.execute("UPDATE student_selection SET assigned = true")
+            db_spin.change_log.record(con, "student_selection", None, "update", ["assigned"])
+        assert choices.refresh(con) == 0
+
+
+def test_bulk_changes_rebuild(built):
+    with db_spin.get_connection() as con:
+        with db_spin.change_log.transaction(con):
+            con.execute("UPDATE student SET level = 'B2'")
+            db_spin.change_log.record(con, "student", None, "update", ["level"])
+        assert choices.refresh(con) == -1
+        assert set(con.execute("SELECT DISTINCT level FROM student_choices_long").fetchall()) == {
+            ("B2",)
+        }
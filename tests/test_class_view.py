@@ -0,0 +1,68 @@
+from src.db import db_school, db_spin
+from src.spin import class_view
+
+
+def connections():
+    return db_spin.get_connection(), db_school.get_connection()
+
+
+def test_changes_on_both_sides_refresh_as_a_rebuild(built, first_row, assert_as_rebuilt):
+    klass = first_row(db_spin.run, "SELECT * FROM spin_class ORDER BY id LIMIT 1")
+    db_spin.update("spin_class", {"id": klass["id"], "timeslot": "Sat: 09:00 - 10:20"})
+    con, school_con = connections()
+    with con, school_con:
+        assert class_view.refresh(con, school_con) == 1
+
+    # A school row changed to match the class, and rows the classes matched
+    timeslot = first_row(
+        db_school.run,
+        "SELECT id FROM timeslot WHERE start_time = '09:00' AND end_time = '10:20' LIMIT 1",
+    )
+    db_school.update("timeslot", {"id": timeslot["id"], "weekday": "Sat"})
+    teacher = first_row(
+        db_spin.run, "SELECT teacher_name FROM spin_class WHERE teacher_name <> '' LIMIT 1"
+    )["teacher_name"]
+    teacher_id = first_row(db_school.run, f"SELECT id FROM teacher WHERE name = '{teacher}'")["id"]
+    db_school.update("teacher", {"id": teacher_id, "name": "Someone Else"})
+    room = first_row(db_spin.run, "SELECT room_name FROM spin_class WHERE room_name <> '' LIMIT 1")
+    room_id = first_row(db_school.run, f"SELECT id FROM room WHERE name = '{room['room_name']}'")
+    db_school.update("room", {"id": room_id["id"], "capacity": 99})
+    code = first_row(db_spin.run, "SELECT course_code FROM spin_class LIMIT 1")["course_code"]
+    course = first_row(db_school.run, f"SELECT id FROM course WHERE code = '{code}'")
+    db_school.update("course", {"id": course["id"], "title": "Renamed"})
+
+    con, school_con = connections()
+    with con, school_con:
+        total = con.execute("SELECT count(*) FROM class_view").fetchone()[0]
+        joined = class_view.refresh(con, school_con)
+        assert 0 < joined < total
+        assert class_view.refresh(con, school_con) == 0
+        assert_as_rebuilt(con, ["class_view"], lambda: class_view.rebuild(con, school_con))
+        assert con.execute(
+            "SELECT weekday FROM class_view WHERE id = ?", [klass["id"]]
+        ).fetchone() == ("Sat",)
+
+
+def test_a_deleted_class_leaves_the_table(built, first_row, assert_as_rebuilt):
+    klass = first_row(db_spin.run, "SELECT id FROM spin_class ORDER BY id LIMIT 1")["id"]
+    db_spin.delete("spin_class", klass)
+
+    con, school_con = connections()
+    with con, school_con:
+        assert class_view.refresh(con, school_con) == 1
+        refreshed = assert_as_rebuilt(
+            con, ["class_view"], lambda: class_view.rebuild(con, school_con)
+        )
+    assert klass not in set(refreshed["class_view"]["id"])
+
+
+def test_bulk_school_changes_rebuild(built):
+    con, school_con = connections()
+    with con, school_con:
+        with db_school.change_log.transaction(school_con):
+            school_con.execute("UPDATE room SET capacity = 1")
+            db_school.change_log.record(school_con, "room", None, "update", ["capacity"])
+        assert class_view.refresh(con, school_con) == -1
+        assert con.execute(
+            "SELECT DISTINCT room_capacity FROM class_view WHERE room_id IS NOT NULL"
+        ).fetchall() == [(1,)]
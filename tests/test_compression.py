@@ -0,0 +1,115 @@
+import gzip
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from src.web.compression import (
+    SKIP_COMPRESSION,
+    CompressionMiddleware,
+    available_encoders,
+    negotiate_encoding,
+)
+
+PAGE = "<p>" + "row " * 500 + "</p>"
+
+
+async def page(request):
+    return Response(PAGE, media_type="text/html")
+
+
+async def small(request):
+    return PlainTextResponse("ok")
+
+
+async def image(request):
+    return Response(b"\x89PNG" + bytes(2000), media_type="image/png")
+
+
+async def events(request):
+    async def stream():
+        for number in range(3):
+            yield f"event: datastar-merge-fragments\ndata: fragments <p>{number}</p>\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+async def managed(request):
+    request.scope[SKIP_COMPRESSION] = True
+    return await events(request)
+
+
+def client(**options) -> TestClient:
+    routes = [
+        Route("/page", page),
+        Route("/small", small),
+        Route("/image", image),
+        Route("/events", events),
+        Route("/managed", managed),
+    ]
+    return TestClient(CompressionMiddleware(Starlette(routes=routes), **options))
+
+
+def get(path: str, encoding: str = "gzip"):
+    return client().get(path, headers={"Accept-Encoding": encoding})
+
+
+def test_negotiates_the_preferred_accepted_encoding():
+    encoders = {"br": object, "zstd": object, "gzip": object}
+    assert negotiate_encoding("gzip, br", encoders) == "br"
+    assert negotiate_encoding("br;q=0, gzip", encoders) == "gzip"
+    assert negotiate_encoding("*", encoders) == "br"
+    assert negotiate_encoding("identity", encoders) is None
+
+
+def test_compresses_pages():
+    response = get("/page")
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == PAGE
+
+
+@pytest.mark.parametrize("path", ["/small", "/image"])
+def test_passes_small_and_compressed_types_through(path):
+    response = get(path)
+
+    assert "content-encoding" not in response.headers
+
+
+def test_passes_everything_through_without_accept_encoding():
+    response = get("/page", encoding="identity")
+
+    assert "content-encoding" not in response.headers
+    assert response.text == PAGE
+
+
+def test_passes_managed_streams_through():
+    with client().stream("GET", "/managed", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert "content-encoding" not in response.headers
+    assert raw.count(b"datastar-merge-fragments") == 3
+
+
+def test_flushes_every_stream_chunk():
+    with client().stream("GET", "/events", headers={"Accept-Encoding": "gzip"}) as response:
+        chunks = list(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    # Each event can be decoded as soon as its chunk arrives
+    decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    first = decoder.decompress(chunks[0]).decode()
+    assert first.startswith("event: datastar-merge-fragments") and "<p>0</p>" in first
+    assert gzip.decompress(b"".join(chunks)).decode().count("datastar-merge-fragments") == 3
+
+
+@pytest.mark.parametrize("encoding", [name for name in available_encoders() if name != "gzip"])
+def test_optional_encoders_round_trip(encoding):
+    response = get("/page", encoding=encoding)
+
+    assert response.headers["content-encoding"] == encoding
+    assert response.text == PAGE
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.spin.conflicts import DAY, IntervalIndex, Schedule, interval, label_interval
+
+CLASS_COLUMNS = [
+    "id",
+    "title",
+    "timeslot",
+    "weekday",
+    "start_time",
+    "end_time",
+    "room_id",
+    "room_name",
+    "teacher_id",
+    "teacher_name",
+]
+
+
+def schedule(*classes) -> Schedule:
+    """A schedule of (id, timeslot label, room name, teacher name) classes matching nothing"""
+    return Schedule(
+        pd.DataFrame(
+            [
+                (id, id.upper(), timeslot, None, None, None, None, room, None, teacher)
+                for id, timeslot, room, teacher in classes
+            ],
+            columns=CLASS_COLUMNS,
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    "timeslot, expected",
+    [
+        (("Mon", "09:00", "10:20"), (540, 620)),
+        (("tuesday", "9:05", "24:00"), (DAY + 545, 2 * DAY)),
+        (("Sun", "23:00", "23:59"), (6 * DAY + 1380, 6 * DAY + 1439)),
+        (("Mon", "10:00", "10:00"), (-1, -1)),
+        (("Mon", "11:00", "10:00"), (-1, -1)),
+        (("Mon", "25:00", "26:00"), (-1, -1)),
+        (("Someday", "09:00", "10:00"), (-1, -1)),
+        ((None, None, None), (-1, -1)),
+    ],
+)
+def test_timeslots_as_minutes_in_the_week(timeslot, expected):
+    assert interval(*timeslot) == expected
+
+
+def test_labels_as_minutes_in_the_week():
+    assert label_interval("Tue: 10:30 - 11:50") == (DAY + 630, DAY + 710)
+    assert label_interval(" Tue : 10:30-11:50 ") == (DAY + 630, DAY + 710)
+    assert label_interval("Tue 10:30") == (-1, -1)
+    assert label_interval(None) == (-1, -1)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_the_index_finds_every_overlap(seed):
+    rng = np.random.default_rng(seed)
+    count = 200
+    keys = [None if key == 0 else f"r{key}" for key in rng.integers(0, 6, count)]
+    starts = rng.integers(0, 2 * DAY, count)
+    ends = starts + rng.integers(1, 240, count)
+    starts[rng.random(count) < 0.05] = -1
+    index = IntervalIndex(keys, starts, ends)
+
+    def overlap(a, b):
+        return (
+            keys[a] is not None
+            and keys[a] == keys[b]
+            and min(starts[a], starts[b]) >= 0
+            and starts[a] < ends[b]
+            and starts[b] < ends[a]
+        )
+
+    expected = {(a, b) for a in range(count) for b in range(a + 1, count) if overlap(a, b)}
+    first, second = index.overlaps()
+    assert len(first) == len(expected)
+    assert {tuple(sorted(pair)) for pair in zip(first, second)} == expected
+    assert (starts[first] <= starts[second]).all()
+
+    for key in ("r1", "r5", "r9", None):
+        start = int(rng.integers(0, 2 * DAY))
+        end = start + int(rng.integers(1, 300))
+        found = sorted(index.query(key, start, end))
+        assert found == [
+            row
+            for row in range(count)
+            if key is not None
+            and keys[row] == key
+            and starts[row] >= 0
+            and starts[row] < end
+            and start < ends[row]
+        ]
+
+
+def test_double_bookings_by_room_and_teacher():
+    booked = schedule(
+        ("a", "Mon: 09:00 - 10:20", "R1", "Ann"),
+        ("b", "Mon: 10:00 - 11:00", "R1", "Bob"),
+        # Ends when the room's next class starts
+        ("c", "Mon: 08:00 - 09:00", "R1", "Bob"),
+        ("d", "Mon: 10:15 - 10:45", "R2", "Ann"),
+        ("e", "Tue: 09:00 - 10:20", "R1", "Ann"),
+        ("f", "not a timeslot", "R1", "Ann"),
+    )
+    conflicts = booked.conflicts()
+    assert conflicts[["resource", "class_id", "other_id", "overlap_minutes"]].to_dict(
+        "records"
+    ) == [
+        {"resource": "room", "class_id": "a", "other_id": "b", "overlap_minutes": 20},
+        {"resource": "teacher", "class_id": "a", "other_id": "d", "overlap_minutes": 5},
+    ]
+    assert booked.conflict_counts().to_dict() == {"a": 2, "b": 1, "d": 1}
+
+
+def test_an_edited_class_is_checked_against_the_others():
+    booked = schedule(
+        ("a", "Mon: 09:00 - 10:20", "R1", "Ann"),
+        ("b", "Mon: 10:00 - 11:00", "R2", "Bob"),
+    )
+    # The class itself is left out, its new timeslot and room are checked
+    found = booked.check(
+        {"id": "a", "timeslot": "Mon: 10:30 - 11:30", "room_name": " R2 ", "teacher_name": "Ann"}
+    )
+    assert found[["resource", "other_id", "overlap_minutes"]].to_dict("records") == [
+        {"resource": "room", "other_id": "b", "overlap_minutes": 30}
+    ]
+    new = {"timeslot": "Mon: 09:30 - 10:30", "room_name": "R1", "teacher_name": "Bob"}
+    assert sorted(map(tuple, booked.check(new)[["resource", "other_id"]].to_numpy())) == [
+        ("room", "a"),
+        ("teacher", "b"),
+    ]
+    assert booked.check({"timeslot": "Mon: 11:00 - 12:00", "room_name": "R2"}).empty
+
+
+def test_the_school_rows_matched_come_before_the_labels():
+    booked = Schedule(
+        pd.DataFrame(
+            [
+                # The label is stale, the school timeslot and room it matched are used
+                ("a", "A", "Fri: 09:00 - 10:00", "Mon", "09:00", "10:00", "r1", "Old", None, "Ann"),
+                ("b", "B", "Mon: 09:30 - 10:30", None, None, None, "r1", "New", None, "Bob"),
+            ],
+            columns=CLASS_COLUMNS,
+        )
+    )
+    assert booked.conflicts()[["resource", "class_id", "other_id"]].to_dict("records") == [
+        {"resource": "room", "class_id": "a", "other_id": "b"}
+    ]
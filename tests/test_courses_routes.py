@@ -0,0 +1,45 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from src.db import db_school
+
+
+@pytest.fixture
+def client(databases):
+    return TestClient(app)
+
+
+def test_create_course(client):
+    response = client.post(
+        "/school/courses", data={"code": "T1", "title": "Test course", "active": "on"}
+    )
+
+    assert response.status_code == 200
+    courses = db_school.get_all("course")
+    assert courses[courses["code"] == "T1"]["title"].tolist() == ["Test course"]
+
+
+@pytest.mark.parametrize("form", [{"title": "No code"}, {"code": "T2"}])
+def test_create_course_without_a_required_field(client, form):
+    response = client.post("/school/courses", data=form)
+
+    assert response.status_code == 400
+    assert "Validation error" in response.text
+
+
+def test_update_course_without_a_required_field(client):
+    course_id = str(db_school.get_all("course")["id"].iloc[0])
+
+    response = client.put(f"/school/courses/{course_id}", data={"title": "No code"})
+
+    assert response.status_code == 400
+    assert "Validation error" in response.text
+
+
+def test_update_missing_course(client):
+    response = client.put(
+        "/school/courses/00000000-0000-0000-0000-000000000000", data={"code": "X", "title": "X"}
+    )
+
+    assert response.status_code == 404
@@ -0,0 +1,123 @@
+import pandas as pd
+
+from src.spin.assignment import DEFAULT_CAPACITY
+from src.spin.demand import course_demand, summarize
+
+
+def frames():
+    demand = pd.DataFrame(
+        [
+            ("IW", "ART", 1, 25),
+            ("IW", "ART", 2, 5),
+            ("IM", "BIO", 1, 10),
+            ("IM", "BIO", 3, 2),
+            ("IM", "CHEM", 2, 4),
+            ("XX", "MUSIC", 1, 1),
+            ("GA", "DRAMA", 1, 3),
+            # Not a ranked choice
+            ("IM", "OLD", 0, 9),
+        ],
+        columns=["course_group", "course_code", "rank", "choices"],
+    )
+    sections = pd.DataFrame(
+        [("ART", "R1"), ("ART", "R2"), ("BIO", "Gone")], columns=["course_code", "room_name"]
+    )
+    rooms = pd.DataFrame([("R1", 12), ("R2", 10), ("R3", 30)], columns=["name", "capacity"])
+    return demand, sections, rooms
+
+
+def test_demand_per_course():
+    demand = course_demand(*frames())
+    assert demand.columns.tolist() == [
+        "course_group",
+        "course_code",
+        "rank_1",
+        "rank_2",
+        "rank_3",
+        "choices",
+        "first_choice_ratio",
+        "section_capacity",
+        "sections",
+        "projected_sections",
+        "missing_sections",
+    ]
+    # GROUP_ORDER first, the most chosen courses first within a group, other groups last
+    assert demand.set_index("course_code").drop(columns="course_group").to_dict("index") == {
+        "BIO": {
+            "rank_1": 10,
+            "rank_2": 0,
+            "rank_3": 2,
+            "choices": 12,
+            "first_choice_ratio": 0.833,
+            # Rooms not in the school database count as DEFAULT_CAPACITY seats
+            "section_capacity": DEFAULT_CAPACITY,
+            "sections": 1,
+            "projected_sections": 1,
+            "missing_sections": 0,
+        },
+        "CHEM": {
+            "rank_1": 0,
+            "rank_2": 4,
+            "rank_3": 0,
+            "choices": 4,
+            "first_choice_ratio": 0.0,
+            # No sections: the median room
+            "section_capacity": 12,
+            "sections": 0,
+            "projected_sections": 0,
+            "missing_sections": 0,
+        },
+        "ART": {
+            "rank_1": 25,
+            "rank_2": 5,
+            "rank_3": 0,
+            "choices": 30,
+            "first_choice_ratio": 0.833,
+            # 25 first choices over the mean of 12 and 10 seats, rounded up
+            "section_capacity": 11,
+            "sections": 2,
+            "projected_sections": 3,
+            "missing_sections": 1,
+        },
+        "DRAMA": {
+            "rank_1": 3,
+            "rank_2": 0,
+            "rank_3": 0,
+            "choices": 3,
+            "first_choice_ratio": 1.0,
+            "section_capacity": 12,
+            "sections": 0,
+            "projected_sections": 1,
+            "missing_sections": 1,
+        },
+        "MUSIC": {
+            "rank_1": 1,
+            "rank_2": 0,
+            "rank_3": 0,
+            "choices": 1,
+            "first_choice_ratio": 1.0,
+            "section_capacity": 12,
+            "sections": 0,
+            "projected_sections": 1,
+            "missing_sections": 1,
+        },
+    }
+    assert demand["course_group"].tolist() == ["IM", "IM", "IW", "GA", "XX"]
+    assert summarize(demand) == {
+        "courses": 5,
+        "choices": 50,
+        "first_choices": 39,
+        "sections": 3,
+        "projected_sections": 6,
+        "missing_sections": 3,
+    }
+
+
+def test_no_rooms_and_no_choices():
+    demand, sections, _ = frames()
+    rooms = pd.DataFrame(columns=["name", "capacity"])
+    result = course_demand(demand[demand["course_code"] == "DRAMA"], sections, rooms)
+    assert result[["section_capacity", "projected_sections"]].values.tolist() == [
+        [DEFAULT_CAPACITY, 1]
+    ]
+    assert course_demand(demand.iloc[:0], sections, rooms).empty
@@ -0,0 +1,133 @@
+import io
+
+import pytest
+
+from src.db import db_spin
+from src.spin import ingest
+
+HEADER = "email,firstName,lastName,level,program,active,created_at,IM1,IW2\n"
+
+
+def upload(text: str) -> io.BytesIO:
+    return io.BytesIO(text.encode())
+
+
+def errors(text: str, format: str = "csv") -> list:
+    """The (line, error) of an upload's rows left out, unparsed or invalid"""
+    found = []
+    for rows, parse_errors in ingest.read_batches(upload(text), format, batch_rows=2):
+        found += parse_errors
+        if not rows.empty:
+            found += list(ingest.validate(rows)[2].itertuples(index=False, name=None))
+    return sorted(found)
+
+
+def run(text: str, format: str = "csv", write: bool = True) -> dict:
+    """The result of ingesting an upload"""
+    *_, done = ingest.ingest(upload(text), format, write, batch_rows=2)
+    return done
+
+
+def test_invalid_rows_are_reported_with_their_line():
+    assert errors(
+        HEADER
+        + "ann@example.org,Ann,Lee,B1,DP,yes,2026-01-05 08:00,ART,\n"
+        + "bob@example.org,Bob,,B1,DP,,,,\n"
+        + "carol@example,Carol,Ng,B1,DP,,,,\n"
+        + "\n"
+        + "dan@example.org,Dan,Wu,B1,DP,maybe,,,\n"
+        + "eve@example.org,Eve,Ko,B1,DP,no,yesterday,,\n"
+        + " ,Fay,Li,,DP,,,,\n"
+    ) == [
+        (3, "lastName is missing"),
+        (4, "email is not valid"),
+        (6, "active is not a boolean"),
+        (7, "created_at is not a timestamp"),
+        (8, "email is missing; level is missing"),
+    ]
+
+
+def test_malformed_json_lines_are_reported():
+    text = "\n".join(
+        [
+            '{"email": "ann@example.org", "firstName": "Ann", "lastName": "Lee",'
+            ' "level": "B1", "program": "DP", "selections": {"IM1": "ART"}}',
+            '{"email": "bob@example.org",',
+            "[1, 2]",
+            "",
+            '{"email": "carol@example.org", "selections": ["ART"]}',
+        ]
+    )
+    assert errors(text, "jsonl") == [
+        (2, "invalid JSON: Expecting property name enclosed in double quotes"),
+        (3, "not a JSON object"),
+        (5, "selections is not an object"),
+    ]
+    (rows, _), *_ = ingest.read_batches(upload(text), "jsonl")
+    students, selections, _ = ingest.validate(rows)
+    assert students["email"].tolist() == ["ann@example.org"]
+    assert selections[["preference_code", "course_code"]].values.tolist() == [["IM1", "ART"]]
+
+
+def selections_of(student_id: str) -> list:
+    return sorted(
+        map(
+            tuple,
+            db_spin.run(
+                "SELECT preference_code, course_code FROM student_selection"
+                f" WHERE student_id = '{student_id}'"
+            ).values.tolist(),
+        )
+    )
+
+
+@pytest.fixture
+def existing(databases):
+    """Two students of the seeded database: (id, email) each"""
+    return [
+        tuple(map(str, row))
+        for row in db_spin.run("SELECT id, email FROM student ORDER BY email LIMIT 2").values
+    ]
+
+
+def test_the_last_row_per_email_wins(databases):
+    result = run(
+        HEADER
+        + "new@example.org,First,Try,B1,DP,,,ART,BIO\n"
+        + "NEW@example.org,Second,Try,B2,MYP,,,CHEM,\n"
+    )
+    assert result["students_inserted"] == 1 and result["selections_inserted"] == 1
+    student = db_spin.run("SELECT * FROM student WHERE email = 'new@example.org'")
+    assert student[["firstName", "level", "program"]].values.tolist() == [["Second", "B2", "MYP"]]
+    assert selections_of(student["id"][0]) == [("IM1", "CHEM")]
+
+
+def test_existing_students_are_matched_ignoring_case(existing):
+    (id, email), (other_id, other_email) = existing
+    kept = selections_of(other_id)
+    assert kept
+    result = run(
+        HEADER
+        + f"{email.upper()},Ann,Lee,B1,DP,,,ART,BIO\n"
+        # No choices: the student's selections are left as they are
+        + f" {other_email} ,Bob,Ray,B2,DP,,,,\n"
+    )
+    assert result["students_inserted"] == 0 and result["students_updated"] == 2
+    assert result["selections_inserted"] == 2
+    assert db_spin.run(f"SELECT firstName FROM student WHERE id = '{id}'").iloc[0, 0] == "Ann"
+    assert selections_of(id) == [("IM1", "ART"), ("IW2", "BIO")]
+    assert selections_of(other_id) == kept
+    assert db_spin.run(f"SELECT lastName FROM student WHERE id = '{other_id}'").iloc[0, 0] == "Ray"
+
+
+def test_a_dry_run_leaves_the_database_untouched(existing):
+    (id, email), _ = existing
+    tables = "SELECT (SELECT count(*) FROM student), (SELECT count(*) FROM student_selection)"
+    before = db_spin.run(tables).values.tolist()
+    result = run(
+        HEADER + f"{email},Ann,Lee,B1,DP,,,ART,\n" + "new@example.org,New,One,B1,DP,,,ART,\n",
+        write=False,
+    )
+    assert result["students_inserted"] == 1 and result["students_updated"] == 1
+    assert db_spin.run(tables).values.tolist() == before
+    assert db_spin.run(f"SELECT firstName FROM student WHERE id = '{id}'").iloc[0, 0] != "Ann"
@@ -0,0 +1,33 @@
+import builtins
+import sys
+import threading
+
+from src.utils import LazyModule, lazy_import
+
+
+def test_threads_share_one_first_load(tmp_path, monkeypatch):
+    (tmp_path / "slow_module.py").write_text(
+        "import time\n"
+        "import builtins\n"
+        "builtins.slow_module_loads = getattr(builtins, 'slow_module_loads', 0) + 1\n"
+        "time.sleep(0.2)\n"
+        "VALUE = 42\n"
+    )
+    monkeypatch.syspath_prepend(tmp_path)
+    # Recorded as absent, so the module imported here is dropped afterwards
+    monkeypatch.setitem(sys.modules, "slow_module", None)
+    monkeypatch.delitem(sys.modules, "slow_module")
+    monkeypatch.setattr("builtins.slow_module_loads", 0, raising=False)
+
+    module = lazy_import("slow_module")
+    assert isinstance(module, LazyModule) and "slow_module" not in sys.modules
+
+    values = []
+    readers = [threading.Thread(target=lambda: values.append(module.VALUE)) for _ in range(8)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join(5)
+    assert values == [42] * 8
+    assert builtins.slow_module_loads == 1
+    assert lazy_import("slow_module") is sys.modules["slow_module"]
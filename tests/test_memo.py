@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from src.db.memo import VersionedMemo
+
+
+def counting(function=lambda x: x * 2):
+    """A function counting its calls"""
+
+    def counted(*args):
+        counted.calls += 1
+        return function(*args)
+
+    counted.calls = 0
+    return counted
+
+
+def test_concurrent_callers_share_one_computation():
+    started, release = threading.Event(), threading.Event()
+
+    def slow(x):
+        started.set()
+        release.wait(5)
+        return x * 2
+
+    function = counting(slow)
+    memo = VersionedMemo("test", function, lambda: 1)
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(memo.get(21))) for _ in range(8)]
+    callers[0].start()
+    assert started.wait(5)
+    for caller in callers[1:]:
+        caller.start()
+    release.set()
+    for caller in callers:
+        caller.join(5)
+    assert results == [42] * 8
+    assert function.calls == 1
+
+
+def test_a_new_version_recomputes():
+    version = [1]
+    function = counting()
+    memo = VersionedMemo("test", function, lambda: version[0])
+    assert memo.get(1) == memo.get(1) == 2
+    assert function.calls == 1
+    version[0] = 2
+    assert memo.get(1) == 2
+    assert function.calls == 2
+    # Other arguments are kept apart
+    assert memo.get(2) == 4
+    assert function.calls == 3
+
+
+def test_old_results_are_recomputed_at_the_same_version(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("src.db.memo.time.monotonic", lambda: now[0])
+    function = counting()
+    memo = VersionedMemo("test", function, lambda: 1, max_age=10)
+    memo.get(1)
+    now[0] += 9
+    memo.get(1)
+    assert function.calls == 1
+    now[0] += 1
+    memo.get(1)
+    assert function.calls == 2
+
+
+def test_a_failed_computation_is_not_cached():
+    def fail_once(x):
+        if function.calls == 1:
+            raise RuntimeError("unavailable")
+        return x
+
+    function = counting(fail_once)
+    memo = VersionedMemo("test", function, lambda: 1)
+    with pytest.raises(RuntimeError):
+        memo.get(1)
+    assert memo.get(1) == 1
+    assert memo.get(1) == 1
+    assert function.calls == 2
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from src.instrumentation.memory import MemoryMiddleware, profiler
+
+
+@pytest.fixture
+def profiling():
+    profiler.reset()
+    profiler.enable()
+    yield profiler
+    profiler.disable()
+    profiler.reset()
+
+
+async def call(app, path: str, sent: list):
+    async def receive():
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": [], "query_string": b""}
+    await app(scope, receive, send)
+
+
+# Snapshots of everything traced since the profiler started take seconds
+@pytest.mark.slow
+def test_open_event_stream_does_not_hold_the_profiler(profiling):
+    closed = asyncio.Event()
+
+    async def events(request):
+        async def stream():
+            yield "event: datastar-merge-fragments\ndata: fragments <p>0</p>\n\n"
+            await closed.wait()
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    async def page(request):
+        return PlainTextResponse("x" * 10_000)
+
+    app = MemoryMiddleware(Starlette(routes=[Route("/events", events), Route("/page", page)]))
+
+    async def scenario():
+        stream_messages, page_messages = [], []
+        stream = asyncio.create_task(call(app, "/events", stream_messages))
+        while len(stream_messages) < 2:
+            await asyncio.sleep(0.01)
+        # The stream is open: other requests are profiled, not skipped
+        await call(app, "/page", page_messages)
+        closed.set()
+        await stream
+
+    asyncio.run(scenario())
+
+    report = profiling.report()
+    assert report["skipped"] == 0
+    assert report["routes"]["/page"]["requests"] == 1
+    assert report["routes"]["/events"]["requests"] == 1
+
+
+def test_requests_alongside_a_profiled_one_are_skipped(profiling):
+    release = asyncio.Event()
+
+    async def slow(request):
+        await release.wait()
+        return PlainTextResponse("done")
+
+    async def page(request):
+        return PlainTextResponse("x")
+
+    app = MemoryMiddleware(Starlette(routes=[Route("/slow", slow), Route("/page", page)]))
+
+    async def scenario():
+        slow_request = asyncio.create_task(call(app, "/slow", []))
+        await asyncio.sleep(0.05)
+        await call(app, "/page", [])
+        release.set()
+        await slow_request
+
+    asyncio.run(scenario())
+
+    report = profiling.report()
+    assert report["skipped"] == 1
+    assert report["routes"]["/slow"]["requests"] == 1
@@ -0,0 +1,101 @@
+import gc
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.staticfiles import StaticFiles
+
+from src.instrumentation import TimingMiddleware
+from src.instrumentation.metrics import (
+    LATENCY_BUCKETS,
+    REQUEST_DURATION,
+    CounterChild,
+    HistogramChild,
+    registry,
+)
+from src.instrumentation.timing import SpanAggregator
+from src.utils import UNMATCHED_ROUTE, route_path
+
+
+def make_client(tmp_path) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(TimingMiddleware)
+    (tmp_path / "app.js").write_text("")
+    app.mount("/static", StaticFiles(directory=tmp_path), name="static")
+
+    @app.get("/courses/{course_id}")
+    def course(course_id: str):
+        return {"id": course_id}
+
+    return TestClient(app)
+
+
+def routes_seen() -> set:
+    return {labels[1] for labels, _ in REQUEST_DURATION.children()}
+
+
+def test_requests_are_labelled_by_route_template(tmp_path):
+    client = make_client(tmp_path)
+    client.get("/courses/1")
+    client.get("/courses/2")
+    client.get("/static/app.js")
+
+    assert {"/courses/{course_id}", "/static/{path}"} <= routes_seen()
+    assert "/courses/1" not in routes_seen()
+
+
+def test_unmatched_paths_share_one_label(tmp_path):
+    client = make_client(tmp_path)
+    for number in range(20):
+        assert client.get(f"/scanner/probe-{number}").status_code == 404
+
+    assert UNMATCHED_ROUTE in routes_seen()
+    assert not any(route.startswith("/scanner") for route in routes_seen())
+    assert "/scanner" not in registry.render()
+
+
+def test_route_path_without_app_or_route():
+    assert route_path({"type": "http", "path": "/anything"}) == UNMATCHED_ROUTE
+
+
+def test_shards_of_ended_threads_are_folded_into_the_total():
+    counter = CounterChild()
+    histogram = HistogramChild(LATENCY_BUCKETS)
+
+    def work():
+        for _ in range(10):
+            counter.inc()
+            histogram.observe(0.01)
+
+    for _ in range(5):
+        threads = [threading.Thread(target=work) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    gc.collect()
+
+    assert counter.value() == 1000
+    assert len(counter._shards._shards) == 0
+    assert len(histogram._shards._shards) == 0
+    assert histogram.snapshot()[2] == 1000
+    counter.inc()
+    assert counter.value() == 1001
+
+
+def test_spans_recorded_from_many_threads_add_up():
+    aggregator = SpanAggregator()
+
+    def record():
+        for number in range(10_000):
+            aggregator.record("db", 0.001 if number % 2 else 0.003)
+
+    workers = [threading.Thread(target=record) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    report = aggregator.report()["db"]
+    assert report["count"] == 80_000
+    assert round(report["total_ms"]) == 160_000
+    assert report["max_ms"] == 3.0
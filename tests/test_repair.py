@@ -0,0 +1,152 @@
+import io
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.db import db_school, db_spin
+from src.spin import assignment, ingest, repair
+
+SUBMISSIONS = b"""email,firstName,lastName,level,program,IM1,IM2,IW1
+late.one@example.com,Late,One,A1,SPIN,{im1},{im2},{iw1}
+alice.nielsen0@example.com,Alice,Nielsen,A1,SPIN,{im2},{im1},{iw1}
+"""
+
+
+@pytest.fixture
+def assigned(databases, monkeypatch):
+    """The seeded databases with a fresh assignment, and no problem kept from other tests"""
+    monkeypatch.setattr(repair, "_warm", {})
+    assignment.assign()
+    return databases
+
+
+def connections():
+    return db_spin.get_connection(), db_school.get_connection()
+
+
+def rows(problem: assignment.Problem) -> pd.DataFrame:
+    """The choices of a problem by ids, to compare problems indexed differently"""
+    return (
+        pd.DataFrame(
+            {
+                "choice": problem.choice_ids,
+                "student": problem.student_ids[problem.choice_student],
+                "program": np.asarray(problem.programs)[
+                    problem.student_program[problem.choice_student]
+                ],
+                "group": np.asarray(problem.groups)[problem.choice_group],
+                "rank": problem.choice_rank,
+                "course": np.asarray(problem.courses)[problem.choice_course],
+            }
+        )
+        .sort_values("choice")
+        .reset_index(drop=True)
+    )
+
+
+def submit(courses):
+    """Ingest SUBMISSIONS with these (IM1, IM2, IW1) courses"""
+    im1, im2, iw1 = courses
+    data = SUBMISSIONS.replace(b"{im1}", im1.encode()).replace(b"{im2}", im2.encode())
+    for step in ingest.ingest(io.BytesIO(data.replace(b"{iw1}", iw1.encode()))):
+        pass
+    assert step["students_inserted"] == 1 and step["students_updated"] == 1
+
+
+def offered():
+    with db_spin.get_connection() as con:
+        return [
+            code
+            for (code,) in con.execute(
+                "SELECT DISTINCT course_code FROM spin_class ORDER BY course_code LIMIT 3"
+            ).fetchall()
+        ]
+
+
+def test_the_kept_problem_follows_the_changes(assigned, monkeypatch):
+    spin_con, school_con = connections()
+    with spin_con, school_con:
+        first = repair.warm_problem(spin_con, school_con)
+
+    submit(offered())
+    selection = db_spin.run("SELECT id FROM student_selection ORDER BY id LIMIT 1")["id"][0]
+    db_spin.delete("student_selection", str(selection))
+
+    load_problem = assignment.load_problem
+    with monkeypatch.context() as patch:
+        # Only the students changed are read again
+        patch.setattr(assignment, "load_problem", None)
+        spin_con, school_con = connections()
+        with spin_con, school_con:
+            warm = repair.warm_problem(spin_con, school_con)
+    spin_con, school_con = connections()
+    with spin_con, school_con:
+        built = load_problem(spin_con, school_con)
+    assert warm is not first and warm.seq == built.seq > first.seq
+    pd.testing.assert_frame_equal(rows(warm), rows(built))
+
+
+def test_a_class_change_builds_the_problem_again(assigned):
+    spin_con, school_con = connections()
+    with spin_con, school_con:
+        first = repair.warm_problem(spin_con, school_con)
+    klass = db_spin.run("SELECT id FROM spin_class ORDER BY id LIMIT 1")["id"][0]
+    db_spin.update("spin_class", {"id": str(klass), "timeslot": "Sat: 09:00 - 10:20"})
+
+    spin_con, school_con = connections()
+    with spin_con, school_con:
+        warm = repair.warm_problem(spin_con, school_con)
+    assert "Sat: 09:00 - 10:20" in warm.timeslots and "Sat: 09:00 - 10:20" not in first.timeslots
+
+
+def test_repair_places_the_submissions_and_keeps_the_rest(assigned):
+    before = db_spin.run(
+        "SELECT student_id::VARCHAR AS s, spin_class_id::VARCHAR AS c FROM assignment"
+    )
+    submit(offered())
+
+    summary = repair.repair_if_assigned()
+    after = db_spin.run(
+        "SELECT student_id::VARCHAR AS s, spin_class_id::VARCHAR AS c FROM assignment"
+    )
+    late = db_spin.run("SELECT id::VARCHAR AS id FROM student WHERE email = 'late.one@example.com'")
+    assert late["id"][0] in set(after["s"])
+    # Only the moves reported changed
+    moved = {move["student_id"] for move in summary["moves"]}
+    kept = before[~before["s"].isin(moved)]
+    assert set(map(tuple, kept.to_numpy())) <= set(map(tuple, after.to_numpy()))
+    assert summary["changed"] >= 2
+
+    # Nothing changed since: nobody moves
+    assert repair.repair()["moves"] == []
+
+
+def test_nothing_is_repaired_before_an_assignment(databases):
+    with db_spin.get_connection() as con:
+        con.execute("DELETE FROM assignment")
+    assert repair.repair_if_assigned() is None
+
+
+def test_requests_during_a_repair_share_the_next_one(monkeypatch):
+    runs, started, release = [], threading.Event(), threading.Event()
+
+    def repair_if_assigned():
+        runs.append(len(runs))
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(repair, "repair_if_assigned", repair_if_assigned)
+    runner = repair.RepairRunner()
+    runner.request()
+    assert started.wait(5)
+    for _ in range(3):
+        runner.request()
+    release.set()
+    for _ in range(500):
+        if not runner._running:
+            break
+        time.sleep(0.01)
+    assert runs == [0, 1]
@@ -0,0 +1,79 @@
+import csv
+import io
+import zipfile
+
+import pytest
+
+from src.db import db_spin
+from src.spin import roster
+
+
+def read(format: str, data: bytes) -> list:
+    """The rows of a roster file, as lists of strings"""
+    if format == "csv":
+        header, *rows = csv.reader(io.StringIO(data.decode()))
+        assert header == roster.COLUMNS
+        return rows
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(data))
+    assert table.column_names == roster.COLUMNS
+    return [list(row.values()) for row in table.to_pylist()]
+
+
+def assignments() -> int:
+    return int(db_spin.run("SELECT count(*) FROM assignment").iloc[0, 0])
+
+
+class Result:
+    """The fetchmany of a query result, over a list"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+def test_partitions_span_batches():
+    rows = [("a", "A", 1), ("a", "A", 2), ("a", "A", 3), ("b", "B", 4), ("c", "C", 5)]
+    assert list(roster.partitions(Result(rows), batch_rows=2)) == [
+        (True, "a", "A", [(1,), (2,)]),
+        (False, "a", "A", [(3,)]),
+        (True, "b", "B", [(4,)]),
+        (True, "c", "C", [(5,)]),
+    ]
+
+
+def test_member_names_are_unique():
+    used = {}
+    names = [roster.file_name(name, "csv", used) for name in ["Art / Design", "Art / Design", None]]
+    assert names == ["Art_Design.csv", "Art_Design-2.csv", "unassigned.csv"]
+
+
+@pytest.mark.parametrize("format", ["csv", "parquet"])
+def test_one_file_holds_every_assignment(built, format):
+    data = b"".join(roster.stream_roster(format, batch_rows=50))
+    rows = read(format, data)
+    assert len(rows) == assignments() > 50
+    assert rows == sorted(rows, key=lambda row: (row[1], row[0], row[2]))
+
+
+@pytest.mark.parametrize("format", ["csv", "parquet"])
+@pytest.mark.parametrize("by", ["class", "teacher"])
+def test_a_file_per_partition(built, format, by):
+    column = {"class": "id", "teacher": "teacher_name"}[by]
+    partitions = db_spin.run(
+        f"SELECT count(DISTINCT sc.{column}) FROM assignment"
+        " JOIN spin_class AS sc ON spin_class_id = sc.id"
+    ).iloc[0, 0]
+    data = b"".join(roster.stream_roster(format, by, batch_rows=7))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        names = archive.namelist()
+        files = [read(format, archive.read(name)) for name in names]
+    assert len(names) == len(set(names)) == partitions
+    assert all(name.endswith(f".{format}") for name in names)
+    assert sum(map(len, files)) == assignments()
+    if by == "class":
+        # A class is one title and timeslot
+        assert all(len({(row[2], row[3]) for row in rows}) == 1 for rows in files)
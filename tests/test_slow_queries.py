@@ -0,0 +1,62 @@
+import duckdb
+import pytest
+
+from src.db.slow_queries import SlowQueryLog, is_read_statement, normalize_sql
+
+
+def test_statements_group_by_normalized_sql():
+    assert normalize_sql("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'a''b'") == (
+        "SELECT * FROM t WHERE id IN (?, ...) AND name = ?"
+    )
+
+
+def test_slow_reads_are_profiled_on_their_connection():
+    log = SlowQueryLog(threshold_ms=0, explain_rate=1)
+    with duckdb.connect() as con:
+        con.execute("CREATE TABLE t AS SELECT range AS id FROM range(10)")
+        log.record("spin", "run", "SELECT count(*) FROM t WHERE id > 3", 0.5, 1, con)
+        # Profiling runs the statement again: writes are only counted
+        log.record("spin", "update", "UPDATE t SET id = id + 1", 0.5, None, con)
+        assert con.execute("SELECT min(id) FROM t").fetchone()[0] == 0
+
+    read, write = sorted(log.worst(), key=lambda entry: entry.kind)
+    assert read.sql == "SELECT count(*) FROM t WHERE id > ?"
+    assert "Query Profiling Information" in read.explain
+    assert write.kind == "update" and write.explain is None
+    assert (read.count, read.rows) == (1, 1)
+
+
+def test_fast_statements_are_not_logged():
+    log = SlowQueryLog(threshold_ms=100, explain_rate=1)
+    log.record("school", "get", "SELECT 1", 0.01, 1)
+    assert log.worst() == []
+
+
+@pytest.mark.parametrize(
+    "sql, read",
+    [
+        ("SELECT * FROM t", True),
+        ("  -- counted\n FROM t WHERE name = 'insert'", True),
+        ('WITH x AS (SELECT 1 AS "delete") SELECT * FROM x;', True),
+        ("WITH x AS (SELECT 1 a) INSERT INTO t SELECT * FROM x", False),
+        ("with x as (select 1) update t set id = 2", False),
+        ("WITH x AS (SELECT 1) DELETE FROM t", False),
+        ("WITH x AS (SELECT 1) COPY t TO 'out.csv'", False),
+        ("SELECT 1; DELETE FROM t", False),
+        ("UPDATE t SET id = 2", False),
+        ("", False),
+    ],
+)
+def test_only_reads_are_run_again(sql, read):
+    assert is_read_statement(sql) is read
+
+
+def test_writes_after_ctes_are_not_profiled():
+    log = SlowQueryLog(threshold_ms=0, explain_rate=1)
+    with duckdb.connect() as con:
+        con.execute("CREATE TABLE t (id INTEGER)")
+        sql = "WITH x AS (SELECT 1 AS id) INSERT INTO t SELECT * FROM x"
+        con.execute(sql)
+        log.record("spin", "run", sql, 0.5, None, con)
+        assert con.execute("SELECT count(*) FROM t").fetchone()[0] == 1
+    assert log.worst()[0].explain is None
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import pytest
+from starlette.exceptions import HTTPException
+
+from src.web.sse import GOODBYE, SSE_EVENTS, ConnectionManager
+
+
+async def read(manager: ConnectionManager, connection) -> list:
+    """Every chunk a stream writes until it ends"""
+    return [chunk async for chunk in manager.events(connection)]
+
+
+def test_a_slow_consumer_keeps_the_newest_events():
+    async def main():
+        manager = ConnectionManager(max_queued=3)
+        connection = manager.connect("courses")
+        dropped = SSE_EVENTS.labels(kind="dropped").value()
+        for number in range(5):
+            manager.publish("courses", f"event {number}\n\n")
+        assert connection.events == ["event 2\n\n", "event 3\n\n", "event 4\n\n"]
+        assert SSE_EVENTS.labels(kind="dropped").value() == dropped + 2
+
+        # Written at once when the client reads again
+        stream = manager.events(connection)
+        assert await anext(stream) == "event 2\n\nevent 3\n\nevent 4\n\n"
+        await stream.aclose()
+        assert manager.count == 0
+
+    asyncio.run(main())
+
+
+def test_publish_from_another_thread():
+    async def main():
+        manager = ConnectionManager()
+        connection = manager.connect("courses")
+        other = manager.connect("rooms")
+        stream = manager.events(connection)
+        first = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+
+        thread = threading.Thread(target=manager.publish, args=("courses", "changed\n\n"))
+        thread.start()
+        thread.join()
+        assert await asyncio.wait_for(first, 1) == "changed\n\n"
+        assert other.events == []
+        await stream.aclose()
+        manager.disconnect(other)
+
+    asyncio.run(main())
+
+
+def test_drain_ends_open_streams():
+    async def main():
+        manager = ConnectionManager()
+        connections = [manager.connect(topic) for topic in ("courses", "courses", "rooms")]
+        readers = [asyncio.ensure_future(read(manager, c)) for c in connections]
+        await asyncio.sleep(0)
+        manager.publish("courses", "changed\n\n")
+
+        await manager.drain(timeout=1)
+        written = [
+            "".join(chunks) for chunks in await asyncio.wait_for(asyncio.gather(*readers), 1)
+        ]
+        assert written == ["changed\n\n" + GOODBYE] * 2 + [GOODBYE]
+        assert manager.count == 0 and not manager.topics
+        assert all(connection.closed == "drain" for connection in connections)
+        with pytest.raises(HTTPException) as refused:
+            manager.response("courses")
+        assert refused.value.status_code == 503
+
+    asyncio.run(main())
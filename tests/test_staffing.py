@@ -0,0 +1,124 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.spin import staffing
+from src.spin.conflicts import to_intervals
+
+
+def build(ratings, classes) -> staffing.Staffing:
+    """A problem from (teacher, course, rating) and (class id, course, timeslot label) rows"""
+    ratings = pd.DataFrame(ratings, columns=["teacher_id", "course_id", "rating"])
+    teachers = sorted(set(ratings["teacher_id"]))
+    return staffing.build_staffing(
+        pd.DataFrame({"id": teachers, "name": teachers}),
+        pd.DataFrame({"id": sorted({course for _, course, _ in classes})}),
+        ratings,
+        pd.DataFrame(
+            [
+                (id, id, course, course, timeslot, None, None, None, None, None)
+                for id, course, timeslot in classes
+            ],
+            columns=[
+                "id",
+                "title",
+                "course_code",
+                "course_id",
+                "timeslot",
+                "teacher_name",
+                "teacher_id",
+                "weekday",
+                "start_time",
+                "end_time",
+            ],
+        ),
+    )
+
+
+def propose(problem, max_load) -> staffing.Proposal:
+    for step in staffing.optimize(problem, max_load, rounds=60, patience=60):
+        pass
+    return step["proposal"]
+
+
+def feasible(problem, class_teacher, max_load) -> bool:
+    for teacher in set(class_teacher[class_teacher >= 0].tolist()):
+        mine = np.flatnonzero(class_teacher == teacher)
+        if len(mine) > max_load:
+            return False
+        for a, b in itertools.combinations(mine, 2):
+            starts, ends = problem.class_start, problem.class_end
+            if min(starts[a], starts[b]) >= 0 and starts[a] < ends[b] and starts[b] < ends[a]:
+                return False
+    return bool((staffing.ratings_of(problem, class_teacher)[class_teacher >= 0] > 0).all())
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_blocks_only_hold_overlapping_timeslots(seed):
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, 600, 60)
+    ends = starts + rng.integers(1, 120, 60)
+    starts[:3] = ends[:3] = -1
+    block = staffing.timeslot_blocks(starts, ends)
+    for b in np.unique(block):
+        members = np.flatnonzero(block == b)
+        if (starts[members] < 0).any():
+            assert len(members) == 1
+        else:
+            assert starts[members].max() < ends[members].min()
+
+
+def test_the_school_periods_are_their_own_blocks():
+    labels = [
+        "Mon: 09:00 - 10:20",
+        "Mon: 10:30 - 11:50",
+        "Mon: 09:00 - 10:20",
+        "Tue: 09:00 - 10:20",
+    ]
+    assert staffing.timeslot_blocks(*to_intervals(labels)).tolist() == [0, 1, 0, 2]
+
+
+def test_classes_overlapping_the_same_one_can_share_a_teacher():
+    problem = build(
+        [("t", "ART", 5)],
+        [
+            ("a", "ART", "Mon: 09:00 - 10:00"),
+            ("b", "ART", "Mon: 09:30 - 10:30"),
+            ("c", "ART", "Mon: 10:00 - 11:00"),
+        ],
+    )
+    proposal = propose(problem, max_load=3)
+    assert sorted(problem.class_ids[proposal.class_teacher >= 0]) == ["a", "c"]
+    assert proposal.rating == 10 <= proposal.bound
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_proposals_are_feasible_and_under_the_bound(seed):
+    rng = np.random.default_rng(seed)
+    teachers, courses = ["t0", "t1", "t2"], ["ART", "BIO", "CHEM"]
+    ratings = [
+        (teacher, course, int(rng.integers(1, 6)))
+        for teacher in teachers
+        for course in courses
+        if rng.random() < 0.7
+    ]
+    classes = []
+    for number in range(6):
+        start = int(rng.choice([540, 570, 600, 630]))
+        end = start + int(rng.choice([30, 60, 90]))
+        timeslot = f"Mon: {start // 60:02d}:{start % 60:02d} - {end // 60:02d}:{end % 60:02d}"
+        classes.append((f"c{number}", str(rng.choice(courses)), timeslot))
+    problem = build(ratings, classes)
+    max_load = int(rng.integers(1, 4))
+
+    best = 0
+    for picks in itertools.product(range(-1, len(problem.teacher_ids)), repeat=len(classes)):
+        class_teacher = np.array(picks, np.int64)
+        if feasible(problem, class_teacher, max_load):
+            best = max(best, staffing.total_rating(problem, class_teacher))
+
+    proposal = propose(problem, max_load)
+    assert feasible(problem, proposal.class_teacher, max_load)
+    assert proposal.rating <= best <= proposal.bound + 1e-9
@@ -0,0 +1,25 @@
+"""
+Startup budget: `import main` must stay fast and leave the data layer unloaded
+(see benchmarks/profile_startup.py). Measured in fresh interpreters.
+"""
+
+import pytest
+
+from benchmarks.profile_startup import (
+    DEFERRED_MODULES,
+    STARTUP_BUDGET_MS,
+    cold_start_ms,
+    import_profile,
+)
+
+pytestmark = pytest.mark.slow
+
+
+def test_heavy_modules_load_on_first_use():
+    imported = {module for module, _, _ in import_profile()}
+
+    assert not imported & set(DEFERRED_MODULES)
+
+
+def test_cold_start_within_budget():
+    assert cold_start_ms(runs=3) <= STARTUP_BUDGET_MS
@@ -0,0 +1,54 @@
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from init import static_files, templates
+from src.utils import response_adapter
+
+
+def make_client(context) -> TestClient:
+    app = FastAPI()
+    app.mount("/static", static_files, name="static")
+
+    @app.get("/page")
+    def page(request: Request):
+        return response_adapter(request, "error_message.html", context, templates)
+
+    return TestClient(app)
+
+
+def test_streams_content_inside_the_shell():
+    response = make_client(lambda: {"message_html": "<p>Loaded</p>"}).get("/page")
+
+    assert response.status_code == 200
+    assert "<p>Loaded</p>" in response.text
+    assert response.text.rstrip().endswith("</html>")
+
+
+def test_context_error_renders_an_error_message_and_the_rest_of_the_layout():
+    def missing():
+        raise HTTPException(status_code=404, detail="No such <course>")
+
+    response = make_client(missing).get("/page")
+
+    assert "No such &lt;course&gt;" in response.text
+    assert response.text.rstrip().endswith("</html>")
+
+
+def test_unexpected_context_error_is_not_shown():
+    def failing():
+        raise RuntimeError("connection string with a password")
+
+    response = make_client(failing).get("/page")
+
+    assert "The page could not be loaded" in response.text
+    assert "password" not in response.text
+    assert response.text.rstrip().endswith("</html>")
+
+
+def test_datastar_requests_get_the_fragment():
+    response = make_client({"message_html": "<p>Fragment</p>"}).get(
+        "/page", headers={"Datastar-Request": "true"}
+    )
+
+    assert "datastar-merge-fragments" in response.text
+    assert "<p>Fragment</p>" in response.text